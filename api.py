@@ -4,11 +4,16 @@ API路由模块
 """
 
 import logging
-from typing import Dict, Any
-from flask import Blueprint, request, jsonify
+from typing import Callable, Dict, Any, Iterator, Optional
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from pymongo.errors import PyMongoError
 
+import endpoints
+from changefeed import SubscriptionClosed, format_error, format_event
+from compression import compress_response
 from database import MongoDBManager
+from endpoints import EVENT_STREAM_MIMETYPE, NDJSON_MIMETYPE
+from serialization import dumps_extended
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +32,120 @@ def get_db_manager() -> MongoDBManager:
     return get_db_manager()
 
 
+def respond(result: endpoints.Result):
+    """
+    把endpoints构建的 (响应体, 状态码, 响应头) 转换为Flask响应
+    
+    Args:
+        result: endpoints中各接口函数的返回值
+        
+    Returns:
+        tuple: Flask视图函数的返回值
+    """
+    body, status, headers = result
+    return jsonify(body), status, headers
+
+
+def wants_stream(params: Dict[str, Any]) -> bool:
+    """
+    判断客户端是否请求流式响应
+    
+    Args:
+        params: 查询参数或请求体
+        
+    Returns:
+        bool: stream=true或Accept中application/x-ndjson的权重高于application/json时返回True
+    """
+    return endpoints.wants_stream(params, request.headers.get("Accept"))
+
+
+def extended_json_dumps(document: Dict[str, Any]) -> str:
+    """
+    以MongoDB扩展JSON（relaxed）序列化文档
+    
+    聚合结果可能包含ObjectId、日期等BSON类型，序列化为 {"$oid": ...}、{"$date": ...}，
+    并保留管道输出的字段顺序
+    """
+    return dumps_extended(document)
+
+
+def ndjson_response(documents: Iterator[Dict[str, Any]],
+                    dumps: Optional[Callable[[Any], str]] = None) -> Response:
+    """
+    构建NDJSON流式响应，每行一条JSON文档
+    
+    第一条文档在返回响应前读取，使查询错误仍能以错误状态码返回；
+    之后的文档随MongoDB游标分批获取、逐行输出。
+    
+    Args:
+        documents: 文档迭代器（通常是PyMongo游标）
+        dumps: 序列化函数，默认使用应用的JSON序列化
+        
+    Returns:
+        Response: 流式响应
+    """
+    dumps = dumps or current_app.json.dumps
+    iterator = iter(documents)
+    first = next(iterator, None)
+    
+    def generate():
+        try:
+            if first is None:
+                return
+            yield dumps(first) + "\n"
+            for document in iterator:
+                yield dumps(document) + "\n"
+        except PyMongoError as e:
+            # 响应已经开始，只能在流中输出错误
+            logger.error(f"流式输出过程中数据库查询失败: {e}")
+            yield dumps({"error": "数据库查询失败"}) + "\n"
+        finally:
+            close = getattr(documents, "close", None)
+            if close:
+                close()
+    
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+
+def json_array_response(documents: Iterator[Dict[str, Any]],
+                        dumps: Optional[Callable[[Any], str]] = None) -> Response:
+    """
+    构建逐条输出的JSON数组响应
+    
+    与ndjson_response相同，先读取第一条文档，之后随游标分批获取逐条输出，
+    客户端收到的是一个完整的JSON数组
+    
+    Args:
+        documents: 文档迭代器（通常是PyMongo游标）
+        dumps: 序列化函数，默认使用应用的JSON序列化
+        
+    Returns:
+        Response: 流式响应
+    """
+    dumps = dumps or current_app.json.dumps
+    iterator = iter(documents)
+    first = next(iterator, None)
+    
+    def generate():
+        yield "["
+        try:
+            if first is not None:
+                yield dumps(first)
+                for document in iterator:
+                    yield "," + dumps(document)
+        except PyMongoError as e:
+            # 响应已经开始，只能在数组末尾输出错误
+            logger.error(f"流式输出过程中数据库查询失败: {e}")
+            yield "," + dumps({"error": "数据库查询失败"})
+        finally:
+            close = getattr(documents, "close", None)
+            if close:
+                close()
+        yield "]"
+    
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+
 @api_bp.route("/save", methods=["POST"])
 def save_data():
     """
@@ -35,35 +154,73 @@ def save_data():
     支持写入任意结构的数据，content字段必须是JSON字符串，
     会自动解析成object存入data字段。必须指定目标数据库和集合。
     
+    查询参数mode=async时校验数据、生成ID后放入异步写入队列并返回202，
+    由后台线程批量写入；队列已满时返回503。
+    
     Returns:
         JSON响应: 包含操作结果和ID
     """
     try:
-        data = request.get_json()
-        if not data:
-            return jsonify({"error": "请求体不能为空"}), 400
-        
-        # 验证必需参数
-        if not data.get("db_name"):
-            return jsonify({"error": "必须指定 db_name 参数"}), 400
-        if not data.get("collection_name"):
-            return jsonify({"error": "必须指定 collection_name 参数"}), 400
+        data = request.get_json(silent=True)
+        mode = endpoints.parse_save(data, request.args)
         
         db_manager = get_db_manager()
-        result = db_manager.save_data(data)
-        
-        # 检查是否有错误
-        if "error" in result:
-            return jsonify(result), 400
+        if mode == "async":
+            result = db_manager.save_async(data)
+        else:
+            result = db_manager.save_data(data)
         
-        return jsonify(result), 200
+        return respond(endpoints.save_result(result, mode))
+    
+    except Exception as e:
+        return respond(endpoints.save_error(e))
+
+
+@api_bp.route("/patch", methods=["POST"])
+def patch_data():
+    """
+    按uuid局部更新已存在的数据
+    
+    只修改指定的字段，不需要重新发送整个content，updated_at与保存接口一致自动更新
+    
+    Request Body:
+        db_name: 数据库名称（必需）
+        collection_name: 集合名称（必需）
+        uuid: 要更新的数据的UUID（必需）
+        uuid_name: UUID字段名（可选，默认为uuid）
+        update: 更新操作符，JSON对象或其字符串形式（必需），支持$set、$inc、$push（可带$each和$slice）和$unset
+        write_concern: 写关注（可选）
         
-    except PyMongoError as e:
-        logger.error(f"数据库操作失败: {e}")
-        return jsonify({"error": "数据库操作失败"}), 500
+    Returns:
+        JSON响应: 包含操作结果和ID，数据不存在时返回404
+    """
+    try:
+        data = endpoints.require_object(request.get_json(silent=True))
+        return respond(endpoints.patch_result(get_db_manager().patch_data(data)))
+    
     except Exception as e:
-        logger.error(f"保存数据时发生错误: {e}")
-        return jsonify({"error": "服务器内部错误"}), 500
+        return respond(endpoints.patch_error(e))
+
+
+@api_bp.route("/save/batch", methods=["POST"])
+def save_batch():
+    """
+    批量保存数据
+    
+    请求体可以是保存数据的数组，也可以是包含items数组的对象；
+    对象顶层的db_name、collection_name、uuid_name作为每条数据的默认值，
+    write_concern作用于整批数据。同一集合的数据通过一次bulk_write写入。
+    
+    Returns:
+        JSON响应: 每条数据的ID、是否新建或错误信息
+    """
+    try:
+        db_manager = get_db_manager()
+        items, write_concern = endpoints.parse_batch(request.get_json(silent=True), db_manager.config.MAX_BATCH_SIZE)
+        return respond((db_manager.save_batch(items, write_concern), 200, {}))
+    
+    except Exception as e:
+        return respond(endpoints.batch_error(e))
 
 
 @api_bp.route("/search", methods=["GET"])
@@ -82,30 +239,143 @@ def search_data():
         sorts: 排序条件JSON字符串（可选）
         limit: 限制返回数量（可选，默认5）
         skip: 跳过数量（可选，默认0）
-    
+        cursor: 游标分页（可选），首页传空值，之后传上一页返回的next_cursor
+        stream: 为true时以NDJSON流式返回（可选），也可通过Accept: application/x-ndjson请求
+        batch_size: 流式响应每批从MongoDB获取的文档数（可选）
+        cache: 为false时跳过搜索缓存（可选）
+        fields: 只返回的字段（可选），逗号分隔的字段路径或JSON对象，支持 {"$slice": n}
+        exclude: 不返回的字段（可选），逗号分隔的字段路径或JSON数组，不能与fields同时使用
+        with_total: 为true时返回符合条件的总数（可选）
+        total_limit: 总数计数的上限（可选），超过上限时total为上限、total_exact为false
+        explain: 为true时不返回数据，返回执行计划和executionStats（可选）
+        read_preference: 读偏好（可选），如secondaryPreferred、nearest，默认按Config配置
+        max_staleness_seconds: 从节点允许落后的最大秒数（可选），不小于90
+        hint: 索引提示（可选），索引名或JSON格式的索引键
+        
     Returns:
-        JSON响应: 查询结果列表
+        JSON响应: 查询结果列表；游标分页或with_total时为包含data、next_cursor、total的对象；
+        流式响应时每行一条JSON文档；explain时为执行计划
     """
     try:
         query_params = request.args.to_dict()
-        
-        # 验证必需参数
-        if not query_params.get("db_name"):
-            return jsonify({"error": "必须指定 db_name 参数"}), 400
-        if not query_params.get("collection_name"):
-            return jsonify({"error": "必须指定 collection_name 参数"}), 400
+        endpoints.require_target(query_params)
         
         db_manager = get_db_manager()
-        results = db_manager.search_data(query_params)
+        if endpoints.is_explain(query_params):
+            return respond((db_manager.explain_search(query_params), 200, {}))
+        if wants_stream(query_params):
+            return ndjson_response(db_manager.search_stream(query_params))
+        
+        return respond(endpoints.search_result(query_params, db_manager.search_page(query_params)))
+    
+    except Exception as e:
+        return respond(endpoints.search_error(e))
+
+
+@api_bp.route("/aggregate", methods=["POST"])
+def aggregate():
+    """
+    执行聚合管道
+    
+    分组、计数等计算在MongoDB中完成，结果随游标分批获取并逐条输出。
+    结果以MongoDB扩展JSON（relaxed）序列化，ObjectId、日期等类型输出为 {"$oid": ...}、{"$date": ...}。
+    
+    Request Body:
+        db_name: 数据库名称（必需）
+        collection_name: 集合名称（必需）
+        pipeline: 聚合管道，JSON数组或其字符串形式（必需），不支持$out和$merge
+        allow_disk_use: 是否允许使用磁盘临时文件（可选，默认false）
+        max_time_ms: 服务端执行时间上限，毫秒（可选，默认AGGREGATE_MAX_TIME_MS）
+        batch_size: 每批从MongoDB获取的文档数（可选，默认STREAM_BATCH_SIZE）
+        stream: 为true时以NDJSON返回（可选），也可通过Accept: application/x-ndjson请求
         
-        return jsonify(results), 200
+    Returns:
+        JSON数组，或每行一条结果的NDJSON流
+    """
+    try:
+        data = endpoints.parse_aggregate(request.get_json(silent=True))
+        documents = get_db_manager().aggregate(data)
         
-    except PyMongoError as e:
-        logger.error(f"数据库查询失败: {e}")
-        return jsonify({"error": "数据库查询失败"}), 500
+        if wants_stream(data):
+            return ndjson_response(documents, extended_json_dumps)
+        return json_array_response(documents, extended_json_dumps)
+    
     except Exception as e:
-        logger.error(f"搜索数据时发生错误: {e}")
-        return jsonify({"error": "服务器内部错误"}), 500
+        return respond(endpoints.aggregate_error(e))
+
+
+@api_bp.route("/watch", methods=["GET"])
+def watch():
+    """
+    订阅集合的变更
+    
+    以server-sent events推送集合的插入、更新和替换，每个事件的id为恢复令牌；
+    断线重连时浏览器的EventSource会通过Last-Event-ID请求头带回最后收到的id，从该事件之后继续推送。
+    需要MongoDB副本集或分片集群。
+    
+    Query Parameters:
+        db_name: 数据库名称（必需）
+        collection_name: 集合名称（必需）
+        match: 变更事件的过滤条件JSON字符串（可选），如 {"operationType": "insert", "fullDocument.type": "log"}
+        resume_after: 从该事件id之后继续推送（可选），也可通过Last-Event-ID请求头传入
+        
+    Returns:
+        text/event-stream: event为change的变更事件；订阅结束时推送event为error的事件
+    """
+    query_params = request.args.to_dict()
+    db_manager = get_db_manager()
+    try:
+        query_params = endpoints.parse_watch(query_params, request.headers.get("Last-Event-ID"))
+        subscription = db_manager.subscribe_changes(query_params)
+    except Exception as e:
+        return respond(endpoints.watch_error(e, query_params))
+    
+    heartbeat = current_app.config["WATCH_HEARTBEAT_INTERVAL"]
+    
+    def generate():
+        try:
+            yield ": connected\n\n"
+            while True:
+                change = subscription.get(heartbeat)
+                # 没有事件时发送注释作为心跳，避免代理因空闲断开连接，也能及时发现客户端已断开
+                yield format_event(change) if change is not None else ": heartbeat\n\n"
+        except SubscriptionClosed as e:
+            if e.args[0]:
+                yield format_error(e.args[0])
+        finally:
+            db_manager.change_feeds.release(subscription)
+    
+    response = Response(stream_with_context(generate()), mimetype=EVENT_STREAM_MIMETYPE)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@api_bp.route("/live", methods=["GET"])
+def live():
+    """
+    存活检查端点
+    
+    只表示进程能够处理请求，不访问数据库，也不创建数据库连接
+    
+    Returns:
+        JSON响应: 进程号和运行时长
+    """
+    return respond(endpoints.live_result())
+
+
+@api_bp.route("/ready", methods=["GET"])
+def ready():
+    """
+    就绪检查端点
+    
+    返回后台预热进度和驱动心跳得到的拓扑状态，不向MongoDB发送命令；
+    预热完成且有可写的服务器时返回200，否则返回503
+    
+    Returns:
+        JSON响应: 就绪状态
+    """
+    return respond(endpoints.ready_result(get_db_manager().readiness()))
 
 
 @api_bp.route("/health", methods=["GET"])
@@ -113,6 +383,8 @@ def health_check():
     """
     健康检查端点
     
+    每次调用都会向MongoDB发送ping，用于人工排查；探针请使用 /api/live 和 /api/ready
+    
     Returns:
         JSON响应: 服务状态信息
     """
@@ -120,21 +392,30 @@ def health_check():
         db_manager = get_db_manager()
         # 尝试连接数据库
         db_manager.client.admin.command('ping')
-        
-        return jsonify({
-            "status": "healthy",
-            "message": "服务运行正常",
-            "database": "connected"
-        }), 200
-        
+        return respond(endpoints.health_result(db_manager))
+    
     except Exception as e:
-        logger.error(f"健康检查失败: {e}")
-        return jsonify({
-            "status": "unhealthy",
-            "message": "服务异常",
-            "database": "disconnected",
-            "error": str(e)
-        }), 503
+        return respond(endpoints.health_error(e))
+
+
+@api_bp.route("/stats", methods=["GET"])
+def stats():
+    """
+    运行指标端点
+    
+    返回当前进程的连接池指标（检出次数、等待时间、使用中的连接数、连接池耗尽次数等）、
+    搜索缓存命中统计、相同搜索的合并统计、异步写入队列统计和变更订阅统计，多进程部署时每个worker分别统计
+    
+    Returns:
+        JSON响应: 运行指标
+    """
+    return respond(endpoints.stats_result(get_db_manager()))
+
+
+@api_bp.after_request
+def compress(response: Response) -> Response:
+    """按Accept-Encoding压缩响应"""
+    return compress_response(response, current_app.config)
 
 
 @api_bp.errorhandler(404)
@@ -6,23 +6,34 @@ Dify MongoDB Tools - 主应用模块
 
 主要功能:
 - 数据保存到指定数据库和集合 (/api/save)
+- 批量保存数据 (/api/save/batch)
+- 按uuid局部更新数据 (/api/patch)
 - 数据搜索和查询 (/api/search)
-- 健康检查 (/api/health)
+- 聚合查询 (/api/aggregate)
+- 集合变更推送 (/api/watch)
+- 健康检查 (/api/health)，存活和就绪检查 (/api/live、/api/ready)
+- Prometheus指标 (/metrics)
 """
 
 import logging
 import os
-from typing import Optional
+import threading
+import time
+from typing import Iterable, Iterator, List, Optional
 
-from flask import Flask, jsonify
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
 
 from config import get_config
 from database import MongoDBManager
 from api import api_bp
+from monitoring import generate_metrics, observe_request
+from serialization import FastJSONProvider
 
-# 全局数据库管理器实例
+# 全局数据库管理器实例，按进程创建
 _db_manager: Optional[MongoDBManager] = None
+_db_manager_pid: Optional[int] = None
+_db_manager_lock = threading.Lock()
 
 
 def create_app(config_name: Optional[str] = None) -> Flask:
@@ -47,6 +58,7 @@ def create_app(config_name: Optional[str] = None) -> Flask:
     # 创建Flask应用
     app = Flask(__name__)
     app.config.from_object(config)
+    app.json = FastJSONProvider(app)
     
     # 启用CORS
     CORS(app)
@@ -57,6 +69,10 @@ def create_app(config_name: Optional[str] = None) -> Flask:
     # 注册错误处理器
     register_error_handlers(app)
     
+    # 注册请求指标和 /metrics 接口
+    if config.METRICS_ENABLED:
+        register_metrics(app)
+    
     # 注册根路由
     @app.route("/")
     def index():
@@ -67,8 +83,16 @@ def create_app(config_name: Optional[str] = None) -> Flask:
             "description": "MongoDB数据操作工具集",
             "endpoints": {
                 "save": "/api/save",
+                "save_batch": "/api/save/batch",
+                "patch": "/api/patch",
                 "search": "/api/search",
-                "health": "/api/health"
+                "aggregate": "/api/aggregate",
+                "watch": "/api/watch",
+                "health": "/api/health",
+                "live": "/api/live",
+                "ready": "/api/ready",
+                "stats": "/api/stats",
+                "metrics": "/metrics" if config.METRICS_ENABLED else None
             },
             "docs": "/api/docs" if app.debug else None
         })
@@ -89,6 +113,11 @@ def register_error_handlers(app: Flask):
         """处理404错误"""
         return jsonify({"error": "资源不存在"}), 404
     
+    @app.errorhandler(405)
+    def method_not_allowed(error):
+        """处理405错误，保留路由支持的方法"""
+        return jsonify({"error": "请求方法不允许"}), 405, {"Allow": ", ".join(error.valid_methods or [])}
+    
     @app.errorhandler(500)
     def internal_error(error):
         """处理500错误"""
@@ -96,39 +125,118 @@ def register_error_handlers(app: Flask):
         return jsonify({"error": "服务器内部错误"}), 500
 
 
+def register_metrics(app: Flask):
+    """
+    注册请求指标
+    
+    请求耗时从before_request开始计算，到响应体全部发送完毕（call_on_close）为止，
+    包含视图函数、JSON序列化和流式输出的时间
+    """
+    
+    @app.before_request
+    def start_request_timer():
+        """记录请求开始时间"""
+        g.request_started_at = time.perf_counter()
+    
+    @app.after_request
+    def record_request_metrics(response: Response) -> Response:
+        """在响应发送完毕后记录请求指标"""
+        started_at = g.pop("request_started_at", None)
+        if started_at is None:
+            return response
+        
+        method = request.method
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        request_size = request.content_length or 0
+        status = response.status_code
+        sent: List[int] = [0]
+        if response.is_streamed:
+            response.response = _count_bytes(response.response, sent)
+        else:
+            sent[0] = response.content_length or 0
+        
+        def finish():
+            observe_request(method, endpoint, status, time.perf_counter() - started_at, request_size, sent[0])
+        
+        response.call_on_close(finish)
+        return response
+    
+    @app.route("/metrics")
+    def metrics():
+        """Prometheus指标"""
+        body, content_type = generate_metrics()
+        return Response(body, content_type=content_type)
+
+
+def _count_bytes(chunks: Iterable, sent: List[int]) -> Iterator:
+    """统计流式响应输出的字节数，结束时关闭原始迭代器"""
+    try:
+        for chunk in chunks:
+            sent[0] += len(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+            yield chunk
+    finally:
+        close = getattr(chunks, "close", None)
+        if close:
+            close()
+
+
 def get_db_manager() -> MongoDBManager:
     """
-    获取数据库管理器实例（单例模式）
+    获取数据库管理器实例（每个进程一个实例）
+    
+    MongoClient在首次使用时创建；多进程部署时fork出的worker检测到进程号变化后
+    会创建自己的客户端，不与父进程共享连接
     
     Returns:
         MongoDBManager: 数据库管理器实例
     """
-    global _db_manager
-    if _db_manager is None:
-        config = get_config()
-        _db_manager = MongoDBManager(config)
+    global _db_manager, _db_manager_pid
+    pid = os.getpid()
+    if _db_manager is None or _db_manager_pid != pid:
+        with _db_manager_lock:
+            if _db_manager is None or _db_manager_pid != pid:
+                config = get_config()
+                _db_manager = MongoDBManager(config)
+                _db_manager_pid = pid
     return _db_manager
 
 
-def init_app():
-    """初始化应用"""
-    # 获取配置
-    config = get_config()
+def reset_db_manager():
+    """
+    丢弃当前进程继承的数据库管理器实例
     
-    # 创建应用实例
-    app = create_app()
+    在gunicorn的post_fork钩子中调用，子进程不关闭也不复用父进程的MongoClient
+    """
+    global _db_manager, _db_manager_pid
+    _db_manager = None
+    _db_manager_pid = None
+
+
+def start_warmup():
+    """
+    创建当前进程的数据库管理器并在后台预热连接，不阻塞启动
     
-    # 初始化数据库连接
-    try:
-        db_manager = get_db_manager()
-        # 测试数据库连接
-        db_manager.client.admin.command('ping')
-        logging.info("数据库连接成功")
-    except Exception as e:
-        logging.error(f"数据库连接失败: {e}")
-        raise
+    在gunicorn的post_fork钩子和开发服务器启动时调用
+    """
+    get_db_manager().start_warmup()
+
+
+def close_db_manager():
+    """关闭当前进程创建的数据库管理器实例"""
+    global _db_manager, _db_manager_pid
+    if _db_manager and _db_manager_pid == os.getpid():
+        _db_manager.close()
+    _db_manager = None
+    _db_manager_pid = None
+
+
+def init_app():
+    """
+    初始化应用
     
-    return app
+    不在此处创建数据库连接，MongoClient在每个进程启动预热（start_warmup）或首次处理请求时创建
+    """
+    return create_app()
 
 
 def main():
@@ -140,6 +248,9 @@ def main():
         # 获取配置
         config = get_config()
         
+        # 后台预热数据库连接，应用立即开始接收请求
+        start_warmup()
+        
         # 启动应用
         logging.info(f"启动应用 - 主机: {config.HOST}, 端口: {config.PORT}")
         app.run(
@@ -147,16 +258,15 @@ def main():
             port=config.PORT,
             debug=config.DEBUG
         )
-        
+    
     except KeyboardInterrupt:
         logging.info("应用被中断")
     except Exception as e:
         logging.error(f"应用启动失败: {e}")
         raise
     finally:
-        # 清理资源
-        if _db_manager:
-            _db_manager.close()
+        # 写完异步写入队列中的数据，再关闭数据库连接
+        close_db_manager()
 
 
 if __name__ == "__main__":
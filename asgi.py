@@ -0,0 +1,698 @@
+"""
+ASGI入口模块
+
+基于AsyncMongoDBManager提供与api_bp一致的 /api/save、/api/save/batch、/api/patch、/api/search、/api/aggregate、
+/api/watch、/api/health、/api/live、/api/ready、/api/stats 接口，以及Prometheus指标接口 /metrics。
+参数校验、状态码和错误信息由endpoints模块与Flask应用共用，/api 下的响应按Accept-Encoding压缩。
+每个进行中的MongoDB操作只占用一个协程而不是一个工作线程，单进程即可处理大量并发请求。
+
+启动方式:
+    uvicorn asgi:app --host 0.0.0.0 --port 3333
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from pymongo.errors import PyMongoError
+
+import endpoints
+from changefeed import AsyncSubscription, ChangeFeedHub, SubscriptionClosed, format_error, format_event
+from compression import StreamCompressor, compress_bytes, create_compressor, is_compressible_mimetype, negotiate_encoding
+from config import get_config
+from database import AsyncMongoDBManager
+from endpoints import EVENT_STREAM_MIMETYPE, NDJSON_MIMETYPE
+from monitoring import generate_metrics, observe_request
+from serialization import JSONDecodeError, dumps_bytes, dumps_extended, loads
+
+logger = logging.getLogger(__name__)
+
+# 全局异步数据库管理器实例
+_async_db_manager: Optional[AsyncMongoDBManager] = None
+
+# 与Flask的app.config一致的配置字典，供压缩等按键读取配置的模块使用
+_app_config: Optional[Dict[str, Any]] = None
+
+
+def get_async_db_manager() -> AsyncMongoDBManager:
+    """
+    获取异步数据库管理器实例（单例模式）
+    
+    Returns:
+        AsyncMongoDBManager: 异步数据库管理器实例
+    """
+    global _async_db_manager
+    if _async_db_manager is None:
+        _async_db_manager = AsyncMongoDBManager(get_config())
+    return _async_db_manager
+
+
+def get_app_config() -> Dict[str, Any]:
+    """
+    获取配置字典，与Flask的app.config.from_object一样只包含大写的配置项
+    
+    Returns:
+        Dict[str, Any]: 配置项名称到值的映射
+    """
+    global _app_config
+    if _app_config is None:
+        config = get_config()
+        _app_config = {key: getattr(config, key) for key in dir(config) if key.isupper()}
+    return _app_config
+
+
+def json_dumps(data: Any) -> bytes:
+    """
+    序列化JSON，键排序与Flask的jsonify保持一致
+    
+    Args:
+        data: 要序列化的数据
+        
+    Returns:
+        bytes: UTF-8编码的JSON
+    """
+    return dumps_bytes(data, sort_keys=True)
+
+
+def extended_json_dumps(document: Dict[str, Any]) -> bytes:
+    """以MongoDB扩展JSON（relaxed）序列化聚合结果，与api.extended_json_dumps一致"""
+    return dumps_extended(document).encode("utf-8")
+
+
+class Request:
+    """ASGI请求的简单封装"""
+    
+    def __init__(self, scope: Dict[str, Any], body: bytes,
+                 receive: Optional[Callable[[], Awaitable[Dict[str, Any]]]] = None):
+        """
+        初始化请求
+        
+        Args:
+            scope: ASGI连接信息
+            body: 请求体
+            receive: 接收消息的协程，长连接响应用来发现客户端断开
+        """
+        self.method: str = scope["method"]
+        self.path: str = scope["path"]
+        self.headers: Dict[str, str] = {
+            key.decode("latin-1").lower(): value.decode("latin-1")
+            for key, value in scope.get("headers", [])
+        }
+        self.body = body
+        self.receive = receive
+        
+        # 与Flask的request.args.to_dict()一致，同名参数取第一个值
+        self.args: Dict[str, str] = {}
+        for key, value in parse_qsl(scope.get("query_string", b"").decode("utf-8"), keep_blank_values=True):
+            self.args.setdefault(key, value)
+    
+    def get_json(self) -> Any:
+        """
+        解析JSON请求体，与Flask的request.get_json(silent=True)一致
+        
+        Returns:
+            解析后的数据，请求体为空或不是合法JSON时返回None
+        """
+        if not self.body:
+            return None
+        try:
+            return loads(self.body)
+        except (JSONDecodeError, UnicodeDecodeError):
+            return None
+
+
+class PlainResponse:
+    """ASGI响应"""
+    
+    def __init__(self, body: bytes, content_type: str, status: int = 200,
+                 headers: Optional[Dict[str, str]] = None):
+        """
+        初始化响应
+        
+        Args:
+            body: 响应体
+            content_type: 内容类型
+            status: 状态码
+            headers: 其他响应头
+        """
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+        self.headers = dict(headers or {})
+    
+    def compress(self, encoding: str, config: Dict[str, Any]):
+        """响应体不小于COMPRESSION_MIN_SIZE时整体压缩"""
+        if len(self.body) < config["COMPRESSION_MIN_SIZE"]:
+            return
+        self.body = compress_bytes(self.body, encoding, config)
+        self.headers["Content-Encoding"] = encoding
+    
+    async def send(self, send: Callable[[Dict[str, Any]], Awaitable[None]]):
+        """发送响应"""
+        await send({
+            "type": "http.response.start",
+            "status": self.status,
+            "headers": build_headers(self.content_type, len(self.body), self.headers)
+        })
+        await send({"type": "http.response.body", "body": self.body})
+
+
+class Response(PlainResponse):
+    """JSON响应"""
+    
+    def __init__(self, data: Any, status: int = 200, headers: Optional[Dict[str, str]] = None):
+        """
+        初始化JSON响应
+        
+        Args:
+            data: 响应数据
+            status: 状态码
+            headers: 其他响应头
+        """
+        super().__init__(json_dumps(data), "application/json", status, headers)
+
+
+class StreamingResponse:
+    """流式响应，逐块发送异步迭代器产生的响应体"""
+    
+    def __init__(self, chunks: AsyncIterator[bytes], content_type: str):
+        """
+        初始化流式响应
+        
+        Args:
+            chunks: 产生响应体的异步迭代器
+            content_type: 内容类型
+        """
+        self.status = 200
+        self.chunks = chunks
+        self.content_type = content_type
+        self.headers: Dict[str, str] = {}
+        self.compressor: Optional[StreamCompressor] = None
+    
+    def compress(self, encoding: str, config: Dict[str, Any]):
+        """流式响应的大小未知，总是逐块压缩"""
+        self.compressor = StreamCompressor(create_compressor(encoding, config))
+        self.headers["Content-Encoding"] = encoding
+    
+    async def send(self, send: Callable[[Dict[str, Any]], Awaitable[None]]):
+        """逐块发送响应体"""
+        await send({
+            "type": "http.response.start",
+            "status": self.status,
+            "headers": build_headers(self.content_type, None, self.headers)
+        })
+        async for chunk in self.chunks:
+            if self.compressor is not None:
+                chunk = self.compressor.compress(chunk)
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        tail = self.compressor.finish() if self.compressor is not None else b""
+        await send({"type": "http.response.body", "body": tail})
+
+
+class EventStreamResponse:
+    """server-sent events响应，推送变更订阅的事件直到订阅结束或客户端断开"""
+    
+    content_type = EVENT_STREAM_MIMETYPE
+    
+    def __init__(self, subscription: AsyncSubscription, hub: ChangeFeedHub, heartbeat: float,
+                 receive: Callable[[], Awaitable[Dict[str, Any]]]):
+        """
+        初始化响应
+        
+        Args:
+            subscription: 变更订阅
+            hub: 创建订阅的ChangeFeedHub，响应结束时释放订阅
+            heartbeat: 没有事件时发送心跳注释的间隔秒数
+            receive: 接收消息的协程
+        """
+        self.status = 200
+        self.headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        self.subscription = subscription
+        self.hub = hub
+        self.heartbeat = heartbeat
+        self.receive = receive
+    
+    async def wait_disconnect(self):
+        """等待客户端断开"""
+        while (await self.receive())["type"] != "http.disconnect":
+            pass
+    
+    async def send(self, send: Callable[[Dict[str, Any]], Awaitable[None]]):
+        """逐条发送事件"""
+        await send({
+            "type": "http.response.start",
+            "status": self.status,
+            "headers": build_headers(self.content_type, None, self.headers)
+        })
+        disconnected = asyncio.ensure_future(self.wait_disconnect())
+        try:
+            await send_event(send, ": connected\n\n")
+            while True:
+                getter = asyncio.ensure_future(self.subscription.get(self.heartbeat))
+                await asyncio.wait({getter, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    getter.cancel()
+                    return
+                change = getter.result()
+                # 没有事件时发送注释作为心跳，避免代理因空闲断开连接
+                await send_event(send, format_event(change) if change is not None else ": heartbeat\n\n")
+        except SubscriptionClosed as e:
+            if e.args[0]:
+                await send_event(send, format_error(e.args[0]))
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            disconnected.cancel()
+            self.hub.release(self.subscription)
+
+
+def build_headers(content_type: str, content_length: Optional[int] = None,
+                  extra: Optional[Dict[str, str]] = None) -> List[Tuple[bytes, bytes]]:
+    """
+    构建响应头，包含与Flask-CORS默认配置一致的跨域头
+    
+    Args:
+        content_type: 内容类型
+        content_length: 内容长度，流式响应为None
+        extra: 其他响应头
+        
+    Returns:
+        List[Tuple[bytes, bytes]]: 响应头列表
+    """
+    headers = [
+        (b"content-type", content_type.encode("latin-1")),
+        (b"access-control-allow-origin", b"*")
+    ]
+    if content_length is not None:
+        headers.append((b"content-length", str(content_length).encode("latin-1")))
+    for key, value in (extra or {}).items():
+        headers.append((key.lower().encode("latin-1"), value.encode("latin-1")))
+    return headers
+
+
+def respond(result: endpoints.Result) -> Response:
+    """把endpoints构建的 (响应体, 状态码, 响应头) 转换为JSON响应"""
+    body, status, headers = result
+    return Response(body, status, headers)
+
+
+def wants_stream(request: Request, params: Dict[str, Any]) -> bool:
+    """
+    判断客户端是否请求流式响应，规则与Flask应用一致
+    
+    Args:
+        request: 请求
+        params: 查询参数或请求体
+        
+    Returns:
+        bool: stream=true或Accept中application/x-ndjson的权重高于application/json时返回True
+    """
+    return endpoints.wants_stream(params, request.headers.get("accept"))
+
+
+async def first_document(documents) -> Optional[Dict[str, Any]]:
+    """预取第一条文档，使查询错误在响应开始前暴露，没有数据时返回None"""
+    try:
+        return await documents.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def close_documents(documents):
+    """关闭异步游标或异步生成器"""
+    close = getattr(documents, "aclose", None) or getattr(documents, "close", None)
+    if close:
+        await close()
+
+
+async def ndjson_chunks(documents, first: Optional[Dict[str, Any]],
+                        dumps: Callable[[Any], bytes] = json_dumps) -> AsyncIterator[bytes]:
+    """逐行输出文档，与api.ndjson_response一致，响应开始后的查询错误在流中输出"""
+    try:
+        if first is not None:
+            yield dumps(first) + b"\n"
+            async for document in documents:
+                yield dumps(document) + b"\n"
+    except PyMongoError as e:
+        # 响应已经开始，只能在流中输出错误
+        logger.error(f"流式输出过程中数据库查询失败: {e}")
+        yield json_dumps({"error": "数据库查询失败"}) + b"\n"
+    finally:
+        await close_documents(documents)
+
+
+async def json_array_chunks(documents, first: Optional[Dict[str, Any]],
+                            dumps: Callable[[Any], bytes] = json_dumps) -> AsyncIterator[bytes]:
+    """逐条输出JSON数组，与api.json_array_response一致"""
+    yield b"["
+    try:
+        if first is not None:
+            yield dumps(first)
+            async for document in documents:
+                yield b"," + dumps(document)
+    except PyMongoError as e:
+        # 响应已经开始，只能在数组末尾输出错误
+        logger.error(f"流式输出过程中数据库查询失败: {e}")
+        yield b"," + json_dumps({"error": "数据库查询失败"})
+    finally:
+        await close_documents(documents)
+    yield b"]"
+
+
+async def send_event(send: Callable[[Dict[str, Any]], Awaitable[None]], event: str):
+    """发送一条server-sent event"""
+    await send({
+        "type": "http.response.body",
+        "body": event.encode("utf-8"),
+        "more_body": True
+    })
+
+
+async def save_data(request: Request):
+    """
+    保存数据到指定的数据库和集合，与 POST /api/save 一致
+    
+    异步写入队列只在Flask应用中提供，mode=async返回400
+    
+    Returns:
+        Response: 包含操作结果和ID
+    """
+    try:
+        data = request.get_json()
+        mode = endpoints.parse_save(data, request.args)
+        if mode == "async":
+            raise endpoints.RequestError("ASGI入口不支持 mode=async，请使用同步写入或Flask应用")
+        return respond(endpoints.save_result(await get_async_db_manager().save_data(data), mode))
+    except Exception as e:
+        return respond(endpoints.save_error(e))
+
+
+async def patch_data(request: Request):
+    """
+    按uuid局部更新已存在的数据，与 POST /api/patch 一致
+    
+    Returns:
+        Response: 包含操作结果和ID，数据不存在时返回404
+    """
+    try:
+        data = endpoints.require_object(request.get_json())
+        return respond(endpoints.patch_result(await get_async_db_manager().patch_data(data)))
+    except Exception as e:
+        return respond(endpoints.patch_error(e))
+
+
+async def save_batch(request: Request):
+    """
+    批量保存数据，与 POST /api/save/batch 一致
+    
+    Returns:
+        Response: 每条数据的ID、是否新建或错误信息
+    """
+    try:
+        db_manager = get_async_db_manager()
+        items, write_concern = endpoints.parse_batch(request.get_json(), db_manager.config.MAX_BATCH_SIZE)
+        return respond((await db_manager.save_batch(items, write_concern), 200, {}))
+    except Exception as e:
+        return respond(endpoints.batch_error(e))
+
+
+async def search_data(request: Request):
+    """
+    搜索数据，参数与 GET /api/search 一致
+    
+    Returns:
+        Response: 查询结果列表、游标分页对象、NDJSON流或执行计划
+    """
+    try:
+        query_params = request.args
+        endpoints.require_target(query_params)
+        
+        db_manager = get_async_db_manager()
+        if endpoints.is_explain(query_params):
+            return respond((await db_manager.explain_search(query_params), 200, {}))
+        if wants_stream(request, query_params):
+            documents = db_manager.search_stream(query_params)
+            first = await first_document(documents)
+            return StreamingResponse(ndjson_chunks(documents, first), NDJSON_MIMETYPE)
+        
+        return respond(endpoints.search_result(query_params, await db_manager.search_page(query_params)))
+    except Exception as e:
+        return respond(endpoints.search_error(e))
+
+
+async def aggregate(request: Request):
+    """
+    执行聚合管道，参数与 POST /api/aggregate 一致
+    
+    Returns:
+        StreamingResponse: JSON数组，或每行一条结果的NDJSON流
+    """
+    try:
+        data = endpoints.parse_aggregate(request.get_json())
+        documents = await get_async_db_manager().aggregate(data)
+        first = await first_document(documents)
+        
+        if wants_stream(request, data):
+            return StreamingResponse(ndjson_chunks(documents, first, extended_json_dumps), NDJSON_MIMETYPE)
+        return StreamingResponse(json_array_chunks(documents, first, extended_json_dumps), "application/json")
+    except Exception as e:
+        return respond(endpoints.aggregate_error(e))
+
+
+async def watch(request: Request):
+    """
+    订阅集合的变更，参数与 GET /api/watch 一致
+    
+    Returns:
+        EventStreamResponse: server-sent events响应
+    """
+    query_params = request.args
+    db_manager = get_async_db_manager()
+    try:
+        query_params = endpoints.parse_watch(query_params, request.headers.get("last-event-id"))
+        subscription = await db_manager.subscribe_changes(query_params)
+    except Exception as e:
+        return respond(endpoints.watch_error(e, query_params))
+    
+    return EventStreamResponse(subscription, db_manager.change_feeds, get_config().WATCH_HEARTBEAT_INTERVAL,
+                               request.receive)
+
+
+async def health_check(request: Request):
+    """
+    健康检查，与 GET /api/health 一致
+    
+    Returns:
+        Response: 服务状态信息和连接池指标
+    """
+    try:
+        db_manager = get_async_db_manager()
+        await db_manager.ping()
+        return respond(endpoints.health_result(db_manager))
+    except Exception as e:
+        return respond(endpoints.health_error(e))
+
+
+async def live(request: Request):
+    """
+    存活检查，与 GET /api/live 一致，不访问数据库
+    
+    Returns:
+        Response: 进程号和运行时长
+    """
+    return respond(endpoints.live_result())
+
+
+async def ready(request: Request):
+    """
+    就绪检查，与 GET /api/ready 一致，不向MongoDB发送命令
+    
+    Returns:
+        Response: 就绪状态
+    """
+    return respond(endpoints.ready_result(get_async_db_manager().readiness()))
+
+
+async def stats(request: Request):
+    """
+    运行指标，与 GET /api/stats 一致，异步写入队列只在Flask应用中提供，write_behind为null
+    
+    Returns:
+        Response: 运行指标
+    """
+    return respond(endpoints.stats_result(get_async_db_manager()))
+
+
+async def metrics(request: Request):
+    """
+    Prometheus指标，与Flask应用的 GET /metrics 一致
+    
+    Returns:
+        PlainResponse: Prometheus文本格式的指标
+    """
+    body, content_type = generate_metrics()
+    return PlainResponse(body, content_type)
+
+
+# 路由表: 路径 -> {方法: 处理函数}
+ROUTES: Dict[str, Dict[str, Callable[[Request], Awaitable[Any]]]] = {
+    "/api/save": {"POST": save_data},
+    "/api/save/batch": {"POST": save_batch},
+    "/api/patch": {"POST": patch_data},
+    "/api/search": {"GET": search_data},
+    "/api/aggregate": {"POST": aggregate},
+    "/api/watch": {"GET": watch},
+    "/api/health": {"GET": health_check},
+    "/api/live": {"GET": live},
+    "/api/ready": {"GET": ready},
+    "/api/stats": {"GET": stats},
+}
+if get_config().METRICS_ENABLED:
+    ROUTES["/metrics"] = {"GET": metrics}
+
+
+def allowed_methods(handlers: Dict[str, Any]) -> str:
+    """路由支持的方法，用于Allow响应头，与Flask一样GET路由同时支持HEAD"""
+    methods = set(handlers) | {"OPTIONS"}
+    if "GET" in methods:
+        methods.add("HEAD")
+    return ", ".join(sorted(methods))
+
+
+def options_response(request: Request, handlers: Dict[str, Any]) -> PlainResponse:
+    """已存在路由的OPTIONS请求（CORS预检），与Flask-CORS默认配置一致"""
+    return PlainResponse(b"", "text/plain", 200, {
+        "Allow": allowed_methods(handlers),
+        "Access-Control-Allow-Methods": allowed_methods(handlers),
+        "Access-Control-Allow-Headers": request.headers.get("access-control-request-headers", "*")
+    })
+
+
+def compress(request: Request, response):
+    """
+    按Accept-Encoding压缩 /api 下的响应，规则与compression.compress_response一致
+    
+    Args:
+        request: 请求
+        response: 处理函数返回的响应
+    """
+    config = get_app_config()
+    if not config["COMPRESSION_ENABLED"] or not request.path.startswith("/api/"):
+        return
+    if (response.status < 200 or response.status in (204, 304) or request.method == "HEAD"
+            or "Content-Encoding" in response.headers
+            or not is_compressible_mimetype(response.content_type.split(";")[0].strip())):
+        return
+    
+    response.headers["Vary"] = "Accept-Encoding"
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"), config)
+    if encoding is not None:
+        response.compress(encoding, config)
+
+
+def without_body(send: Callable[[Dict[str, Any]], Awaitable[None]]) -> Callable[[Dict[str, Any]], Awaitable[None]]:
+    """HEAD请求只发送响应头，丢弃响应体"""
+    async def send_headers(message: Dict[str, Any]):
+        if message["type"] == "http.response.body":
+            message = {"type": "http.response.body", "body": b"", "more_body": message.get("more_body", False)}
+        await send(message)
+    
+    return send_headers
+
+
+async def read_body(receive: Callable[[], Awaitable[Dict[str, Any]]]) -> bytes:
+    """读取完整的请求体"""
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+async def lifespan(receive, send):
+    """处理ASGI生命周期事件，启动时在后台预热数据库连接，关闭时释放数据库连接"""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            get_async_db_manager().start_warmup()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            global _async_db_manager
+            if _async_db_manager:
+                await _async_db_manager.close()
+                _async_db_manager = None
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """
+    ASGI应用
+    
+    Args:
+        scope: ASGI连接信息
+        receive: 接收消息的协程
+        send: 发送消息的协程
+    """
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    
+    started_at = time.perf_counter()
+    request = Request(scope, await read_body(receive), receive)
+    
+    path = request.path.rstrip("/") or "/"
+    handlers = ROUTES.get(path)
+    if handlers is None:
+        response = Response({"error": "资源不存在"}, 404)
+    elif request.method == "OPTIONS":
+        response = options_response(request, handlers)
+    elif request.method == "HEAD" and "GET" in handlers:
+        response = await handlers["GET"](request)
+    elif request.method not in handlers:
+        response = Response({"error": "请求方法不允许"}, 405, {"Allow": allowed_methods(handlers)})
+    else:
+        response = await handlers[request.method](request)
+    compress(request, response)
+    
+    if request.method == "HEAD":
+        send = without_body(send)
+    
+    if "/metrics" not in ROUTES:
+        await response.send(send)
+        return
+    
+    # 统计实际发送的响应体字节数，流式响应发送完毕后才记录耗时
+    sent = [0]
+    
+    async def send_with_metrics(message: Dict[str, Any]):
+        if message["type"] == "http.response.body":
+            sent[0] += len(message.get("body", b""))
+        await send(message)
+    
+    await response.send(send_with_metrics)
+    observe_request(request.method, path if handlers is not None else "unmatched", response.status,
+                    time.perf_counter() - started_at, len(request.body), sent[0])
+
+
+def main():
+    """主函数，使用uvicorn启动ASGI应用"""
+    import uvicorn
+    
+    config = get_config()
+    logging.basicConfig(
+        level=getattr(logging, config.LOG_LEVEL),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    logging.info(f"启动ASGI应用 - 主机: {config.HOST}, 端口: {config.PORT}")
+    uvicorn.run("asgi:app", host=config.HOST, port=config.PORT, log_level=config.LOG_LEVEL.lower())
+
+
+if __name__ == "__main__":
+    main()
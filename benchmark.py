@@ -0,0 +1,356 @@
+"""
+性能基准测试
+
+通过create_app创建Flask应用，连接本地mongod或进程内的mongomock，
+按配置的比例发送 /api/save 和 /api/search 请求，组合不同的文档大小、集合大小和并发数，
+输出每组场景的吞吐量和p50/p95/p99延迟（JSON），用于对比database.py等改动前后的性能。
+
+请求通过Flask测试客户端在进程内发出，不经过HTTP服务器，测量的是应用和数据库部分的开销。
+
+使用方式:
+    python benchmark.py --mongomock --requests 2000
+    python benchmark.py --mongo-uri mongodb://localhost:27017/ \\
+        --concurrency 1,8,32 --doc-size 256,4096 --collection-size 1000,100000 \\
+        --mix save=1,update=1,search=6,scan=2 --output results.json
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import string
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+# 支持的操作:
+#   save   - 保存新文档
+#   update - 按uuid更新已有文档
+#   search - 按uuid查询单条文档
+#   scan   - 按created_at倒序查询最近的文档
+OPERATIONS = ("save", "update", "search", "scan")
+
+BENCHMARK_DB = "benchmark"
+PRELOAD_BATCH_SIZE = 1000
+
+
+def parse_int_list(value: str) -> List[int]:
+    """解析逗号分隔的整数列表"""
+    try:
+        numbers = [int(item) for item in value.split(",") if item.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的整数列表: {value}")
+    if not numbers or any(number < 0 for number in numbers):
+        raise argparse.ArgumentTypeError(f"无效的整数列表: {value}")
+    return numbers
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """
+    解析操作比例，如 "save=1,search=4"
+    
+    Args:
+        value: 操作比例字符串
+        
+    Returns:
+        Dict[str, float]: 操作 -> 权重
+    """
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"未知的操作: {name}，可选: {', '.join(OPERATIONS)}")
+        try:
+            mix[name] = float(weight) if weight else 1.0
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"无效的权重: {item}")
+        if mix[name] < 0:
+            raise argparse.ArgumentTypeError(f"无效的权重: {item}")
+    if not sum(mix.values()):
+        raise argparse.ArgumentTypeError("操作比例不能全部为0")
+    return mix
+
+
+def percentile(sorted_values: List[float], percent: float) -> float:
+    """
+    计算百分位数（最近秩法）
+    
+    Args:
+        sorted_values: 已排序的数值
+        percent: 百分位，0-100
+        
+    Returns:
+        float: 百分位数，没有数据时返回0
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(percent * len(sorted_values) / 100), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: List[float], duration: float) -> Dict[str, Any]:
+    """
+    汇总延迟统计
+    
+    Args:
+        latencies: 每个请求的延迟（秒）
+        duration: 总耗时（秒）
+        
+    Returns:
+        Dict[str, Any]: 请求数、吞吐量和延迟分位数（毫秒）
+    """
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "throughput": round(len(values) / duration, 2) if duration else 0.0,
+        "latency_ms": {
+            "mean": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+            "p50": round(percentile(values, 50) * 1000, 3),
+            "p95": round(percentile(values, 95) * 1000, 3),
+            "p99": round(percentile(values, 99) * 1000, 3),
+            "max": round(values[-1] * 1000, 3) if values else 0.0
+        }
+    }
+
+
+def make_payload(rng: random.Random, doc_size: int) -> str:
+    """生成指定长度的随机字符串"""
+    return "".join(rng.choices(string.ascii_letters + string.digits, k=doc_size))
+
+
+class Scenario:
+    """一组基准测试场景：固定的文档大小、集合大小和并发数"""
+    
+    def __init__(self, app, db_manager, args: argparse.Namespace,
+                 concurrency: int, doc_size: int, collection_size: int):
+        """
+        初始化场景
+        
+        Args:
+            app: Flask应用
+            db_manager: 数据库管理器，用于预置数据和清理
+            args: 命令行参数
+            concurrency: 并发线程数
+            doc_size: 文档内容大小（字节）
+            collection_size: 预置文档数
+        """
+        self.app = app
+        self.db_manager = db_manager
+        self.args = args
+        self.concurrency = concurrency
+        self.doc_size = doc_size
+        self.collection_size = collection_size
+        self.collection_name = f"bench_{collection_size}_{doc_size}"
+        self.uuids: List[str] = []
+        self.operations = list(args.mix)
+        self.weights = [args.mix[name] for name in self.operations]
+    
+    def preload(self):
+        """清空集合并预置文档，文档结构与 /api/save 写入的一致"""
+        collection = self.db_manager.get_collection(BENCHMARK_DB, self.collection_name)
+        collection.drop()
+        # 重新建立索引（自动索引每个进程每个集合只创建一次，集合删除后需要重置）
+        self.db_manager.indexed_collections.clear()
+        
+        rng = random.Random(self.args.seed)
+        now = int(time.time() * 1000)
+        self.uuids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(self.collection_size)]
+        for start in range(0, self.collection_size, PRELOAD_BATCH_SIZE):
+            documents = [{
+                "uuid": document_id,
+                "category": rng.randrange(100),
+                "payload": make_payload(rng, self.doc_size),
+                "created_at": now - self.collection_size + start + offset,
+                "updated_at": now - self.collection_size + start + offset
+            } for offset, document_id in enumerate(self.uuids[start:start + PRELOAD_BATCH_SIZE])]
+            collection.insert_many(documents, ordered=False)
+        self.db_manager.ensure_indexes(BENCHMARK_DB, self.collection_name)
+    
+    def cleanup(self):
+        """删除场景使用的集合"""
+        if not self.args.keep:
+            self.db_manager.get_collection(BENCHMARK_DB, self.collection_name).drop()
+    
+    def request(self, client, rng: random.Random, operation: str):
+        """
+        发送一个请求
+        
+        Returns:
+            Response: 响应
+        """
+        if operation in ("save", "update"):
+            body = {
+                "db_name": BENCHMARK_DB,
+                "collection_name": self.collection_name,
+                "content": json.dumps({
+                    "category": rng.randrange(100),
+                    "payload": make_payload(rng, self.doc_size)
+                })
+            }
+            if operation == "update" and self.uuids:
+                body["uuid"] = rng.choice(self.uuids)
+            return client.post("/api/save", json=body)
+        
+        params = {"db_name": BENCHMARK_DB, "collection_name": self.collection_name}
+        if operation == "search" and self.uuids:
+            params["uuid"] = rng.choice(self.uuids)
+        else:
+            params["conditions"] = "{}"
+            params["limit"] = str(self.args.scan_limit)
+        return client.get("/api/search", query_string=params)
+    
+    def run(self) -> Dict[str, Any]:
+        """
+        运行场景
+        
+        Returns:
+            Dict[str, Any]: 场景参数和统计结果
+        """
+        self.preload()
+        try:
+            self._run_requests(self.args.warmup, random.Random(self.args.seed + 1))
+            started_at = time.perf_counter()
+            results = self._run_requests(self.args.requests, random.Random(self.args.seed + 2))
+            duration = time.perf_counter() - started_at
+        finally:
+            self.cleanup()
+        
+        latencies = [latency for _, latency, _ in results]
+        summary = summarize(latencies, duration)
+        summary["operations"] = {
+            operation: summarize([latency for name, latency, _ in results if name == operation], duration)
+            for operation in self.operations
+        }
+        return {
+            "concurrency": self.concurrency,
+            "doc_size": self.doc_size,
+            "collection_size": self.collection_size,
+            "duration_s": round(duration, 3),
+            "errors": sum(1 for _, _, ok in results if not ok),
+            **summary
+        }
+    
+    def _run_requests(self, total: int, rng: random.Random) -> List[Tuple[str, float, bool]]:
+        """
+        使用concurrency个线程发送total个请求
+        
+        每个线程使用自己的测试客户端和随机数生成器，请求序列由seed决定，可重复
+        
+        Returns:
+            List[Tuple[str, float, bool]]: (操作, 延迟秒数, 是否成功)
+        """
+        plan = rng.choices(self.operations, weights=self.weights, k=total)
+        seeds = [rng.getrandbits(32) for _ in range(self.concurrency)]
+        results: List[List[Tuple[str, float, bool]]] = [[] for _ in range(self.concurrency)]
+        barrier = threading.Barrier(self.concurrency)
+        
+        def worker(index: int):
+            client = self.app.test_client()
+            worker_rng = random.Random(seeds[index])
+            barrier.wait()
+            for operation in plan[index::self.concurrency]:
+                started_at = time.perf_counter()
+                with self.request(client, worker_rng, operation) as response:
+                    response.get_data()
+                    ok = response.status_code == 200
+                results[index].append((operation, time.perf_counter() - started_at, ok))
+        
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return [result for worker_results in results for result in worker_results]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(description="MongoDB Tools 性能基准测试")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--mongo-uri", help="MongoDB连接地址，默认使用 MONGO_URI 环境变量")
+    target.add_argument("--mongomock", action="store_true", help="使用进程内的mongomock代替mongod")
+    parser.add_argument("--config", default="production", help="应用配置名称，默认production（WARNING日志）")
+    parser.add_argument("--concurrency", type=parse_int_list, default=[1, 8], help="并发线程数列表，默认 1,8")
+    parser.add_argument("--doc-size", type=parse_int_list, default=[256], help="文档内容大小（字节）列表，默认 256")
+    parser.add_argument("--collection-size", type=parse_int_list, default=[1000],
+                        help="预置文档数列表，默认 1000")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("save=1,update=1,search=6,scan=2"),
+                        help=f"操作比例，可选操作: {', '.join(OPERATIONS)}，默认 save=1,update=1,search=6,scan=2")
+    parser.add_argument("--requests", type=int, default=1000, help="每个场景的请求数，默认1000")
+    parser.add_argument("--warmup", type=int, default=100, help="每个场景正式计时前的预热请求数，默认100")
+    parser.add_argument("--scan-limit", type=int, default=20, help="scan操作每次返回的文档数，默认20")
+    parser.add_argument("--seed", type=int, default=42, help="随机数种子，默认42")
+    parser.add_argument("--keep", action="store_true", help="保留测试集合，不在结束后删除")
+    parser.add_argument("--output", help="结果输出文件，默认输出到标准输出")
+    return parser
+
+
+def main(argv=None):
+    """主函数"""
+    args = build_parser().parse_args(argv)
+    
+    # 配置在导入时读取环境变量，需要在导入应用之前设置
+    os.environ["FLASK_ENV"] = args.config
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+    
+    import pymongo
+    import database
+    from app import close_db_manager, create_app, get_db_manager
+    
+    if args.mongomock:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("使用 --mongomock 需要先安装: pip install mongomock")
+        database.MongoClient = mongomock.MongoClient
+    
+    app = create_app(args.config)
+    db_manager = get_db_manager()
+    
+    results = []
+    try:
+        for collection_size in args.collection_size:
+            for doc_size in args.doc_size:
+                for concurrency in args.concurrency:
+                    scenario = Scenario(app, db_manager, args, max(concurrency, 1), doc_size, collection_size)
+                    result = scenario.run()
+                    print(f"concurrency={result['concurrency']} doc_size={doc_size} "
+                          f"collection_size={collection_size}: {result['throughput']} req/s, "
+                          f"p50={result['latency_ms']['p50']}ms p99={result['latency_ms']['p99']}ms, "
+                          f"errors={result['errors']}", file=sys.stderr)
+                    results.append(result)
+    finally:
+        close_db_manager()
+    
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "backend": "mongomock" if args.mongomock else "mongod",
+            "python": platform.python_version(),
+            "pymongo": pymongo.version,
+            "config": args.config,
+            "search_cache": db_manager.config.SEARCH_CACHE_ENABLED,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "mix": args.mix,
+            "seed": args.seed
+        },
+        "results": results
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
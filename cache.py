@@ -0,0 +1,396 @@
+"""
+查询缓存模块
+为搜索结果提供进程内的LRU缓存，支持按条目数和字节数限制、按集合设置TTL以及写入失效；
+并合并同时进行的相同查询（single-flight）
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+import bson
+from bson import json_util
+
+
+class QueryCache:
+    """
+    搜索结果缓存
+    
+    以规范化后的查询为键缓存结果，超过条目数或字节数上限时淘汰最久未使用的条目。
+    每个集合维护一个版本号，写入时递增版本号并删除该集合的缓存，
+    写入前开始、写入后才完成的查询结果不会再被放入缓存。
+    """
+    
+    def __init__(self, max_entries: int, max_bytes: int, default_ttl: float,
+                 collection_ttls: Optional[Dict[str, float]] = None):
+        """
+        初始化缓存
+        
+        Args:
+            max_entries: 最大条目数
+            max_bytes: 缓存结果的最大总字节数（按BSON大小估算）
+            default_ttl: 默认过期时间（秒）
+            collection_ttls: 按集合设置的过期时间，键为 "db_name.collection_name"，0表示不缓存
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.collection_ttls = collection_ttls or {}
+        
+        self._lock = threading.Lock()
+        # 键 -> (集合, 过期时间, 字节数, 结果)
+        self._entries: "OrderedDict[str, Tuple[Tuple[str, str], float, int, Any]]" = OrderedDict()
+        self._keys_by_collection: Dict[Tuple[str, str], Set[str]] = {}
+        self._versions: Dict[Tuple[str, str], int] = {}
+        self._bytes = 0
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+    
+    @staticmethod
+    def make_key(query: Dict[str, Any]) -> str:
+        """
+        根据查询生成缓存键
+        
+        Args:
+            query: 规范化后的查询（包含数据库、集合、条件、排序、分页等）
+            
+        Returns:
+            str: 缓存键
+        """
+        return json_util.dumps(query, json_options=json_util.CANONICAL_JSON_OPTIONS)
+    
+    def get_ttl(self, db_name: str, collection_name: str) -> float:
+        """
+        获取集合的缓存过期时间
+        
+        Args:
+            db_name: 数据库名称
+            collection_name: 集合名称
+            
+        Returns:
+            float: 过期时间（秒），0表示不缓存
+        """
+        return self.collection_ttls.get(f"{db_name}.{collection_name}", self.default_ttl)
+    
+    def get_version(self, db_name: str, collection_name: str) -> int:
+        """
+        获取集合当前的版本号，查询前读取，放入缓存时校验
+        
+        Args:
+            db_name: 数据库名称
+            collection_name: 集合名称
+            
+        Returns:
+            int: 版本号
+        """
+        with self._lock:
+            return self._versions.get((db_name, collection_name), 0)
+    
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """
+        读取缓存
+        
+        Args:
+            key: 缓存键
+            
+        Returns:
+            Tuple[bool, Any]: (是否命中, 缓存结果)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            
+            if entry[1] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[3]
+    
+    def put(self, key: str, db_name: str, collection_name: str, value: Any, version: int):
+        """
+        写入缓存
+        
+        Args:
+            key: 缓存键
+            db_name: 数据库名称
+            collection_name: 集合名称
+            value: 查询结果
+            version: 查询开始前读取的集合版本号，与当前版本不一致时不写入
+        """
+        ttl = self.get_ttl(db_name, collection_name)
+        if ttl <= 0:
+            return
+        
+        size = len(key) + self._estimate_size(value)
+        if size > self.max_bytes:
+            return
+        
+        collection = (db_name, collection_name)
+        with self._lock:
+            if self._versions.get(collection, 0) != version:
+                return
+            
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (collection, time.monotonic() + ttl, size, value)
+            self._keys_by_collection.setdefault(collection, set()).add(key)
+            self._bytes += size
+            
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+    
+    def invalidate(self, db_name: str, collection_name: str):
+        """
+        使集合的全部缓存失效
+        
+        Args:
+            db_name: 数据库名称
+            collection_name: 集合名称
+        """
+        collection = (db_name, collection_name)
+        with self._lock:
+            self._versions[collection] = self._versions.get(collection, 0) + 1
+            for key in list(self._keys_by_collection.get(collection, ())):
+                self._remove(key)
+                self.invalidations += 1
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_collection.clear()
+            self._bytes = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+        
+        Returns:
+            Dict[str, Any]: 命中、未命中、淘汰等统计
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations
+            }
+    
+    def _remove(self, key: str):
+        """删除条目（调用方需持有锁）"""
+        collection, _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        keys = self._keys_by_collection.get(collection)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_collection[collection]
+    
+    @staticmethod
+    def _estimate_size(value: Any) -> int:
+        """按BSON编码大小估算结果占用的字节数"""
+        if isinstance(value, dict):
+            value = value.get("data", [])
+        return sum(len(bson.encode(document)) for document in value if isinstance(document, dict))
+
+
+class _Call:
+    """进行中的查询"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    合并同时进行的相同查询
+    
+    同一个键的查询正在执行时，后到的调用方等待并共享其结果（或异常），不再单独查询。
+    集合被写入后递增代数，写入之后发起的查询不会合并到写入之前开始的查询上。
+    """
+    
+    def __init__(self):
+        """初始化"""
+        self._lock = threading.Lock()
+        self._calls: Dict[Tuple[str, int], _Call] = {}
+        self._generations: Dict[Tuple[str, str], int] = {}
+        
+        self.executed = 0
+        self.coalesced = 0
+    
+    def do(self, key: str, db_name: str, collection_name: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        执行查询，相同的查询正在进行时等待其结果
+        
+        Args:
+            key: 查询键（通常为QueryCache.make_key的结果）
+            db_name: 数据库名称
+            collection_name: 集合名称
+            fn: 实际执行查询的函数
+            
+        Returns:
+            Tuple[Any, bool]: (查询结果, 是否与其他请求合并)
+        """
+        with self._lock:
+            flight_key = (key, self._generations.get((db_name, collection_name), 0))
+            call = self._calls.get(flight_key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[flight_key] = call
+                self.executed += 1
+            else:
+                self.coalesced += 1
+        
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(flight_key, None)
+            call.done.set()
+    
+    def invalidate(self, db_name: str, collection_name: str):
+        """
+        集合被写入后调用，之后的查询不再合并到进行中的查询上
+        
+        Args:
+            db_name: 数据库名称
+            collection_name: 集合名称
+        """
+        collection = (db_name, collection_name)
+        with self._lock:
+            self._generations[collection] = self._generations.get(collection, 0) + 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取合并统计
+        
+        Returns:
+            Dict[str, Any]: 进行中的查询数、实际执行和被合并的请求数
+        """
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "executed": self.executed,
+                "coalesced": self.coalesced
+            }
+
+
+class AsyncSingleFlight:
+    """
+    在事件循环中合并同时进行的相同查询，规则与SingleFlight一致
+    
+    只在创建它的事件循环中使用，不需要加锁；等待方被取消不影响进行中的查询，
+    执行查询的请求被取消时，等待方重新发起查询
+    """
+    
+    def __init__(self):
+        """初始化"""
+        self._calls: Dict[Tuple[str, int], asyncio.Future] = {}
+        self._generations: Dict[Tuple[str, str], int] = {}
+        
+        self.executed = 0
+        self.coalesced = 0
+    
+    async def do(self, key: str, db_name: str, collection_name: str,
+                 fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        执行查询，相同的查询正在进行时等待其结果
+        
+        Args:
+            key: 查询键（通常为QueryCache.make_key的结果）
+            db_name: 数据库名称
+            collection_name: 集合名称
+            fn: 实际执行查询的协程函数
+            
+        Returns:
+            Tuple[Any, bool]: (查询结果, 是否与其他请求合并)
+        """
+        while True:
+            flight_key = (key, self._generations.get((db_name, collection_name), 0))
+            future = self._calls.get(flight_key)
+            if future is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+        
+        future = asyncio.get_running_loop().create_future()
+        self._calls[flight_key] = future
+        self.executed += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有等待方时不记录"exception was never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            if self._calls.get(flight_key) is future:
+                del self._calls[flight_key]
+    
+    def invalidate(self, db_name: str, collection_name: str):
+        """
+        集合被写入后调用，之后的查询不再合并到进行中的查询上
+        
+        Args:
+            db_name: 数据库名称
+            collection_name: 集合名称
+        """
+        collection = (db_name, collection_name)
+        self._generations[collection] = self._generations.get(collection, 0) + 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取合并统计
+        
+        Returns:
+            Dict[str, Any]: 进行中的查询数、实际执行和被合并的请求数
+        """
+        return {
+            "in_flight": len(self._calls),
+            "executed": self.executed,
+            "coalesced": self.coalesced
+        }
@@ -0,0 +1,717 @@
+"""
+变更推送模块
+通过MongoDB变更流（change stream）把集合的插入和更新以server-sent events推送给客户端。
+每个进程对每个集合只打开一个变更流，由该集合的全部订阅者共享，订阅者的$match条件在进程内逐条匹配；
+从恢复令牌继续订阅时需要读取历史位置，为该订阅者单独打开变更流。
+"""
+
+import asyncio
+import logging
+import queue
+import re
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from serialization import JSONDecodeError, dumps, dumps_extended, loads
+
+logger = logging.getLogger(__name__)
+
+# 推送的变更类型
+WATCH_OPERATIONS = ("insert", "update", "replace")
+
+# 变更流每次getMore在服务端等待新事件的最长毫秒数，也是后台读取检查停止信号的间隔
+WATCH_MAX_AWAIT_MS = 1000
+
+# 推送给客户端的变更事件字段
+EVENT_FIELDS = ("operationType", "ns", "documentKey", "fullDocument", "updateDescription", "clusterTime")
+
+# 订阅的$match条件支持的操作符
+MATCH_OPERATORS = ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin", "$exists")
+
+_MISSING = object()
+
+
+class SubscriptionClosed(Exception):
+    """订阅已结束，参数为错误原因（正常关闭时为None）"""
+
+
+class TooManySubscribers(Exception):
+    """当前进程的订阅者或单独打开的变更流已达到上限"""
+
+
+def parse_match(match: Any) -> Dict[str, Any]:
+    """
+    解析并校验订阅的$match条件
+    
+    条件作用于变更事件，如 {"operationType": "insert", "fullDocument.type": "log"}；
+    支持字段等值、$eq、$ne、$gt、$gte、$lt、$lte、$in、$nin、$exists以及$and、$or
+    
+    Args:
+        match: JSON对象或其字符串形式，为空时不过滤
+        
+    Returns:
+        Dict[str, Any]: 条件
+        
+    Raises:
+        ValueError: 条件格式无效或包含不支持的操作符
+    """
+    if match in (None, ""):
+        return {}
+    if isinstance(match, str):
+        try:
+            match = loads(match)
+        except JSONDecodeError:
+            raise ValueError("match 必须是JSON对象")
+    if not isinstance(match, dict):
+        raise ValueError("match 必须是JSON对象")
+    _validate_match(match)
+    return match
+
+
+def _validate_match(match: Dict[str, Any]):
+    """递归校验$match条件"""
+    for key, condition in match.items():
+        if key in ("$and", "$or"):
+            if not isinstance(condition, list) or not condition or not all(isinstance(item, dict) for item in condition):
+                raise ValueError(f"match 中的 {key} 必须是非空的对象数组")
+            for clause in condition:
+                _validate_match(clause)
+        elif key.startswith("$"):
+            raise ValueError(f"match 不支持的操作符: {key}")
+        elif _is_operator_condition(condition):
+            for operator, value in condition.items():
+                if operator not in MATCH_OPERATORS:
+                    raise ValueError(f"match 不支持的操作符: {operator}")
+                if operator in ("$in", "$nin") and not isinstance(value, list):
+                    raise ValueError(f"match 中的 {operator} 必须是数组")
+
+
+def _is_operator_condition(condition: Any) -> bool:
+    """判断字段条件是否为操作符条件（如 {"$gt": 1}）而不是等值比较的对象"""
+    return isinstance(condition, dict) and bool(condition) and all(key.startswith("$") for key in condition)
+
+
+def _lookup(document: Any, path: str) -> Any:
+    """按点分路径读取字段，不存在时返回_MISSING"""
+    value = document
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return _MISSING
+        value = value[key]
+    return value
+
+
+def _candidates(value: Any) -> List[Any]:
+    """与MongoDB一致，数组字段既按整体比较，也按其中的每个元素比较"""
+    return [value] + value if isinstance(value, list) else [value]
+
+
+def _equals(value: Any, expected: Any) -> bool:
+    """等值比较，条件为null时也匹配不存在的字段"""
+    if value is _MISSING:
+        return expected is None
+    return any(candidate == expected for candidate in _candidates(value))
+
+
+def _compare(value: Any, operator: str, expected: Any) -> bool:
+    """大小比较，类型无法比较时视为不匹配"""
+    if value is _MISSING:
+        return False
+    for candidate in _candidates(value):
+        try:
+            if ((operator == "$gt" and candidate > expected) or (operator == "$gte" and candidate >= expected)
+                    or (operator == "$lt" and candidate < expected) or (operator == "$lte" and candidate <= expected)):
+                return True
+        except TypeError:
+            continue
+    return False
+
+
+def _field_matches(value: Any, condition: Any) -> bool:
+    """判断字段值是否满足条件"""
+    if not _is_operator_condition(condition):
+        return _equals(value, condition)
+    for operator, expected in condition.items():
+        if operator == "$eq":
+            matched = _equals(value, expected)
+        elif operator == "$ne":
+            matched = not _equals(value, expected)
+        elif operator == "$in":
+            matched = any(_equals(value, item) for item in expected)
+        elif operator == "$nin":
+            matched = not any(_equals(value, item) for item in expected)
+        elif operator == "$exists":
+            matched = (value is not _MISSING) == bool(expected)
+        else:
+            matched = _compare(value, operator, expected)
+        if not matched:
+            return False
+    return True
+
+
+def matches(event: Dict[str, Any], match: Dict[str, Any]) -> bool:
+    """
+    判断变更事件是否满足parse_match解析的条件
+    
+    Args:
+        event: 变更事件
+        match: 条件
+        
+    Returns:
+        bool: 是否匹配
+    """
+    for key, condition in match.items():
+        if key == "$and":
+            matched = all(matches(event, clause) for clause in condition)
+        elif key == "$or":
+            matched = any(matches(event, clause) for clause in condition)
+        else:
+            matched = _field_matches(_lookup(event, key), condition)
+        if not matched:
+            return False
+    return True
+
+
+def parse_resume_token(token: Optional[str]) -> Optional[Dict[str, str]]:
+    """
+    解析客户端传回的恢复令牌（即事件的id）
+    
+    Args:
+        token: 十六进制字符串，为空时返回None
+        
+    Returns:
+        Optional[Dict[str, str]]: 变更流的resume_after参数
+        
+    Raises:
+        ValueError: 令牌格式无效
+    """
+    if not token:
+        return None
+    if not re.fullmatch(r"[0-9A-Fa-f]+", token):
+        raise ValueError("无效的 resume_after 参数")
+    return {"_data": token}
+
+
+def format_event(change: Dict[str, Any]) -> str:
+    """
+    把变更事件格式化为一条server-sent event
+    
+    事件的id为恢复令牌，客户端断线重连时通过Last-Event-ID请求头或resume_after参数传回；
+    数据为宽松模式的MongoDB Extended JSON
+    
+    Args:
+        change: 变更事件
+        
+    Returns:
+        str: event为change的SSE消息
+    """
+    payload = {field: change[field] for field in EVENT_FIELDS if field in change}
+    return f"id: {change['_id']['_data']}\nevent: change\ndata: {dumps_extended(payload)}\n\n"
+
+
+def format_error(message: str) -> str:
+    """把订阅结束的原因格式化为event为error的SSE消息"""
+    return f"event: error\ndata: {dumps({'error': message})}\n\n"
+
+
+class Subscription:
+    """订阅者：按$match条件过滤后等待推送的变更事件"""
+    
+    def __init__(self, match: Dict[str, Any], queue_size: int):
+        """
+        初始化订阅
+        
+        Args:
+            match: parse_match解析的条件
+            queue_size: 等待推送的事件数上限，超过时结束订阅，客户端可从最后收到的事件恢复
+        """
+        self.match = match
+        self.feed: Optional["ChangeFeed"] = None
+        self.closed = False
+        self.error: Optional[str] = None
+        self._queue = self._create_queue(queue_size)
+    
+    @staticmethod
+    def _create_queue(queue_size: int):
+        """创建事件队列"""
+        return queue.Queue(queue_size)
+    
+    def deliver(self, change: Dict[str, Any]) -> bool:
+        """
+        放入一条变更事件，不满足条件的事件直接忽略
+        
+        Returns:
+            bool: 队列已满时返回False
+        """
+        if self.match and not matches(change, self.match):
+            return True
+        try:
+            self._queue.put_nowait(change)
+            return True
+        except (queue.Full, asyncio.QueueFull):
+            return False
+    
+    def close(self, error: Optional[str] = None):
+        """结束订阅，已放入队列的事件仍会被读取"""
+        if self.closed:
+            return
+        self.closed = True
+        self.error = error
+        try:
+            # 唤醒等待中的读取；队列已满时读取方在读完事件、等待超时后发现订阅已结束
+            self._queue.put_nowait(None)
+        except (queue.Full, asyncio.QueueFull):
+            pass
+    
+    def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        等待下一条变更事件
+        
+        Args:
+            timeout: 最长等待秒数
+            
+        Returns:
+            Optional[Dict[str, Any]]: 变更事件，超时时返回None
+            
+        Raises:
+            SubscriptionClosed: 订阅已结束且事件已读完
+        """
+        try:
+            change = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            change = None
+            if not self.closed:
+                return None
+        if change is None:
+            raise SubscriptionClosed(self.error)
+        return change
+
+
+class AsyncSubscription(Subscription):
+    """在事件循环中等待推送的订阅者"""
+    
+    @staticmethod
+    def _create_queue(queue_size: int):
+        """创建事件队列"""
+        return asyncio.Queue(queue_size)
+    
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """等待下一条变更事件，与Subscription.get一致"""
+        try:
+            change = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            change = None
+            if not self.closed:
+                return None
+        if change is None:
+            raise SubscriptionClosed(self.error)
+        return change
+
+
+class ChangeFeed:
+    """一个变更流及其订阅者，在后台线程中读取变更流并分发"""
+    
+    subscription_class = Subscription
+    
+    def __init__(self, name: str, stream: Any, queue_size: int):
+        """
+        初始化
+        
+        Args:
+            name: 集合的 "db_name.collection_name"
+            stream: 已打开的变更流
+            queue_size: 每个订阅者等待推送的事件数上限，也是保留的最近事件数
+        """
+        self.name = name
+        self.queue_size = queue_size
+        self.events = 0
+        # 最近分发的事件，断线重连的订阅者从这里补发而不单独打开变更流
+        self._recent: deque = deque(maxlen=queue_size)
+        self._stream = stream
+        self._subscribers: Set[Subscription] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._runner: Any = None
+    
+    @property
+    def running(self) -> bool:
+        """变更流是否仍在读取"""
+        return not self._stop.is_set()
+    
+    @property
+    def subscriber_count(self) -> int:
+        """订阅者数"""
+        with self._lock:
+            return len(self._subscribers)
+    
+    def subscribe(self, match: Dict[str, Any]) -> Subscription:
+        """添加订阅者"""
+        subscription = self.subscription_class(match, self.queue_size)
+        subscription.feed = self
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+    
+    def resume(self, match: Dict[str, Any], resume_after: Dict[str, str]) -> Optional[Subscription]:
+        """
+        从最近分发的事件恢复订阅：补发恢复令牌之后的事件并加入订阅者
+        
+        Args:
+            match: parse_match解析的条件
+            resume_after: 恢复令牌
+            
+        Returns:
+            Optional[Subscription]: 订阅，令牌不在最近的事件中时返回None
+        """
+        token = resume_after.get("_data")
+        with self._lock:
+            # 与dispatch持有同一把锁，补发的事件与之后分发的事件不重复也不遗漏
+            changes = list(self._recent)
+            for index in range(len(changes) - 1, -1, -1):
+                if changes[index]["_id"].get("_data") == token:
+                    break
+            else:
+                return None
+            subscription = self.subscription_class(match, self.queue_size)
+            subscription.feed = self
+            for change in changes[index + 1:]:
+                subscription.deliver(change)
+            self._subscribers.add(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription: Subscription) -> int:
+        """
+        移除订阅者
+        
+        Returns:
+            int: 剩余的订阅者数
+        """
+        with self._lock:
+            self._subscribers.discard(subscription)
+            return len(self._subscribers)
+    
+    def start(self):
+        """在后台线程中开始读取"""
+        self._runner = threading.Thread(target=self._run, name=f"change-feed-{self.name}", daemon=True)
+        self._runner.start()
+    
+    def stop(self):
+        """停止读取，后台线程在当前getMore返回后关闭变更流"""
+        self._stop.set()
+    
+    def dispatch(self, change: Dict[str, Any]):
+        """把一条变更事件分发给全部订阅者，事件队列已满的订阅者被结束"""
+        self.events += 1
+        with self._lock:
+            self._recent.append(change)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if not subscription.deliver(change):
+                logger.warning(f"订阅者处理过慢，事件队列已满，结束订阅，集合: {self.name}")
+                self.unsubscribe(subscription)
+                subscription.close("事件积压过多，请使用最后收到的事件id重新订阅")
+    
+    def close_subscribers(self, error: Optional[str] = None):
+        """结束全部订阅"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._subscribers.clear()
+        for subscription in subscribers:
+            subscription.close(error)
+    
+    def _run(self):
+        """读取变更流直到停止、变更流失效或出错"""
+        error = None
+        try:
+            while not self._stop.is_set():
+                change = self._stream.try_next()
+                if change is not None:
+                    self.dispatch(change)
+                elif not self._stream.alive:
+                    error = "变更流已结束（集合可能已被删除或重命名）"
+                    break
+        except Exception as e:
+            # 停止后连接可能已关闭，此时的错误不需要记录
+            if not self._stop.is_set():
+                logger.error(f"读取变更流失败，集合: {self.name}, 错误: {e}")
+                error = "读取变更流失败"
+        finally:
+            self._stop.set()
+            self.close_subscribers(error)
+            try:
+                self._stream.close()
+            except Exception as e:
+                logger.debug(f"关闭变更流失败，集合: {self.name}, 错误: {e}")
+
+
+class AsyncChangeFeed(ChangeFeed):
+    """在事件循环中读取变更流的ChangeFeed"""
+    
+    subscription_class = AsyncSubscription
+    
+    def start(self):
+        """在当前事件循环中开始读取"""
+        self._runner = asyncio.get_running_loop().create_task(self._run())
+    
+    def stop(self):
+        """停止读取并取消等待中的getMore"""
+        self._stop.set()
+        if self._runner is not None:
+            self._runner.cancel()
+    
+    async def _run(self):
+        """读取变更流直到停止、变更流失效或出错"""
+        error = None
+        try:
+            while not self._stop.is_set():
+                change = await self._stream.try_next()
+                if change is not None:
+                    self.dispatch(change)
+                elif not self._stream.alive:
+                    error = "变更流已结束（集合可能已被删除或重命名）"
+                    break
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            if not self._stop.is_set():
+                logger.error(f"读取变更流失败，集合: {self.name}, 错误: {e}")
+                error = "读取变更流失败"
+        finally:
+            self._stop.set()
+            self.close_subscribers(error)
+            try:
+                await self._stream.close()
+            except Exception as e:
+                logger.debug(f"关闭变更流失败，集合: {self.name}, 错误: {e}")
+
+
+class ChangeFeedHub:
+    """
+    按集合共享变更流
+    
+    同一集合的订阅共享一个变更流；最后一个订阅者离开时关闭变更流。
+    带恢复令牌的订阅在令牌仍在共享变更流最近的事件中时加入共享变更流并补发之后的事件，
+    否则单独打开从该位置开始的变更流。
+    """
+    
+    feed_class = ChangeFeed
+    
+    def __init__(self, open_stream: Callable[[str, str, Optional[Dict[str, str]]], Any],
+                 queue_size: int, max_subscribers: int, max_private_feeds: int):
+        """
+        初始化
+        
+        Args:
+            open_stream: 打开变更流的函数，参数为数据库、集合和恢复令牌
+            queue_size: 每个订阅者等待推送的事件数上限
+            max_subscribers: 当前进程的订阅者上限
+            max_private_feeds: 当前进程单独打开（从较早的令牌恢复）的变更流上限
+        """
+        self.open_stream = open_stream
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.max_private_feeds = max_private_feeds
+        self._lock = threading.Lock()
+        self._feeds: Dict[Tuple[str, str], ChangeFeed] = {}
+        self._private_feeds: Set[ChangeFeed] = set()
+    
+    def subscribe(self, db_name: str, collection_name: str, match: Dict[str, Any],
+                  resume_after: Optional[Dict[str, str]] = None) -> Subscription:
+        """
+        订阅集合的变更
+        
+        Args:
+            db_name: 数据库名称
+            collection_name: 集合名称
+            match: parse_match解析的条件
+            resume_after: 恢复令牌，从该事件之后继续推送
+            
+        Returns:
+            Subscription: 订阅
+            
+        Raises:
+            TooManySubscribers: 订阅者或单独打开的变更流已达上限
+            PyMongoError: 打开变更流失败
+        """
+        with self._lock:
+            self._check_capacity(None)
+            subscription = self._join_feed(db_name, collection_name, match, resume_after)
+            if subscription is not None:
+                return subscription
+            self._check_capacity(resume_after)
+        # 打开变更流需要等待服务端响应，不持有锁以免阻塞其他集合的订阅和结束订阅
+        stream = self.open_stream(db_name, collection_name, resume_after)
+        try:
+            with self._lock:
+                # 等待期间其他线程可能已打开同一集合的变更流或占满订阅者
+                self._check_capacity(None)
+                subscription = self._join_feed(db_name, collection_name, match, resume_after)
+                if subscription is None:
+                    self._check_capacity(resume_after)
+                    feed = self.feed_class(f"{db_name}.{collection_name}", stream, self.queue_size)
+                    self._add_feed(db_name, collection_name, feed, resume_after)
+                    stream = None
+                    subscription = feed.subscribe(match)
+                return subscription
+        finally:
+            if stream is not None:
+                stream.close()
+    
+    def release(self, subscription: Subscription):
+        """
+        结束订阅，集合没有其他订阅者时关闭变更流
+        
+        Args:
+            subscription: subscribe返回的订阅
+        """
+        feed = subscription.feed
+        with self._lock:
+            if feed.unsubscribe(subscription) > 0 and feed not in self._private_feeds:
+                return
+            feed.stop()
+            self._private_feeds.discard(feed)
+            for key, shared in list(self._feeds.items()):
+                if shared is feed:
+                    del self._feeds[key]
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取订阅统计
+        
+        Returns:
+            Dict[str, Any]: 共享和单独打开的变更流数、订阅者数、已分发的事件数
+        """
+        with self._lock:
+            feeds = list(self._feeds.values()) + list(self._private_feeds)
+            return {
+                "feeds": len(self._feeds),
+                "private_feeds": len(self._private_feeds),
+                "subscribers": sum(feed.subscriber_count for feed in feeds),
+                "events": sum(feed.events for feed in feeds)
+            }
+    
+    def close(self):
+        """关闭全部变更流并结束订阅"""
+        with self._lock:
+            feeds = list(self._feeds.values()) + list(self._private_feeds)
+            self._feeds.clear()
+            self._private_feeds.clear()
+        for feed in feeds:
+            feed.stop()
+            feed.close_subscribers("服务正在关闭")
+    
+    def _check_capacity(self, resume_after: Optional[Dict[str, str]]):
+        """
+        检查是否还能订阅（调用方需持有锁）
+        
+        resume_after为None时检查订阅者数，否则检查单独打开的变更流数
+        """
+        if resume_after is not None:
+            if len(self._private_feeds) >= self.max_private_feeds:
+                raise TooManySubscribers()
+            return
+        feeds = list(self._feeds.values()) + list(self._private_feeds)
+        if sum(feed.subscriber_count for feed in feeds) >= self.max_subscribers:
+            raise TooManySubscribers()
+    
+    def _join_feed(self, db_name: str, collection_name: str, match: Dict[str, Any],
+                   resume_after: Optional[Dict[str, str]]) -> Optional[Subscription]:
+        """
+        加入集合的共享变更流（调用方需持有锁）
+        
+        Returns:
+            Optional[Subscription]: 订阅，没有共享变更流或恢复令牌已不在最近的事件中时返回None
+        """
+        feed = self._feeds.get((db_name, collection_name))
+        if feed is None or not feed.running:
+            return None
+        if resume_after is None:
+            return feed.subscribe(match)
+        return feed.resume(match, resume_after)
+    
+    def _add_feed(self, db_name: str, collection_name: str, feed: ChangeFeed,
+                  resume_after: Optional[Dict[str, str]]):
+        """登记并启动新打开的变更流（调用方需持有锁）"""
+        if resume_after is None:
+            self._feeds[(db_name, collection_name)] = feed
+        else:
+            self._private_feeds.add(feed)
+        feed.start()
+
+
+class AsyncChangeFeedHub(ChangeFeedHub):
+    """在事件循环中共享变更流的ChangeFeedHub，open_stream为协程函数"""
+    
+    feed_class = AsyncChangeFeed
+    
+    def __init__(self, open_stream: Callable[[str, str, Optional[Dict[str, str]]], Awaitable[Any]],
+                 queue_size: int, max_subscribers: int, max_private_feeds: int):
+        """初始化，参数与ChangeFeedHub一致"""
+        super().__init__(open_stream, queue_size, max_subscribers, max_private_feeds)
+        # (数据库, 集合) -> 正在打开的共享变更流，打开完成（成功或失败）时设置结果
+        self._opening: Dict[Tuple[str, str], asyncio.Future] = {}
+    
+    async def subscribe(self, db_name: str, collection_name: str, match: Dict[str, Any],
+                        resume_after: Optional[Dict[str, str]] = None) -> AsyncSubscription:
+        """
+        订阅集合的变更，与ChangeFeedHub.subscribe一致
+        
+        同一集合只由第一个订阅者打开共享变更流，其余订阅者等待打开完成后加入；
+        等待服务端响应时不阻塞其他集合的订阅
+        """
+        key = (db_name, collection_name)
+        while True:
+            with self._lock:
+                self._check_capacity(None)
+                subscription = self._join_feed(db_name, collection_name, match, resume_after)
+                if subscription is not None:
+                    return subscription
+                self._check_capacity(resume_after)
+                opening = self._opening.get(key) if resume_after is None else None
+                if opening is None:
+                    break
+            # 其他订阅者正在打开同一集合的变更流，打开失败时抛出同样的异常
+            await asyncio.shield(opening)
+        
+        if resume_after is not None:
+            return await self._open_feed(db_name, collection_name, match, resume_after)
+        
+        opening = asyncio.get_running_loop().create_future()
+        with self._lock:
+            self._opening[key] = opening
+        try:
+            subscription = await self._open_feed(db_name, collection_name, match, None)
+        except asyncio.CancelledError:
+            # 由等待的订阅者重新打开
+            opening.set_result(None)
+            raise
+        except Exception as e:
+            opening.set_exception(e)
+            # 没有订阅者等待时避免记录未获取的异常
+            opening.exception()
+            raise
+        else:
+            opening.set_result(None)
+        finally:
+            with self._lock:
+                if self._opening.get(key) is opening:
+                    del self._opening[key]
+        return subscription
+    
+    async def _open_feed(self, db_name: str, collection_name: str, match: Dict[str, Any],
+                         resume_after: Optional[Dict[str, str]]) -> AsyncSubscription:
+        """打开变更流并登记，订阅者已达上限时关闭刚打开的变更流"""
+        stream = await self.open_stream(db_name, collection_name, resume_after)
+        try:
+            with self._lock:
+                # 等待期间其他协程可能已占满订阅者
+                self._check_capacity(None)
+                self._check_capacity(resume_after)
+                feed = self.feed_class(f"{db_name}.{collection_name}", stream, self.queue_size)
+                self._add_feed(db_name, collection_name, feed, resume_after)
+                stream = None
+                return feed.subscribe(match)
+        finally:
+            if stream is not None:
+                await stream.close()
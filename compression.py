@@ -0,0 +1,265 @@
+"""
+响应压缩模块
+根据Accept-Encoding对API响应进行zstd、brotli或gzip压缩。
+普通响应超过大小阈值时整体压缩；流式响应逐块压缩输出，不需要先缓存完整响应体。
+编码协商和压缩器由Flask应用（compress_response）和ASGI入口共用。
+"""
+
+import zlib
+from typing import Any, Iterable, Iterator, List, Mapping, Optional
+
+from flask import Response, request
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli为可选依赖
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard为可选依赖
+    zstandard = None
+
+# 按优先级排列，客户端同等接受时选择靠前的编码
+ENCODINGS = ("zstd", "br", "gzip")
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+}
+
+# 流式响应累计输入超过该字节数时刷新压缩器，使客户端能及时收到已压缩的数据
+STREAM_FLUSH_SIZE = 64 * 1024
+
+
+def available_encodings(algorithms: Optional[str] = None) -> List[str]:
+    """
+    获取可用的压缩编码
+    
+    Args:
+        algorithms: 逗号分隔的编码列表（zstd、br、gzip），None表示全部
+        
+    Returns:
+        List[str]: 已安装依赖的编码，按优先级排列
+    """
+    allowed = ENCODINGS if algorithms is None else [name.strip() for name in algorithms.split(",")]
+    installed = {"zstd": zstandard is not None, "br": brotli is not None, "gzip": True}
+    return [name for name in ENCODINGS if name in allowed and installed[name]]
+
+
+def negotiate_encoding(accept_encoding: Optional[str], config: Mapping[str, Any]) -> Optional[str]:
+    """
+    按Accept-Encoding请求头选择压缩编码
+    
+    Args:
+        accept_encoding: Accept-Encoding请求头
+        config: 应用配置
+        
+    Returns:
+        Optional[str]: 客户端接受的权重最高的可用编码，没有时返回None
+    """
+    encodings = available_encodings(config["COMPRESSION_ALGORITHMS"])
+    if not encodings:
+        return None
+    return parse_accept_header(accept_encoding).best_match(encodings)
+
+
+class _GzipCompressor:
+    """gzip流式压缩器"""
+    
+    def __init__(self, level: int):
+        """初始化压缩器"""
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    
+    def compress(self, data: bytes) -> bytes:
+        """压缩一块数据，返回已产生的输出"""
+        return self._compressor.compress(data)
+    
+    def flush(self) -> bytes:
+        """刷新已缓冲的数据，之后仍可继续压缩"""
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+    
+    def finish(self) -> bytes:
+        """结束压缩，返回剩余的输出"""
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliCompressor:
+    """brotli流式压缩器"""
+    
+    def __init__(self, quality: int):
+        """初始化压缩器"""
+        self._compressor = brotli.Compressor(quality=quality)
+    
+    def compress(self, data: bytes) -> bytes:
+        """压缩一块数据，返回已产生的输出"""
+        return self._compressor.process(data)
+    
+    def flush(self) -> bytes:
+        """刷新已缓冲的数据，之后仍可继续压缩"""
+        return self._compressor.flush()
+    
+    def finish(self) -> bytes:
+        """结束压缩，返回剩余的输出"""
+        return self._compressor.finish()
+
+
+class _ZstdCompressor:
+    """zstd流式压缩器"""
+    
+    def __init__(self, level: int):
+        """初始化压缩器"""
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    
+    def compress(self, data: bytes) -> bytes:
+        """压缩一块数据，返回已产生的输出"""
+        return self._compressor.compress(data)
+    
+    def flush(self) -> bytes:
+        """刷新已缓冲的数据，之后仍可继续压缩"""
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+    
+    def finish(self) -> bytes:
+        """结束压缩，返回剩余的输出"""
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def create_compressor(encoding: str, config: Mapping[str, Any]):
+    """
+    创建流式压缩器
+    
+    Args:
+        encoding: zstd、br或gzip
+        config: 应用配置，读取各编码的压缩级别
+        
+    Returns:
+        提供compress、flush、finish方法的压缩器
+    """
+    if encoding == "zstd":
+        return _ZstdCompressor(config["COMPRESSION_ZSTD_LEVEL"])
+    if encoding == "br":
+        return _BrotliCompressor(config["COMPRESSION_BROTLI_QUALITY"])
+    if encoding == "gzip":
+        return _GzipCompressor(config["COMPRESSION_GZIP_LEVEL"])
+    raise ValueError(f"不支持的压缩编码: {encoding}")
+
+
+def compress_bytes(data: bytes, encoding: str, config: Mapping[str, Any]) -> bytes:
+    """
+    整体压缩数据
+    
+    Args:
+        data: 原始数据
+        encoding: zstd、br或gzip
+        config: 应用配置
+        
+    Returns:
+        bytes: 压缩后的数据
+    """
+    compressor = create_compressor(encoding, config)
+    return compressor.compress(data) + compressor.finish()
+
+
+class StreamCompressor:
+    """
+    流式响应的逐块压缩
+    
+    压缩器自行缓冲较小的块；累计输入超过STREAM_FLUSH_SIZE时刷新一次，
+    避免慢速流长时间没有输出
+    """
+    
+    def __init__(self, compressor):
+        """
+        初始化
+        
+        Args:
+            compressor: create_compressor创建的压缩器
+        """
+        self.compressor = compressor
+        self.pending = 0
+    
+    def compress(self, chunk) -> bytes:
+        """压缩一块响应体（str按UTF-8编码），返回当前可以发送的输出"""
+        data = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+        if not data:
+            return b""
+        output = self.compressor.compress(data)
+        self.pending += len(data)
+        if self.pending >= STREAM_FLUSH_SIZE:
+            output += self.compressor.flush()
+            self.pending = 0
+        return output
+    
+    def finish(self) -> bytes:
+        """结束压缩，返回剩余的输出"""
+        return self.compressor.finish()
+
+
+def compress_stream(chunks: Iterable, compressor) -> Iterator[bytes]:
+    """逐块压缩流式响应，结束时关闭原始迭代器"""
+    stream = StreamCompressor(compressor)
+    try:
+        for chunk in chunks:
+            output = stream.compress(chunk)
+            if output:
+                yield output
+        yield stream.finish()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close:
+            close()
+
+
+def is_compressible(response: Response) -> bool:
+    """判断响应类型是否适合压缩"""
+    return is_compressible_mimetype(response.mimetype)
+
+
+def is_compressible_mimetype(mimetype: Optional[str]) -> bool:
+    """判断内容类型是否适合压缩，server-sent events需要逐条立即送达，不压缩"""
+    mimetype = mimetype or ""
+    if mimetype == "text/event-stream":
+        return False
+    return mimetype.startswith("text/") or mimetype in COMPRESSIBLE_MIMETYPES
+
+
+def compress_response(response: Response, config: Mapping[str, Any]) -> Response:
+    """
+    按Accept-Encoding压缩响应
+    
+    已经设置Content-Encoding、没有响应体、直接透传（如send_file）或类型不适合压缩的响应原样返回。
+    普通响应小于COMPRESSION_MIN_SIZE时不压缩；流式响应的大小未知，总是压缩。
+    
+    Args:
+        response: 响应
+        config: 应用配置
+        
+    Returns:
+        Response: 压缩后的响应
+    """
+    if not config["COMPRESSION_ENABLED"]:
+        return response
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or request.method == "HEAD" or response.direct_passthrough
+            or "Content-Encoding" in response.headers or not is_compressible(response)):
+        return response
+    
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding(request.headers.get("Accept-Encoding"), config)
+    if encoding is None:
+        return response
+    
+    if response.is_streamed:
+        response.response = compress_stream(response.response, create_compressor(encoding, config))
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < config["COMPRESSION_MIN_SIZE"]:
+            return response
+        response.set_data(compress_bytes(data, encoding, config))
+    
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -3,33 +3,179 @@
 集中管理应用程序的所有配置项
 """
 
+import json
+import multiprocessing
 import os
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
 
 # 加载环境变量
 load_dotenv()
 
 
+def _getenv_int(name: str) -> Optional[int]:
+    """读取可选的整数环境变量，未设置时返回None"""
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def _getenv_json(name: str, default: Any) -> Any:
+    """读取JSON格式的环境变量，未设置时返回默认值"""
+    value = os.getenv(name)
+    return json.loads(value) if value else default
+
+
+def _getenv_list(name: str) -> List[str]:
+    """读取逗号分隔的列表环境变量，未设置时返回空列表"""
+    return [item.strip() for item in os.getenv(name, "").split(",") if item.strip()]
+
+
+def _getenv_bool(name: str) -> Optional[bool]:
+    """读取可选的布尔环境变量，未设置时返回None"""
+    value = os.getenv(name)
+    return value.lower() == "true" if value else None
+
+
 class Config:
     """应用程序配置类"""
     
     # MongoDB 配置
     MONGO_URI: str = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
     
+    # 连接池与连接配置（未设置时使用PyMongo默认值）
+    MONGO_MAX_POOL_SIZE: Optional[int] = _getenv_int("MONGO_MAX_POOL_SIZE")
+    MONGO_MIN_POOL_SIZE: Optional[int] = _getenv_int("MONGO_MIN_POOL_SIZE")
+    MONGO_MAX_IDLE_TIME_MS: Optional[int] = _getenv_int("MONGO_MAX_IDLE_TIME_MS")
+    MONGO_MAX_CONNECTING: Optional[int] = _getenv_int("MONGO_MAX_CONNECTING")
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: Optional[int] = _getenv_int("MONGO_WAIT_QUEUE_TIMEOUT_MS")
+    MONGO_CONNECT_TIMEOUT_MS: Optional[int] = _getenv_int("MONGO_CONNECT_TIMEOUT_MS")
+    MONGO_SOCKET_TIMEOUT_MS: Optional[int] = _getenv_int("MONGO_SOCKET_TIMEOUT_MS")
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: Optional[int] = _getenv_int("MONGO_SERVER_SELECTION_TIMEOUT_MS")
+    MONGO_LOCAL_THRESHOLD_MS: Optional[int] = _getenv_int("MONGO_LOCAL_THRESHOLD_MS")
+    MONGO_COMPRESSORS: Optional[str] = os.getenv("MONGO_COMPRESSORS") or None  # 如 "zstd,snappy,zlib"
+    MONGO_ZLIB_COMPRESSION_LEVEL: Optional[int] = _getenv_int("MONGO_ZLIB_COMPRESSION_LEVEL")
+    
+    # 写关注配置（未设置时使用连接默认值，可被请求中的write_concern覆盖）
+    WRITE_CONCERN_W: Optional[str] = os.getenv("WRITE_CONCERN_W") or None  # 如 "majority"、"1"、"0"
+    WRITE_CONCERN_J: Optional[bool] = _getenv_bool("WRITE_CONCERN_J")
+    WRITE_CONCERN_WTIMEOUT: Optional[int] = _getenv_int("WRITE_CONCERN_WTIMEOUT")  # 毫秒
+    
+    # 搜索的读偏好（未设置时读主节点），请求中的read_preference、max_staleness_seconds优先
+    READ_PREFERENCE: Optional[str] = os.getenv("READ_PREFERENCE") or None  # 如 "secondaryPreferred"、"nearest"
+    READ_MAX_STALENESS_SECONDS: Optional[int] = _getenv_int("READ_MAX_STALENESS_SECONDS")  # 不小于90秒
+    # 按数据库设置读偏好：{"db": "nearest"} 或 {"db": {"mode": "secondaryPreferred", "max_staleness_seconds": 120}}
+    READ_PREFERENCES: Dict[str, Any] = _getenv_json("READ_PREFERENCES", {})
+    
     # Flask 应用配置
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "3333"))
     DEBUG: bool = os.getenv("DEBUG", "false").lower() == "true"
     
+    # 生产服务器配置（gunicorn，见 gunicorn.conf.py）
+    WEB_WORKERS: int = int(os.getenv("WEB_WORKERS", str(multiprocessing.cpu_count() * 2 + 1)))
+    WEB_THREADS: int = int(os.getenv("WEB_THREADS", "4"))  # 每个worker的线程数
+    WEB_KEEPALIVE: int = int(os.getenv("WEB_KEEPALIVE", "5"))  # keep-alive连接保持秒数
+    WEB_TIMEOUT: int = int(os.getenv("WEB_TIMEOUT", "30"))  # worker无响应超时秒数
+    
     # 日志配置
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     
+    # 监控配置（/metrics 接口，gunicorn多进程部署时需设置PROMETHEUS_MULTIPROC_DIR）
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    
+    # JSON编解码后端：auto（安装了orjson时使用orjson）、orjson、json（标准库）
+    JSON_BACKEND: str = os.getenv("JSON_BACKEND", "auto")
+    
+    # 响应压缩配置（/api 接口，按Accept-Encoding选择zstd、br、gzip；zstd和br需安装可选依赖）
+    COMPRESSION_ENABLED: bool = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+    COMPRESSION_ALGORITHMS: str = os.getenv("COMPRESSION_ALGORITHMS", "zstd,br,gzip")
+    COMPRESSION_MIN_SIZE: int = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))  # 小于该字节数的响应不压缩，流式响应不受限制
+    COMPRESSION_GZIP_LEVEL: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))  # 1-9
+    COMPRESSION_BROTLI_QUALITY: int = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))  # 0-11
+    COMPRESSION_ZSTD_LEVEL: int = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))  # 1-22
+    
     # API 配置
     DEFAULT_LIMIT: int = 5
     DEFAULT_SKIP: int = 0
     DEFAULT_SORT_FIELD: str = "created_at"
     DEFAULT_SORT_ORDER: int = -1  # -1 for descending, 1 for ascending
+    MAX_BATCH_SIZE: int = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+    STREAM_BATCH_SIZE: int = int(os.getenv("STREAM_BATCH_SIZE", "100"))  # 流式响应每批从MongoDB获取的文档数
+    AGGREGATE_MAX_TIME_MS: Optional[int] = _getenv_int("AGGREGATE_MAX_TIME_MS")  # 聚合默认的服务端执行时间上限
+    SEARCH_TOTAL_LIMIT: Optional[int] = _getenv_int("SEARCH_TOTAL_LIMIT")  # with_total计数的默认上限
+    
+    # 慢查询日志（超过阈值的搜索记录查询结构、执行计划、扫描和返回的文档数）
+    SLOW_QUERY_MS: Optional[int] = _getenv_int("SLOW_QUERY_MS")  # 未设置时不记录
+    SLOW_QUERY_LOG_INTERVAL: float = float(os.getenv("SLOW_QUERY_LOG_INTERVAL", "60"))  # 同一查询结构的日志间隔秒数
+    
+    # 搜索结果缓存配置（进程内，写入时按集合失效）
+    SEARCH_CACHE_ENABLED: bool = os.getenv("SEARCH_CACHE_ENABLED", "false").lower() == "true"
+    SEARCH_CACHE_MAX_ENTRIES: int = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1000"))
+    SEARCH_CACHE_MAX_BYTES: int = int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    SEARCH_CACHE_TTL: float = float(os.getenv("SEARCH_CACHE_TTL", "5"))  # 秒
+    SEARCH_CACHE_TTLS: Dict[str, float] = _getenv_json("SEARCH_CACHE_TTLS", {})  # {"db.collection": 秒}
+    
+    # 异步写入配置（/api/save?mode=async，后台线程按条数或时间间隔批量写入）
+    ASYNC_SAVE_QUEUE_SIZE: int = int(os.getenv("ASYNC_SAVE_QUEUE_SIZE", "10000"))
+    ASYNC_SAVE_BATCH_SIZE: int = int(os.getenv("ASYNC_SAVE_BATCH_SIZE", "500"))
+    ASYNC_SAVE_FLUSH_INTERVAL_MS: int = int(os.getenv("ASYNC_SAVE_FLUSH_INTERVAL_MS", "100"))
+    ASYNC_SAVE_ENQUEUE_TIMEOUT_MS: int = int(os.getenv("ASYNC_SAVE_ENQUEUE_TIMEOUT_MS", "0"))  # 队列满时的等待时间
+    ASYNC_SAVE_DRAIN_TIMEOUT: float = float(os.getenv("ASYNC_SAVE_DRAIN_TIMEOUT", "20"))  # 关闭时写完队列的等待秒数
+    
+    # 合并同时进行的相同搜索，只查询一次MongoDB
+    SEARCH_COALESCING_ENABLED: bool = os.getenv("SEARCH_COALESCING_ENABLED", "true").lower() == "true"
+    
+    # 启动预热（进程启动后在后台连接MongoDB、建立MONGO_MIN_POOL_SIZE个连接并创建所列集合的索引，不阻塞请求处理）
+    WARMUP_ENABLED: bool = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+    WARMUP_COLLECTIONS: List[str] = _getenv_list("WARMUP_COLLECTIONS")  # "db.collection"，逗号分隔
+    WARMUP_RETRY_INTERVAL: float = float(os.getenv("WARMUP_RETRY_INTERVAL", "5"))  # 连接失败后的重试间隔秒数
+    
+    # 按created_at每月分区的集合（"db.collection"，逗号分隔），写入 collection_YYYY_MM，搜索时只查询时间范围重叠的分区
+    PARTITIONED_COLLECTIONS: List[str] = _getenv_list("PARTITIONED_COLLECTIONS")
+    
+    # 全文搜索（/api/search的q参数）：按集合配置全文索引 {"db.collection": ["title", "content"]}
+    # 或带权重 {"db.collection": {"title": 10, "content": 1}}，索引随其他索引自动创建
+    TEXT_INDEXES: Dict[str, Any] = _getenv_json("TEXT_INDEXES", {})
+    TEXT_INDEX_LANGUAGE: str = os.getenv("TEXT_INDEX_LANGUAGE", "none")  # 分词语言，none表示不做词干提取和停用词过滤
+    # 没有全文索引的集合退化为在这些字段上不区分大小写的正则匹配（会扫描整个集合）
+    TEXT_SEARCH_FALLBACK_FIELDS: List[str] = _getenv_list("TEXT_SEARCH_FALLBACK_FIELDS") or ["title"]
+    
+    # 变更推送（/api/watch，需要副本集），同一集合的订阅者共享一个变更流
+    WATCH_HEARTBEAT_INTERVAL: float = float(os.getenv("WATCH_HEARTBEAT_INTERVAL", "15"))  # 没有事件时发送心跳注释的间隔秒数
+    WATCH_QUEUE_SIZE: int = int(os.getenv("WATCH_QUEUE_SIZE", "1000"))  # 每个订阅者等待推送的事件数上限
+    # Flask入口每个进程的订阅者上限：gthread worker中每个订阅者占用一个线程直到断开，默认为WEB_THREADS的1/4
+    WATCH_MAX_SUBSCRIBERS: int = _getenv_int("WATCH_MAX_SUBSCRIBERS") or max(1, WEB_THREADS // 4)
+    # ASGI入口每个进程的订阅者上限，每个订阅者只占用一个协程
+    ASGI_WATCH_MAX_SUBSCRIBERS: int = int(os.getenv("ASGI_WATCH_MAX_SUBSCRIBERS", "100"))
+    # 每个进程单独打开的变更流上限：恢复令牌已不在共享变更流最近WATCH_QUEUE_SIZE条事件中的订阅各自打开一个变更流
+    WATCH_MAX_PRIVATE_FEEDS: int = int(os.getenv("WATCH_MAX_PRIVATE_FEEDS", "10"))
+    
+    # 索引配置（写入时创建，搜索等只读接口不创建；每个进程对每个集合只检查一次）
+    AUTO_CREATE_INDEXES: bool = os.getenv("AUTO_CREATE_INDEXES", "true").lower() == "true"
+    UUID_INDEX_UNIQUE: bool = os.getenv("UUID_INDEX_UNIQUE", "false").lower() == "true"
+    
+    
+    def mongo_client_options(self) -> Dict[str, Any]:
+        """
+        构建MongoClient的连接池和连接参数
+        
+        Returns:
+            Dict[str, Any]: 已配置的MongoClient关键字参数
+        """
+        options = {
+            "maxPoolSize": self.MONGO_MAX_POOL_SIZE,
+            "minPoolSize": self.MONGO_MIN_POOL_SIZE,
+            "maxIdleTimeMS": self.MONGO_MAX_IDLE_TIME_MS,
+            "maxConnecting": self.MONGO_MAX_CONNECTING,
+            "waitQueueTimeoutMS": self.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            "connectTimeoutMS": self.MONGO_CONNECT_TIMEOUT_MS,
+            "socketTimeoutMS": self.MONGO_SOCKET_TIMEOUT_MS,
+            "serverSelectionTimeoutMS": self.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            "localThresholdMS": self.MONGO_LOCAL_THRESHOLD_MS,
+            "compressors": self.MONGO_COMPRESSORS,
+            "zlibCompressionLevel": self.MONGO_ZLIB_COMPRESSION_LEVEL,
+        }
+        return {key: value for key, value in options.items() if value is not None}
 
 
 class DevelopmentConfig(Config):
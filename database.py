@@ -3,34 +3,86 @@
 封装MongoDB的增删改查操作
 """
 
-import json
+import asyncio
+import threading
 import time
 import uuid
 import logging
-from typing import Dict, List, Any, Optional, Union
-from pymongo import MongoClient
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, takewhile
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Any, Optional, Set, Tuple, Union
+from pymongo import ASCENDING, DESCENDING, TEXT, AsyncMongoClient, IndexModel, MongoClient, UpdateOne
 from pymongo.collection import Collection
+from pymongo.command_cursor import CommandCursor
+from pymongo.cursor import Cursor
 from pymongo.database import Database
-from pymongo.errors import PyMongoError
+from pymongo.errors import BulkWriteError, ConfigurationError, OperationFailure, PyMongoError
+from pymongo.read_preferences import _ServerMode
+from pymongo.write_concern import WriteConcern
 
+from cache import AsyncSingleFlight, QueryCache, SingleFlight
+from changefeed import (WATCH_MAX_AWAIT_MS, WATCH_OPERATIONS, AsyncChangeFeedHub, AsyncSubscription, ChangeFeedHub,
+                        Subscription, parse_match, parse_resume_token)
 from config import Config
+from monitoring import CommandMetrics, PoolMetrics, SlowQueryLog, TopologyState, observe_coalesced
+from partitioning import merge_sorted, merge_sorted_async, partition_name, partition_pattern, select_partitions
+from serialization import JSONDecodeError, dumps, loads
+from utils import (TEXT_SCORE_FIELD, build_keyset_filter, build_projection, build_regex_search_filter, decode_cursor,
+                   encode_cursor, keyset_projection, make_read_preference, normalize_sort, parse_hint, parse_pipeline,
+                   parse_read_preference, parse_text_index, parse_update, query_shape, remove_field, summarize_plan)
+from writebehind import WriteBehindQueue
 
 logger = logging.getLogger(__name__)
 
+# 最多缓存的集合对象数（按数据库、集合、写关注和读偏好区分），超出时淘汰最久未使用的
+MAX_CACHED_COLLECTIONS = 1024
 
-class MongoDBManager:
-    """MongoDB管理器"""
+
+class BaseMongoDBManager:
+    """
+    MongoDB管理器的公共部分
+    
+    参数校验、查询和管道构建、结果整理等不访问数据库的逻辑，由同步和异步管理器共用；
+    数据库操作由子类分别基于MongoClient和AsyncMongoClient实现
+    """
     
     def __init__(self, config: Config):
         """
-        初始化MongoDB管理器
+        初始化同步和异步管理器共用的状态
+        
+        相同搜索的合并、异步写入队列、变更订阅和数据库客户端依赖线程或事件循环，由子类的构造函数设置
         
         Args:
             config: 配置实例
         """
         self.config = config
-        self.client = MongoClient(config.MONGO_URI)
-        
+        self.pool_metrics = PoolMetrics()
+        self.command_metrics = CommandMetrics()
+        self.topology_state = TopologyState()
+        self.query_cache = QueryCache(
+            config.SEARCH_CACHE_MAX_ENTRIES,
+            config.SEARCH_CACHE_MAX_BYTES,
+            config.SEARCH_CACHE_TTL,
+            config.SEARCH_CACHE_TTLS
+        ) if config.SEARCH_CACHE_ENABLED else None
+        self.single_flight: Optional[Union[SingleFlight, AsyncSingleFlight]] = None
+        self.write_behind: Optional[WriteBehindQueue] = None
+        # 已确保索引的 (数据库, 集合, uuid字段)
+        self.indexed_collections: Set[Tuple[str, str, str]] = set()
+        # 正在创建索引的 (数据库, 集合, uuid字段)，并发的首次写入只有一个会创建索引
+        self._indexes_in_progress: Set[Tuple[str, str, str]] = set()
+        self._indexes_lock = threading.Lock()
+        # (数据库, 集合, 写关注, 读偏好) -> 集合对象
+        self._collections: "OrderedDict[Tuple[str, str, Optional[str], Optional[str]], Collection]" = OrderedDict()
+        self._collections_lock = threading.Lock()
+        self.slow_query_log = SlowQueryLog(
+            config.SLOW_QUERY_MS, config.SLOW_QUERY_LOG_INTERVAL
+        ) if config.SLOW_QUERY_MS is not None else None
+        # 启动预热：pending（未开始）、connecting、warming、done、disabled
+        self.warmup_status = "pending" if config.WARMUP_ENABLED else "disabled"
+        self.warmup_error: Optional[str] = None
+    
     def get_database(self, db_name: str) -> Database:
         """
         获取数据库实例
@@ -43,19 +95,330 @@ class MongoDBManager:
         """
         return self.client[db_name]
     
-    def get_collection(self, db_name: str, collection_name: str) -> Collection:
+    def get_collection(self, db_name: str, collection_name: str,
+                       write_concern: Optional[WriteConcern] = None,
+                       read_preference: Optional[_ServerMode] = None) -> Collection:
         """
         获取集合实例
         
+        集合对象按数据库、集合、写关注和读偏好缓存，重复调用不会重新创建
+        
         Args:
             db_name: 数据库名称
             collection_name: 集合名称
+            write_concern: 写关注，为None时使用连接默认值
+            read_preference: 读偏好，为None时使用连接默认值（主节点）
             
         Returns:
             Collection: 集合实例
         """
-        db = self.get_database(db_name)
-        return db[collection_name]
+        key = (db_name, collection_name,
+               repr(write_concern) if write_concern is not None else None,
+               repr(read_preference) if read_preference is not None else None)
+        with self._collections_lock:
+            collection = self._collections.get(key)
+            if collection is not None:
+                self._collections.move_to_end(key)
+                return collection
+        
+        collection = self.get_database(db_name)[collection_name]
+        if write_concern is not None or read_preference is not None:
+            collection = collection.with_options(write_concern=write_concern, read_preference=read_preference)
+        
+        with self._collections_lock:
+            self._collections[key] = collection
+            while len(self._collections) > MAX_CACHED_COLLECTIONS:
+                self._collections.popitem(last=False)
+        return collection
+    
+    def get_read_preference(self, query_params: Dict[str, Any], db_name: str) -> Optional[Dict[str, Any]]:
+        """
+        确定搜索使用的读偏好
+        
+        请求中的read_preference优先（max_staleness_seconds也只取请求中的值）；
+        否则使用READ_PREFERENCES中该数据库的配置，最后使用READ_PREFERENCE和READ_MAX_STALENESS_SECONDS
+        
+        Args:
+            query_params: 查询参数
+            db_name: 数据库名称
+            
+        Returns:
+            Optional[Dict[str, Any]]: parse_read_preference的结果，读主节点时为None
+            
+        Raises:
+            ValueError: 读偏好参数无效
+        """
+        if query_params.get("read_preference") or query_params.get("max_staleness_seconds"):
+            spec = parse_read_preference(query_params.get("read_preference"),
+                                         query_params.get("max_staleness_seconds"))
+        else:
+            configured = self.config.READ_PREFERENCES.get(db_name)
+            if configured is None:
+                configured = {"mode": self.config.READ_PREFERENCE}
+            elif isinstance(configured, str):
+                configured = {"mode": configured}
+            mode = configured.get("mode")
+            max_staleness = configured.get("max_staleness_seconds", self.config.READ_MAX_STALENESS_SECONDS)
+            if not mode or str(mode).lower() == "primary":
+                max_staleness = None
+            spec = parse_read_preference(mode, max_staleness)
+        
+        if spec is None or spec["mode"] == "primary":
+            return None
+        return spec
+    
+    def get_write_concern(self, options: Optional[Dict[str, Any]] = None) -> Optional[WriteConcern]:
+        """
+        构建写关注
+        
+        请求中的w、j、wtimeout优先，未指定的项使用Config中的默认值
+        
+        Args:
+            options: 请求中的写关注参数
+            
+        Returns:
+            Optional[WriteConcern]: 写关注，全部未设置时返回None
+            
+        Raises:
+            ValueError: 写关注参数无效
+        """
+        options = options or {}
+        if not isinstance(options, dict):
+            raise ValueError("write_concern 必须是JSON对象")
+        unknown = set(options) - {"w", "j", "wtimeout"}
+        if unknown:
+            raise ValueError(f"write_concern 不支持的参数: {', '.join(sorted(unknown))}")
+        
+        w = options.get("w", self.config.WRITE_CONCERN_W)
+        j = options.get("j", self.config.WRITE_CONCERN_J)
+        wtimeout = options.get("wtimeout", self.config.WRITE_CONCERN_WTIMEOUT)
+        if w is None and j is None and wtimeout is None:
+            return None
+        
+        if isinstance(w, str) and w.isdigit():
+            w = int(w)
+        try:
+            return WriteConcern(w=w, j=j, wtimeout=wtimeout)
+        except (TypeError, ValueError, ConfigurationError) as e:
+            raise ValueError(f"无效的 write_concern: {e}")
+    
+    def invalidate_cache(self, db_name: str, collection_name: str):
+        """
+        写入后使集合的查询缓存失效
+        
+        Args:
+            db_name: 数据库名称
+            collection_name: 集合名称
+        """
+        if self.query_cache is not None:
+            self.query_cache.invalidate(db_name, collection_name)
+        if self.single_flight is not None:
+            self.single_flight.invalidate(db_name, collection_name)
+    
+    def is_partitioned(self, db_name: str, collection_name: str) -> bool:
+        """
+        判断集合是否按时间分区
+        
+        Args:
+            db_name: 数据库名称
+            collection_name: 集合名称
+            
+        Returns:
+            bool: 在PARTITIONED_COLLECTIONS中时为True
+        """
+        return f"{db_name}.{collection_name}" in self.config.PARTITIONED_COLLECTIONS
+    
+    def get_write_collection_name(self, db_name: str, collection_name: str, update: Dict[str, Any],
+                                  partition: Optional[str] = None) -> str:
+        """
+        获取保存操作实际写入的集合名
+        
+        分区集合写入已保存该uuid的分区，新uuid按created_at写入所在月份的分区，其他集合原样返回
+        
+        Args:
+            db_name: 数据库名称
+            collection_name: 集合名称
+            update: build_save_operation构建的更新文档
+            partition: locate_partitions找到的已保存该uuid的分区，没有时为None
+            
+        Returns:
+            str: 集合名称
+        """
+        if not self.is_partitioned(db_name, collection_name):
+            return collection_name
+        if partition is not None:
+            return partition
+        return partition_name(collection_name, update["$setOnInsert"]["created_at"])
+    
+    @staticmethod
+    def _locate_query(pending: Dict[str, Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, int]]:
+        """
+        构建在一个分区中查找多个uuid的查询
+        
+        Args:
+            pending: dumps(查询条件) -> 尚未找到的查询条件
+            
+        Returns:
+            Tuple: (查询条件, 只返回uuid字段的投影)
+        """
+        uuid_values: Dict[str, List[Any]] = {}
+        for find_obj in pending.values():
+            for uuid_name, value in find_obj.items():
+                uuid_values.setdefault(uuid_name, []).append(value)
+        query = {"$or": [{uuid_name: {"$in": values}} for uuid_name, values in uuid_values.items()]}
+        projection = {uuid_name: 1 for uuid_name in uuid_values}
+        projection["_id"] = 0
+        return query, projection
+    
+    @staticmethod
+    def _record_located(documents: Iterable[Dict[str, Any]], partition: str,
+                        pending: Dict[str, Dict[str, Any]], located: Dict[str, str]):
+        """
+        把在分区中找到的uuid从pending移到located
+        
+        Args:
+            documents: _locate_query查询返回的文档
+            partition: 查询的分区
+            pending: dumps(查询条件) -> 尚未找到的查询条件
+            located: dumps(查询条件) -> 已保存该uuid的分区
+        """
+        uuid_names = {uuid_name for find_obj in pending.values() for uuid_name in find_obj}
+        for document in documents:
+            for uuid_name in uuid_names:
+                if uuid_name not in document:
+                    continue
+                key = dumps({uuid_name: document[uuid_name]})
+                if key in pending:
+                    del pending[key]
+                    located[key] = partition
+    
+    def _batch_targets(self, entries: List[Tuple[Any, str, str, Dict[str, Any], Dict[str, Any]]]
+                       ) -> Dict[Tuple[str, str], List[Dict[str, Any]]]:
+        """
+        取出批量写入中分区集合的uuid，用于查找已保存它们的分区
+        
+        Args:
+            entries: _parse_batch返回的 (标记, 数据库, 集合, 查询条件, 更新文档) 列表
+            
+        Returns:
+            Dict: (数据库, 集合) -> 查询条件列表，只包含分区集合
+        """
+        targets: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for _, db_name, collection_name, find_obj, _ in entries:
+            if self.is_partitioned(db_name, collection_name):
+                targets.setdefault((db_name, collection_name), []).append(find_obj)
+        return targets
+    
+    def get_text_index(self, db_name: str, collection_name: str) -> Optional[Dict[str, int]]:
+        """
+        获取集合在TEXT_INDEXES中配置的全文索引
+        
+        分区集合的各个分区使用所属集合的配置
+        
+        Args:
+            db_name: 数据库名称
+            collection_name: 集合名称
+            
+        Returns:
+            Optional[Dict[str, int]]: 字段到权重的映射，未配置时为None
+            
+        Raises:
+            ValueError: 配置格式无效
+        """
+        spec = self.config.TEXT_INDEXES.get(f"{db_name}.{collection_name}")
+        base_name = collection_name[:-len("_YYYY_MM")]
+        if (spec is None and partition_pattern(base_name).match(collection_name)
+                and self.is_partitioned(db_name, base_name)):
+            spec = self.config.TEXT_INDEXES.get(f"{db_name}.{base_name}")
+        return parse_text_index(spec) if spec is not None else None
+    
+    def _claim_indexes(self, db_name: str, collection_name: str, uuid_name: str) -> Optional[Tuple[str, str, str]]:
+        """
+        标记集合正在创建索引
+        
+        Returns:
+            Optional[Tuple[str, str, str]]: 需要由调用方创建索引时返回 (数据库, 集合, uuid字段)，
+                已创建、正在创建、未开启AUTO_CREATE_INDEXES或分区集合本身时返回None
+        """
+        key = (db_name, collection_name, uuid_name)
+        if not self.config.AUTO_CREATE_INDEXES or self.is_partitioned(db_name, collection_name):
+            return None
+        with self._indexes_lock:
+            if key in self.indexed_collections or key in self._indexes_in_progress:
+                return None
+            self._indexes_in_progress.add(key)
+        return key
+    
+    def _release_indexes(self, key: Tuple[str, str, str], created: bool):
+        """结束索引创建，created为False时下次访问重新创建"""
+        with self._indexes_lock:
+            self._indexes_in_progress.discard(key)
+            if created:
+                self.indexed_collections.add(key)
+    
+    def build_index_models(self, uuid_name: str, text_index: Optional[Dict[str, int]] = None) -> List[IndexModel]:
+        """
+        构建集合所需的索引
+        
+        uuid字段索引用于save_data的upsert查询；时间戳索引附带_id，
+        同时满足按时间戳排序和游标分页（时间戳加_id）的排序；
+        配置了全文索引时再加上供q参数使用的全文索引（每个集合最多一个）
+        
+        Args:
+            uuid_name: UUID字段名
+            text_index: 全文索引的字段和权重
+            
+        Returns:
+            List[IndexModel]: 索引列表
+        """
+        models = [
+            IndexModel([(uuid_name, ASCENDING)], unique=self.config.UUID_INDEX_UNIQUE),
+            IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)]),
+            IndexModel([("updated_at", DESCENDING), ("_id", DESCENDING)])
+        ]
+        if text_index:
+            models.append(IndexModel(
+                [(field, TEXT) for field in text_index],
+                weights=text_index,
+                default_language=self.config.TEXT_INDEX_LANGUAGE,
+                name="text_search"
+            ))
+        return models
+    
+    def get_warmup_collections(self) -> List[Tuple[str, str]]:
+        """
+        解析预热时需要创建索引的集合
+        
+        Returns:
+            List[Tuple[str, str]]: (数据库名称, 集合名称) 列表，格式错误的项记录警告后跳过
+        """
+        collections = []
+        for name in self.config.WARMUP_COLLECTIONS:
+            db_name, _, collection_name = name.partition(".")
+            if not db_name or not collection_name:
+                logger.warning(f"WARMUP_COLLECTIONS 中的集合格式应为 db.collection，已跳过: {name}")
+                continue
+            collections.append((db_name, collection_name))
+        return collections
+    
+    def readiness(self) -> Dict[str, Any]:
+        """
+        获取就绪状态
+        
+        只读取预热进度和驱动后台心跳得到的拓扑状态，不向MongoDB发送命令；
+        预热尚未开始时（如未经gunicorn启动）顺便启动预热
+        
+        Returns:
+            Dict[str, Any]: ready为True表示预热已完成且有可写的服务器
+        """
+        self.start_warmup()
+        topology = self.topology_state.snapshot()
+        warmed_up = self.warmup_status in ("done", "disabled")
+        return {
+            "ready": warmed_up and topology["writable"],
+            "warmup": {"status": self.warmup_status, "error": self.warmup_error},
+            "topology": topology
+        }
     
     def generate_uuid(self) -> str:
         """
@@ -86,151 +449,2199 @@ class MongoDBManager:
             Dict[str, Any]: 解析后的字典
         """
         try:
-            return json.loads(content)
-        except json.JSONDecodeError as e:
+            return loads(content)
+        except JSONDecodeError as e:
             logger.warning(f"JSON解析失败: {e}")
             return {}
     
-    def save_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
+    def build_save_operation(self, data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
         """
-        保存数据到指定数据库和集合
+        构建保存操作的查询条件和更新文档
+        
+        content字段解析为数组时包装在list字段中；updated_at每次写入，
+        created_at通过$setOnInsert仅在插入时写入，一次upsert即可完成
         
         Args:
-            data: 要保存的数据
+            data: 保存请求数据
             
         Returns:
-            Dict[str, Any]: 操作结果
+            Tuple: (查询条件, 更新文档)
+            
+        Raises:
+            ValueError: content不是JSON对象或数组
         """
-        try:
-            # 获取目标数据库和集合
-            db_name = data.get("db_name")
-            collection_name = data.get("collection_name")
+        # 构建查询条件
+        uuid_name = data.get("uuid_name", "uuid")
+        uuid_value = data.get("uuid", self.generate_uuid())
+        find_obj = {uuid_name: uuid_value}
+        
+        # 解析content字段
+        if "content" in data:
+            parsed_data = self.parse_json_content(data.get("content", "{}"))
+            if isinstance(parsed_data, list):
+                parsed_data = {"list": parsed_data}
+            if not isinstance(parsed_data, dict):
+                raise ValueError("content 必须是JSON对象或数组")
+        else:
+            parsed_data = {}
+        
+        # 添加时间戳，created_at由服务端在插入时写入
+        now_timestamp = self.get_current_timestamp()
+        parsed_data.pop("created_at", None)
+        parsed_data["updated_at"] = now_timestamp
+        
+        update = {
+            "$set": parsed_data,
+            "$setOnInsert": {"created_at": now_timestamp}
+        }
+        return find_obj, update
+    
+    def build_patch_operation(self, data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        构建局部更新的查询条件和更新文档
+        
+        uuid字段、created_at和updated_at不允许修改，updated_at与保存接口一致在每次更新时写入
+        
+        Args:
+            data: 局部更新请求数据
             
-            if not db_name or not collection_name:
-                return {
-                    "error": "必须指定 db_name 和 collection_name",
-                    "message": "Missing required parameters"
-                }
+        Returns:
+            Tuple: (查询条件, 更新文档)
             
-            target_collection = self.get_collection(db_name, collection_name)
+        Raises:
+            ValueError: 缺少uuid或update无效
+        """
+        uuid_name = data.get("uuid_name") or "uuid"
+        if data.get("uuid") in (None, ""):
+            raise ValueError("必须指定 uuid")
+        if "update" not in data:
+            raise ValueError("必须指定 update")
+        
+        update = parse_update(data["update"], (uuid_name, "created_at", "updated_at"))
+        update.setdefault("$set", {})["updated_at"] = self.get_current_timestamp()
+        return {uuid_name: data["uuid"]}, update
+    
+    @staticmethod
+    def _build_patch_response(db_name: str, collection_name: str, find_obj: Dict[str, Any],
+                              result: Any) -> Dict[str, Any]:
+        """根据update_one的结果构建局部更新的响应"""
+        if result is not None and not result.acknowledged:
+            return {"message": "Data patched", "id": find_obj, "acknowledged": False}
+        if result is None or not result.matched_count:
+            return {"error": "数据不存在", "message": "Not found", "id": find_obj}
+        logger.info(f"数据局部更新成功，数据库: {db_name}, 集合: {collection_name}, ID: {find_obj}")
+        return {
+            "message": "Data patched successfully",
+            "id": find_obj,
+            "modified": bool(result.modified_count)
+        }
+    
+    def _parse_batch(self, items: List[Any],
+                     results: List[Optional[Dict[str, Any]]]) -> List[Tuple[int, str, str, Dict[str, Any], Dict[str, Any]]]:
+        """
+        校验批量保存的数据并构建写操作，无效数据的错误直接填入results
+        
+        Args:
+            items: 保存请求数据列表
+            results: save_batch的结果列表
             
-            # 构建查询条件
-            uuid_name = data.get("uuid_name", "uuid")
-            uuid_value = data.get("uuid", self.generate_uuid())
-            find_obj = {uuid_name: uuid_value}
+        Returns:
+            List[Tuple]: (请求中的序号, 数据库, 集合, 查询条件, 更新文档) 列表
+        """
+        entries = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results[index] = {"index": index, "error": "数据项必须是JSON对象"}
+                continue
             
-            # 解析content字段
-            if "content" in data:
-                parsed_data = self.parse_json_content(data.get("content", "{}"))
-                if isinstance(parsed_data, list):
-                    parsed_data = {"list": parsed_data}
-                data["data"] = parsed_data
-            else:
-                data["data"] = {}
+            db_name = item.get("db_name")
+            collection_name = item.get("collection_name")
+            if not db_name or not collection_name:
+                results[index] = {"index": index, "error": "必须指定 db_name 和 collection_name"}
+                continue
             
-            # 添加时间戳
-            now_timestamp = self.get_current_timestamp()
-            data["data"]["updated_at"] = now_timestamp
+            try:
+                find_obj, update = self.build_save_operation(item)
+            except ValueError as e:
+                results[index] = {"index": index, "error": str(e)}
+                continue
+            entries.append((index, db_name, collection_name, find_obj, update))
+        return entries
+    
+    def _group_batch(self, entries: List[Tuple[Any, str, str, Dict[str, Any], Dict[str, Any]]],
+                     located: Dict[Tuple[str, str], Dict[str, str]]) -> Dict[Tuple[str, str, str], List[List[Tuple]]]:
+        """
+        按数据库和集合（分区集合按分区）分组并拆分成多轮写入
+        
+        同一uuid在一组中第n次出现时放入第n轮，每一轮中的uuid互不相同
+        
+        Args:
+            entries: (标记, 数据库, 集合, 查询条件, 更新文档) 列表，标记原样放入结果
+            located: (数据库, 集合) -> locate_partitions的结果
             
-            # 插入或更新数据
-            result = target_collection.update_one(
-                find_obj, 
-                {"$set": data["data"]}, 
-                upsert=True
-            )
+        Returns:
+            Dict: (数据库, 请求中的集合, 写入的集合) -> 各轮的 (标记, 查询条件, 写操作) 列表
+        """
+        groups: Dict[Tuple[str, str, str], List[List[Tuple[Any, Dict[str, Any], UpdateOne]]]] = {}
+        occurrences: Dict[Tuple[str, str, str], int] = {}
+        
+        for tag, db_name, collection_name, find_obj, update in entries:
+            uuid_key = dumps(find_obj)
+            partition = located.get((db_name, collection_name), {}).get(uuid_key)
+            write_collection = self.get_write_collection_name(db_name, collection_name, update, partition)
+            key = (db_name, write_collection, uuid_key)
+            round_index = occurrences.get(key, 0)
+            occurrences[key] = round_index + 1
+            rounds = groups.setdefault((db_name, collection_name, write_collection), [])
+            if len(rounds) <= round_index:
+                rounds.append([])
+            rounds[round_index].append((tag, find_obj, UpdateOne(find_obj, update, upsert=True)))
+        return groups
+    
+    @staticmethod
+    def _parse_bulk_write_error(error: BulkWriteError) -> Tuple[Dict[int, Any], Dict[int, str]]:
+        """
+        从BulkWriteError中取出已成功的upsert和每条写入的错误
+        
+        Returns:
+            Tuple: (序号 -> upsert的_id, 序号 -> 错误信息)
+        """
+        upserted = {upsert["index"]: upsert["_id"] for upsert in error.details.get("upserted", [])}
+        write_errors = {
+            write_error["index"]: write_error.get("errmsg", "写入失败")
+            for write_error in error.details.get("writeErrors", [])
+        }
+        return upserted, write_errors
+    
+    @staticmethod
+    def _record_batch_round(entries: List[Tuple[int, Dict[str, Any], UpdateOne]],
+                            results: List[Optional[Dict[str, Any]]],
+                            upserted: Optional[Dict[int, Any]], write_errors: Dict[int, str]):
+        """
+        把一轮bulk_write中每条数据的结果填入results
+        
+        Args:
+            entries: (请求中的序号, 查询条件, 写操作) 列表
+            results: save_batch的结果列表
+            upserted: 新建数据在本轮中的序号，非确认写入时为None
+            write_errors: 本轮中的序号 -> 错误信息
+        """
+        for position, (index, find_obj, _) in enumerate(entries):
+            if position in write_errors:
+                results[index] = {"index": index, "id": find_obj, "error": write_errors[position]}
+            else:
+                is_new = position in upserted if upserted is not None else None
+                results[index] = {"index": index, "id": find_obj, "is_new": is_new}
+    
+    @staticmethod
+    def _build_batch_response(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """根据每条数据的结果构建批量保存的响应"""
+        failed = sum(1 for result in results if "error" in result)
+        return {
+            "message": "Batch processed",
+            "saved": len(results) - failed,
+            "failed": failed,
+            "results": results
+        }
+    
+    def build_search_query(self, query_params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        根据查询参数构建搜索查询
+        
+        Args:
+            query_params: 查询参数
             
-            # 如果是新插入的数据，添加创建时间
-            if result.upserted_id:
-                data["data"]["created_at"] = now_timestamp
-                target_collection.update_one(
-                    find_obj, 
-                    {"$set": {"created_at": now_timestamp}}
-                )
+        Returns:
+            Optional[Dict[str, Any]]: 包含db_name、collection_name、filter、projection、sort、limit、skip的查询，
+            游标分页时还包含cursor，with_total时还包含total（计数上限）；
+            缺少数据库/集合或没有查询条件时返回None
             
-            logger.info(f"数据保存成功，数据库: {db_name}, 集合: {collection_name}, ID: {find_obj}")
-            return {
-                "message": "Data saved successfully",
-                "id": find_obj,
-                "is_new": bool(result.upserted_id)
-            }
+        Raises:
+            ValueError: fields、exclude、total_limit或q参数无效
+        """
+        # 获取目标数据库和集合
+        db_name = query_params.get("db_name")
+        collection_name = query_params.get("collection_name")
+        
+        if not db_name or not collection_name:
+            return None
+        
+        # 构建查询条件
+        find_obj = {}
+        uuid_name = query_params.get("uuid_name", "uuid")
+        uuid_value = query_params.get("uuid")
+        
+        if uuid_name and uuid_value:
+            find_obj[uuid_name] = uuid_value
+        
+        # 解析额外查询条件
+        conditions = query_params.get("conditions")
+        if conditions:
+            try:
+                parsed_conditions = loads(conditions)
+                find_obj.update(parsed_conditions)
+            except JSONDecodeError as e:
+                logger.error(f"查询条件解析失败: {e}")
+        
+        # 全文搜索：集合配置了全文索引时使用$text，否则在TEXT_SEARCH_FALLBACK_FIELDS上按正则匹配
+        text_search = (query_params.get("q") or "").strip()
+        text_index = self.get_text_index(db_name, collection_name) if text_search else None
+        if text_index is not None:
+            find_obj["$text"] = {"$search": text_search}
+        elif text_search:
+            regex_filter = build_regex_search_filter(text_search, self.config.TEXT_SEARCH_FALLBACK_FIELDS)
+            if "$or" in find_obj and "$or" in regex_filter:
+                find_obj = {"$and": [find_obj, regex_filter]}
+            else:
+                find_obj.update(regex_filter)
+        
+        # 如果没有查询条件，不执行查询
+        if not find_obj and not conditions:
+            return None
+        
+        # 构建排序条件，全文搜索默认按相关度排序
+        sort_obj = {self.config.DEFAULT_SORT_FIELD: self.config.DEFAULT_SORT_ORDER}
+        if text_index is not None:
+            sort_obj = {TEXT_SCORE_FIELD: {"$meta": "textScore"}}
+        sorts = query_params.get("sorts")
+        if sorts:
+            try:
+                sort_obj = loads(sorts)
+            except JSONDecodeError as e:
+                logger.error(f"排序条件解析失败: {e}")
+        
+        # 获取分页参数
+        limit = int(query_params.get("limit", self.config.DEFAULT_LIMIT))
+        skip = int(query_params.get("skip", self.config.DEFAULT_SKIP))
+        
+        # 构建投影，只返回需要的字段；全文搜索时附带相关度得分
+        projection = build_projection(query_params.get("fields"), query_params.get("exclude"))
+        if text_index is not None:
+            projection[TEXT_SCORE_FIELD] = {"$meta": "textScore"}
+        
+        query = {
+            "db_name": db_name,
+            "collection_name": collection_name,
+            "filter": find_obj,
+            "projection": projection,
+            "sort": sort_obj,
+            "limit": limit,
+            "skip": skip
+        }
+        read_preference = self.get_read_preference(query_params, db_name)
+        if read_preference is not None:
+            query["read_preference"] = read_preference
+        if query_params.get("hint"):
+            query["hint"] = parse_hint(query_params["hint"])
+        # 游标分页时记录游标，首页为空字符串
+        if "cursor" in query_params:
+            query["cursor"] = query_params.get("cursor") or ""
+        if str(query_params.get("with_total", "")).lower() == "true":
+            query["total"] = {"limit": self._get_total_limit(query_params)}
+        return query
+    
+    def _use_query_cache(self, query_params: Dict[str, Any]) -> bool:
+        """判断搜索是否使用查询缓存：已启用缓存且请求没有指定cache=false"""
+        return self.query_cache is not None and str(query_params.get("cache", "")).lower() != "false"
+    
+    def _get_total_limit(self, query_params: Dict[str, Any]) -> Optional[int]:
+        """
+        获取总数计数的上限
+        
+        Args:
+            query_params: 查询参数
             
-        except PyMongoError as e:
-            logger.error(f"数据库操作失败: {e}")
-            raise
+        Returns:
+            Optional[int]: 计数上限，None表示不限制
+            
+        Raises:
+            ValueError: total_limit无效
+        """
+        total_limit = query_params.get("total_limit") or self.config.SEARCH_TOTAL_LIMIT
+        if total_limit is None:
+            return None
+        total_limit = int(total_limit)
+        if total_limit <= 0:
+            raise ValueError("total_limit 必须大于0")
+        return total_limit
     
-    def search_data(self, query_params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def _total_count_operation(self, query: Dict[str, Any]) -> Tuple[str, Tuple[Any, ...], Dict[str, Any]]:
         """
-        搜索数据
+        选择计算总数的方式
         
-        支持复杂的查询条件、排序和分页，可指定目标数据库和集合
+        没有查询条件时使用estimated_document_count读取集合元数据；
+        有条件时使用count_documents，设置上限时多数一条以判断是否超过上限
         
         Args:
-            query_params: 查询参数
+            query: build_search_query构建的查询
             
         Returns:
-            List[Dict[str, Any]]: 查询结果列表
+            Tuple: (集合方法名, 位置参数, 关键字参数)
         """
-        try:
-            # 获取目标数据库和集合
-            db_name = query_params.get("db_name")
-            collection_name = query_params.get("collection_name")
+        if not query["filter"]:
+            return "estimated_document_count", (), {}
+        total_limit = query["total"]["limit"]
+        kwargs: Dict[str, Any] = {"limit": total_limit + 1} if total_limit else {}
+        if "hint" in query:
+            kwargs["hint"] = query["hint"]
+        return "count_documents", (query["filter"],), kwargs
+    
+    def _build_total(self, query: Dict[str, Any], method: str, count: int) -> Dict[str, Any]:
+        """
+        构建总数字段
+        
+        Args:
+            query: build_search_query构建的查询
+            method: 计数使用的集合方法名
+            count: 计数结果
             
-            if not db_name or not collection_name:
-                return []
-            
-            target_collection = self.get_collection(db_name, collection_name)
-            
-            # 构建查询条件
-            find_obj = {}
-            uuid_name = query_params.get("uuid_name", "uuid")
-            uuid_value = query_params.get("uuid")
-            
-            if uuid_name and uuid_value:
-                find_obj[uuid_name] = uuid_value
-            
-            # 解析额外查询条件
-            conditions = query_params.get("conditions")
-            if conditions:
-                try:
-                    parsed_conditions = json.loads(conditions)
-                    find_obj.update(parsed_conditions)
-                except json.JSONDecodeError as e:
-                    logger.error(f"查询条件解析失败: {e}")
-            
-            # 如果没有查询条件，返回空列表
-            if not find_obj and not conditions:
-                return []
-            
-            # 构建排序条件
-            sort_obj = {self.config.DEFAULT_SORT_FIELD: self.config.DEFAULT_SORT_ORDER}
-            sorts = query_params.get("sorts")
-            if sorts:
-                try:
-                    sort_obj = json.loads(sorts)
-                except json.JSONDecodeError as e:
-                    logger.error(f"排序条件解析失败: {e}")
-            
-            # 获取分页参数
-            limit = int(query_params.get("limit", self.config.DEFAULT_LIMIT))
-            skip = int(query_params.get("skip", self.config.DEFAULT_SKIP))
-            
-            logger.info(f"查询数据库: {db_name}, 集合: {collection_name}, 条件: {find_obj}, 排序: {sort_obj}")
+        Returns:
+            Dict[str, Any]: total为总数（超过上限时为上限），total_exact表示是否为精确值
+        """
+        if method == "estimated_document_count":
+            return {"total": count, "total_exact": False}
+        total_limit = query["total"]["limit"]
+        if total_limit and count > total_limit:
+            return {"total": total_limit, "total_exact": False}
+        return {"total": count, "total_exact": True}
+    
+    def _prepare_partition_query(self, query: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]],
+                                                                       List[Tuple[str, int]], int, List[str]]:
+        """
+        构建在各分区中执行的查询
+        
+        排序条件追加_id，使各分区的结果可以确定地合并；投影包含合并所需的排序字段
+        
+        Args:
+            query: build_search_query构建的查询
             
-            # 执行查询
-            results = list(
-                target_collection.find(find_obj, {"_id": 0})
-                .skip(skip)
-                .limit(limit)
-                .sort(sort_obj)
-            )
+        Returns:
+            Tuple: (查询条件, 投影, 排序条件, 每个分区最多返回的文档数（0表示不限）, 需要从结果中去掉的排序字段)
             
-            return results
+        Raises:
+            ValueError: 游标或排序条件无效，或按相关度排序
+        """
+        if isinstance(query["sort"], dict) and any(isinstance(value, dict) for value in query["sort"].values()):
+            raise ValueError("分区集合不支持按相关度排序，请在 sorts 中指定排序字段")
+        if "cursor" in query:
+            find_obj, sort_spec, limit = self._prepare_keyset_query(query, query["cursor"])
+            fetch = limit + 1
+        else:
+            find_obj, sort_spec = query["filter"], normalize_sort(query["sort"])
+            fetch = query["skip"] + abs(query["limit"]) if query["limit"] else 0
+        projection, hidden_fields = keyset_projection(query["projection"], sort_spec)
+        return find_obj, projection, sort_spec, fetch, hidden_fields
+    
+    @staticmethod
+    def _partition_cursor(target_collection: Collection, query: Dict[str, Any], prepared: Tuple) -> Cursor:
+        """按_prepare_partition_query的结果构建单个分区的游标"""
+        find_obj, projection, sort_spec, fetch, _ = prepared
+        cursor = target_collection.find(find_obj, projection).limit(fetch).sort(sort_spec)
+        if "hint" in query:
+            cursor = cursor.hint(query["hint"])
+        return cursor
+    
+    def _build_partition_page(self, query: Dict[str, Any], documents: Iterable[Dict[str, Any]],
+                              prepared: Tuple) -> Dict[str, Any]:
+        """
+        根据合并后的各分区结果构建一页数据
+        
+        Args:
+            query: build_search_query构建的查询
+            documents: 按排序条件合并后的文档
+            prepared: _prepare_partition_query的结果
             
-        except PyMongoError as e:
-            logger.error(f"数据库查询失败: {e}")
-            raise
+        Returns:
+            Dict[str, Any]: 包含data，游标分页时还包含next_cursor
+        """
+        _, _, sort_spec, fetch, hidden_fields = prepared
+        if "cursor" in query:
+            return self._build_keyset_page(list(islice(documents, fetch)), sort_spec, query["limit"], hidden_fields)
+        data = list(islice(documents, query["skip"], fetch or None))
+        self._remove_hidden_fields(data, hidden_fields)
+        return {"data": data}
     
-    def close(self):
-        """关闭数据库连接"""
-        if self.client:
-            self.client.close() 
\ No newline at end of file
+    def get_search_collection(self, query: Dict[str, Any], collection_name: Optional[str] = None) -> Collection:
+        """
+        获取搜索使用的集合实例，按查询中的读偏好路由到主节点或从节点
+        
+        Args:
+            query: build_search_query构建的查询
+            collection_name: 实际查询的集合（如分区），为None时使用查询中的集合
+            
+        Returns:
+            Collection: 集合实例
+        """
+        read_preference = query.get("read_preference")
+        return self.get_collection(
+            query["db_name"], collection_name or query["collection_name"],
+            read_preference=make_read_preference(read_preference) if read_preference else None
+        )
+    
+    @staticmethod
+    def _find_cursor(target_collection: Collection, query: Dict[str, Any]) -> Cursor:
+        """按查询的条件、投影、分页、排序和索引提示构建游标"""
+        cursor = (
+            target_collection.find(query["filter"], query["projection"])
+            .skip(query["skip"])
+            .limit(query["limit"])
+            .sort(query["sort"])
+        )
+        if "hint" in query:
+            cursor = cursor.hint(query["hint"])
+        return cursor
+    
+    def _keyset_cursor(self, target_collection: Collection,
+                       query: Dict[str, Any]) -> Tuple[Cursor, List[Tuple[str, int]], int, List[str]]:
+        """
+        构建游标分页的游标，多取一条用于判断是否还有下一页
+        
+        Returns:
+            Tuple: (游标, 排序条件, 每页数量, 需要从结果中去掉的排序字段)
+        """
+        find_obj, sort_spec, limit = self._prepare_keyset_query(query, query["cursor"])
+        projection, hidden_fields = keyset_projection(query["projection"], sort_spec)
+        cursor = target_collection.find(find_obj, projection).limit(limit + 1).sort(sort_spec)
+        if "hint" in query:
+            cursor = cursor.hint(query["hint"])
+        return cursor, sort_spec, limit, hidden_fields
+    
+    def _explain_cursor(self, target_collection: Collection, query: Dict[str, Any]) -> Cursor:
+        """构建与实际查询相同的游标，用于explain"""
+        if "cursor" in query:
+            return self._keyset_cursor(target_collection, query)[0]
+        return self._find_cursor(target_collection, query)
+    
+    def _plan_command(self, target_collection: Collection, query: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        构建与实际查询相同的find命令，用于慢查询日志的explain
+        
+        explain命令的verbosity可以单独指定；executionStats级别会把查询完整再执行一次，只在后台执行
+        """
+        if "cursor" in query:
+            find_obj, sort_spec, limit = self._prepare_keyset_query(query, query["cursor"])
+            projection, _ = keyset_projection(query["projection"], sort_spec)
+            command = {"find": target_collection.name, "filter": find_obj, "sort": dict(sort_spec),
+                       "limit": limit + 1}
+        else:
+            projection = query["projection"]
+            command = {"find": target_collection.name, "filter": query["filter"], "sort": dict(query["sort"]),
+                       "skip": query["skip"], "limit": query["limit"]}
+        if projection:
+            command["projection"] = projection
+        if "hint" in query:
+            hint = query["hint"]
+            command["hint"] = hint if isinstance(hint, str) else dict(hint)
+        return command
+    
+    def _build_explain(self, query: Dict[str, Any], explanation: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        从explain结果中提取执行计划和执行统计
+        
+        Args:
+            query: build_search_query构建的查询
+            explanation: explain命令的结果
+            
+        Returns:
+            Dict[str, Any]: query_shape、plan_summary、winning_plan、rejected_plans、execution_stats
+        """
+        planner = explanation.get("queryPlanner", {})
+        winning_plan = planner.get("winningPlan", {})
+        execution_stats = {
+            key: value for key, value in explanation.get("executionStats", {}).items()
+            if key != "allPlansExecution"
+        }
+        return {
+            "query_shape": query_shape(query["filter"]),
+            "sort": query["sort"],
+            "plan_summary": summarize_plan(winning_plan),
+            "winning_plan": winning_plan,
+            "rejected_plans": len(planner.get("rejectedPlans", [])),
+            "execution_stats": execution_stats
+        }
+    
+    def _build_partition_explain(self, query: Dict[str, Any],
+                                 explanations: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        汇总各分区的explain结果
+        
+        Args:
+            query: build_search_query构建的查询
+            explanations: (分区集合名, explain命令的结果) 列表
+            
+        Returns:
+            Dict[str, Any]: query_shape、sort，以及partitions中每个分区的执行计划和执行统计
+        """
+        partitions = []
+        for name, explanation in explanations:
+            summary = self._build_explain(query, explanation)
+            del summary["query_shape"], summary["sort"]
+            partitions.append({"collection_name": name, **summary})
+        return {"query_shape": query_shape(query["filter"]), "sort": query["sort"], "partitions": partitions}
+    
+    def _acquire_slow_query_log(self, query: Dict[str, Any], duration: float) -> Optional[int]:
+        """
+        判断本次搜索是否需要记录慢查询日志
+        
+        Args:
+            query: build_search_query构建的查询
+            duration: 查询耗时（秒）
+            
+        Returns:
+            Optional[int]: 需要记录时返回同一查询结构此前被跳过的次数，否则返回None
+        """
+        if self.slow_query_log is None or not self.slow_query_log.is_slow(duration):
+            return None
+        shape_key = dumps([query["db_name"], query["collection_name"], query_shape(query["filter"]),
+                           query["sort"], "cursor" in query], sort_keys=True)
+        return self.slow_query_log.acquire(shape_key)
+    
+    def _log_slow_query(self, query: Dict[str, Any], returned: int, duration: float,
+                        explanation: Dict[str, Any], suppressed: int):
+        """
+        记录一条慢查询日志
+        
+        Args:
+            query: build_search_query构建的查询
+            returned: 返回的文档数
+            duration: 查询耗时（秒）
+            explanation: executionStats级别的explain结果，分区集合或explain失败时为空字典
+            suppressed: 同一查询结构此前被跳过的慢查询次数
+        """
+        summary = self._build_explain(query, explanation) if explanation else None
+        stats = summary["execution_stats"] if summary else {}
+        message = (
+            f"慢查询 {duration * 1000:.0f}ms，数据库: {query['db_name']}, 集合: {query['collection_name']}, "
+            f"查询结构: {dumps(query_shape(query['filter']))}, 排序: {dumps(query['sort'])}, "
+            f"执行计划: {summary['plan_summary'] if summary else '未知'}, "
+            f"扫描索引键数: {stats.get('totalKeysExamined', '未知')}, "
+            f"扫描文档数: {stats.get('totalDocsExamined', '未知')}, "
+            f"返回文档数: {returned}"
+        )
+        if suppressed:
+            message += f"（此前 {self.slow_query_log.interval:g} 秒内另有 {suppressed} 次相同结构的慢查询未记录）"
+        logger.warning(message)
+    
+    def _empty_page(self, query_params: Dict[str, Any]) -> Dict[str, Any]:
+        """没有查询条件时返回的空结果，字段与正常结果一致"""
+        page: Dict[str, Any] = {"data": []}
+        if "cursor" in query_params:
+            page["next_cursor"] = None
+        if str(query_params.get("with_total", "")).lower() == "true":
+            page.update({"total": 0, "total_exact": True})
+        return page
+    
+    def build_aggregate_options(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        构建聚合选项
+        
+        Args:
+            params: 请求参数，可包含allow_disk_use、max_time_ms、batch_size
+            
+        Returns:
+            Dict[str, Any]: Collection.aggregate的关键字参数
+            
+        Raises:
+            ValueError: 参数无效
+        """
+        allow_disk_use = params.get("allow_disk_use", False)
+        if isinstance(allow_disk_use, str):
+            allow_disk_use = allow_disk_use.lower() == "true"
+        if not isinstance(allow_disk_use, bool):
+            raise ValueError("allow_disk_use 必须是布尔值")
+        
+        options: Dict[str, Any] = {
+            "allowDiskUse": allow_disk_use,
+            "batchSize": int(params.get("batch_size") or self.config.STREAM_BATCH_SIZE)
+        }
+        max_time_ms = params.get("max_time_ms")
+        if max_time_ms is None:
+            max_time_ms = self.config.AGGREGATE_MAX_TIME_MS
+        if max_time_ms is not None:
+            options["maxTimeMS"] = int(max_time_ms)
+            if options["maxTimeMS"] <= 0:
+                raise ValueError("max_time_ms 必须大于0")
+        if options["batchSize"] <= 0:
+            raise ValueError("batch_size 必须大于0")
+        return options
+    
+    def _prepare_aggregate(self, params: Dict[str, Any]) -> Tuple[str, str, List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        校验聚合请求
+        
+        Args:
+            params: 请求参数
+            
+        Returns:
+            Tuple: (数据库, 集合, 管道, Collection.aggregate的关键字参数)
+            
+        Raises:
+            ValueError: 参数无效
+        """
+        db_name = params.get("db_name")
+        collection_name = params.get("collection_name")
+        if not db_name or not collection_name:
+            raise ValueError("必须指定 db_name 和 collection_name")
+        return db_name, collection_name, parse_pipeline(params.get("pipeline")), self.build_aggregate_options(params)
+    
+    @staticmethod
+    def _aggregate_partition_query(db_name: str, collection_name: str,
+                                   pipeline: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        构建list_partitions的查询，按管道开头$match阶段中的created_at条件选择分区
+        
+        Returns:
+            Dict[str, Any]: 包含db_name、collection_name、filter
+        """
+        filters = [stage["$match"] for stage in takewhile(lambda stage: "$match" in stage, pipeline)]
+        find_obj = filters[0] if len(filters) == 1 else ({"$and": filters} if filters else {})
+        return {"db_name": db_name, "collection_name": collection_name, "filter": find_obj}
+    
+    @staticmethod
+    def _expand_partitions(collection_name: str, partitions: List[str],
+                           pipeline: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        把分区集合上的聚合展开为在第一个分区上执行、用$unionWith合并其余分区
+        
+        管道开头的$match阶段同时放入每个$unionWith的子管道，各分区都先按条件过滤再合并
+        
+        Args:
+            collection_name: 请求中的集合名称
+            partitions: 与查询时间范围重叠的分区，没有时仍在原集合上执行（结果为空）
+            pipeline: 请求中的聚合管道
+            
+        Returns:
+            Tuple: (执行聚合的集合, 展开后的管道)
+        """
+        if not partitions:
+            return collection_name, pipeline
+        leading = list(takewhile(lambda stage: "$match" in stage, pipeline))
+        union = [{"$unionWith": {"coll": name, "pipeline": leading}} for name in partitions[1:]]
+        return partitions[0], leading + union + pipeline[len(leading):]
+    
+    def _get_stream_batch_size(self, query_params: Dict[str, Any]) -> int:
+        """
+        校验流式搜索参数并获取batch_size
+        
+        Args:
+            query_params: 查询参数
+            
+        Returns:
+            int: 每批获取的文档数
+            
+        Raises:
+            ValueError: 参数无效
+        """
+        if "cursor" in query_params:
+            raise ValueError("流式响应不支持 cursor 分页")
+        if str(query_params.get("with_total", "")).lower() == "true":
+            raise ValueError("流式响应不支持 with_total")
+        
+        batch_size = int(query_params.get("batch_size") or self.config.STREAM_BATCH_SIZE)
+        if batch_size <= 0:
+            raise ValueError("batch_size 必须大于0")
+        return batch_size
+    
+    def _prepare_keyset_query(self, query: Dict[str, Any],
+                              cursor: Optional[str]) -> Tuple[Dict[str, Any], List[Tuple[str, int]], int]:
+        """
+        构建游标分页的查询条件和排序
+        
+        Args:
+            query: build_search_query构建的查询
+            cursor: 上一页返回的游标，为空时从第一页开始
+            
+        Returns:
+            Tuple: (查询条件, 排序条件, 每页数量)
+            
+        Raises:
+            ValueError: 游标无效或与排序条件不匹配
+        """
+        limit = query["limit"]
+        if limit <= 0:
+            raise ValueError("游标分页的 limit 必须大于0")
+        
+        sort_spec = normalize_sort(query["sort"])
+        find_obj = query["filter"]
+        
+        if cursor:
+            cursor_sort, values = decode_cursor(cursor)
+            if cursor_sort != sort_spec:
+                raise ValueError("cursor 与当前排序条件不匹配")
+            keyset_filter = build_keyset_filter(sort_spec, values)
+            find_obj = {"$and": [find_obj, keyset_filter]} if find_obj else keyset_filter
+        
+        return find_obj, sort_spec, limit
+    
+    def _build_keyset_page(self, documents: List[Dict[str, Any]], sort_spec: List[Tuple[str, int]],
+                           limit: int, hidden_fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        根据多取一条的查询结果构建游标分页结果
+        
+        Args:
+            documents: 查询结果（最多limit + 1条，包含_id）
+            sort_spec: 排序条件
+            limit: 每页数量
+            hidden_fields: 仅为生成游标而查询、不在结果中返回的排序字段
+            
+        Returns:
+            Dict[str, Any]: 包含data和next_cursor
+        """
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            next_cursor = encode_cursor(sort_spec, documents[-1])
+        
+        self._remove_hidden_fields(documents, hidden_fields)
+        return {"data": documents, "next_cursor": next_cursor}
+    
+    @staticmethod
+    def _remove_hidden_fields(documents: List[Dict[str, Any]], hidden_fields: Optional[List[str]] = None):
+        """删除仅为排序或生成游标而查询的_id和排序字段"""
+        for document in documents:
+            document.pop("_id", None)
+            for field in hidden_fields or ():
+                remove_field(document, field)
+    
+    def build_change_stream(self, db_name: str,
+                            collection_name: str) -> Tuple[Union[Database, Collection], List[Dict[str, Any]]]:
+        """
+        构建变更流的监听目标和管道
+        
+        只推送插入、更新和替换；分区集合在数据库级别监听，按集合名匹配全部分区，
+        新建的月份分区无需重新订阅
+        
+        Args:
+            db_name: 数据库名称
+            collection_name: 集合名称
+            
+        Returns:
+            Tuple[Union[Database, Collection], List[Dict[str, Any]]]: (监听的数据库或集合, 管道)
+        """
+        match: Dict[str, Any] = {"operationType": {"$in": list(WATCH_OPERATIONS)}}
+        if self.is_partitioned(db_name, collection_name):
+            match["ns.coll"] = {"$regex": partition_pattern(collection_name).pattern}
+            return self.get_database(db_name), [{"$match": match}]
+        return self.get_collection(db_name, collection_name), [{"$match": match}]
+
+
+class MongoDBManager(BaseMongoDBManager):
+    """MongoDB管理器"""
+    
+    def __init__(self, config: Config):
+        """
+        初始化MongoDB管理器
+        
+        Args:
+            config: 配置实例
+        """
+        super().__init__(config)
+        self.single_flight = SingleFlight() if config.SEARCH_COALESCING_ENABLED else None
+        self.write_behind = WriteBehindQueue(
+            self._flush_write_behind,
+            config.ASYNC_SAVE_QUEUE_SIZE,
+            config.ASYNC_SAVE_BATCH_SIZE,
+            config.ASYNC_SAVE_FLUSH_INTERVAL_MS / 1000,
+            config.ASYNC_SAVE_ENQUEUE_TIMEOUT_MS / 1000
+        )
+        self._warmup_lock = threading.Lock()
+        self._warmup_stop = threading.Event()
+        self._warmup_thread: Optional[threading.Thread] = None
+        # 首次写入集合时的索引创建和慢查询的explain在该线程中执行，请求不等待
+        self._background = ThreadPoolExecutor(1, thread_name_prefix="mongodb-background")
+        self.change_feeds = ChangeFeedHub(
+            self.open_change_stream, config.WATCH_QUEUE_SIZE, config.WATCH_MAX_SUBSCRIBERS,
+            config.WATCH_MAX_PRIVATE_FEEDS
+        )
+        self.client = MongoClient(
+            config.MONGO_URI,
+            event_listeners=[self.pool_metrics, self.command_metrics, self.topology_state],
+            **config.mongo_client_options()
+        )
+    
+    def list_partitions(self, query: Dict[str, Any]) -> List[str]:
+        """
+        列出与查询时间范围重叠的已存在分区
+        
+        Args:
+            query: build_search_query构建的查询
+            
+        Returns:
+            List[str]: 分区集合名，按时间从新到旧排列
+        """
+        collection_name = query["collection_name"]
+        names = self.get_database(query["db_name"]).list_collection_names(
+            filter={"name": {"$regex": partition_pattern(collection_name).pattern}}
+        )
+        return select_partitions(collection_name, names, query["filter"])
+    
+    def ensure_indexes(self, db_name: str, collection_name: str, uuid_name: str = "uuid"):
+        """
+        确保集合上存在uuid字段和时间戳索引，等待创建完成
+        
+        每个进程对每个集合和uuid字段只创建一次，之后直接返回；其他线程正在创建时也直接返回。
+        索引创建失败只记录日志，不影响读写请求；索引冲突等服务端错误不再重试，
+        网络错误在下次访问时重试。分区集合本身不存放数据，索引在写入各分区时创建
+        
+        Args:
+            db_name: 数据库名称
+            collection_name: 集合名称
+            uuid_name: UUID字段名
+        """
+        key = self._claim_indexes(db_name, collection_name, uuid_name)
+        if key is not None:
+            self._create_indexes(key)
+    
+    def request_indexes(self, db_name: str, collection_name: str, uuid_name: str = "uuid"):
+        """
+        在后台线程中确保索引，不阻塞写入请求
+        
+        规则与ensure_indexes一致；并发的首次写入只有一个会提交创建任务，其余直接返回
+        
+        Args:
+            db_name: 数据库名称
+            collection_name: 集合名称
+            uuid_name: UUID字段名
+        """
+        key = self._claim_indexes(db_name, collection_name, uuid_name)
+        if key is not None and not self._submit_background(self._create_indexes, key):
+            self._release_indexes(key, False)
+    
+    def _submit_background(self, fn: Callable[..., Any], *args: Any) -> bool:
+        """
+        在后台线程中执行fn
+        
+        Returns:
+            bool: 已关闭、不再接受任务时返回False
+        """
+        try:
+            self._background.submit(fn, *args)
+        except RuntimeError:
+            return False
+        return True
+    
+    def _create_indexes(self, key: Tuple[str, str, str]):
+        """创建_claim_indexes标记的集合的索引"""
+        db_name, collection_name, uuid_name = key
+        created = False
+        try:
+            self.get_collection(db_name, collection_name).create_indexes(
+                self.build_index_models(uuid_name, self.get_text_index(db_name, collection_name))
+            )
+            created = True
+            logger.info(f"索引已创建，数据库: {db_name}, 集合: {collection_name}, UUID字段: {uuid_name}")
+        except OperationFailure as e:
+            created = True
+            logger.warning(f"索引创建失败，数据库: {db_name}, 集合: {collection_name}, 错误: {e}")
+        except PyMongoError as e:
+            logger.warning(f"索引创建失败，将在下次访问时重试，数据库: {db_name}, 集合: {collection_name}, 错误: {e}")
+        finally:
+            self._release_indexes(key, created)
+    
+    def start_warmup(self):
+        """
+        在后台线程中预热，不等待完成，重复调用只启动一次
+        
+        未开启WARMUP_ENABLED时不做任何事，连接在首次请求时建立
+        """
+        if self.warmup_status == "disabled":
+            return
+        with self._warmup_lock:
+            if self._warmup_thread is not None:
+                return
+            self._warmup_thread = threading.Thread(target=self.warm_up, name="mongodb-warmup", daemon=True)
+            self._warmup_thread.start()
+    
+    def warm_up(self):
+        """
+        预热数据库连接
+        
+        先用ping等待MongoDB可用（失败时每隔WARMUP_RETRY_INTERVAL秒重试，直到成功或关闭），
+        再并发执行ping把连接池填充到MONGO_MIN_POOL_SIZE，最后为WARMUP_COLLECTIONS中的集合创建索引
+        """
+        self.warmup_status = "connecting"
+        while True:
+            try:
+                self.client.admin.command("ping")
+                break
+            except PyMongoError as e:
+                self.warmup_error = str(e)
+                logger.warning(f"预热时连接MongoDB失败，{self.config.WARMUP_RETRY_INTERVAL} 秒后重试，错误: {e}")
+                if self._warmup_stop.wait(self.config.WARMUP_RETRY_INTERVAL):
+                    return
+        
+        self.warmup_status = "warming"
+        pool_size = self.config.MONGO_MIN_POOL_SIZE or 0
+        if pool_size > 1:
+            with ThreadPoolExecutor(pool_size, thread_name_prefix="mongodb-warmup") as executor:
+                for error in executor.map(self._warmup_ping, range(pool_size)):
+                    if error:
+                        logger.warning(f"预热连接池时ping失败，错误: {error}")
+        for db_name, collection_name in self.get_warmup_collections():
+            self.ensure_indexes(db_name, collection_name)
+        
+        self.warmup_error = None
+        self.warmup_status = "done"
+        logger.info(f"预热完成，已建立连接: {self.pool_metrics.snapshot()['connections_created']}")
+    
+    def _warmup_ping(self, _: int) -> Optional[str]:
+        """预热连接池时执行一次ping，返回错误信息"""
+        try:
+            self.client.admin.command("ping")
+        except PyMongoError as e:
+            return str(e)
+        return None
+    
+    def save_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        保存数据到指定数据库和集合
+        
+        Args:
+            data: 要保存的数据
+            
+        Returns:
+            Dict[str, Any]: 操作结果
+        """
+        try:
+            # 获取目标数据库和集合
+            db_name = data.get("db_name")
+            collection_name = data.get("collection_name")
+            
+            if not db_name or not collection_name:
+                return {
+                    "error": "必须指定 db_name 和 collection_name",
+                    "message": "Missing required parameters"
+                }
+            
+            try:
+                write_concern = self.get_write_concern(data.get("write_concern"))
+                find_obj, update = self.build_save_operation(data)
+            except ValueError as e:
+                return {
+                    "error": str(e),
+                    "message": "Invalid parameters"
+                }
+            
+            partition = self.locate_partitions(db_name, collection_name, [find_obj]).get(dumps(find_obj))
+            write_collection = self.get_write_collection_name(db_name, collection_name, update, partition)
+            self.request_indexes(db_name, write_collection, next(iter(find_obj)))
+            target_collection = self.get_collection(db_name, write_collection, write_concern)
+            
+            # 插入或更新数据，新文档的created_at在同一次操作中写入
+            try:
+                result = target_collection.update_one(find_obj, update, upsert=True)
+            finally:
+                self.invalidate_cache(db_name, collection_name)
+            
+            logger.info(f"数据保存成功，数据库: {db_name}, 集合: {collection_name}, ID: {find_obj}")
+            response = {
+                "message": "Data saved successfully",
+                "id": find_obj,
+                "is_new": bool(result.upserted_id) if result.acknowledged else None
+            }
+            if not result.acknowledged:
+                response["acknowledged"] = False
+            return response
+        
+        except PyMongoError as e:
+            logger.error(f"数据库操作失败: {e}")
+            raise
+    
+    def patch_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        按uuid局部更新一条已存在的数据
+        
+        只发送和记录被修改的字段，不需要像save_data那样重写整个content；分区集合从最新的分区开始查找
+        
+        Args:
+            data: 局部更新请求数据，包含db_name、collection_name、uuid、update，可选uuid_name和write_concern
+            
+        Returns:
+            Dict[str, Any]: 操作结果，数据不存在时message为Not found
+        """
+        try:
+            db_name = data.get("db_name")
+            collection_name = data.get("collection_name")
+            
+            if not db_name or not collection_name:
+                return {
+                    "error": "必须指定 db_name 和 collection_name",
+                    "message": "Missing required parameters"
+                }
+            
+            try:
+                write_concern = self.get_write_concern(data.get("write_concern"))
+                find_obj, update = self.build_patch_operation(data)
+            except ValueError as e:
+                return {
+                    "error": str(e),
+                    "message": "Invalid parameters"
+                }
+            
+            result = None
+            try:
+                for write_collection in self.get_patch_collection_names(db_name, collection_name):
+                    self.request_indexes(db_name, write_collection, next(iter(find_obj)))
+                    target_collection = self.get_collection(db_name, write_collection, write_concern)
+                    result = target_collection.update_one(find_obj, update)
+                    if not result.acknowledged or result.matched_count:
+                        break
+            finally:
+                self.invalidate_cache(db_name, collection_name)
+            
+            return self._build_patch_response(db_name, collection_name, find_obj, result)
+        
+        except PyMongoError as e:
+            logger.error(f"数据库操作失败: {e}")
+            raise
+    
+    def get_patch_collection_names(self, db_name: str, collection_name: str) -> List[str]:
+        """
+        获取局部更新需要依次尝试的集合
+        
+        Returns:
+            List[str]: 普通集合为集合本身，分区集合为全部分区（从新到旧）
+        """
+        if not self.is_partitioned(db_name, collection_name):
+            return [collection_name]
+        return self.list_partitions({"db_name": db_name, "collection_name": collection_name, "filter": {}})
+    
+    def locate_partitions(self, db_name: str, collection_name: str,
+                          find_objs: List[Dict[str, Any]]) -> Dict[str, str]:
+        """
+        查找已保存这些uuid的分区，保存时写回原分区，避免跨月份重复保存同一uuid时在当月分区新建一条
+        
+        从最新的分区开始查找，全部找到后不再查询更早的分区
+        
+        Args:
+            db_name: 数据库名称
+            collection_name: 集合名称
+            find_objs: 保存操作的查询条件
+            
+        Returns:
+            Dict[str, str]: dumps(查询条件) -> 分区集合名，普通集合和新uuid不在结果中
+        """
+        located: Dict[str, str] = {}
+        if not find_objs or not self.is_partitioned(db_name, collection_name):
+            return located
+        
+        pending = {dumps(find_obj): find_obj for find_obj in find_objs}
+        for partition in self.get_patch_collection_names(db_name, collection_name):
+            query, projection = self._locate_query(pending)
+            documents = self.get_collection(db_name, partition).find(query, projection)
+            self._record_located(documents, partition, pending, located)
+            if not pending:
+                break
+        return located
+    
+    def _locate_batch(self, entries: List[Tuple[Any, str, str, Dict[str, Any], Dict[str, Any]]]
+                      ) -> Dict[Tuple[str, str], Dict[str, str]]:
+        """查找批量写入中分区集合的uuid所在的分区，返回 (数据库, 集合) -> locate_partitions的结果"""
+        return {
+            (db_name, collection_name): self.locate_partitions(db_name, collection_name, find_objs)
+            for (db_name, collection_name), find_objs in self._batch_targets(entries).items()
+        }
+    
+    def save_async(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        校验数据并放入异步写入队列，不等待写入完成
+        
+        uuid和时间戳在放入队列时生成，与save_data一致；写入使用Config中的默认写关注，
+        写入失败只记录日志和统计，不会通知调用方
+        
+        Args:
+            data: 要保存的数据
+            
+        Returns:
+            Dict[str, Any]: 操作结果
+            
+        Raises:
+            WriteQueueFull: 写入队列已满或已关闭
+        """
+        db_name = data.get("db_name")
+        collection_name = data.get("collection_name")
+        if not db_name or not collection_name:
+            return {
+                "error": "必须指定 db_name 和 collection_name",
+                "message": "Missing required parameters"
+            }
+        
+        if data.get("write_concern") is not None:
+            return {
+                "error": "异步写入不支持 write_concern",
+                "message": "Invalid parameters"
+            }
+        
+        try:
+            find_obj, update = self.build_save_operation(data)
+        except ValueError as e:
+            return {
+                "error": str(e),
+                "message": "Invalid parameters"
+            }
+        
+        self.write_behind.put((db_name, collection_name, find_obj, update))
+        return {
+            "message": "Data accepted",
+            "id": find_obj
+        }
+    
+    def _flush_write_behind(self, items: List[Tuple[str, str, Dict[str, Any], Dict[str, Any]]]) -> int:
+        """
+        批量写入异步队列中的数据
+        
+        按数据库和集合（分区集合按分区）分组，每组使用无序bulk_write执行upsert；同一批中同一uuid出现多次时，
+        后出现的写入放到下一轮bulk_write，保证按放入队列的顺序生效
+        
+        Args:
+            items: (数据库, 集合, 查询条件, 更新文档) 列表
+            
+        Returns:
+            int: 写入失败的条数
+        """
+        parsed = [(None, db_name, collection_name, find_obj, update)
+                  for db_name, collection_name, find_obj, update in items]
+        groups = self._group_batch(parsed, self._locate_batch(parsed))
+        
+        failed = 0
+        write_concern = self.get_write_concern()
+        for (db_name, collection_name, write_collection), rounds in groups.items():
+            for uuid_name in {next(iter(find_obj)) for _, find_obj, _ in rounds[0]}:
+                self.request_indexes(db_name, write_collection, uuid_name)
+            target_collection = self.get_collection(db_name, write_collection, write_concern)
+            
+            try:
+                for entries in rounds:
+                    try:
+                        target_collection.bulk_write([operation for _, _, operation in entries], ordered=False)
+                    except BulkWriteError as e:
+                        write_errors = e.details.get("writeErrors", [])
+                        failed += len(write_errors)
+                        for error in write_errors:
+                            logger.error(
+                                f"异步写入失败，数据库: {db_name}, 集合: {collection_name}, "
+                                f"ID: {entries[error['index']][1]}, 错误: {error.get('errmsg')}"
+                            )
+                    except PyMongoError as e:
+                        failed += len(entries)
+                        logger.error(f"异步写入失败，数据库: {db_name}, 集合: {collection_name}, "
+                                     f"数量: {len(entries)}, 错误: {e}")
+            finally:
+                self.invalidate_cache(db_name, collection_name)
+            
+            logger.info(f"异步写入完成，数据库: {db_name}, 集合: {collection_name}, "
+                        f"数量: {sum(len(entries) for entries in rounds)}")
+        return failed
+    
+    def save_batch(self, items: List[Dict[str, Any]],
+                   write_concern: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        批量保存数据
+        
+        按数据库和集合（分区集合按分区）分组，每组使用无序bulk_write执行upsert，
+        content解析和时间戳规则与save_data一致；同一批中同一uuid出现多次时，后出现的数据放到下一轮bulk_write，
+        避免无序写入中的两个upsert同时插入同一uuid，并保证按请求中的顺序生效
+        
+        Args:
+            items: 保存请求数据列表
+            write_concern: 整批数据使用的写关注参数
+            
+        Returns:
+            Dict[str, Any]: 操作结果，包含每条数据的ID、是否新建或错误信息
+            
+        Raises:
+            ValueError: 写关注参数无效
+        """
+        batch_write_concern = self.get_write_concern(write_concern)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        parsed = self._parse_batch(items, results)
+        groups = self._group_batch(parsed, self._locate_batch(parsed))
+        
+        for (db_name, collection_name, write_collection), rounds in groups.items():
+            for uuid_name in {next(iter(find_obj)) for _, find_obj, _ in rounds[0]}:
+                self.request_indexes(db_name, write_collection, uuid_name)
+            target_collection = self.get_collection(db_name, write_collection, batch_write_concern)
+            
+            try:
+                for entries in rounds:
+                    self._write_batch_round(target_collection, db_name, collection_name, entries, results)
+            finally:
+                self.invalidate_cache(db_name, collection_name)
+            
+            logger.info(f"批量保存完成，数据库: {db_name}, 集合: {collection_name}, "
+                        f"数量: {sum(len(entries) for entries in rounds)}")
+        
+        return self._build_batch_response(results)
+    
+    def _write_batch_round(self, target_collection: Collection, db_name: str, collection_name: str,
+                           entries: List[Tuple[int, Dict[str, Any], UpdateOne]],
+                           results: List[Optional[Dict[str, Any]]]):
+        """
+        使用一次无序bulk_write写入save_batch中的一轮数据，并把每条数据的结果填入results
+        
+        Args:
+            target_collection: 写入的集合
+            db_name: 数据库名称
+            collection_name: 请求中的集合名称
+            entries: (请求中的序号, 查询条件, 写操作) 列表，uuid互不相同
+            results: save_batch的结果列表
+        """
+        upserted: Optional[Dict[int, Any]] = {}
+        write_errors: Dict[int, str] = {}
+        
+        try:
+            result = target_collection.bulk_write(
+                [operation for _, _, operation in entries],
+                ordered=False
+            )
+            # 非确认写入（w=0）无法得知是否新建
+            upserted = (result.upserted_ids or {}) if result.acknowledged else None
+        except BulkWriteError as e:
+            upserted, write_errors = self._parse_bulk_write_error(e)
+        except PyMongoError as e:
+            logger.error(f"批量写入失败，数据库: {db_name}, 集合: {collection_name}, 错误: {e}")
+            write_errors = {position: "数据库操作失败" for position in range(len(entries))}
+        
+        self._record_batch_round(entries, results, upserted, write_errors)
+    
+    def search_data(self, query_params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        搜索数据
+        
+        支持复杂的查询条件、排序和分页，可指定目标数据库和集合
+        
+        Args:
+            query_params: 查询参数
+            
+        Returns:
+            List[Dict[str, Any]]: 查询结果列表
+        """
+        return self.search_page(query_params)["data"]
+    
+    def search_page(self, query_params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        搜索一页数据
+        
+        查询参数中包含cursor时使用游标分页：按排序字段加_id的范围条件定位下一页，
+        不再使用skip，并在结果中返回下一页的游标（没有更多数据时为None）。
+        with_total=true时同时返回符合条件的总数，total_limit可限制计数的上限。
+        启用查询缓存时相同的查询直接返回缓存结果，cache=false可跳过缓存。
+        
+        Args:
+            query_params: 查询参数
+            
+        Returns:
+            Dict[str, Any]: 包含data，游标分页时还包含next_cursor，with_total时还包含total和total_exact
+            
+        Raises:
+            ValueError: 游标、排序条件或total_limit无效
+        """
+        try:
+            query = self.build_search_query(query_params)
+            if query is None:
+                return self._empty_page(query_params)
+            
+            if not self._use_query_cache(query_params):
+                return self._coalesced_search(query)
+            
+            db_name = query["db_name"]
+            collection_name = query["collection_name"]
+            cache_key = QueryCache.make_key(query)
+            hit, page = self.query_cache.get(cache_key)
+            if hit:
+                return page
+            
+            version = self.query_cache.get_version(db_name, collection_name)
+            page = self._coalesced_search(query, cache_key)
+            self.query_cache.put(cache_key, db_name, collection_name, page, version)
+            return page
+        
+        except PyMongoError as e:
+            logger.error(f"数据库查询失败: {e}")
+            raise
+    
+    def _coalesced_search(self, query: Dict[str, Any], key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        执行搜索查询，相同的查询正在进行时共享其结果
+        
+        Args:
+            query: build_search_query构建的查询
+            key: 查询键，为None时根据查询生成
+            
+        Returns:
+            Dict[str, Any]: 查询结果，与_execute_search一致
+        """
+        if self.single_flight is None:
+            return self._execute_search(query)
+        
+        db_name = query["db_name"]
+        collection_name = query["collection_name"]
+        page, shared = self.single_flight.do(
+            key or QueryCache.make_key(query), db_name, collection_name, lambda: self._execute_search(query)
+        )
+        if shared:
+            observe_coalesced(db_name, collection_name)
+        return page
+    
+    def _execute_search(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        执行搜索查询
+        
+        Args:
+            query: build_search_query构建的查询
+            
+        Returns:
+            Dict[str, Any]: 包含data，游标分页时还包含next_cursor
+        """
+        db_name = query["db_name"]
+        collection_name = query["collection_name"]
+        partitioned = self.is_partitioned(db_name, collection_name)
+        target_collection = None if partitioned else self.get_search_collection(query)
+        
+        logger.info(f"查询数据库: {db_name}, 集合: {collection_name}, 条件: {query['filter']}, 排序: {query['sort']}")
+        started_at = time.perf_counter()
+        
+        if partitioned:
+            page = self._search_partitions(query, self.list_partitions(query))
+        elif "cursor" in query:
+            page = self._search_keyset(target_collection, query)
+        else:
+            # 执行查询
+            page = {"data": list(self._find_cursor(target_collection, query))}
+        
+        if "total" in query and not partitioned:
+            method, args, kwargs = self._total_count_operation(query)
+            page.update(self._build_total(query, method, getattr(target_collection, method)(*args, **kwargs)))
+        
+        duration = time.perf_counter() - started_at
+        suppressed = self._acquire_slow_query_log(query, duration)
+        if suppressed is not None:
+            if partitioned:
+                # 分区集合的执行计划分散在各分区中，慢查询日志不再逐个explain
+                self._log_slow_query(query, len(page["data"]), duration, {}, suppressed)
+            else:
+                self._submit_background(self._explain_slow_query, target_collection, query, len(page["data"]),
+                                        duration, suppressed)
+        return page
+    
+    def _explain_slow_query(self, target_collection: Collection, query: Dict[str, Any], returned: int,
+                            duration: float, suppressed: int):
+        """
+        在后台线程中以executionStats级别explain慢查询并记录日志
+        
+        explain会重新执行一次查询，不占用请求线程；SlowQueryLog保证同一查询结构在间隔内只explain一次
+        """
+        explanation = {}
+        try:
+            explanation = target_collection.database.command(
+                "explain", self._plan_command(target_collection, query), verbosity="executionStats",
+                read_preference=target_collection.read_preference
+            )
+        except PyMongoError as e:
+            logger.warning(f"慢查询explain失败: {e}")
+        self._log_slow_query(query, returned, duration, explanation, suppressed)
+    
+    def _search_partitions(self, query: Dict[str, Any], partitions: List[str]) -> Dict[str, Any]:
+        """
+        在各分区中执行搜索并合并结果
+        
+        每个分区按排序条件取前skip + limit条（游标分页时取limit + 1条），
+        按排序条件合并后再统一跳过skip条并取limit条；with_total时累加各分区的计数
+        
+        Args:
+            query: build_search_query构建的查询
+            partitions: list_partitions选出的分区
+            
+        Returns:
+            Dict[str, Any]: 与_execute_search一致
+        """
+        prepared = self._prepare_partition_query(query)
+        cursors = [self._partition_cursor(self.get_search_collection(query, name), query, prepared)
+                   for name in partitions]
+        page = self._build_partition_page(query, merge_sorted(cursors, prepared[2]), prepared)
+        
+        if "total" in query:
+            method, args, kwargs = self._total_count_operation(query)
+            count = sum(getattr(self.get_search_collection(query, name), method)(*args, **kwargs)
+                        for name in partitions)
+            page.update(self._build_total(query, method, count))
+        return page
+    
+    def explain_search(self, query_params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        返回搜索的执行计划和执行统计，不返回数据
+        
+        使用与search_page相同的条件、投影、排序和分页（包括游标分页）执行explain；
+        分区集合对每个被查询的分区分别执行explain
+        
+        Args:
+            query_params: 查询参数
+            
+        Returns:
+            Dict[str, Any]: 查询结构、执行计划概要、胜出的执行计划和executionStats
+            
+        Raises:
+            ValueError: 参数无效或没有查询条件
+        """
+        query = self.build_search_query(query_params)
+        if query is None:
+            raise ValueError("没有查询条件，无法explain")
+        
+        try:
+            if self.is_partitioned(query["db_name"], query["collection_name"]):
+                prepared = self._prepare_partition_query(query)
+                return self._build_partition_explain(query, [
+                    (name, self._partition_cursor(self.get_search_collection(query, name), query, prepared).explain())
+                    for name in self.list_partitions(query)
+                ])
+            target_collection = self.get_search_collection(query)
+            return self._build_explain(query, self._explain_cursor(target_collection, query).explain())
+        except PyMongoError as e:
+            logger.error(f"explain失败: {e}")
+            raise
+    
+    def search_stream(self, query_params: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        以流的方式搜索数据
+        
+        返回的游标按batch_size分批从MongoDB获取文档，调用方逐条迭代，
+        不会一次性把全部结果加载到内存；分区集合边读取各分区的游标边合并
+        
+        Args:
+            query_params: 查询参数，batch_size可选，默认使用Config.STREAM_BATCH_SIZE
+            
+        Returns:
+            Iterator[Dict[str, Any]]: 文档迭代器
+            
+        Raises:
+            ValueError: 参数无效
+        """
+        batch_size = self._get_stream_batch_size(query_params)
+        
+        try:
+            query = self.build_search_query(query_params)
+            if query is None:
+                return iter([])
+            
+            db_name = query["db_name"]
+            collection_name = query["collection_name"]
+            
+            logger.info(f"流式查询数据库: {db_name}, 集合: {collection_name}, 条件: {query['filter']}, 排序: {query['sort']}")
+            
+            if self.is_partitioned(db_name, collection_name):
+                prepared = self._prepare_partition_query(query)
+                cursors = [
+                    self._partition_cursor(self.get_search_collection(query, name), query, prepared).batch_size(batch_size)
+                    for name in self.list_partitions(query)
+                ]
+                return self._stream_partitions(query, cursors, prepared)
+            return self._find_cursor(self.get_search_collection(query), query).batch_size(batch_size)
+        
+        except PyMongoError as e:
+            logger.error(f"数据库查询失败: {e}")
+            raise
+    
+    def _stream_partitions(self, query: Dict[str, Any], cursors: List[Cursor], prepared: Tuple) -> Iterator[Dict[str, Any]]:
+        """逐条合并各分区的游标并按skip、limit输出，结束或被关闭时关闭全部游标"""
+        _, _, sort_spec, fetch, hidden_fields = prepared
+        try:
+            for document in islice(merge_sorted(cursors, sort_spec), query["skip"], fetch or None):
+                self._remove_hidden_fields([document], hidden_fields)
+                yield document
+        finally:
+            for cursor in cursors:
+                cursor.close()
+    
+    def aggregate(self, params: Dict[str, Any]) -> CommandCursor:
+        """
+        执行聚合管道
+        
+        分组、计数等计算在MongoDB中完成，结果通过游标按batch_size分批获取，
+        调用方逐条迭代，不会一次性把全部结果加载到内存；分区集合用$unionWith合并与开头$match的时间范围重叠的分区
+        
+        Args:
+            params: 请求参数，包含db_name、collection_name、pipeline，
+                可选allow_disk_use、max_time_ms、batch_size
+                
+        Returns:
+            CommandCursor: 聚合结果游标
+            
+        Raises:
+            ValueError: 参数无效
+        """
+        db_name, collection_name, pipeline, options = self._prepare_aggregate(params)
+        
+        try:
+            source = collection_name
+            if self.is_partitioned(db_name, collection_name):
+                partitions = self.list_partitions(self._aggregate_partition_query(db_name, collection_name, pipeline))
+                source, pipeline = self._expand_partitions(collection_name, partitions, pipeline)
+            target_collection = self.get_collection(db_name, source)
+            logger.info(f"聚合查询数据库: {db_name}, 集合: {collection_name}, 阶段数: {len(pipeline)}")
+            return target_collection.aggregate(pipeline, **options)
+        except PyMongoError as e:
+            logger.error(f"聚合查询失败: {e}")
+            raise
+    
+    def _search_keyset(self, target_collection: Collection, query: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        使用游标（keyset）分页执行查询
+        
+        Args:
+            target_collection: 目标集合
+            query: build_search_query构建的查询，cursor为上一页返回的游标，为空时从第一页开始
+            
+        Returns:
+            Dict[str, Any]: 包含data和next_cursor
+        """
+        keyset_cursor, sort_spec, limit, hidden_fields = self._keyset_cursor(target_collection, query)
+        return self._build_keyset_page(list(keyset_cursor), sort_spec, limit, hidden_fields)
+    
+    def open_change_stream(self, db_name: str, collection_name: str,
+                           resume_after: Optional[Dict[str, str]] = None):
+        """
+        打开集合的变更流，更新事件附带更新后的完整文档
+        
+        Args:
+            db_name: 数据库名称
+            collection_name: 集合名称
+            resume_after: 恢复令牌，从该事件之后开始
+            
+        Returns:
+            ChangeStream: 变更流
+        """
+        target, pipeline = self.build_change_stream(db_name, collection_name)
+        return target.watch(pipeline, full_document="updateLookup",
+                            max_await_time_ms=WATCH_MAX_AWAIT_MS, resume_after=resume_after)
+    
+    def subscribe_changes(self, query_params: Dict[str, Any]) -> Subscription:
+        """
+        订阅集合的变更
+        
+        同一集合的订阅者共享一个变更流；指定resume_after时单独打开从该位置开始的变更流
+        
+        Args:
+            query_params: db_name、collection_name，可选的match（变更事件的过滤条件）和resume_after（事件id）
+            
+        Returns:
+            Subscription: 订阅，用完后需调用change_feeds.release
+            
+        Raises:
+            ValueError: 参数无效
+            TooManySubscribers: 订阅者已达WATCH_MAX_SUBSCRIBERS
+            PyMongoError: 打开变更流失败
+        """
+        match = parse_match(query_params.get("match"))
+        resume_after = parse_resume_token(query_params.get("resume_after"))
+        db_name = query_params["db_name"]
+        collection_name = query_params["collection_name"]
+        logger.info(f"订阅变更，数据库: {db_name}, 集合: {collection_name}, 条件: {match}")
+        return self.change_feeds.subscribe(db_name, collection_name, match, resume_after)
+    
+    def close(self):
+        """写完异步写入队列中的数据后关闭数据库连接"""
+        self._warmup_stop.set()
+        self.change_feeds.close()
+        self.write_behind.close(self.config.ASYNC_SAVE_DRAIN_TIMEOUT)
+        self._background.shutdown(wait=False, cancel_futures=True)
+        if self.client:
+            self.client.close()
+
+
+class AsyncMongoDBManager(BaseMongoDBManager):
+    """
+    基于PyMongo异步API的MongoDB管理器
+    
+    查询构建、参数校验等逻辑与MongoDBManager共用，数据库操作均为协程，
+    供ASGI入口在单个事件循环中并发处理大量请求。
+    异步写入队列依赖后台线程和同步客户端，只在MongoDBManager中提供
+    """
+    
+    def __init__(self, config: Config):
+        """
+        初始化异步MongoDB管理器
+        
+        Args:
+            config: 配置实例
+        """
+        super().__init__(config)
+        self.single_flight = AsyncSingleFlight() if config.SEARCH_COALESCING_ENABLED else None
+        self._warmup_task: Optional[asyncio.Task] = None
+        # 索引创建和慢查询explain的后台任务
+        self._background_tasks: Set[asyncio.Task] = set()
+        self.change_feeds = AsyncChangeFeedHub(
+            self.open_change_stream, config.WATCH_QUEUE_SIZE, config.ASGI_WATCH_MAX_SUBSCRIBERS,
+            config.WATCH_MAX_PRIVATE_FEEDS
+        )
+        self.client = AsyncMongoClient(
+            config.MONGO_URI,
+            event_listeners=[self.pool_metrics, self.command_metrics, self.topology_state],
+            **config.mongo_client_options()
+        )
+    
+    async def ping(self) -> Dict[str, Any]:
+        """
+        检测数据库连接
+        
+        Returns:
+            Dict[str, Any]: ping命令结果
+        """
+        return await self.client.admin.command('ping')
+    
+    def start_warmup(self):
+        """在当前事件循环中启动预热任务，不等待完成，重复调用只启动一次"""
+        if self.warmup_status == "disabled" or self._warmup_task is not None:
+            return
+        self._warmup_task = asyncio.get_running_loop().create_task(self.warm_up())
+    
+    async def warm_up(self):
+        """预热数据库连接，步骤与MongoDBManager.warm_up一致"""
+        self.warmup_status = "connecting"
+        while True:
+            try:
+                await self.ping()
+                break
+            except PyMongoError as e:
+                self.warmup_error = str(e)
+                logger.warning(f"预热时连接MongoDB失败，{self.config.WARMUP_RETRY_INTERVAL} 秒后重试，错误: {e}")
+                await asyncio.sleep(self.config.WARMUP_RETRY_INTERVAL)
+        
+        self.warmup_status = "warming"
+        pool_size = self.config.MONGO_MIN_POOL_SIZE or 0
+        if pool_size > 1:
+            results = await asyncio.gather(*(self.ping() for _ in range(pool_size)), return_exceptions=True)
+            for result in results:
+                if isinstance(result, PyMongoError):
+                    logger.warning(f"预热连接池时ping失败，错误: {result}")
+        for db_name, collection_name in self.get_warmup_collections():
+            await self.ensure_indexes(db_name, collection_name)
+        
+        self.warmup_error = None
+        self.warmup_status = "done"
+        logger.info(f"预热完成，已建立连接: {self.pool_metrics.snapshot()['connections_created']}")
+    
+    async def list_partitions(self, query: Dict[str, Any]) -> List[str]:
+        """
+        列出与查询时间范围重叠的已存在分区，规则与MongoDBManager.list_partitions一致
+        
+        Args:
+            query: build_search_query构建的查询
+            
+        Returns:
+            List[str]: 分区集合名，按时间从新到旧排列
+        """
+        collection_name = query["collection_name"]
+        names = await self.get_database(query["db_name"]).list_collection_names(
+            filter={"name": {"$regex": partition_pattern(collection_name).pattern}}
+        )
+        return select_partitions(collection_name, names, query["filter"])
+    
+    async def ensure_indexes(self, db_name: str, collection_name: str, uuid_name: str = "uuid"):
+        """
+        确保集合上存在uuid字段和时间戳索引并等待创建完成，规则与MongoDBManager.ensure_indexes一致
+        
+        Args:
+            db_name: 数据库名称
+            collection_name: 集合名称
+            uuid_name: UUID字段名
+        """
+        key = self._claim_indexes(db_name, collection_name, uuid_name)
+        if key is not None:
+            await self._create_indexes(key)
+    
+    def request_indexes(self, db_name: str, collection_name: str, uuid_name: str = "uuid"):
+        """
+        在后台任务中确保索引，不阻塞写入请求，规则与MongoDBManager.request_indexes一致
+        
+        Args:
+            db_name: 数据库名称
+            collection_name: 集合名称
+            uuid_name: UUID字段名
+        """
+        key = self._claim_indexes(db_name, collection_name, uuid_name)
+        if key is not None:
+            self._spawn(self._create_indexes(key))
+    
+    def _spawn(self, coroutine: Awaitable[Any]):
+        """在后台任务中执行协程，保留任务的引用，避免执行中被回收"""
+        task = asyncio.ensure_future(coroutine)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _create_indexes(self, key: Tuple[str, str, str]):
+        """创建_claim_indexes标记的集合的索引"""
+        db_name, collection_name, uuid_name = key
+        created = False
+        try:
+            await self.get_collection(db_name, collection_name).create_indexes(
+                self.build_index_models(uuid_name, self.get_text_index(db_name, collection_name))
+            )
+            created = True
+            logger.info(f"索引已创建，数据库: {db_name}, 集合: {collection_name}, UUID字段: {uuid_name}")
+        except OperationFailure as e:
+            created = True
+            logger.warning(f"索引创建失败，数据库: {db_name}, 集合: {collection_name}, 错误: {e}")
+        except PyMongoError as e:
+            logger.warning(f"索引创建失败，将在下次访问时重试，数据库: {db_name}, 集合: {collection_name}, 错误: {e}")
+        finally:
+            self._release_indexes(key, created)
+    
+    async def save_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        保存数据到指定数据库和集合，规则与MongoDBManager.save_data一致
+        
+        Args:
+            data: 要保存的数据
+            
+        Returns:
+            Dict[str, Any]: 操作结果
+        """
+        try:
+            db_name = data.get("db_name")
+            collection_name = data.get("collection_name")
+            
+            if not db_name or not collection_name:
+                return {
+                    "error": "必须指定 db_name 和 collection_name",
+                    "message": "Missing required parameters"
+                }
+            
+            try:
+                write_concern = self.get_write_concern(data.get("write_concern"))
+                find_obj, update = self.build_save_operation(data)
+            except ValueError as e:
+                return {
+                    "error": str(e),
+                    "message": "Invalid parameters"
+                }
+            
+            located = await self.locate_partitions(db_name, collection_name, [find_obj])
+            write_collection = self.get_write_collection_name(db_name, collection_name, update,
+                                                              located.get(dumps(find_obj)))
+            self.request_indexes(db_name, write_collection, next(iter(find_obj)))
+            target_collection = self.get_collection(db_name, write_collection, write_concern)
+            try:
+                result = await target_collection.update_one(find_obj, update, upsert=True)
+            finally:
+                self.invalidate_cache(db_name, collection_name)
+            
+            logger.info(f"数据保存成功，数据库: {db_name}, 集合: {collection_name}, ID: {find_obj}")
+            response = {
+                "message": "Data saved successfully",
+                "id": find_obj,
+                "is_new": bool(result.upserted_id) if result.acknowledged else None
+            }
+            if not result.acknowledged:
+                response["acknowledged"] = False
+            return response
+        
+        except PyMongoError as e:
+            logger.error(f"数据库操作失败: {e}")
+            raise
+    
+    async def patch_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        按uuid局部更新一条已存在的数据，规则与MongoDBManager.patch_data一致
+        
+        Args:
+            data: 局部更新请求数据
+            
+        Returns:
+            Dict[str, Any]: 操作结果
+        """
+        try:
+            db_name = data.get("db_name")
+            collection_name = data.get("collection_name")
+            
+            if not db_name or not collection_name:
+                return {
+                    "error": "必须指定 db_name 和 collection_name",
+                    "message": "Missing required parameters"
+                }
+            
+            try:
+                write_concern = self.get_write_concern(data.get("write_concern"))
+                find_obj, update = self.build_patch_operation(data)
+            except ValueError as e:
+                return {
+                    "error": str(e),
+                    "message": "Invalid parameters"
+                }
+            
+            result = None
+            try:
+                for write_collection in await self.get_patch_collection_names(db_name, collection_name):
+                    self.request_indexes(db_name, write_collection, next(iter(find_obj)))
+                    target_collection = self.get_collection(db_name, write_collection, write_concern)
+                    result = await target_collection.update_one(find_obj, update)
+                    if not result.acknowledged or result.matched_count:
+                        break
+            finally:
+                self.invalidate_cache(db_name, collection_name)
+            
+            return self._build_patch_response(db_name, collection_name, find_obj, result)
+        
+        except PyMongoError as e:
+            logger.error(f"数据库操作失败: {e}")
+            raise
+    
+    async def get_patch_collection_names(self, db_name: str, collection_name: str) -> List[str]:
+        """获取局部更新需要依次尝试的集合，与MongoDBManager.get_patch_collection_names一致"""
+        if not self.is_partitioned(db_name, collection_name):
+            return [collection_name]
+        return await self.list_partitions({"db_name": db_name, "collection_name": collection_name, "filter": {}})
+    
+    async def locate_partitions(self, db_name: str, collection_name: str,
+                                find_objs: List[Dict[str, Any]]) -> Dict[str, str]:
+        """查找已保存这些uuid的分区，与MongoDBManager.locate_partitions一致"""
+        located: Dict[str, str] = {}
+        if not find_objs or not self.is_partitioned(db_name, collection_name):
+            return located
+        
+        pending = {dumps(find_obj): find_obj for find_obj in find_objs}
+        for partition in await self.get_patch_collection_names(db_name, collection_name):
+            query, projection = self._locate_query(pending)
+            documents = await self.get_collection(db_name, partition).find(query, projection).to_list(None)
+            self._record_located(documents, partition, pending, located)
+            if not pending:
+                break
+        return located
+    
+    async def _locate_batch(self, entries: List[Tuple[Any, str, str, Dict[str, Any], Dict[str, Any]]]
+                            ) -> Dict[Tuple[str, str], Dict[str, str]]:
+        """查找批量写入中分区集合的uuid所在的分区，与MongoDBManager._locate_batch一致"""
+        return {
+            (db_name, collection_name): await self.locate_partitions(db_name, collection_name, find_objs)
+            for (db_name, collection_name), find_objs in self._batch_targets(entries).items()
+        }
+    
+    async def save_batch(self, items: List[Dict[str, Any]],
+                         write_concern: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        批量保存数据，分组和多轮写入的规则与MongoDBManager.save_batch一致
+        
+        Args:
+            items: 保存请求数据列表
+            write_concern: 整批数据使用的写关注参数
+            
+        Returns:
+            Dict[str, Any]: 操作结果，包含每条数据的ID、是否新建或错误信息
+            
+        Raises:
+            ValueError: 写关注参数无效
+        """
+        batch_write_concern = self.get_write_concern(write_concern)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        parsed = self._parse_batch(items, results)
+        groups = self._group_batch(parsed, await self._locate_batch(parsed))
+        
+        for (db_name, collection_name, write_collection), rounds in groups.items():
+            for uuid_name in {next(iter(find_obj)) for _, find_obj, _ in rounds[0]}:
+                self.request_indexes(db_name, write_collection, uuid_name)
+            target_collection = self.get_collection(db_name, write_collection, batch_write_concern)
+            
+            try:
+                for entries in rounds:
+                    await self._write_batch_round(target_collection, db_name, collection_name, entries, results)
+            finally:
+                self.invalidate_cache(db_name, collection_name)
+            
+            logger.info(f"批量保存完成，数据库: {db_name}, 集合: {collection_name}, "
+                        f"数量: {sum(len(entries) for entries in rounds)}")
+        
+        return self._build_batch_response(results)
+    
+    async def _write_batch_round(self, target_collection, db_name: str, collection_name: str,
+                                 entries: List[Tuple[int, Dict[str, Any], UpdateOne]],
+                                 results: List[Optional[Dict[str, Any]]]):
+        """使用一次无序bulk_write写入save_batch中的一轮数据，与MongoDBManager._write_batch_round一致"""
+        upserted: Optional[Dict[int, Any]] = {}
+        write_errors: Dict[int, str] = {}
+        
+        try:
+            result = await target_collection.bulk_write(
+                [operation for _, _, operation in entries],
+                ordered=False
+            )
+            upserted = (result.upserted_ids or {}) if result.acknowledged else None
+        except BulkWriteError as e:
+            upserted, write_errors = self._parse_bulk_write_error(e)
+        except PyMongoError as e:
+            logger.error(f"批量写入失败，数据库: {db_name}, 集合: {collection_name}, 错误: {e}")
+            write_errors = {position: "数据库操作失败" for position in range(len(entries))}
+        
+        self._record_batch_round(entries, results, upserted, write_errors)
+    
+    async def search_data(self, query_params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        搜索数据
+        
+        Args:
+            query_params: 查询参数
+            
+        Returns:
+            List[Dict[str, Any]]: 查询结果列表
+        """
+        return (await self.search_page(query_params))["data"]
+    
+    async def search_page(self, query_params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        搜索一页数据，参数、返回值和查询缓存的规则与MongoDBManager.search_page一致
+        
+        Args:
+            query_params: 查询参数
+            
+        Returns:
+            Dict[str, Any]: 包含data，游标分页时还包含next_cursor，with_total时还包含total和total_exact
+            
+        Raises:
+            ValueError: 游标、排序条件或total_limit无效
+        """
+        try:
+            query = self.build_search_query(query_params)
+            if query is None:
+                return self._empty_page(query_params)
+            
+            if not self._use_query_cache(query_params):
+                return await self._coalesced_search(query)
+            
+            db_name = query["db_name"]
+            collection_name = query["collection_name"]
+            cache_key = QueryCache.make_key(query)
+            hit, page = self.query_cache.get(cache_key)
+            if hit:
+                return page
+            
+            version = self.query_cache.get_version(db_name, collection_name)
+            page = await self._coalesced_search(query, cache_key)
+            self.query_cache.put(cache_key, db_name, collection_name, page, version)
+            return page
+        
+        except PyMongoError as e:
+            logger.error(f"数据库查询失败: {e}")
+            raise
+    
+    async def _coalesced_search(self, query: Dict[str, Any], key: Optional[str] = None) -> Dict[str, Any]:
+        """执行搜索查询，相同的查询正在进行时共享其结果，与MongoDBManager._coalesced_search一致"""
+        if self.single_flight is None:
+            return await self._execute_search(query)
+        
+        db_name = query["db_name"]
+        collection_name = query["collection_name"]
+        page, shared = await self.single_flight.do(
+            key or QueryCache.make_key(query), db_name, collection_name, lambda: self._execute_search(query)
+        )
+        if shared:
+            observe_coalesced(db_name, collection_name)
+        return page
+    
+    async def _execute_search(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        执行搜索查询
+        
+        Args:
+            query: build_search_query构建的查询
+            
+        Returns:
+            Dict[str, Any]: 包含data，游标分页时还包含next_cursor
+        """
+        db_name = query["db_name"]
+        collection_name = query["collection_name"]
+        partitioned = self.is_partitioned(db_name, collection_name)
+        target_collection = None if partitioned else self.get_search_collection(query)
+        
+        logger.info(f"查询数据库: {db_name}, 集合: {collection_name}, 条件: {query['filter']}, 排序: {query['sort']}")
+        started_at = time.perf_counter()
+        
+        if partitioned:
+            page = await self._search_partitions(query, await self.list_partitions(query))
+        elif "cursor" in query:
+            keyset_cursor, sort_spec, limit, hidden_fields = self._keyset_cursor(target_collection, query)
+            page = self._build_keyset_page(await keyset_cursor.to_list(), sort_spec, limit, hidden_fields)
+        else:
+            page = {"data": await self._find_cursor(target_collection, query).to_list()}
+        
+        if "total" in query and not partitioned:
+            method, args, kwargs = self._total_count_operation(query)
+            page.update(self._build_total(query, method, await getattr(target_collection, method)(*args, **kwargs)))
+        
+        duration = time.perf_counter() - started_at
+        suppressed = self._acquire_slow_query_log(query, duration)
+        if suppressed is not None:
+            if partitioned:
+                self._log_slow_query(query, len(page["data"]), duration, {}, suppressed)
+            else:
+                self._spawn(self._explain_slow_query(target_collection, query, len(page["data"]), duration, suppressed))
+        return page
+    
+    async def _explain_slow_query(self, target_collection, query: Dict[str, Any], returned: int,
+                                  duration: float, suppressed: int):
+        """在后台任务中explain慢查询并记录日志，与MongoDBManager._explain_slow_query一致"""
+        explanation = {}
+        try:
+            explanation = await target_collection.database.command(
+                "explain", self._plan_command(target_collection, query), verbosity="executionStats",
+                read_preference=target_collection.read_preference
+            )
+        except PyMongoError as e:
+            logger.warning(f"慢查询explain失败: {e}")
+        self._log_slow_query(query, returned, duration, explanation, suppressed)
+    
+    async def _search_partitions(self, query: Dict[str, Any], partitions: List[str]) -> Dict[str, Any]:
+        """
+        在各分区中并发执行搜索并合并结果，规则与MongoDBManager._search_partitions一致
+        
+        Args:
+            query: build_search_query构建的查询
+            partitions: list_partitions选出的分区
+            
+        Returns:
+            Dict[str, Any]: 包含data，游标分页时还包含next_cursor，with_total时还包含total和total_exact
+        """
+        prepared = self._prepare_partition_query(query)
+        results = await asyncio.gather(*(
+            self._partition_cursor(self.get_search_collection(query, name), query, prepared).to_list()
+            for name in partitions
+        ))
+        page = self._build_partition_page(query, merge_sorted(results, prepared[2]), prepared)
+        
+        if "total" in query:
+            method, args, kwargs = self._total_count_operation(query)
+            counts = await asyncio.gather(*(
+                getattr(self.get_search_collection(query, name), method)(*args, **kwargs) for name in partitions
+            ))
+            page.update(self._build_total(query, method, sum(counts)))
+        return page
+    
+    async def explain_search(self, query_params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        返回搜索的执行计划和执行统计，参数和返回值与MongoDBManager.explain_search一致
+        
+        Args:
+            query_params: 查询参数
+            
+        Returns:
+            Dict[str, Any]: 查询结构、执行计划概要、胜出的执行计划和executionStats
+            
+        Raises:
+            ValueError: 参数无效或没有查询条件
+        """
+        query = self.build_search_query(query_params)
+        if query is None:
+            raise ValueError("没有查询条件，无法explain")
+        
+        try:
+            if self.is_partitioned(query["db_name"], query["collection_name"]):
+                prepared = self._prepare_partition_query(query)
+                return self._build_partition_explain(query, [
+                    (name, await self._partition_cursor(self.get_search_collection(query, name), query, prepared).explain())
+                    for name in await self.list_partitions(query)
+                ])
+            target_collection = self.get_search_collection(query)
+            return self._build_explain(query, await self._explain_cursor(target_collection, query).explain())
+        except PyMongoError as e:
+            logger.error(f"explain失败: {e}")
+            raise
+    
+    def search_stream(self, query_params: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        以流的方式搜索数据
+        
+        Args:
+            query_params: 查询参数，batch_size可选
+            
+        Returns:
+            AsyncIterator[Dict[str, Any]]: 按批次从服务端获取文档的异步游标
+            
+        Raises:
+            ValueError: 参数无效
+        """
+        batch_size = self._get_stream_batch_size(query_params)
+        query = self.build_search_query(query_params)
+        if query is None:
+            return _empty_async_iterator()
+        
+        if self.is_partitioned(query["db_name"], query["collection_name"]):
+            return self._stream_partitions(query, self._prepare_partition_query(query), batch_size)
+        return self._find_cursor(self.get_search_collection(query), query).batch_size(batch_size)
+    
+    async def _stream_partitions(self, query: Dict[str, Any], prepared: Tuple,
+                                 batch_size: int) -> AsyncIterator[Dict[str, Any]]:
+        """逐条合并各分区的异步游标并按skip、limit输出，结束或被关闭时关闭全部游标"""
+        _, _, sort_spec, fetch, hidden_fields = prepared
+        cursors = [
+            self._partition_cursor(self.get_search_collection(query, name), query, prepared).batch_size(batch_size)
+            for name in await self.list_partitions(query)
+        ]
+        try:
+            position = 0
+            async for document in merge_sorted_async(cursors, sort_spec):
+                position += 1
+                if position <= query["skip"]:
+                    continue
+                self._remove_hidden_fields([document], hidden_fields)
+                yield document
+                if fetch and position >= fetch:
+                    break
+        finally:
+            for cursor in cursors:
+                await cursor.close()
+    
+    async def aggregate(self, params: Dict[str, Any]):
+        """
+        执行聚合管道，参数与MongoDBManager.aggregate一致
+        
+        Args:
+            params: 请求参数
+            
+        Returns:
+            AsyncCommandCursor: 按batch_size分批获取结果的异步游标
+            
+        Raises:
+            ValueError: 参数无效
+        """
+        db_name, collection_name, pipeline, options = self._prepare_aggregate(params)
+        
+        try:
+            source = collection_name
+            if self.is_partitioned(db_name, collection_name):
+                query = self._aggregate_partition_query(db_name, collection_name, pipeline)
+                source, pipeline = self._expand_partitions(collection_name, await self.list_partitions(query), pipeline)
+            target_collection = self.get_collection(db_name, source)
+            logger.info(f"聚合查询数据库: {db_name}, 集合: {collection_name}, 阶段数: {len(pipeline)}")
+            return await target_collection.aggregate(pipeline, **options)
+        except PyMongoError as e:
+            logger.error(f"聚合查询失败: {e}")
+            raise
+    
+    async def open_change_stream(self, db_name: str, collection_name: str,
+                                 resume_after: Optional[Dict[str, str]] = None):
+        """打开集合的变更流，与MongoDBManager.open_change_stream一致"""
+        target, pipeline = self.build_change_stream(db_name, collection_name)
+        return await target.watch(pipeline, full_document="updateLookup",
+                                  max_await_time_ms=WATCH_MAX_AWAIT_MS, resume_after=resume_after)
+    
+    async def subscribe_changes(self, query_params: Dict[str, Any]) -> AsyncSubscription:
+        """订阅集合的变更，与MongoDBManager.subscribe_changes一致"""
+        match = parse_match(query_params.get("match"))
+        resume_after = parse_resume_token(query_params.get("resume_after"))
+        db_name = query_params["db_name"]
+        collection_name = query_params["collection_name"]
+        logger.info(f"订阅变更，数据库: {db_name}, 集合: {collection_name}, 条件: {match}")
+        return await self.change_feeds.subscribe(db_name, collection_name, match, resume_after)
+    
+    async def close(self):
+        """停止预热和后台任务、结束变更订阅并关闭数据库连接"""
+        if self._warmup_task is not None:
+            self._warmup_task.cancel()
+        for task in list(self._background_tasks):
+            task.cancel()
+        self.change_feeds.close()
+        if self.client:
+            await self.client.close()
+
+
+async def _empty_async_iterator() -> AsyncIterator[Dict[str, Any]]:
+    """空的异步迭代器"""
+    return
+    yield
@@ -0,0 +1,381 @@
+"""
+接口的请求校验和响应构建模块
+Flask应用（api.py）和ASGI入口（asgi.py）共用，两个入口的参数校验、状态码和错误信息保持一致；
+入口只负责读取请求、调用数据库管理器和发送响应
+"""
+
+import logging
+import os
+import time
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from pymongo.errors import ExecutionTimeout, OperationFailure, PyMongoError, WriteConcernError
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from changefeed import TooManySubscribers
+from writebehind import WriteQueueFull
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+EVENT_STREAM_MIMETYPE = "text/event-stream"
+
+# MongoDB的BadValue错误码：查询条件中的操作符无效、hint指定的索引不存在等，属于请求参数错误
+BAD_VALUE_ERROR_CODE = 2
+
+# 进程启动时间，供存活检查返回运行时长
+STARTED_AT = time.time()
+
+# 接口的处理结果: (响应体, 状态码, 响应头)
+Result = Tuple[Any, int, Dict[str, str]]
+
+
+class RequestError(Exception):
+    """请求参数无效，携带返回给客户端的响应体和状态码"""
+    
+    def __init__(self, error: str, status: int = 400):
+        """
+        初始化异常
+        
+        Args:
+            error: 错误信息
+            status: 状态码
+        """
+        super().__init__(error)
+        self.body = {"error": error}
+        self.status = status
+
+
+def require_target(params: Mapping[str, Any]):
+    """
+    校验请求中的db_name和collection_name
+    
+    Raises:
+        RequestError: 缺少db_name或collection_name
+    """
+    if not params.get("db_name"):
+        raise RequestError("必须指定 db_name 参数")
+    if not params.get("collection_name"):
+        raise RequestError("必须指定 collection_name 参数")
+
+
+def require_object(data: Any) -> Dict[str, Any]:
+    """
+    校验请求体是JSON对象并校验目标数据库和集合
+    
+    Raises:
+        RequestError: 请求体不是JSON对象或缺少参数
+    """
+    if not data or not isinstance(data, dict):
+        raise RequestError("请求体必须是JSON对象")
+    require_target(data)
+    return data
+
+
+def wants_stream(params: Mapping[str, Any], accept: Optional[str]) -> bool:
+    """
+    判断客户端是否请求流式响应
+    
+    Args:
+        params: 查询参数或请求体
+        accept: Accept请求头
+        
+    Returns:
+        bool: stream=true，或Accept中application/x-ndjson的权重（q值）高于application/json时返回True
+    """
+    if str(params.get("stream", "")).lower() == "true":
+        return True
+    best = parse_accept_header(accept, MIMEAccept).best_match(["application/json", NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+def parse_save(data: Any, args: Mapping[str, Any]) -> str:
+    """
+    校验保存请求
+    
+    Args:
+        data: 请求体
+        args: 查询参数
+        
+    Returns:
+        str: 写入模式，sync或async
+        
+    Raises:
+        RequestError: 参数无效
+    """
+    if not data:
+        raise RequestError("请求体不能为空")
+    if not isinstance(data, dict):
+        raise RequestError("请求体必须是JSON对象")
+    require_target(data)
+    mode = args.get("mode", "sync")
+    if mode not in ("sync", "async"):
+        raise RequestError("mode 只能是 sync 或 async")
+    return mode
+
+
+def save_result(result: Dict[str, Any], mode: str) -> Result:
+    """构建保存接口的响应，异步写入已放入队列时返回202"""
+    if "error" in result:
+        return result, 400, {}
+    return result, 202 if mode == "async" else 200, {}
+
+
+def save_error(error: Exception) -> Result:
+    """构建保存接口的错误响应"""
+    if isinstance(error, RequestError):
+        return error.body, error.status, {}
+    if isinstance(error, WriteQueueFull):
+        logger.warning(f"异步写入队列不可用: {error}")
+        return {"error": str(error)}, 503, {"Retry-After": "1"}
+    if isinstance(error, PyMongoError):
+        logger.error(f"数据库操作失败: {error}")
+        return {"error": "数据库操作失败"}, 500, {}
+    logger.error(f"保存数据时发生错误: {error}")
+    return {"error": "服务器内部错误"}, 500, {}
+
+
+def patch_result(result: Dict[str, Any]) -> Result:
+    """构建局部更新接口的响应，数据不存在时返回404"""
+    if "error" in result:
+        return result, 404 if result.get("message") == "Not found" else 400, {}
+    return result, 200, {}
+
+
+def patch_error(error: Exception) -> Result:
+    """构建局部更新接口的错误响应"""
+    if isinstance(error, RequestError):
+        return error.body, error.status, {}
+    if isinstance(error, WriteConcernError):
+        logger.error(f"数据库操作失败: {error}")
+        return {"error": "数据库操作失败"}, 500, {}
+    if isinstance(error, OperationFailure):
+        # 更新由调用方提供，如对非数值字段$inc、对非数组字段$push
+        return {"error": "更新无法应用到该数据", "details": _errmsg(error)}, 400, {}
+    if isinstance(error, PyMongoError):
+        logger.error(f"数据库操作失败: {error}")
+        return {"error": "数据库操作失败"}, 500, {}
+    logger.error(f"局部更新数据时发生错误: {error}")
+    return {"error": "服务器内部错误"}, 500, {}
+
+
+def parse_batch(data: Any, max_batch_size: int) -> Tuple[List[Any], Optional[Dict[str, Any]]]:
+    """
+    校验批量保存请求
+    
+    请求体可以是保存数据的数组，也可以是包含items数组的对象；
+    对象顶层的db_name、collection_name、uuid_name作为每条数据的默认值
+    
+    Args:
+        data: 请求体
+        max_batch_size: 单次最多保存的条数
+        
+    Returns:
+        Tuple: (合并默认值后的数据列表, 写关注参数)
+        
+    Raises:
+        RequestError: 参数无效
+    """
+    if not data:
+        raise RequestError("请求体不能为空")
+    
+    write_concern = None
+    if isinstance(data, list):
+        items, defaults = data, {}
+    elif isinstance(data, dict) and isinstance(data.get("items"), list):
+        items = data["items"]
+        defaults = {
+            key: data[key]
+            for key in ("db_name", "collection_name", "uuid_name")
+            if data.get(key)
+        }
+        write_concern = data.get("write_concern")
+    else:
+        raise RequestError("请求体必须是数组或包含 items 数组的对象")
+    
+    if not items:
+        raise RequestError("items 不能为空")
+    if len(items) > max_batch_size:
+        raise RequestError(f"单次最多保存 {max_batch_size} 条数据")
+    
+    return [{**defaults, **item} if isinstance(item, dict) else item for item in items], write_concern
+
+
+def batch_error(error: Exception) -> Result:
+    """构建批量保存接口的错误响应"""
+    if isinstance(error, RequestError):
+        return error.body, error.status, {}
+    if isinstance(error, ValueError):
+        return {"error": str(error)}, 400, {}
+    if isinstance(error, PyMongoError):
+        logger.error(f"数据库操作失败: {error}")
+        return {"error": "数据库操作失败"}, 500, {}
+    logger.error(f"批量保存数据时发生错误: {error}")
+    return {"error": "服务器内部错误"}, 500, {}
+
+
+def is_explain(params: Mapping[str, Any]) -> bool:
+    """判断搜索请求是否只返回执行计划"""
+    return str(params.get("explain", "")).lower() == "true"
+
+
+def search_result(params: Mapping[str, Any], page: Dict[str, Any]) -> Result:
+    """构建搜索接口的响应：游标分页和with_total时返回包含data的对象，否则返回结果列表"""
+    if "cursor" in params or "total" in page:
+        return page, 200, {}
+    return page["data"], 200, {}
+
+
+def search_error(error: Exception) -> Result:
+    """构建搜索接口的错误响应"""
+    if isinstance(error, RequestError):
+        return error.body, error.status, {}
+    if isinstance(error, ValueError):
+        return {"error": str(error)}, 400, {}
+    if isinstance(error, OperationFailure):
+        if error.code == BAD_VALUE_ERROR_CODE:
+            return {"error": "查询参数无效", "details": _errmsg(error)}, 400, {}
+        logger.error(f"数据库查询失败: {error}")
+        return {"error": "数据库查询失败"}, 500, {}
+    if isinstance(error, PyMongoError):
+        logger.error(f"数据库查询失败: {error}")
+        return {"error": "数据库查询失败"}, 500, {}
+    logger.error(f"搜索数据时发生错误: {error}")
+    return {"error": "服务器内部错误"}, 500, {}
+
+
+def parse_aggregate(data: Any) -> Dict[str, Any]:
+    """
+    校验聚合请求
+    
+    Raises:
+        RequestError: 请求体不是JSON对象或缺少参数
+    """
+    data = require_object(data)
+    if "pipeline" not in data:
+        raise RequestError("必须指定 pipeline 参数")
+    return data
+
+
+def aggregate_error(error: Exception) -> Result:
+    """构建聚合接口的错误响应"""
+    if isinstance(error, RequestError):
+        return error.body, error.status, {}
+    if isinstance(error, ValueError):
+        return {"error": str(error)}, 400, {}
+    if isinstance(error, ExecutionTimeout):
+        logger.warning(f"聚合查询超时: {error}")
+        return {"error": "聚合查询超过 max_time_ms"}, 504, {}
+    if isinstance(error, OperationFailure):
+        # 管道由调用方提供，服务端拒绝执行时返回错误原因
+        return {"error": "聚合管道执行失败", "details": _errmsg(error)}, 400, {}
+    if isinstance(error, PyMongoError):
+        logger.error(f"聚合查询失败: {error}")
+        return {"error": "数据库查询失败"}, 500, {}
+    logger.error(f"聚合查询时发生错误: {error}")
+    return {"error": "服务器内部错误"}, 500, {}
+
+
+def parse_watch(args: Mapping[str, Any], last_event_id: Optional[str]) -> Dict[str, Any]:
+    """
+    校验变更订阅请求
+    
+    Args:
+        args: 查询参数
+        last_event_id: Last-Event-ID请求头，未指定resume_after时作为恢复位置
+        
+    Returns:
+        Dict[str, Any]: 订阅参数
+        
+    Raises:
+        RequestError: 缺少参数
+    """
+    require_target(args)
+    params = dict(args)
+    if not params.get("resume_after") and last_event_id:
+        params["resume_after"] = last_event_id
+    return params
+
+
+def watch_error(error: Exception, params: Mapping[str, Any]) -> Result:
+    """
+    构建变更订阅接口的错误响应
+    
+    Raises:
+        Exception: 不属于参数、订阅者上限或数据库的错误原样抛出
+    """
+    if isinstance(error, RequestError):
+        return error.body, error.status, {}
+    if isinstance(error, ValueError):
+        return {"error": str(error)}, 400, {}
+    if isinstance(error, TooManySubscribers):
+        return {"error": "订阅者过多，请稍后重试"}, 503, {}
+    if isinstance(error, OperationFailure):
+        if params.get("resume_after"):
+            # 令牌对应的事件已超出oplog保留范围或不属于该集合
+            return {"error": "无法从 resume_after 恢复", "details": _errmsg(error)}, 400, {}
+        logger.error(f"打开变更流失败: {error}")
+        return {"error": "打开变更流失败", "details": _errmsg(error)}, 500, {}
+    if isinstance(error, PyMongoError):
+        logger.error(f"打开变更流失败: {error}")
+        return {"error": "打开变更流失败"}, 500, {}
+    raise error
+
+
+def live_result() -> Result:
+    """构建存活检查的响应：进程号和运行时长"""
+    return {
+        "status": "alive",
+        "pid": os.getpid(),
+        "uptime": round(time.time() - STARTED_AT, 3)
+    }, 200, {}
+
+
+def ready_result(readiness: Dict[str, Any]) -> Result:
+    """构建就绪检查的响应，未就绪时返回503"""
+    return {
+        "status": "ready" if readiness["ready"] else "not_ready",
+        **readiness
+    }, 200 if readiness["ready"] else 503, {}
+
+
+def health_result(db_manager: Any) -> Result:
+    """构建健康检查的响应，ping成功后调用"""
+    return {
+        "status": "healthy",
+        "message": "服务运行正常",
+        "database": "connected",
+        "pool": db_manager.pool_metrics.snapshot()
+    }, 200, {}
+
+
+def health_error(error: Exception) -> Result:
+    """构建健康检查失败的响应"""
+    logger.error(f"健康检查失败: {error}")
+    return {
+        "status": "unhealthy",
+        "message": "服务异常",
+        "database": "disconnected",
+        "error": str(error)
+    }, 503, {}
+
+
+def stats_result(db_manager: Any) -> Result:
+    """构建运行指标的响应，未启用的组件为None"""
+    query_cache = db_manager.query_cache
+    single_flight = db_manager.single_flight
+    write_behind = db_manager.write_behind
+    return {
+        "pid": os.getpid(),
+        "pool": db_manager.pool_metrics.snapshot(),
+        "cache": query_cache.stats() if query_cache is not None else None,
+        "coalescing": single_flight.stats() if single_flight is not None else None,
+        "write_behind": write_behind.stats() if write_behind is not None else None,
+        "watch": db_manager.change_feeds.stats()
+    }, 200, {}
+
+
+def _errmsg(error: OperationFailure) -> str:
+    """取出服务端返回的错误信息"""
+    return (error.details or {}).get("errmsg", str(error))
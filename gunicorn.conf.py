@@ -0,0 +1,58 @@
+"""
+gunicorn配置文件
+
+worker数量、每个worker的线程数、keep-alive等参数来自Config，
+可通过 WEB_WORKERS、WEB_THREADS、WEB_KEEPALIVE、WEB_TIMEOUT 环境变量调整。
+设置 PROMETHEUS_MULTIPROC_DIR 后 /metrics 汇总所有worker的指标。
+
+启动方式:
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+import glob
+import os
+
+from config import get_config
+
+_config = get_config()
+
+bind = f"{_config.HOST}:{_config.PORT}"
+workers = _config.WEB_WORKERS
+threads = _config.WEB_THREADS
+worker_class = "gthread"
+keepalive = _config.WEB_KEEPALIVE
+timeout = _config.WEB_TIMEOUT
+loglevel = _config.LOG_LEVEL.lower()
+accesslog = "-"
+
+# 在master中加载应用后再fork，worker共享代码内存；MongoClient在各worker中首次使用时创建
+preload_app = True
+
+
+def on_starting(server):
+    """启动时清理上次运行遗留的多进程指标文件"""
+    multiproc_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(multiproc_dir, "*.db")):
+            os.remove(path)
+
+
+def post_fork(server, worker):
+    """fork之后丢弃可能从master继承的数据库管理器，并在后台预热worker自己的连接"""
+    from app import reset_db_manager, start_warmup
+    reset_db_manager()
+    start_warmup()
+
+
+def worker_exit(server, worker):
+    """worker退出时关闭自己的数据库连接"""
+    from app import close_db_manager
+    close_db_manager()
+
+
+def child_exit(server, worker):
+    """worker退出后在master中清理其多进程指标"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,445 @@
+"""
+监控模块
+通过PyMongo事件监听器收集连接池、拓扑状态等运行指标，以Prometheus格式导出请求和MongoDB命令指标，并对慢查询日志限流
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+from pymongo import monitoring
+
+# 响应时间分桶（秒），覆盖毫秒级的缓存命中到数秒的慢查询
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 请求和响应大小分桶（字节）
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+# database、collection标签各自最多的取值数，超出的名称计入OTHER_LABEL
+MAX_LABEL_VALUES = int(os.getenv("METRICS_MAX_LABEL_VALUES", "100"))
+OTHER_LABEL = "other"
+# 按月分区的集合名后缀（orders_2024_05），标签中折叠为基础集合名
+PARTITION_SUFFIX = re.compile(r"_\d{4}_\d{2}$")
+
+REQUEST_COUNT = Counter(
+    "http_requests_total", "HTTP请求数",
+    ["method", "endpoint", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP请求处理时间（包含响应序列化和流式输出）",
+    ["method", "endpoint"], buckets=LATENCY_BUCKETS
+)
+REQUEST_SIZE = Histogram(
+    "http_request_size_bytes", "HTTP请求体大小",
+    ["method", "endpoint"], buckets=SIZE_BUCKETS
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "HTTP响应体大小",
+    ["method", "endpoint"], buckets=SIZE_BUCKETS
+)
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB命令执行时间（从发送命令到收到响应）",
+    ["command", "database", "collection"], buckets=LATENCY_BUCKETS
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongodb_command_failures_total", "MongoDB命令失败次数",
+    ["command", "database", "collection"]
+)
+SEARCH_COALESCED = Counter(
+    "search_coalesced_requests_total", "与进行中的相同搜索合并、未单独查询MongoDB的请求数",
+    ["database", "collection"]
+)
+
+
+class NamespaceLabels:
+    """
+    限制database和collection标签的取值数
+    
+    数据库和集合名由客户端指定，按月分区还会不断产生新集合，直接作为标签会使时间序列无限增长。
+    分区名折叠为基础集合名，取值数达到上限后新出现的名称计入OTHER_LABEL
+    """
+    
+    def __init__(self, max_values: int):
+        """
+        初始化
+        
+        Args:
+            max_values: database、collection标签各自最多的取值数
+        """
+        self.max_values = max_values
+        self._lock = threading.Lock()
+        self._databases: Set[str] = set()
+        self._collections: Set[str] = set()
+    
+    def labels(self, database: str, collection: str) -> Tuple[str, str]:
+        """
+        获取数据库和集合对应的标签值
+        
+        Args:
+            database: 数据库名称
+            collection: 集合名称，没有集合的命令为空字符串
+            
+        Returns:
+            Tuple[str, str]: (database标签, collection标签)
+        """
+        collection = PARTITION_SUFFIX.sub("", collection)
+        with self._lock:
+            return self._bound(self._databases, database), self._bound(self._collections, collection)
+    
+    def _bound(self, values: Set[str], value: str) -> str:
+        """已出现过或未达上限的名称原样返回，否则返回OTHER_LABEL（调用方需持有锁）"""
+        if not value or value in values:
+            return value
+        if len(values) >= self.max_values:
+            return OTHER_LABEL
+        values.add(value)
+        return value
+
+
+NAMESPACE_LABELS = NamespaceLabels(MAX_LABEL_VALUES)
+
+
+def observe_request(method: str, endpoint: str, status: int, duration: float,
+                    request_size: int, response_size: int):
+    """
+    记录一次HTTP请求的指标
+    
+    Args:
+        method: 请求方法
+        endpoint: 路由规则，未匹配路由时为"unmatched"，避免按原始路径产生大量标签
+        status: 响应状态码
+        duration: 处理时间（秒）
+        request_size: 请求体字节数
+        response_size: 响应体字节数
+    """
+    REQUEST_COUNT.labels(method, endpoint, str(status)).inc()
+    REQUEST_LATENCY.labels(method, endpoint).observe(duration)
+    REQUEST_SIZE.labels(method, endpoint).observe(request_size)
+    RESPONSE_SIZE.labels(method, endpoint).observe(response_size)
+
+
+def observe_coalesced(database: str, collection: str):
+    """
+    记录一次被合并的搜索请求
+    
+    Args:
+        database: 数据库名称
+        collection: 集合名称
+    """
+    SEARCH_COALESCED.labels(*NAMESPACE_LABELS.labels(database, collection)).inc()
+
+
+def generate_metrics() -> Tuple[bytes, str]:
+    """
+    生成Prometheus文本格式的指标
+    
+    设置了PROMETHEUS_MULTIPROC_DIR时（gunicorn多进程部署）汇总所有worker的指标，
+    否则只导出当前进程的指标
+    
+    Returns:
+        Tuple[bytes, str]: (指标内容, Content-Type)
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    连接池指标监听器
+    
+    统计连接检出次数、等待时间、使用中的连接数和连接池耗尽（等待超时）次数，
+    用于根据真实负载调整连接池大小
+    """
+    
+    def __init__(self):
+        """初始化指标"""
+        self._lock = threading.Lock()
+        self.checkouts_started = 0
+        self.checkouts = 0
+        self.checkout_failures: Dict[str, int] = {}
+        self.checked_in = 0
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.pools_cleared = 0
+        self.wait_time_total_ms = 0.0
+        self.wait_time_max_ms = 0.0
+        self.in_use: Dict[str, int] = {}
+        self.in_use_max = 0
+    
+    @staticmethod
+    def _address_key(address) -> str:
+        """服务器地址转为字符串"""
+        host, port = address
+        return f"{host}:{port}"
+    
+    def pool_created(self, event):
+        """连接池创建"""
+        with self._lock:
+            self.in_use.setdefault(self._address_key(event.address), 0)
+    
+    def pool_ready(self, event):
+        """连接池就绪"""
+    
+    def pool_cleared(self, event):
+        """连接池被清空（通常由网络错误或主节点切换引起）"""
+        with self._lock:
+            self.pools_cleared += 1
+    
+    def pool_closed(self, event):
+        """连接池关闭"""
+        with self._lock:
+            self.in_use.pop(self._address_key(event.address), None)
+    
+    def connection_created(self, event):
+        """新建连接"""
+        with self._lock:
+            self.connections_created += 1
+    
+    def connection_ready(self, event):
+        """连接就绪"""
+    
+    def connection_closed(self, event):
+        """连接关闭"""
+        with self._lock:
+            self.connections_closed += 1
+    
+    def connection_check_out_started(self, event):
+        """开始检出连接"""
+        with self._lock:
+            self.checkouts_started += 1
+    
+    def connection_check_out_failed(self, event):
+        """检出连接失败，reason为timeout时表示连接池已耗尽"""
+        with self._lock:
+            self.checkout_failures[event.reason] = self.checkout_failures.get(event.reason, 0) + 1
+            self._record_wait(event.duration)
+    
+    def connection_checked_out(self, event):
+        """成功检出连接"""
+        with self._lock:
+            self.checkouts += 1
+            self._record_wait(event.duration)
+            key = self._address_key(event.address)
+            self.in_use[key] = self.in_use.get(key, 0) + 1
+            self.in_use_max = max(self.in_use_max, sum(self.in_use.values()))
+    
+    def connection_checked_in(self, event):
+        """连接归还到连接池"""
+        with self._lock:
+            self.checked_in += 1
+            key = self._address_key(event.address)
+            if self.in_use.get(key):
+                self.in_use[key] -= 1
+    
+    def _record_wait(self, duration):
+        """记录检出等待时间（调用方需持有锁）"""
+        if duration is None:
+            return
+        wait_ms = duration * 1000
+        self.wait_time_total_ms += wait_ms
+        self.wait_time_max_ms = max(self.wait_time_max_ms, wait_ms)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        获取当前指标快照
+        
+        Returns:
+            Dict[str, Any]: 连接池指标
+        """
+        with self._lock:
+            completed = self.checkouts + sum(self.checkout_failures.values())
+            return {
+                "checkouts": self.checkouts,
+                "checkouts_waiting": max(self.checkouts_started - completed, 0),
+                "checkout_failures": dict(self.checkout_failures),
+                "pool_exhausted": self.checkout_failures.get(
+                    monitoring.ConnectionCheckOutFailedReason.TIMEOUT, 0),
+                "checked_in": self.checked_in,
+                "in_use": sum(self.in_use.values()),
+                "in_use_by_server": dict(self.in_use),
+                "in_use_max": self.in_use_max,
+                "connections_created": self.connections_created,
+                "connections_closed": self.connections_closed,
+                "pools_cleared": self.pools_cleared,
+                "wait_time_avg_ms": round(self.wait_time_total_ms / completed, 3) if completed else 0.0,
+                "wait_time_max_ms": round(self.wait_time_max_ms, 3)
+            }
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    MongoDB命令指标监听器
+    
+    按命令名、数据库和集合统计命令耗时和失败次数。
+    成功和失败事件中不包含命令内容，数据库和集合名在命令开始时记录
+    """
+    
+    def __init__(self, namespace_labels: NamespaceLabels = NAMESPACE_LABELS):
+        """
+        初始化监听器
+        
+        Args:
+            namespace_labels: 数据库和集合名到标签值的映射，默认与其他指标共用
+        """
+        self.namespace_labels = namespace_labels
+        self._lock = threading.Lock()
+        # (连接, 请求ID) -> (数据库名, 集合名)
+        self._namespaces: Dict[Tuple[Any, int], Tuple[str, str]] = {}
+    
+    @staticmethod
+    def _collection_name(event) -> str:
+        """从命令中取出集合名，getMore的集合名在collection字段中，ping等命令没有集合"""
+        command = event.command
+        if event.command_name == "getMore":
+            value = command.get("collection")
+        else:
+            value = command.get(event.command_name)
+        return value if isinstance(value, str) else ""
+    
+    def _pop_namespace(self, event) -> Tuple[str, str]:
+        """取出命令开始时记录的数据库和集合名，返回对应的标签值"""
+        with self._lock:
+            database, collection = self._namespaces.pop(
+                (event.connection_id, event.request_id), (event.database_name, ""))
+        return self.namespace_labels.labels(database, collection)
+    
+    def started(self, event):
+        """命令开始"""
+        with self._lock:
+            self._namespaces[(event.connection_id, event.request_id)] = (
+                event.database_name, self._collection_name(event))
+    
+    def succeeded(self, event):
+        """命令成功"""
+        database, collection = self._pop_namespace(event)
+        MONGO_COMMAND_LATENCY.labels(event.command_name, database, collection).observe(
+            event.duration_micros / 1e6)
+    
+    def failed(self, event):
+        """命令失败"""
+        database, collection = self._pop_namespace(event)
+        MONGO_COMMAND_LATENCY.labels(event.command_name, database, collection).observe(
+            event.duration_micros / 1e6)
+        MONGO_COMMAND_FAILURES.labels(event.command_name, database, collection).inc()
+
+
+class TopologyState(monitoring.TopologyListener):
+    """
+    集群拓扑状态监听器
+    
+    记录驱动后台心跳得到的拓扑状态（是否有可写、可读的服务器），
+    就绪检查直接读取该状态，不向MongoDB发送额外的命令
+    """
+    
+    def __init__(self):
+        """初始化状态"""
+        self._lock = threading.Lock()
+        self.topology_type = "Unknown"
+        self.writable = False
+        self.readable = False
+        self.changed_at: Optional[float] = None
+    
+    def opened(self, event):
+        """拓扑开始监控"""
+    
+    def description_changed(self, event):
+        """拓扑状态变化（服务器发现、主节点切换、连接断开等）"""
+        description = event.new_description
+        with self._lock:
+            self.topology_type = description.topology_type_name
+            self.writable = description.has_writable_server()
+            self.readable = description.has_readable_server()
+            self.changed_at = time.time()
+    
+    def closed(self, event):
+        """拓扑关闭"""
+        with self._lock:
+            self.writable = False
+            self.readable = False
+            self.changed_at = time.time()
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        获取当前拓扑状态
+        
+        Returns:
+            Dict[str, Any]: 拓扑类型、是否有可写和可读的服务器、最近一次变化的时间
+        """
+        with self._lock:
+            return {
+                "topology_type": self.topology_type,
+                "writable": self.writable,
+                "readable": self.readable,
+                "changed_at": self.changed_at
+            }
+
+
+class SlowQueryLog:
+    """
+    慢查询日志限流
+    
+    同一查询结构在interval秒内只记录一次日志（并只执行一次explain），
+    期间被跳过的慢查询次数在下一条日志中一并报告
+    """
+    
+    def __init__(self, threshold_ms: int, interval: float, max_shapes: int = 1000):
+        """
+        初始化
+        
+        Args:
+            threshold_ms: 慢查询阈值（毫秒）
+            interval: 同一查询结构两条日志之间的最小间隔（秒）
+            max_shapes: 最多跟踪的查询结构数，超出时淘汰最久未出现的结构
+        """
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.max_shapes = max_shapes
+        self._lock = threading.Lock()
+        # 查询结构 -> [上次记录日志的时间, 之后被跳过的次数]
+        self._shapes: "OrderedDict[str, List[Any]]" = OrderedDict()
+    
+    def is_slow(self, duration: float) -> bool:
+        """
+        判断是否为慢查询
+        
+        Args:
+            duration: 查询耗时（秒）
+            
+        Returns:
+            bool: 超过阈值时返回True
+        """
+        return duration >= self.threshold
+    
+    def acquire(self, shape_key: str) -> Optional[int]:
+        """
+        判断本次慢查询是否需要记录日志
+        
+        Args:
+            shape_key: 查询结构的键
+            
+        Returns:
+            Optional[int]: 需要记录时返回上次记录之后被跳过的次数，否则返回None
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._shapes.get(shape_key)
+            if entry is not None:
+                self._shapes.move_to_end(shape_key)
+                if now - entry[0] < self.interval:
+                    entry[1] += 1
+                    return None
+                suppressed = entry[1]
+                entry[0], entry[1] = now, 0
+                return suppressed
+            
+            self._shapes[shape_key] = [now, 0]
+            while len(self._shapes) > self.max_shapes:
+                self._shapes.popitem(last=False)
+            return 0
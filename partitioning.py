@@ -0,0 +1,211 @@
+"""
+时间分区模块
+按created_at把只追加的集合拆分为每月一个的分区集合（如 logs_2026_10），
+并提供根据查询条件筛选分区、按排序条件合并多个分区结果的工具函数
+"""
+
+import functools
+import heapq
+import re
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Pattern, Tuple
+
+from utils import get_field_value
+
+# 分区依据的时间字段（毫秒时间戳，由保存接口在插入时写入）
+PARTITION_FIELD = "created_at"
+
+TimeRange = Tuple[Optional[float], Optional[float]]
+
+
+def partition_name(collection_name: str, timestamp: int) -> str:
+    """
+    获取时间戳所在分区的集合名
+    
+    Args:
+        collection_name: 集合名称
+        timestamp: 毫秒时间戳
+        
+    Returns:
+        str: 分区集合名，如 "logs_2026_10"（按UTC划分月份）
+    """
+    moment = datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc)
+    return f"{collection_name}_{moment.year:04d}_{moment.month:02d}"
+
+
+def partition_pattern(collection_name: str) -> Pattern:
+    """获取匹配集合全部分区名的正则表达式，分组为年和月"""
+    return re.compile(rf"^{re.escape(collection_name)}_(\d{{4}})_(\d{{2}})$")
+
+
+def partition_bounds(year: int, month: int) -> Tuple[int, int]:
+    """
+    获取分区覆盖的时间范围
+    
+    Returns:
+        Tuple[int, int]: (起始毫秒时间戳, 下个月起始毫秒时间戳)
+    """
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+
+def _is_number(value: Any) -> bool:
+    """判断是否为可比较的数值时间戳"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _intersect(first: TimeRange, second: TimeRange) -> TimeRange:
+    """求两个时间范围的交集，None表示不限"""
+    lower = max((bound for bound in (first[0], second[0]) if bound is not None), default=None)
+    upper = min((bound for bound in (first[1], second[1]) if bound is not None), default=None)
+    return lower, upper
+
+
+def _condition_range(condition: Any) -> TimeRange:
+    """根据单个时间字段条件计算时间范围，无法识别的条件视为不限"""
+    if _is_number(condition):
+        return condition, condition
+    if not isinstance(condition, dict):
+        return None, None
+    
+    time_range: TimeRange = (None, None)
+    for operator, value in condition.items():
+        if operator == "$eq" and _is_number(value):
+            time_range = _intersect(time_range, (value, value))
+        elif operator in ("$gt", "$gte") and _is_number(value):
+            time_range = _intersect(time_range, (value, None))
+        elif operator in ("$lt", "$lte") and _is_number(value):
+            time_range = _intersect(time_range, (None, value))
+        elif operator == "$in" and isinstance(value, list) and value and all(_is_number(item) for item in value):
+            time_range = _intersect(time_range, (min(value), max(value)))
+    return time_range
+
+
+def time_range(find_obj: Dict[str, Any], field: str = PARTITION_FIELD) -> TimeRange:
+    """
+    从查询条件中提取时间字段的范围
+    
+    识别顶层和$and中对时间字段的等值、$eq、$gt、$gte、$lt、$lte和$in条件；
+    范围按闭区间处理，只用于筛选分区，不影响查询本身
+    
+    Args:
+        find_obj: 查询条件
+        field: 时间字段
+        
+    Returns:
+        TimeRange: (下界, 上界)毫秒时间戳，None表示不限
+    """
+    result: TimeRange = (None, None)
+    if field in find_obj:
+        result = _intersect(result, _condition_range(find_obj[field]))
+    for clause in find_obj.get("$and") or ():
+        if isinstance(clause, dict):
+            result = _intersect(result, time_range(clause, field))
+    return result
+
+
+def select_partitions(collection_name: str, names: Iterable[str], find_obj: Dict[str, Any]) -> List[str]:
+    """
+    从已存在的集合中选出与查询时间范围重叠的分区
+    
+    Args:
+        collection_name: 集合名称
+        names: 数据库中的集合名
+        find_obj: 查询条件
+        
+    Returns:
+        List[str]: 分区集合名，按时间从新到旧排列
+    """
+    lower, upper = time_range(find_obj)
+    pattern = partition_pattern(collection_name)
+    selected = []
+    for name in names:
+        match = pattern.match(name)
+        if not match or not 1 <= int(match.group(2)) <= 12:
+            continue
+        start, end = partition_bounds(int(match.group(1)), int(match.group(2)))
+        if (upper is None or start <= upper) and (lower is None or end > lower):
+            selected.append(name)
+    return sorted(selected, reverse=True)
+
+
+def _compare_values(first: Any, second: Any) -> int:
+    """比较两个字段值，缺失（None）排在最前，类型不同时按类型名比较"""
+    if first == second:
+        return 0
+    if first is None or second is None:
+        return -1 if first is None else 1
+    try:
+        return -1 if first < second else 1
+    except TypeError:
+        first_type, second_type = type(first).__name__, type(second).__name__
+        if first_type == second_type:
+            return 0
+        return -1 if first_type < second_type else 1
+
+
+def sort_key(sort_spec: List[Tuple[str, int]]):
+    """
+    生成按排序条件比较文档的key函数
+    
+    Args:
+        sort_spec: 规范化后的排序条件
+        
+    Returns:
+        可用于sorted、heapq.merge的key函数
+    """
+    def compare(first: Dict[str, Any], second: Dict[str, Any]) -> int:
+        for field, direction in sort_spec:
+            result = _compare_values(get_field_value(first, field), get_field_value(second, field))
+            if result:
+                return result * direction
+        return 0
+    
+    return functools.cmp_to_key(compare)
+
+
+def merge_sorted(results: Iterable[Iterable[Dict[str, Any]]], sort_spec: List[Tuple[str, int]]) -> Iterator[Dict[str, Any]]:
+    """
+    合并多个已按同一排序条件排好序的结果
+    
+    按需从各个结果中读取，适用于游标等惰性迭代器
+    
+    Args:
+        results: 各分区的查询结果
+        sort_spec: 规范化后的排序条件
+        
+    Returns:
+        Iterator[Dict[str, Any]]: 合并后的文档
+    """
+    return heapq.merge(*results, key=sort_key(sort_spec))
+
+
+async def merge_sorted_async(results: List[AsyncIterator[Dict[str, Any]]],
+                             sort_spec: List[Tuple[str, int]]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    合并多个已按同一排序条件排好序的异步结果，与merge_sorted一致
+    
+    Args:
+        results: 各分区的异步游标
+        sort_spec: 规范化后的排序条件
+        
+    Returns:
+        AsyncIterator[Dict[str, Any]]: 合并后的文档
+    """
+    key = sort_key(sort_spec)
+    heap = []
+    for index, iterator in enumerate(results):
+        document = await anext(iterator, None)
+        if document is not None:
+            heap.append((key(document), index, document))
+    heapq.heapify(heap)
+    
+    while heap:
+        _, index, document = heap[0]
+        yield document
+        following = await anext(results[index], None)
+        if following is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (key(following), index, following))
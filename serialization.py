@@ -0,0 +1,213 @@
+"""
+JSON序列化模块
+提供可切换后端的JSON编解码：安装了orjson时默认使用orjson，否则使用标准库json。
+ObjectId、datetime、Decimal128等BSON类型在编码时直接转换，不需要调用方预处理。
+"""
+
+import base64
+import datetime
+import json
+import logging
+from typing import Any, Optional, Union
+
+from bson import json_util
+from flask.json.provider import JSONProvider
+
+from config import Config
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson为可选依赖
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("auto", "orjson", "json")
+
+# orjson.JSONDecodeError是json.JSONDecodeError的子类，调用方统一捕获这一个异常即可
+JSONDecodeError = json.JSONDecodeError
+
+_backend = "json"
+
+
+def resolve_backend(name: str) -> str:
+    """
+    解析JSON后端名称
+    
+    Args:
+        name: auto、orjson或json，auto表示安装了orjson时使用orjson
+        
+    Returns:
+        str: 实际使用的后端（orjson或json）
+        
+    Raises:
+        ValueError: 后端名称无效
+    """
+    name = (name or "auto").lower()
+    if name not in BACKENDS:
+        raise ValueError(f"JSON_BACKEND 无效: {name}，可选值为 {', '.join(BACKENDS)}")
+    if name == "json":
+        return "json"
+    if orjson is None:
+        if name == "orjson":
+            logger.warning("JSON_BACKEND=orjson 但未安装orjson，使用标准库json")
+        return "json"
+    return "orjson"
+
+
+def set_backend(name: str) -> str:
+    """
+    切换JSON后端
+    
+    Args:
+        name: auto、orjson或json
+        
+    Returns:
+        str: 实际使用的后端
+    """
+    global _backend
+    _backend = resolve_backend(name)
+    return _backend
+
+
+def get_backend() -> str:
+    """
+    获取当前使用的JSON后端
+    
+    Returns:
+        str: orjson或json
+    """
+    return _backend
+
+
+def default(obj: Any) -> Any:
+    """
+    将JSON不支持的类型转换为可序列化的值
+    
+    ObjectId、Decimal128、Decimal、UUID转为字符串，datetime/date转为ISO 8601字符串，
+    bytes转为base64字符串，其他类型使用str()。
+    
+    Args:
+        obj: 无法直接序列化的对象
+        
+    Returns:
+        可序列化的值
+    """
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    if isinstance(obj, bytes):
+        return base64.b64encode(obj).decode("ascii")
+    return str(obj)
+
+
+def _extended_default(obj: Any) -> Any:
+    """转换为宽松模式的MongoDB Extended JSON（与json_util.RELAXED_JSON_OPTIONS一致）"""
+    return json_util.default(obj, json_options=json_util.RELAXED_JSON_OPTIONS)
+
+
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    """
+    解析JSON
+    
+    Args:
+        data: JSON字符串或UTF-8字节串
+        
+    Returns:
+        解析后的数据
+        
+    Raises:
+        JSONDecodeError: 不是合法的JSON
+    """
+    if _backend == "orjson":
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_bytes(obj: Any, sort_keys: bool = False, indent: bool = False) -> bytes:
+    """
+    序列化为UTF-8编码的JSON字节串，响应体直接使用时可省去一次编码
+    
+    Args:
+        obj: 要序列化的数据
+        sort_keys: 是否按键排序
+        indent: 是否缩进两格输出
+        
+    Returns:
+        bytes: JSON字节串
+    """
+    if _backend == "orjson":
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=default, option=option)
+    return dumps(obj, sort_keys=sort_keys, indent=indent).encode("utf-8")
+
+
+def dumps(obj: Any, sort_keys: bool = False, indent: bool = False) -> str:
+    """
+    序列化为JSON字符串
+    
+    Args:
+        obj: 要序列化的数据
+        sort_keys: 是否按键排序
+        indent: 是否缩进两格输出
+        
+    Returns:
+        str: JSON字符串
+    """
+    if _backend == "orjson":
+        return dumps_bytes(obj, sort_keys=sort_keys, indent=indent).decode("utf-8")
+    return json.dumps(obj, default=default, sort_keys=sort_keys, ensure_ascii=False,
+                      indent=2 if indent else None, separators=None if indent else (",", ":"))
+
+
+def dumps_extended(obj: Any) -> str:
+    """
+    序列化为宽松模式的MongoDB Extended JSON
+    
+    ObjectId输出为 {"$oid": ...}，datetime输出为 {"$date": ...}，Decimal128输出为 {"$numberDecimal": ...}。
+    使用orjson时由orjson遍历文档、只对BSON类型调用json_util转换，结果与json_util.dumps等价。
+    
+    Args:
+        obj: 要序列化的数据
+        
+    Returns:
+        str: JSON字符串
+    """
+    if _backend == "orjson":
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        return orjson.dumps(obj, default=_extended_default, option=option).decode("utf-8")
+    return json_util.dumps(obj, json_options=json_util.RELAXED_JSON_OPTIONS)
+
+
+class FastJSONProvider(JSONProvider):
+    """
+    Flask的JSON提供器，使用当前JSON后端编解码
+    
+    与Flask默认提供器一样按键排序，调试模式下缩进输出；
+    jsonify直接使用编码后的字节串构建响应。
+    """
+    
+    sort_keys: bool = True
+    compact: Optional[bool] = None
+    mimetype: str = "application/json"
+    
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        """序列化为JSON字符串"""
+        return dumps(obj, sort_keys=kwargs.get("sort_keys", self.sort_keys))
+    
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        """解析JSON"""
+        return loads(s)
+    
+    def response(self, *args: Any, **kwargs: Any):
+        """构建JSON响应"""
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        body = dumps_bytes(obj, sort_keys=self.sort_keys, indent=indent)
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+
+set_backend(Config.JSON_BACKEND)
@@ -140,9 +140,13 @@ start_application() {
         source venv/bin/activate
     fi
     
-    # 启动应用
+    # 启动应用：生产模式使用gunicorn多进程，开发模式使用Flask开发服务器
     log_success "应用启动中..."
-    python app.py
+    if [ "$FLASK_ENV" = "production" ]; then
+        gunicorn -c gunicorn.conf.py wsgi:app
+    else
+        python app.py
+    fi
 }
 
 # 显示帮助信息
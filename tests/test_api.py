@@ -0,0 +1,314 @@
+"""
+API路由测试
+测试各API端点的参数校验和响应格式
+"""
+
+import json
+import unittest
+from unittest.mock import Mock, patch
+
+from bson import ObjectId
+from pymongo.errors import ExecutionTimeout, OperationFailure, PyMongoError
+
+from app import create_app
+from changefeed import Subscription, TooManySubscribers
+from config import TestingConfig
+from writebehind import WriteQueueFull
+
+
+class TestApi(unittest.TestCase):
+    """API路由测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.app = create_app("testing")
+        self.client = self.app.test_client()
+        self.db_manager = Mock()
+        self.db_manager.config = TestingConfig()
+        patcher = patch('api.get_db_manager', return_value=self.db_manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_save_async(self):
+        """测试异步保存返回202，队列已满时返回503"""
+        self.db_manager.save_async.return_value = {"message": "Data accepted", "id": {"uuid": "a"}}
+        body = {"db_name": "db1", "collection_name": "c1", "content": "{}"}
+        
+        response = self.client.post("/api/save?mode=async", json=body)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.get_json()["id"], {"uuid": "a"})
+        self.db_manager.save_data.assert_not_called()
+        
+        self.db_manager.save_async.side_effect = WriteQueueFull("写入队列已满")
+        response = self.client.post("/api/save?mode=async", json=body)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "1")
+        
+        response = self.client.post("/api/save?mode=later", json=body)
+        self.assertEqual(response.status_code, 400)
+    
+    def test_search_explain(self):
+        """测试explain=true返回执行计划"""
+        self.db_manager.explain_search.return_value = {"plan_summary": "COLLSCAN"}
+        
+        response = self.client.get("/api/search?db_name=db1&collection_name=c1&conditions=%7B%7D&explain=true&stream=true")
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {"plan_summary": "COLLSCAN"})
+        self.db_manager.search_page.assert_not_called()
+        self.db_manager.search_stream.assert_not_called()
+    
+    def test_live_does_not_touch_database(self):
+        """测试存活检查不访问数据库"""
+        with patch('api.get_db_manager') as get_db_manager:
+            response = self.client.get("/api/live")
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["status"], "alive")
+        get_db_manager.assert_not_called()
+    
+    def test_ready(self):
+        """测试就绪检查根据预热和拓扑状态返回200或503"""
+        self.db_manager.readiness.return_value = {"ready": False, "warmup": {"status": "connecting", "error": None}}
+        response = self.client.get("/api/ready")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.get_json()["status"], "not_ready")
+        
+        self.db_manager.readiness.return_value = {"ready": True, "warmup": {"status": "done", "error": None}}
+        response = self.client.get("/api/ready")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["warmup"]["status"], "done")
+    
+    def test_search_bad_value(self):
+        """测试MongoDB拒绝查询参数（如hint指定的索引不存在）时返回400"""
+        self.db_manager.search_page.side_effect = OperationFailure(
+            "hint provided does not correspond to an existing index", code=2,
+            details={"errmsg": "hint provided does not correspond to an existing index"})
+        
+        response = self.client.get("/api/search?db_name=db1&collection_name=c1&conditions=%7B%7D&hint=missing_1")
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("hint", response.get_json()["details"])
+        
+        self.db_manager.search_page.side_effect = OperationFailure("not authorized", code=13)
+        response = self.client.get("/api/search?db_name=db1&collection_name=c1&conditions=%7B%7D")
+        self.assertEqual(response.status_code, 500)
+    
+    def test_patch(self):
+        """测试局部更新的状态码：成功200、参数错误400、数据不存在404、更新无法应用400"""
+        body = {"db_name": "db1", "collection_name": "c1", "uuid": "a", "update": {"$inc": {"count": 1}}}
+        self.db_manager.patch_data.return_value = {"message": "Data patched successfully", "id": {"uuid": "a"}, "modified": True}
+        response = self.client.post("/api/patch", json=body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.db_manager.patch_data.call_args[0][0], body)
+        
+        self.db_manager.patch_data.return_value = {"error": "必须指定 uuid", "message": "Invalid parameters"}
+        self.assertEqual(self.client.post("/api/patch", json=body).status_code, 400)
+        
+        self.db_manager.patch_data.return_value = {"error": "数据不存在", "message": "Not found", "id": {"uuid": "a"}}
+        self.assertEqual(self.client.post("/api/patch", json=body).status_code, 404)
+        
+        self.db_manager.patch_data.side_effect = OperationFailure(
+            "type mismatch", code=14, details={"errmsg": "Cannot apply $inc to a value of non-numeric type"})
+        response = self.client.post("/api/patch", json=body)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()["details"], "Cannot apply $inc to a value of non-numeric type")
+        
+        self.assertEqual(self.client.post("/api/patch", json={"db_name": "db1"}).status_code, 400)
+    
+    def test_save_batch_applies_defaults(self):
+        """测试批量保存使用顶层默认值"""
+        self.db_manager.save_batch.return_value = {"message": "Batch processed", "results": []}
+        
+        response = self.client.post("/api/save/batch", json={
+            "db_name": "db1",
+            "collection_name": "c1",
+            "items": [{"content": "{}"}, {"collection_name": "c2"}]
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        items = self.db_manager.save_batch.call_args[0][0]
+        self.assertEqual(items[0]["collection_name"], "c1")
+        self.assertEqual(items[1]["collection_name"], "c2")
+        self.assertEqual(items[1]["db_name"], "db1")
+    
+    def test_save_batch_rejects_invalid_body(self):
+        """测试批量保存的请求体校验"""
+        response = self.client.post("/api/save/batch", json={"db_name": "db1"})
+        self.assertEqual(response.status_code, 400)
+        
+        response = self.client.post("/api/save/batch", json={"items": []})
+        self.assertEqual(response.status_code, 400)
+        self.db_manager.save_batch.assert_not_called()
+    
+    def test_save_batch_rejects_oversized_batch(self):
+        """测试批量保存的数量上限"""
+        self.db_manager.config.MAX_BATCH_SIZE = 2
+        
+        response = self.client.post("/api/save/batch", json=[{}, {}, {}])
+        
+        self.assertEqual(response.status_code, 400)
+        self.db_manager.save_batch.assert_not_called()
+    
+    
+    def test_search_returns_list_without_cursor(self):
+        """测试未使用游标时返回结果列表"""
+        self.db_manager.search_page.return_value = {"data": [{"uuid": "a"}]}
+        
+        response = self.client.get("/api/search?db_name=db1&collection_name=c1&conditions={}")
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), [{"uuid": "a"}])
+    
+    def test_search_returns_envelope_with_cursor(self):
+        """测试游标分页返回包含next_cursor的对象"""
+        self.db_manager.search_page.return_value = {"data": [{"uuid": "a"}], "next_cursor": "abc"}
+        
+        response = self.client.get("/api/search?db_name=db1&collection_name=c1&conditions={}&cursor=")
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {"data": [{"uuid": "a"}], "next_cursor": "abc"})
+    
+    def test_search_returns_envelope_with_total(self):
+        """测试with_total时返回包含总数的对象"""
+        self.db_manager.search_page.return_value = {"data": [{"uuid": "a"}], "total": 7, "total_exact": True}
+        
+        response = self.client.get("/api/search?db_name=db1&collection_name=c1&conditions={}&with_total=true")
+        
+        self.assertEqual(response.get_json(), {"data": [{"uuid": "a"}], "total": 7, "total_exact": True})
+    
+    def test_search_stream_ndjson(self):
+        """测试NDJSON流式搜索"""
+        self.db_manager.search_stream.return_value = iter([{"uuid": "a"}, {"uuid": "b"}])
+        
+        response = self.client.get("/api/search?db_name=db1&collection_name=c1&conditions={}&stream=true")
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{"uuid": "a"}, {"uuid": "b"}])
+        self.db_manager.search_page.assert_not_called()
+    
+    def test_search_stream_by_accept_header(self):
+        """测试通过Accept头请求流式响应"""
+        self.db_manager.search_stream.return_value = iter([])
+        
+        response = self.client.get(
+            "/api/search?db_name=db1&collection_name=c1&conditions={}",
+            headers={"Accept": "application/x-ndjson"}
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(as_text=True), "")
+    
+    def test_search_stream_error_before_first_document(self):
+        """测试流式搜索在首条数据前出错时返回错误状态码"""
+        def failing_documents():
+            raise PyMongoError("boom")
+            yield
+        
+        self.db_manager.search_stream.return_value = failing_documents()
+        
+        response = self.client.get("/api/search?db_name=db1&collection_name=c1&conditions={}&stream=true")
+        
+        self.assertEqual(response.status_code, 500)
+    
+    def test_search_invalid_cursor(self):
+        """测试无效游标返回400"""
+        self.db_manager.search_page.side_effect = ValueError("无效的 cursor 参数")
+        
+        response = self.client.get("/api/search?db_name=db1&collection_name=c1&cursor=bad")
+        
+        self.assertEqual(response.status_code, 400)
+    
+    
+    def test_aggregate_json_array(self):
+        """测试聚合结果以JSON数组输出，BSON类型使用扩展JSON"""
+        documents = iter([{"_id": ObjectId("64b7f0c2a1b2c3d4e5f60718"), "count": 2}, {"_id": None, "count": 1}])
+        self.db_manager.aggregate.return_value = documents
+        
+        response = self.client.post("/api/aggregate", json={
+            "db_name": "db1", "collection_name": "c1", "pipeline": [{"$group": {"_id": "$ref"}}]
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), [
+            {"_id": {"$oid": "64b7f0c2a1b2c3d4e5f60718"}, "count": 2},
+            {"_id": None, "count": 1}
+        ])
+    
+    def test_aggregate_ndjson(self):
+        """测试聚合结果以NDJSON流式输出"""
+        self.db_manager.aggregate.return_value = iter([{"_id": "a"}, {"_id": "b"}])
+        
+        response = self.client.post("/api/aggregate", json={
+            "db_name": "db1", "collection_name": "c1", "pipeline": [], "stream": True
+        })
+        
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{"_id": "a"}, {"_id": "b"}])
+    
+    def test_aggregate_errors(self):
+        """测试聚合参数错误和服务端拒绝执行"""
+        response = self.client.post("/api/aggregate", json={"db_name": "db1", "collection_name": "c1"})
+        self.assertEqual(response.status_code, 400)
+        
+        self.db_manager.aggregate.side_effect = OperationFailure("bad", details={"errmsg": "Unrecognized pipeline stage"})
+        response = self.client.post("/api/aggregate", json={
+            "db_name": "db1", "collection_name": "c1", "pipeline": [{"$bad": {}}]
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()["details"], "Unrecognized pipeline stage")
+        
+        self.db_manager.aggregate.side_effect = ExecutionTimeout("timeout")
+        response = self.client.post("/api/aggregate", json={
+            "db_name": "db1", "collection_name": "c1", "pipeline": []
+        })
+        self.assertEqual(response.status_code, 504)
+    
+    def test_watch(self):
+        """测试以server-sent events推送变更，不压缩，结束时释放订阅"""
+        subscription = Subscription({}, 10)
+        subscription.deliver({"_id": {"_data": "8263A1"}, "operationType": "insert", "fullDocument": {"uuid": "a"}})
+        subscription.close("变更流已结束")
+        self.db_manager.subscribe_changes.return_value = subscription
+        
+        response = self.client.get("/api/watch?db_name=db1&collection_name=c1",
+                                   headers={"Last-Event-ID": "8263A0", "Accept-Encoding": "gzip"})
+        body = response.get_data(as_text=True)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "text/event-stream")
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(self.db_manager.subscribe_changes.call_args[0][0]["resume_after"], "8263A0")
+        events = body.split("\n\n")
+        self.assertEqual(events[0], ": connected")
+        self.assertTrue(events[1].startswith("id: 8263A1\nevent: change\ndata: "))
+        self.assertEqual(json.loads(events[1].split("data: ")[1])["fullDocument"], {"uuid": "a"})
+        self.assertTrue(events[2].startswith("event: error\ndata: "))
+        self.assertEqual(json.loads(events[2].split("data: ")[1]), {"error": "变更流已结束"})
+        self.db_manager.change_feeds.release.assert_called_once_with(subscription)
+    
+    def test_watch_errors(self):
+        """测试订阅参数错误、订阅者过多和无法恢复"""
+        response = self.client.get("/api/watch?db_name=db1")
+        self.assertEqual(response.status_code, 400)
+        
+        self.db_manager.subscribe_changes.side_effect = ValueError("match 必须是JSON对象")
+        response = self.client.get("/api/watch?db_name=db1&collection_name=c1&match=x")
+        self.assertEqual(response.status_code, 400)
+        
+        self.db_manager.subscribe_changes.side_effect = TooManySubscribers()
+        response = self.client.get("/api/watch?db_name=db1&collection_name=c1")
+        self.assertEqual(response.status_code, 503)
+        
+        self.db_manager.subscribe_changes.side_effect = OperationFailure(
+            "history lost", code=286, details={"errmsg": "resume point may no longer be in the oplog"})
+        response = self.client.get("/api/watch?db_name=db1&collection_name=c1&resume_after=8263A1")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()["details"], "resume point may no longer be in the oplog")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+应用模块测试
+测试数据库管理器在多进程部署下的创建方式
+"""
+
+import unittest
+from unittest.mock import Mock, patch
+
+from prometheus_client import REGISTRY
+
+import app as app_module
+from config import TestingConfig
+
+
+class TestDbManagerLifecycle(unittest.TestCase):
+    """数据库管理器生命周期测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        app_module.reset_db_manager()
+        patcher = patch('app.MongoDBManager')
+        self.manager_class = patcher.start()
+        self.manager_class.side_effect = lambda config: object()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(app_module.reset_db_manager)
+    
+    def test_init_app_does_not_connect(self):
+        """测试初始化应用时不创建数据库连接"""
+        app_module.init_app()
+        self.manager_class.assert_not_called()
+    
+    def test_get_db_manager_reused_in_same_process(self):
+        """测试同一进程复用数据库管理器"""
+        first = app_module.get_db_manager()
+        second = app_module.get_db_manager()
+        
+        self.assertIs(first, second)
+        self.assertEqual(self.manager_class.call_count, 1)
+    
+    def test_get_db_manager_recreated_after_fork(self):
+        """测试fork后的子进程创建新的数据库管理器"""
+        with patch('app.os.getpid', return_value=100):
+            parent = app_module.get_db_manager()
+        with patch('app.os.getpid', return_value=200):
+            child = app_module.get_db_manager()
+        
+        self.assertIsNot(parent, child)
+        self.assertEqual(self.manager_class.call_count, 2)
+
+
+class TestMetrics(unittest.TestCase):
+    """请求指标测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.client = app_module.create_app("testing").test_client()
+    
+    @staticmethod
+    def sample(name, labels):
+        """读取指标当前值"""
+        return REGISTRY.get_sample_value(name, labels) or 0
+    
+    def test_request_metrics(self):
+        """测试请求数、耗时和响应大小"""
+        labels = {"method": "GET", "endpoint": "/", "status": "200"}
+        count = self.sample("http_requests_total", labels)
+        size = self.sample("http_response_size_bytes_sum", {"method": "GET", "endpoint": "/"})
+        
+        with self.client.get("/") as response:
+            body_size = len(response.data)
+        with self.client.get("/no/such/path") as response:
+            self.assertEqual(response.status_code, 404)
+        
+        self.assertEqual(self.sample("http_requests_total", labels), count + 1)
+        self.assertEqual(self.sample("http_response_size_bytes_sum", {"method": "GET", "endpoint": "/"}),
+                         size + body_size)
+        self.assertGreaterEqual(self.sample("http_requests_total", {
+            "method": "GET", "endpoint": "unmatched", "status": "404"}), 1)
+        
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'http_request_duration_seconds_bucket{endpoint="/"', response.data)
+    
+    def test_streamed_response_size(self):
+        """测试流式响应按实际输出字节数统计"""
+        db_manager = Mock()
+        db_manager.config = TestingConfig()
+        db_manager.search_stream.return_value = iter([{"uuid": "a"}, {"uuid": "b"}])
+        labels = {"method": "GET", "endpoint": "/api/search"}
+        size = self.sample("http_response_size_bytes_sum", labels)
+        
+        with patch('api.get_db_manager', return_value=db_manager):
+            with self.client.get("/api/search?db_name=db1&collection_name=c1&stream=true") as response:
+                body_size = len(response.data)
+        
+        self.assertGreater(body_size, 0)
+        self.assertEqual(self.sample("http_response_size_bytes_sum", labels), size + body_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,576 @@
+"""
+ASGI入口测试
+测试异步接口与Flask接口保持一致的行为
+"""
+
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+
+from pymongo.errors import PyMongoError
+
+import asgi
+from cache import AsyncSingleFlight
+from changefeed import AsyncSubscription
+from config import TestingConfig
+from database import AsyncMongoDBManager, BaseMongoDBManager, MongoDBManager
+
+
+async def call_app(method, path, query_string=b"", body=b"", headers=None):
+    """调用ASGI应用并收集响应"""
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query_string,
+        "headers": headers or []
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+    
+    async def receive():
+        return messages.pop(0)
+    
+    async def send(message):
+        sent.append(message)
+    
+    await asgi.app(scope, receive, send)
+    status = sent[0]["status"]
+    body = b"".join(message.get("body", b"") for message in sent[1:])
+    return status, body
+
+
+class AsyncDocuments:
+    """模拟异步游标"""
+    
+    def __init__(self, documents):
+        self.documents = list(documents)
+        self.closed = False
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        if not self.documents:
+            raise StopAsyncIteration
+        return self.documents.pop(0)
+    
+    async def close(self):
+        self.closed = True
+
+
+class TestAsgiApp(unittest.IsolatedAsyncioTestCase):
+    """ASGI应用测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.db_manager = Mock()
+        self.db_manager.save_data = AsyncMock()
+        self.db_manager.search_page = AsyncMock()
+        self.db_manager.ping = AsyncMock()
+        self.db_manager.ensure_indexes = AsyncMock()
+        patcher = patch('asgi.get_async_db_manager', return_value=self.db_manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    async def test_save_data(self):
+        """测试保存数据"""
+        self.db_manager.save_data.return_value = {"message": "Data saved successfully", "id": {"uuid": "a"}}
+        
+        status, body = await call_app(
+            "POST", "/api/save",
+            body=json.dumps({"db_name": "db1", "collection_name": "c1", "content": "{}"}).encode()
+        )
+        
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)["id"], {"uuid": "a"})
+    
+    async def test_save_data_missing_collection_name(self):
+        """测试保存数据缺少集合名称"""
+        status, _ = await call_app("POST", "/api/save", body=b'{"db_name": "db1"}')
+        
+        self.assertEqual(status, 400)
+        self.db_manager.save_data.assert_not_called()
+    
+    async def test_save_data_async_mode_rejected(self):
+        """测试ASGI入口不支持异步写入，mode=async返回400而不是同步写入"""
+        body = json.dumps({"db_name": "db1", "collection_name": "c1", "content": "{}"}).encode()
+        for query_string in (b"mode=async", b"mode=later"):
+            status, _ = await call_app("POST", "/api/save", query_string=query_string, body=body)
+            self.assertEqual(status, 400)
+        self.db_manager.save_data.assert_not_called()
+    
+    async def test_search_data(self):
+        """测试搜索返回列表和游标分页对象"""
+        self.db_manager.search_page.return_value = {"data": [{"uuid": "a"}], "next_cursor": None}
+        
+        status, body = await call_app(
+            "GET", "/api/search", query_string=b"db_name=db1&collection_name=c1&conditions=%7B%7D"
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), [{"uuid": "a"}])
+        
+        status, body = await call_app(
+            "GET", "/api/search", query_string=b"db_name=db1&collection_name=c1&cursor="
+        )
+        self.assertEqual(json.loads(body), {"data": [{"uuid": "a"}], "next_cursor": None})
+    
+    async def test_search_stream(self):
+        """测试NDJSON流式搜索"""
+        documents = AsyncDocuments([{"uuid": "a"}, {"uuid": "b"}])
+        self.db_manager.search_stream.return_value = documents
+        
+        status, body = await call_app(
+            "GET", "/api/search", query_string=b"db_name=db1&collection_name=c1&stream=true"
+        )
+        
+        self.assertEqual(status, 200)
+        lines = body.decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{"uuid": "a"}, {"uuid": "b"}])
+        self.assertTrue(documents.closed)
+    
+    async def test_health_check_unhealthy(self):
+        """测试数据库不可用时的健康检查"""
+        self.db_manager.ping.side_effect = PyMongoError("connection refused")
+        
+        status, body = await call_app("GET", "/api/health")
+        
+        self.assertEqual(status, 503)
+        self.assertEqual(json.loads(body)["status"], "unhealthy")
+    
+    async def test_metrics(self):
+        """测试Prometheus指标接口"""
+        await call_app("GET", "/api/health")
+        
+        status, body = await call_app("GET", "/metrics")
+        
+        self.assertEqual(status, 200)
+        self.assertIn(b'http_requests_total{endpoint="/api/health",method="GET",status="200"}', body)
+    
+    async def test_live_and_ready(self):
+        """测试存活和就绪检查"""
+        self.db_manager.readiness.return_value = {"ready": False}
+        
+        status, body = await call_app("GET", "/api/live")
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)["status"], "alive")
+        
+        status, body = await call_app("GET", "/api/ready")
+        self.assertEqual(status, 503)
+        self.assertEqual(json.loads(body)["status"], "not_ready")
+        self.db_manager.ping.assert_not_awaited()
+    
+    async def test_watch(self):
+        """测试推送变更事件，订阅结束后释放订阅"""
+        subscription = AsyncSubscription({"operationType": "insert"}, 10)
+        subscription.deliver({"_id": {"_data": "01"}, "operationType": "update"})
+        subscription.deliver({"_id": {"_data": "02"}, "operationType": "insert"})
+        subscription.close("变更流已结束")
+        self.db_manager.subscribe_changes = AsyncMock(return_value=subscription)
+        scope = {"type": "http", "method": "GET", "path": "/api/watch",
+                 "query_string": b"db_name=db1&collection_name=c1", "headers": []}
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+        sent = []
+        
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            # 客户端保持连接
+            await asyncio.Event().wait()
+        
+        async def send(message):
+            sent.append(message)
+        
+        await asgi.app(scope, receive, send)
+        
+        self.assertIn((b"content-type", b"text/event-stream"), sent[0]["headers"])
+        body = b"".join(message.get("body", b"") for message in sent[1:]).decode()
+        self.assertNotIn("id: 01", body)
+        self.assertIn("id: 02\nevent: change", body)
+        self.assertEqual(json.loads(body.split("event: error\ndata: ")[1]), {"error": "变更流已结束"})
+        self.db_manager.change_feeds.release.assert_called_once_with(subscription)
+    
+    async def test_unknown_route_and_method(self):
+        """测试未知路由和不允许的方法"""
+        status, _ = await call_app("GET", "/api/unknown")
+        self.assertEqual(status, 404)
+        
+        status, _ = await call_app("GET", "/api/save")
+        self.assertEqual(status, 405)
+
+
+class TestAsyncMongoDBManager(unittest.IsolatedAsyncioTestCase):
+    """异步MongoDB管理器测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        with patch('database.AsyncMongoClient'):
+            self.db_manager = AsyncMongoDBManager(TestingConfig())
+        self.mock_collection = Mock()
+        self.mock_collection.create_indexes = AsyncMock()
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = self.mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+    
+    def test_shared_state(self):
+        """测试异步管理器与同步管理器共用基类，不继承同步客户端上的数据库操作"""
+        self.assertIsInstance(self.db_manager, BaseMongoDBManager)
+        self.assertNotIsInstance(self.db_manager, MongoDBManager)
+        self.assertIsNone(self.db_manager.write_behind)
+        self.assertIsNone(self.db_manager.query_cache)
+        self.assertIsInstance(self.db_manager.single_flight, AsyncSingleFlight)
+        self.assertEqual(self.db_manager.indexed_collections, set())
+        self.assertFalse(hasattr(self.db_manager, "save_async"))
+        for name in ("save_data", "save_batch", "search_page", "aggregate", "explain_search"):
+            self.assertTrue(asyncio.iscoroutinefunction(getattr(self.db_manager, name)), name)
+    
+    async def test_save_batch(self):
+        """测试异步批量保存按集合一次bulk_write，同一uuid放到下一轮"""
+        self.mock_collection.bulk_write = AsyncMock(return_value=Mock(acknowledged=True, upserted_ids={0: "id"}))
+        
+        result = await self.db_manager.save_batch([
+            {"db_name": "test_db", "collection_name": "test_collection", "uuid": "a"},
+            {"db_name": "test_db", "collection_name": "test_collection", "uuid": "b"},
+            {"db_name": "test_db", "collection_name": "test_collection", "uuid": "a"},
+            {"db_name": "test_db"}
+        ])
+        
+        self.assertEqual(self.mock_collection.bulk_write.await_count, 2)
+        self.assertEqual(len(self.mock_collection.bulk_write.await_args_list[0][0][0]), 2)
+        self.assertEqual((result["saved"], result["failed"]), (3, 1))
+        self.assertTrue(result["results"][0]["is_new"])
+    
+    async def test_aggregate(self):
+        """测试异步聚合返回服务端游标"""
+        cursor = AsyncDocuments([{"_id": "a", "count": 1}])
+        self.mock_collection.aggregate = AsyncMock(return_value=cursor)
+        
+        result = await self.db_manager.aggregate({
+            "db_name": "test_db",
+            "collection_name": "test_collection",
+            "pipeline": '[{"$group": {"_id": "$type", "count": {"$sum": 1}}}]'
+        })
+        
+        self.assertIs(result, cursor)
+        pipeline, = self.mock_collection.aggregate.await_args[0]
+        self.assertEqual(pipeline[0]["$group"]["_id"], "$type")
+    
+    async def test_search_cache(self):
+        """测试异步搜索使用查询缓存，写入后失效"""
+        config = TestingConfig()
+        config.SEARCH_CACHE_ENABLED = True
+        with patch('database.AsyncMongoClient'):
+            db_manager = AsyncMongoDBManager(config)
+        db_manager.client.__getitem__.return_value.__getitem__.return_value = self.mock_collection
+        chain = self.mock_collection.find.return_value.skip.return_value.limit.return_value.sort.return_value
+        chain.to_list = AsyncMock(return_value=[{"uuid": "a"}])
+        params = {"db_name": "test_db", "collection_name": "test_collection", "uuid": "a"}
+        
+        await db_manager.search_page(params)
+        await db_manager.search_page(params)
+        self.assertEqual(chain.to_list.await_count, 1)
+        
+        self.mock_collection.update_one = AsyncMock()
+        await db_manager.save_data({"db_name": "test_db", "collection_name": "test_collection", "uuid": "a"})
+        await db_manager.search_page(params)
+        self.assertEqual(chain.to_list.await_count, 2)
+    
+    def test_watch_subscriber_limit(self):
+        """测试ASGI入口的订阅者上限不受Flask工作线程数限制"""
+        config = TestingConfig()
+        self.assertEqual(self.db_manager.change_feeds.max_subscribers, config.ASGI_WATCH_MAX_SUBSCRIBERS)
+        self.assertLessEqual(config.WATCH_MAX_SUBSCRIBERS, config.WEB_THREADS)
+    
+    async def test_save_data_single_upsert(self):
+        """测试异步保存使用一次upsert"""
+        self.mock_collection.update_one = AsyncMock()
+        self.mock_collection.update_one.return_value.upserted_id = "new_id"
+        
+        result = await self.db_manager.save_data({
+            "db_name": "test_db",
+            "collection_name": "test_collection",
+            "content": '{"test": "data"}'
+        })
+        
+        self.assertTrue(result["is_new"])
+        update = self.mock_collection.update_one.call_args[0][1]
+        self.assertEqual(update["$set"]["test"], "data")
+        self.assertIn("created_at", update["$setOnInsert"])
+    
+    async def test_save_data_partitioned_existing_uuid(self):
+        """测试异步保存把已存在的uuid写回原分区"""
+        self.db_manager.config.PARTITIONED_COLLECTIONS = ["test_db.logs"]
+        collections = {name: Mock() for name in ("logs_2026_11", "logs_2026_10")}
+        for name, documents in (("logs_2026_11", []), ("logs_2026_10", [{"uuid": "u1"}])):
+            collections[name].find.return_value.to_list = AsyncMock(return_value=documents)
+            collections[name].update_one = AsyncMock()
+            collections[name].create_indexes = AsyncMock()
+        mock_db = MagicMock()
+        mock_db.list_collection_names = AsyncMock(return_value=["logs_2026_10", "logs_2026_11"])
+        mock_db.__getitem__.side_effect = lambda name: collections[name]
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        with patch.object(self.db_manager, 'get_current_timestamp', return_value=1793491200000):
+            await self.db_manager.save_data({"db_name": "test_db", "collection_name": "logs", "uuid": "u1",
+                                             "content": "{}"})
+        
+        collections["logs_2026_10"].update_one.assert_awaited_once()
+        collections["logs_2026_11"].update_one.assert_not_awaited()
+    
+    async def test_patch_data(self):
+        """测试异步局部更新不使用upsert，数据不存在时返回Not found"""
+        self.mock_collection.update_one = AsyncMock(return_value=Mock(acknowledged=True, matched_count=0))
+        
+        result = await self.db_manager.patch_data({
+            "db_name": "test_db",
+            "collection_name": "test_collection",
+            "uuid": "a",
+            "update": {"$unset": {"draft": 1}}
+        })
+        
+        self.assertEqual(result["message"], "Not found")
+        find_obj, update = self.mock_collection.update_one.call_args[0]
+        self.assertEqual(find_obj, {"uuid": "a"})
+        self.assertEqual(update["$unset"], {"draft": ""})
+        self.assertIn("updated_at", update["$set"])
+    
+    async def test_search_page(self):
+        """测试异步搜索"""
+        chain = self.mock_collection.find.return_value.skip.return_value.limit.return_value.sort.return_value
+        chain.to_list = AsyncMock(return_value=[{"uuid": "a"}])
+        
+        results = await self.db_manager.search_data({
+            "db_name": "test_db",
+            "collection_name": "test_collection",
+            "conditions": '{"title": "test"}'
+        })
+        
+        self.assertEqual(results, [{"uuid": "a"}])
+        self.mock_collection.find.assert_called_once_with({"title": "test"}, {"_id": 0})
+    
+    async def test_slow_query_explained_in_background(self):
+        """测试异步搜索的慢查询在后台任务中explain，日志包含扫描数"""
+        self.db_manager.config.SLOW_QUERY_MS = 0
+        with patch('database.AsyncMongoClient'):
+            db_manager = AsyncMongoDBManager(self.db_manager.config)
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = self.mock_collection
+        db_manager.client.__getitem__.return_value = mock_db
+        self.mock_collection.name = "test_collection"
+        chain = self.mock_collection.find.return_value.skip.return_value.limit.return_value.sort.return_value
+        chain.to_list = AsyncMock(return_value=[{"uuid": "a"}])
+        self.mock_collection.database.command = AsyncMock(return_value={
+            "queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}},
+            "executionStats": {"totalKeysExamined": 0, "totalDocsExamined": 500}
+        })
+        
+        with self.assertLogs('database', level='WARNING') as logs:
+            await db_manager.search_data({"db_name": "test_db", "collection_name": "test_collection",
+                                          "conditions": '{"title": "test"}'})
+            self.assertEqual(len(db_manager._background_tasks), 1)
+            await asyncio.gather(*db_manager._background_tasks)
+        
+        self.assertIn("扫描索引键数: 0, 扫描文档数: 500, 返回文档数: 1", logs.output[0])
+        self.assertEqual(self.mock_collection.database.command.call_args[1]["verbosity"], "executionStats")
+    
+    async def test_warm_up_task(self):
+        """测试预热在后台任务中执行，只启动一次"""
+        self.db_manager.client.admin.command = AsyncMock(return_value={"ok": 1})
+        self.db_manager.config.MONGO_MIN_POOL_SIZE = 3
+        self.db_manager.config.WARMUP_COLLECTIONS = ["test_db.test_collection"]
+        
+        self.db_manager.start_warmup()
+        task = self.db_manager._warmup_task
+        self.db_manager.start_warmup()
+        await task
+        
+        self.assertIs(self.db_manager._warmup_task, task)
+        self.assertEqual(self.db_manager.warmup_status, "done")
+        self.assertEqual(self.db_manager.client.admin.command.await_count, 4)
+        self.mock_collection.create_indexes.assert_awaited_once()
+    
+    async def test_save_data_does_not_wait_for_indexes(self):
+        """测试异步保存在后台任务中创建索引，并发的首次写入只创建一次"""
+        release = asyncio.Event()
+        
+        async def create_indexes(models):
+            await release.wait()
+        
+        self.mock_collection.create_indexes = AsyncMock(side_effect=create_indexes)
+        self.mock_collection.update_one = AsyncMock()
+        data = {"db_name": "test_db", "collection_name": "test_collection", "content": "{}"}
+        
+        await asyncio.gather(*(self.db_manager.save_data(data) for _ in range(5)))
+        
+        self.assertEqual(self.mock_collection.update_one.await_count, 5)
+        self.assertEqual(len(self.db_manager._background_tasks), 1)
+        release.set()
+        await asyncio.gather(*self.db_manager._background_tasks)
+        self.mock_collection.create_indexes.assert_awaited_once()
+        self.assertIn(("test_db", "test_collection", "uuid"), self.db_manager.indexed_collections)
+    
+    async def test_ensure_indexes_once(self):
+        """测试异步索引每个集合只创建一次"""
+        await self.db_manager.ensure_indexes("test_db", "test_collection")
+        await self.db_manager.ensure_indexes("test_db", "test_collection")
+        
+        self.mock_collection.create_indexes.assert_awaited_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+async def call_app_with_headers(method, path, query_string=b"", body=b"", headers=None):
+    """调用ASGI应用并收集状态码、响应头和响应体"""
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query_string,
+        "headers": [(key.lower().encode("latin-1"), value.encode("latin-1")) for key, value in (headers or {}).items()]
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+    
+    async def receive():
+        return messages.pop(0)
+    
+    async def send(message):
+        sent.append(message)
+    
+    await asgi.app(scope, receive, send)
+    response_headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in sent[0]["headers"]}
+    return sent[0]["status"], response_headers, b"".join(message.get("body", b"") for message in sent[1:])
+
+
+class TestFlaskParity(unittest.IsolatedAsyncioTestCase):
+    """同一请求分别发给Flask应用和ASGI应用，状态码和响应体应一致"""
+    
+    DOCUMENTS = [{"uuid": f"id-{i}", "content": "x" * 20} for i in range(100)]
+    
+    def setUp(self):
+        """测试前准备"""
+        from app import create_app
+        
+        self.flask_client = create_app("testing").test_client()
+        self.sync_manager = self.create_manager(Mock)
+        self.async_manager = self.create_manager(AsyncMock)
+        
+        for target, manager in (('api.get_db_manager', self.sync_manager),
+                                ('asgi.get_async_db_manager', self.async_manager)):
+            patcher = patch(target, return_value=manager)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def create_manager(self, method_mock):
+        """创建数据库管理器的模拟对象，I/O方法为Mock（Flask）或AsyncMock（ASGI）"""
+        manager = Mock()
+        manager.config = TestingConfig()
+        manager.pool_metrics.snapshot.return_value = {"checked_out": 0}
+        manager.query_cache = None
+        manager.single_flight = None
+        manager.write_behind = None
+        manager.change_feeds.stats.return_value = {"feeds": 0}
+        manager.readiness.return_value = {"ready": True}
+        manager.save_data = method_mock(return_value={"id": "id-1", "created": True})
+        manager.patch_data = method_mock(return_value=None)
+        manager.save_batch = method_mock(return_value={"results": [{"id": "id-1", "created": True}]})
+        manager.search_page = method_mock(return_value={"data": self.DOCUMENTS, "next_cursor": None})
+        manager.ping = method_mock()
+        return manager
+    
+    async def assert_same(self, method, path, query_string="", body=None, headers=None, compare_body=True):
+        """发送同一请求并比较两个应用的响应"""
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        flask_headers = dict(headers or {})
+        if body is not None:
+            flask_headers["Content-Type"] = "application/json"
+        flask_response = self.flask_client.open(path, method=method, query_string=query_string, data=data,
+                                                headers=flask_headers)
+        status, asgi_headers, asgi_body = await call_app_with_headers(
+            method, path, query_string.encode("utf-8"), data, flask_headers)
+        
+        self.assertEqual(status, flask_response.status_code, f"{method} {path}")
+        self.assertEqual(asgi_headers.get("content-encoding"), flask_response.headers.get("Content-Encoding"))
+        if compare_body and flask_response.headers.get("Content-Encoding") is None:
+            self.assertEqual(json.loads(asgi_body), flask_response.get_json(), f"{method} {path}")
+        return flask_response, asgi_headers, asgi_body
+    
+    async def test_save_validation(self):
+        """测试保存接口的校验"""
+        await self.assert_same("POST", "/api/save", body={"collection_name": "c", "content": "x"})
+        await self.assert_same("POST", "/api/save", body={"db_name": "db", "content": "x"})
+        await self.assert_same("POST", "/api/save", body=["not", "object"])
+        await self.assert_same("POST", "/api/save", body={"db_name": "db", "collection_name": "c", "mode": "later"})
+        await self.assert_same("POST", "/api/save", body={"db_name": "db", "collection_name": "c", "content": "x"})
+    
+    async def test_patch_not_found(self):
+        """测试局部更新不存在的数据"""
+        await self.assert_same("POST", "/api/patch", body={"db_name": "db", "collection_name": "c", "uuid": "u"})
+    
+    async def test_save_batch(self):
+        """测试批量保存"""
+        await self.assert_same("POST", "/api/save/batch", body={"items": []})
+        await self.assert_same("POST", "/api/save/batch", body={
+            "items": [{"db_name": "db", "collection_name": "c", "content": "x"}]
+        })
+    
+    async def test_search(self):
+        """测试搜索的校验和结果"""
+        await self.assert_same("GET", "/api/search", "collection_name=c")
+        await self.assert_same("GET", "/api/search", "db_name=db&collection_name=c&limit=abc")
+        await self.assert_same("GET", "/api/search", "db_name=db&collection_name=c")
+        await self.assert_same("GET", "/api/search", "db_name=db&collection_name=c&cursor=")
+    
+    async def test_accept_q_values(self):
+        """测试Accept中application/x-ndjson权重较低时不使用流式响应"""
+        headers = {"Accept": "application/x-ndjson;q=0.1, application/json"}
+        flask_response, asgi_headers, _ = await self.assert_same(
+            "GET", "/api/search", "db_name=db&collection_name=c", headers=headers)
+        self.assertEqual(flask_response.mimetype, "application/json")
+        self.assertEqual(asgi_headers["content-type"], "application/json")
+        self.sync_manager.search_stream.assert_not_called()
+        self.async_manager.search_stream.assert_not_called()
+    
+    async def test_aggregate_validation(self):
+        """测试聚合接口的校验"""
+        await self.assert_same("POST", "/api/aggregate", body={"db_name": "db", "collection_name": "c"})
+        await self.assert_same("POST", "/api/aggregate", body={"db_name": "db", "collection_name": "c",
+                                                               "pipeline": {"$match": {}}})
+    
+    async def test_health_and_stats(self):
+        """测试健康检查、就绪检查和运行指标"""
+        for path in ("/api/health", "/api/ready", "/api/stats"):
+            flask_response, _, asgi_body = await self.assert_same("GET", path, compare_body=False)
+            expected = flask_response.get_json()
+            actual = json.loads(asgi_body)
+            expected.pop("pid", None)
+            actual.pop("pid", None)
+            self.assertEqual(actual, expected, path)
+        
+        flask_response, _, asgi_body = await self.assert_same("GET", "/api/live", compare_body=False)
+        self.assertEqual(json.loads(asgi_body).keys(), flask_response.get_json().keys())
+    
+    async def test_routing_errors(self):
+        """测试未知路由、不允许的方法和OPTIONS请求"""
+        await self.assert_same("GET", "/api/unknown")
+        await self.assert_same("OPTIONS", "/api/unknown")
+        flask_response, asgi_headers, _ = await self.assert_same("GET", "/api/save")
+        self.assertEqual(set(asgi_headers["allow"].split(", ")), set(flask_response.headers["Allow"].split(", ")))
+        
+        flask_response = self.flask_client.options("/api/search")
+        status, asgi_headers, _ = await call_app_with_headers("OPTIONS", "/api/search")
+        self.assertEqual(status, flask_response.status_code)
+        self.assertEqual(set(asgi_headers["allow"].split(", ")), set(flask_response.headers["Allow"].split(", ")))
+    
+    async def test_compression(self):
+        """测试较大的响应按Accept-Encoding压缩"""
+        import gzip
+        
+        flask_response, asgi_headers, asgi_body = await self.assert_same(
+            "GET", "/api/search", "db_name=db&collection_name=c", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(asgi_headers["content-encoding"], "gzip")
+        self.assertIn("Accept-Encoding", asgi_headers["vary"])
+        self.assertEqual(json.loads(gzip.decompress(asgi_body)), json.loads(gzip.decompress(flask_response.data)))
@@ -0,0 +1,81 @@
+"""
+基准测试工具测试
+测试参数解析、延迟统计以及基于mongomock的场景运行
+"""
+
+import argparse
+import unittest
+from unittest.mock import patch
+
+import benchmark
+from app import create_app
+from config import TestingConfig
+from database import MongoDBManager
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+class TestBenchmarkHelpers(unittest.TestCase):
+    """基准测试辅助函数测试类"""
+    
+    def test_parse_mix(self):
+        """测试操作比例解析"""
+        self.assertEqual(benchmark.parse_mix("save=1,search=4"), {"save": 1.0, "search": 4.0})
+        self.assertEqual(benchmark.parse_mix("scan"), {"scan": 1.0})
+        for value in ("delete=1", "save=x", "save=-1", "save=0"):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                benchmark.parse_mix(value)
+    
+    def test_parse_int_list(self):
+        """测试整数列表解析"""
+        self.assertEqual(benchmark.parse_int_list("1,8, 32"), [1, 8, 32])
+        with self.assertRaises(argparse.ArgumentTypeError):
+            benchmark.parse_int_list("1,a")
+    
+    def test_percentile(self):
+        """测试百分位数计算"""
+        values = [float(value) for value in range(1, 101)]
+        
+        self.assertEqual(benchmark.percentile(values, 50), 50.0)
+        self.assertEqual(benchmark.percentile(values, 99), 99.0)
+        self.assertEqual(benchmark.percentile(values, 100), 100.0)
+        self.assertEqual(benchmark.percentile([], 99), 0.0)
+    
+    def test_summarize(self):
+        """测试延迟汇总"""
+        summary = benchmark.summarize([0.002, 0.001, 0.003, 0.004], duration=2.0)
+        
+        self.assertEqual(summary["requests"], 4)
+        self.assertEqual(summary["throughput"], 2.0)
+        self.assertEqual(summary["latency_ms"]["p50"], 2.0)
+        self.assertEqual(summary["latency_ms"]["max"], 4.0)
+
+
+@unittest.skipIf(mongomock is None, "需要安装mongomock")
+class TestScenario(unittest.TestCase):
+    """基准测试场景测试类"""
+    
+    def test_run_with_mongomock(self):
+        """测试使用mongomock运行场景"""
+        with patch('database.MongoClient', mongomock.MongoClient):
+            db_manager = MongoDBManager(TestingConfig())
+        args = benchmark.build_parser().parse_args([
+            "--mongomock", "--requests", "40", "--warmup", "0", "--mix", "save=1,update=1,search=1,scan=1"
+        ])
+        
+        with patch('api.get_db_manager', return_value=db_manager):
+            result = benchmark.Scenario(create_app("testing"), db_manager, args, 2, 64, 20).run()
+        
+        self.assertEqual(result["requests"], 40)
+        self.assertEqual(result["errors"], 0)
+        self.assertEqual(sum(item["requests"] for item in result["operations"].values()), 40)
+        self.assertIn("p99", result["latency_ms"])
+        # 场景结束后删除测试集合
+        self.assertNotIn("bench_20_64", db_manager.get_database(benchmark.BENCHMARK_DB).list_collection_names())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,257 @@
+"""
+查询缓存测试
+测试LRU淘汰、过期、写入失效以及相同查询的合并
+"""
+
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+
+from cache import AsyncSingleFlight, QueryCache, SingleFlight
+
+
+def page(*uuids):
+    """构造搜索结果"""
+    return {"data": [{"uuid": uuid} for uuid in uuids]}
+
+
+class TestQueryCache(unittest.TestCase):
+    """查询缓存测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.cache = QueryCache(max_entries=2, max_bytes=10000, default_ttl=5)
+    
+    def test_make_key_normalizes_query(self):
+        """测试相同查询生成相同的缓存键"""
+        first = QueryCache.make_key({"db_name": "db", "filter": {"a": 1}, "limit": 5})
+        second = QueryCache.make_key({"db_name": "db", "filter": {"a": 1}, "limit": 5})
+        third = QueryCache.make_key({"db_name": "db", "filter": {"a": 1}, "limit": 6})
+        
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, third)
+    
+    def test_get_and_put(self):
+        """测试缓存命中和未命中"""
+        self.assertEqual(self.cache.get("k1"), (False, None))
+        self.cache.put("k1", "db", "c", page("a"), version=0)
+        
+        self.assertEqual(self.cache.get("k1"), (True, page("a")))
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+    
+    def test_lru_eviction_by_entries(self):
+        """测试按条目数淘汰最久未使用的条目"""
+        self.cache.put("k1", "db", "c", page("a"), version=0)
+        self.cache.put("k2", "db", "c", page("b"), version=0)
+        self.cache.get("k1")
+        self.cache.put("k3", "db", "c", page("c"), version=0)
+        
+        self.assertTrue(self.cache.get("k1")[0])
+        self.assertFalse(self.cache.get("k2")[0])
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+    
+    def test_eviction_by_bytes(self):
+        """测试按字节数淘汰"""
+        cache = QueryCache(max_entries=100, max_bytes=100, default_ttl=5)
+        cache.put("k1", "db", "c", page("a" * 40), version=0)
+        cache.put("k2", "db", "c", page("b" * 40), version=0)
+        
+        self.assertFalse(cache.get("k1")[0])
+        self.assertTrue(cache.get("k2")[0])
+        self.assertLessEqual(cache.stats()["bytes"], 100)
+        
+        # 单条结果超过上限时不缓存
+        cache.put("k3", "db", "c", page("c" * 200), version=0)
+        self.assertFalse(cache.get("k3")[0])
+    
+    def test_ttl_expiration(self):
+        """测试过期和按集合设置的TTL"""
+        cache = QueryCache(max_entries=10, max_bytes=10000, default_ttl=5,
+                           collection_ttls={"db.short": 1, "db.never": 0})
+        with patch('cache.time.monotonic', return_value=100.0):
+            cache.put("k1", "db", "c", page("a"), version=0)
+            cache.put("k2", "db", "short", page("b"), version=0)
+            cache.put("k3", "db", "never", page("c"), version=0)
+        
+        with patch('cache.time.monotonic', return_value=102.0):
+            self.assertTrue(cache.get("k1")[0])
+            self.assertFalse(cache.get("k2")[0])
+            self.assertFalse(cache.get("k3")[0])
+        self.assertEqual(cache.stats()["expirations"], 1)
+    
+    def test_invalidate_collection(self):
+        """测试写入后集合缓存失效"""
+        self.cache.put("k1", "db", "c1", page("a"), version=0)
+        self.cache.put("k2", "db", "c2", page("b"), version=0)
+        
+        self.cache.invalidate("db", "c1")
+        
+        self.assertFalse(self.cache.get("k1")[0])
+        self.assertTrue(self.cache.get("k2")[0])
+        self.assertEqual(self.cache.stats()["invalidations"], 1)
+    
+    def test_put_rejected_after_concurrent_write(self):
+        """测试查询期间发生写入时不缓存旧结果"""
+        version = self.cache.get_version("db", "c")
+        self.cache.invalidate("db", "c")
+        self.cache.put("k1", "db", "c", page("stale"), version=version)
+        
+        self.assertFalse(self.cache.get("k1")[0])
+
+
+
+class TestSingleFlight(unittest.TestCase):
+    """相同查询合并测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.single_flight = SingleFlight()
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = 0
+    
+    def query(self):
+        """模拟一次耗时的查询"""
+        self.calls += 1
+        self.started.set()
+        self.release.wait(2)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+    
+    def run_concurrently(self, count, key="k", db_name="db", collection_name="c"):
+        """在第一个查询进行中时发起其余的查询"""
+        outcomes = []
+        
+        def call():
+            try:
+                outcomes.append(self.single_flight.do(key, db_name, collection_name, self.query))
+            except Exception as e:
+                outcomes.append(e)
+        
+        threads = [threading.Thread(target=call)]
+        threads[0].start()
+        self.started.wait(2)
+        threads += [threading.Thread(target=call) for _ in range(count - 1)]
+        for thread in threads[1:]:
+            thread.start()
+        while self.single_flight.stats()["coalesced"] < count - 1:
+            threading.Event().wait(0.01)
+        self.release.set()
+        for thread in threads:
+            thread.join(2)
+        return outcomes
+    
+    def test_concurrent_calls_share_result(self):
+        """测试同时进行的相同查询只执行一次"""
+        self.result = page("a")
+        
+        outcomes = self.run_concurrently(5)
+        
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(sorted(shared for _, shared in outcomes), [False, True, True, True, True])
+        self.assertTrue(all(result is self.result for result, _ in outcomes))
+        self.assertEqual(self.single_flight.stats(), {"in_flight": 0, "executed": 1, "coalesced": 4})
+        
+        # 查询结束后再次调用会重新执行
+        self.single_flight.do("k", "db", "c", self.query)
+        self.assertEqual(self.calls, 2)
+    
+    def test_error_shared(self):
+        """测试查询异常传递给所有等待的调用方"""
+        self.result = RuntimeError("boom")
+        
+        outcomes = self.run_concurrently(3)
+        
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(isinstance(outcome, RuntimeError) for outcome in outcomes))
+    
+    def test_invalidate_starts_new_flight(self):
+        """测试写入之后发起的查询不合并到写入之前的查询上"""
+        self.result = page("a")
+        thread = threading.Thread(target=self.single_flight.do, args=("k", "db", "c", self.query))
+        thread.start()
+        self.started.wait(2)
+        
+        self.single_flight.invalidate("db", "c")
+        self.release.set()
+        result, shared = self.single_flight.do("k", "db", "c", self.query)
+        thread.join(2)
+        
+        self.assertFalse(shared)
+        self.assertEqual(self.calls, 2)
+
+
+class TestAsyncSingleFlight(unittest.IsolatedAsyncioTestCase):
+    """事件循环中相同查询合并测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.single_flight = AsyncSingleFlight()
+        self.release = asyncio.Event()
+        self.calls = 0
+        self.result = page("a")
+    
+    async def query(self):
+        """模拟一次耗时的查询"""
+        self.calls += 1
+        await self.release.wait()
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+    
+    async def test_concurrent_calls_share_result(self):
+        """测试同时进行的相同查询只执行一次"""
+        tasks = [asyncio.create_task(self.single_flight.do("k", "db", "c", self.query)) for _ in range(3)]
+        await asyncio.sleep(0)
+        self.release.set()
+        outcomes = await asyncio.gather(*tasks)
+        
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(sorted(shared for _, shared in outcomes), [False, True, True])
+        self.assertEqual(self.single_flight.stats(), {"in_flight": 0, "executed": 1, "coalesced": 2})
+    
+    async def test_error_shared(self):
+        """测试查询异常传递给所有等待的调用方"""
+        self.result = RuntimeError("boom")
+        tasks = [asyncio.create_task(self.single_flight.do("k", "db", "c", self.query)) for _ in range(3)]
+        await asyncio.sleep(0)
+        self.release.set()
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(isinstance(outcome, RuntimeError) for outcome in outcomes))
+    
+    async def test_leader_cancelled(self):
+        """测试执行查询的请求被取消时，等待方重新发起查询"""
+        leader = asyncio.create_task(self.single_flight.do("k", "db", "c", self.query))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(self.single_flight.do("k", "db", "c", self.query))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        self.release.set()
+        
+        result, shared = await follower
+        self.assertIs(result, self.result)
+        self.assertFalse(shared)
+        self.assertEqual(self.calls, 2)
+    
+    async def test_invalidate_starts_new_flight(self):
+        """测试写入之后发起的查询不合并到写入之前的查询上"""
+        first = asyncio.create_task(self.single_flight.do("k", "db", "c", self.query))
+        await asyncio.sleep(0)
+        self.single_flight.invalidate("db", "c")
+        second = asyncio.create_task(self.single_flight.do("k", "db", "c", self.query))
+        await asyncio.sleep(0)
+        self.release.set()
+        
+        self.assertFalse((await first)[1])
+        self.assertFalse((await second)[1])
+        self.assertEqual(self.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,310 @@
+"""
+变更推送测试
+测试订阅条件的匹配、事件格式以及同一集合共享变更流
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+
+from bson import Timestamp
+
+from changefeed import (AsyncChangeFeedHub, ChangeFeedHub, SubscriptionClosed, TooManySubscribers, format_event,
+                        matches, parse_match, parse_resume_token)
+from serialization import loads
+
+
+def make_change(token, operation="insert", **document):
+    """构建变更事件"""
+    return {
+        "_id": {"_data": token},
+        "operationType": operation,
+        "ns": {"db": "db1", "coll": "c1"},
+        "documentKey": {"_id": 1},
+        "fullDocument": document
+    }
+
+
+class FakeStream:
+    """模拟变更流，依次返回预置的事件，之后返回None"""
+    
+    def __init__(self, changes=()):
+        self.changes = list(changes)
+        self.alive = True
+        self.closed = threading.Event()
+    
+    def try_next(self):
+        if self.changes:
+            return self.changes.pop(0)
+        self.closed.wait(0.01)
+        return None
+    
+    def close(self):
+        self.closed.set()
+
+
+class AsyncFakeStream(FakeStream):
+    """模拟异步变更流"""
+    
+    async def try_next(self):
+        if self.changes:
+            return self.changes.pop(0)
+        await asyncio.sleep(0.01)
+        return None
+    
+    async def close(self):
+        self.closed.set()
+
+
+class TestMatch(unittest.TestCase):
+    """订阅条件测试类"""
+    
+    def test_parse_match(self):
+        """测试解析并拒绝不支持的条件"""
+        self.assertEqual(parse_match(None), {})
+        self.assertEqual(parse_match('{"operationType": "insert"}'), {"operationType": "insert"})
+        for match in ("[1]", "{bad", '{"$where": "1"}', '{"a": {"$regex": "x"}}', '{"$or": []}', '{"a": {"$in": 1}}'):
+            with self.assertRaises(ValueError):
+                parse_match(match)
+    
+    def test_matches(self):
+        """测试点分路径、数组元素、比较操作符和逻辑组合"""
+        change = make_change("01", type="log", level=3, tags=["a", "b"])
+        
+        self.assertTrue(matches(change, {"fullDocument.type": "log", "fullDocument.tags": "b"}))
+        self.assertTrue(matches(change, {"fullDocument.level": {"$gte": 3, "$lt": 5}}))
+        self.assertTrue(matches(change, {"fullDocument.missing": None, "fullDocument.user": {"$exists": False}}))
+        self.assertTrue(matches(change, {"$or": [{"operationType": "update"}, {"fullDocument.tags": {"$in": ["c", "a"]}}]}))
+        self.assertFalse(matches(change, {"operationType": {"$nin": ["insert", "replace"]}}))
+        self.assertFalse(matches(change, {"fullDocument.level": {"$gt": "2"}}))
+        self.assertFalse(matches(change, {"$and": [{"fullDocument.type": "log"}, {"fullDocument.level": {"$ne": 3}}]}))
+    
+    def test_parse_resume_token(self):
+        """测试恢复令牌只接受十六进制字符串"""
+        self.assertIsNone(parse_resume_token(""))
+        self.assertEqual(parse_resume_token("8263A1"), {"_data": "8263A1"})
+        with self.assertRaises(ValueError):
+            parse_resume_token('{"_data": 1}')
+    
+    def test_format_event(self):
+        """测试事件id为恢复令牌，数据为Extended JSON"""
+        change = make_change("8263A1", title="t")
+        change["clusterTime"] = Timestamp(1790812800, 1)
+        
+        event = format_event(change)
+        
+        lines = event.split("\n")
+        self.assertEqual(lines[:2], ["id: 8263A1", "event: change"])
+        self.assertTrue(event.endswith("\n\n"))
+        data = loads(lines[2][len("data: "):])
+        self.assertNotIn("_id", data)
+        self.assertEqual(data["fullDocument"], {"title": "t"})
+        self.assertEqual(data["clusterTime"], {"$timestamp": {"t": 1790812800, "i": 1}})
+
+
+class TestChangeFeedHub(unittest.TestCase):
+    """变更流共享测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.streams = []
+        
+        def open_stream(db_name, collection_name, resume_after):
+            stream = FakeStream()
+            self.streams.append((db_name, collection_name, resume_after, stream))
+            return stream
+        
+        self.hub = ChangeFeedHub(open_stream, queue_size=2, max_subscribers=3, max_private_feeds=1)
+        self.addCleanup(self.hub.close)
+    
+    def test_shared_stream(self):
+        """测试同一集合的订阅共享变更流，各自按条件过滤，最后一个订阅者离开时关闭"""
+        logs = self.hub.subscribe("db1", "c1", {"fullDocument.type": "log"})
+        everything = self.hub.subscribe("db1", "c1", {})
+        self.assertEqual(len(self.streams), 1)
+        stream = self.streams[0][3]
+        
+        stream.changes.extend([make_change("01", type="log"), make_change("02", type="user")])
+        self.assertEqual(everything.get(1)["_id"]["_data"], "01")
+        self.assertEqual(everything.get(1)["_id"]["_data"], "02")
+        self.assertEqual(logs.get(1)["_id"]["_data"], "01")
+        self.assertIsNone(logs.get(0.05))
+        self.assertEqual(self.hub.stats(), {"feeds": 1, "private_feeds": 0, "subscribers": 2, "events": 2})
+        
+        self.hub.release(logs)
+        self.assertFalse(stream.closed.is_set())
+        self.hub.release(everything)
+        self.assertTrue(stream.closed.wait(1))
+        self.assertEqual(self.hub.stats()["feeds"], 0)
+    
+    def test_open_stream_outside_lock(self):
+        """测试打开变更流时不持有锁，并发打开同一集合时关闭多余的变更流"""
+        opening = threading.Semaphore(0)
+        proceed = threading.Event()
+        opened = []
+        
+        def open_stream(db_name, collection_name, resume_after):
+            stream = FakeStream()
+            opened.append(stream)
+            if collection_name == "slow":
+                opening.release()
+                proceed.wait(1)
+            return stream
+        
+        hub = ChangeFeedHub(open_stream, queue_size=2, max_subscribers=3, max_private_feeds=1)
+        self.addCleanup(hub.close)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(hub.subscribe("db1", "slow", {})))
+                   for _ in range(2)]
+        threads[0].start()
+        self.assertTrue(opening.acquire(timeout=1))
+        # 慢集合打开期间其他集合的订阅和统计不被阻塞
+        hub.subscribe("db1", "c1", {})
+        self.assertEqual(hub.stats()["feeds"], 1)
+        threads[1].start()
+        self.assertTrue(opening.acquire(timeout=1))
+        proceed.set()
+        for thread in threads:
+            thread.join(1)
+        
+        self.assertEqual(len(opened), 3)
+        self.assertIs(results[0].feed, results[1].feed)
+        self.assertEqual(sum(stream.closed.is_set() for stream in opened), 1)
+        self.assertEqual(hub.stats()["feeds"], 2)
+    
+    def test_resume_from_shared_stream(self):
+        """测试恢复令牌在共享变更流最近的事件中时补发之后的事件，不单独打开变更流"""
+        first = self.hub.subscribe("db1", "c1", {})
+        self.streams[0][3].changes.extend([make_change("01"), make_change("02", type="log")])
+        self.assertEqual(first.get(1)["_id"]["_data"], "01")
+        self.assertEqual(first.get(1)["_id"]["_data"], "02")
+        
+        resumed = self.hub.subscribe("db1", "c1", {"fullDocument.type": "log"}, {"_data": "01"})
+        latest = self.hub.subscribe("db1", "c1", {}, {"_data": "02"})
+        self.streams[0][3].changes.append(make_change("03", type="log"))
+        
+        self.assertEqual(resumed.get(1)["_id"]["_data"], "02")
+        self.assertEqual(resumed.get(1)["_id"]["_data"], "03")
+        self.assertEqual(latest.get(1)["_id"]["_data"], "03")
+        self.assertEqual(len(self.streams), 1)
+        self.assertEqual(self.hub.stats()["private_feeds"], 0)
+    
+    def test_resume_uses_private_stream(self):
+        """测试恢复令牌已不在最近的事件中时单独打开变更流，数量受单独的上限限制"""
+        self.hub.subscribe("db1", "c1", {})
+        resumed = self.hub.subscribe("db1", "c1", {}, {"_data": "01"})
+        
+        self.assertEqual([stream[2] for stream in self.streams], [None, {"_data": "01"}])
+        self.assertEqual(self.hub.stats()["private_feeds"], 1)
+        with self.assertRaises(TooManySubscribers):
+            self.hub.subscribe("db1", "c2", {}, {"_data": "02"})
+        self.hub.release(resumed)
+        self.assertTrue(self.streams[1][3].closed.wait(1))
+        self.hub.subscribe("db1", "c2", {}, {"_data": "02"})
+    
+    def test_subscriber_limits(self):
+        """测试订阅者上限，事件积压时结束订阅并返回原因"""
+        slow = self.hub.subscribe("db1", "c1", {})
+        self.hub.subscribe("db1", "c2", {})
+        self.hub.subscribe("db1", "c2", {})
+        with self.assertRaises(TooManySubscribers):
+            self.hub.subscribe("db1", "c3", {})
+        
+        self.streams[0][3].changes.extend(make_change(str(index)) for index in range(3))
+        deadline = time.monotonic() + 1
+        while not slow.closed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(slow.get(1)["_id"]["_data"], "0")
+        self.assertEqual(slow.get(1)["_id"]["_data"], "1")
+        with self.assertRaises(SubscriptionClosed) as context:
+            slow.get(0.05)
+        self.assertIn("重新订阅", context.exception.args[0])
+    
+    def test_stream_ended(self):
+        """测试变更流失效时结束全部订阅"""
+        subscription = self.hub.subscribe("db1", "c1", {})
+        self.streams[0][3].alive = False
+        
+        with self.assertRaises(SubscriptionClosed) as context:
+            subscription.get(1)
+        self.assertIn("变更流已结束", context.exception.args[0])
+        self.assertIsNone(self.hub.subscribe("db1", "c1", {}).error)
+        self.assertEqual(len(self.streams), 2)
+
+
+class TestAsyncChangeFeedHub(unittest.IsolatedAsyncioTestCase):
+    """异步变更流共享测试类"""
+    
+    async def test_shared_stream(self):
+        """测试并发订阅只打开一个变更流"""
+        streams = []
+        
+        async def open_stream(db_name, collection_name, resume_after):
+            await asyncio.sleep(0)
+            streams.append(AsyncFakeStream())
+            return streams[-1]
+        
+        hub = AsyncChangeFeedHub(open_stream, queue_size=10, max_subscribers=10, max_private_feeds=1)
+        first, second = await asyncio.gather(hub.subscribe("db1", "c1", {}), hub.subscribe("db1", "c1", {}))
+        
+        self.assertEqual(len(streams), 1)
+        streams[0].changes.append(make_change("01"))
+        self.assertEqual((await first.get(1))["_id"]["_data"], "01")
+        self.assertEqual((await second.get(1))["_id"]["_data"], "01")
+        self.assertIsNone(await first.get(0.05))
+        
+        hub.release(first)
+        hub.release(second)
+        await asyncio.sleep(0.05)
+        self.assertTrue(streams[0].closed.is_set())
+    
+    
+    async def test_open_does_not_block_other_collections(self):
+        """测试打开一个集合的变更流时，其他集合的订阅不需要等待"""
+        release = asyncio.Event()
+        opened = []
+        
+        async def open_stream(db_name, collection_name, resume_after):
+            opened.append(collection_name)
+            if collection_name == "slow":
+                await release.wait()
+            return AsyncFakeStream()
+        
+        hub = AsyncChangeFeedHub(open_stream, queue_size=10, max_subscribers=10, max_private_feeds=1)
+        slow = [asyncio.ensure_future(hub.subscribe("db1", "slow", {})) for _ in range(3)]
+        await asyncio.sleep(0)
+        
+        other = await asyncio.wait_for(hub.subscribe("db1", "fast", {}), 1)
+        self.assertFalse(any(task.done() for task in slow))
+        
+        release.set()
+        subscriptions = await asyncio.gather(*slow)
+        self.assertEqual(opened.count("slow"), 1)
+        self.assertEqual(len({subscription.feed for subscription in subscriptions}), 1)
+        for subscription in subscriptions + [other]:
+            hub.release(subscription)
+    
+    async def test_open_failure_shared_by_waiters(self):
+        """测试打开变更流失败时等待的订阅者收到同样的异常，之后的订阅重新打开"""
+        attempts = []
+        
+        async def open_stream(db_name, collection_name, resume_after):
+            attempts.append(collection_name)
+            await asyncio.sleep(0.01)
+            if len(attempts) == 1:
+                raise RuntimeError("failed")
+            return AsyncFakeStream()
+        
+        hub = AsyncChangeFeedHub(open_stream, queue_size=10, max_subscribers=10, max_private_feeds=1)
+        results = await asyncio.gather(hub.subscribe("db1", "c1", {}), hub.subscribe("db1", "c1", {}),
+                                       return_exceptions=True)
+        
+        self.assertEqual([type(result) for result in results], [RuntimeError, RuntimeError])
+        subscription = await hub.subscribe("db1", "c1", {})
+        self.assertEqual(len(attempts), 2)
+        hub.release(subscription)
+
+
+if __name__ == '__main__':
+    unittest.main()
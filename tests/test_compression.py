@@ -0,0 +1,120 @@
+"""
+响应压缩测试
+测试编码协商、大小阈值以及流式响应的逐块压缩
+"""
+
+import gzip
+import json
+import unittest
+import zlib
+from unittest.mock import Mock, patch
+
+import compression
+from app import create_app
+from compression import available_encodings, compress_bytes, compress_stream, create_compressor
+
+
+def decompress(data, encoding):
+    """按编码解压"""
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "br":
+        return compression.brotli.decompress(data)
+    return compression.zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+class TestCompression(unittest.TestCase):
+    """响应压缩测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.app = create_app("testing")
+        self.client = self.app.test_client()
+        self.db_manager = Mock()
+        patcher = patch('api.get_db_manager', return_value=self.db_manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.documents = [{"uuid": str(index), "content": "x" * 100} for index in range(50)]
+    
+    def test_available_encodings(self):
+        """测试按配置和已安装的依赖筛选编码"""
+        self.assertEqual(available_encodings("gzip"), ["gzip"])
+        self.assertEqual(available_encodings("gzip, zstd")[-1], "gzip")
+        with patch.object(compression, "brotli", None), patch.object(compression, "zstandard", None):
+            self.assertEqual(available_encodings(), ["gzip"])
+    
+    def test_compress_bytes_roundtrip(self):
+        """测试各编码整体压缩后可以解压"""
+        data = json.dumps(self.documents).encode("utf-8")
+        for encoding in available_encodings():
+            with self.subTest(encoding=encoding):
+                compressed = compress_bytes(data, encoding, self.app.config)
+                self.assertLess(len(compressed), len(data))
+                self.assertEqual(decompress(compressed, encoding), data)
+    
+    def test_compress_stream_flushes_and_closes(self):
+        """测试流式压缩超过刷新大小时输出数据，结束时关闭原始迭代器"""
+        closed = []
+        
+        def chunks():
+            try:
+                for _ in range(4):
+                    yield "a" * compression.STREAM_FLUSH_SIZE
+            finally:
+                closed.append(True)
+        
+        compressor = create_compressor("gzip", self.app.config)
+        outputs = list(compress_stream(chunks(), compressor))
+        
+        self.assertGreaterEqual(len([output for output in outputs if output]), 4)
+        self.assertEqual(zlib.decompress(b"".join(outputs), 31), b"a" * compression.STREAM_FLUSH_SIZE * 4)
+        self.assertEqual(closed, [True])
+    
+    def test_search_negotiates_encoding(self):
+        """测试按Accept-Encoding选择编码，小响应不压缩"""
+        self.db_manager.search_page.return_value = {"data": self.documents}
+        url = "/api/search?db_name=db1&collection_name=c1"
+        
+        for encoding in available_encodings():
+            with self.subTest(encoding=encoding):
+                response = self.client.get(url, headers={"Accept-Encoding": f"{encoding}, identity;q=0.5"})
+                self.assertEqual(response.headers["Content-Encoding"], encoding)
+                self.assertIn("Accept-Encoding", response.headers["Vary"])
+                self.assertEqual(int(response.headers["Content-Length"]), len(response.data))
+                self.assertEqual(json.loads(decompress(response.data, encoding)), self.documents)
+        
+        response = self.client.get(url)
+        self.assertNotIn("Content-Encoding", response.headers)
+        
+        self.db_manager.search_page.return_value = {"data": self.documents[:1]}
+        response = self.client.get(url, headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.get_json(), self.documents[:1])
+    
+    def test_stream_compressed_without_content_length(self):
+        """测试流式响应逐块压缩且不设置Content-Length"""
+        self.db_manager.search_stream.return_value = iter(self.documents[:2])
+        
+        response = self.client.get(
+            "/api/search?db_name=db1&collection_name=c1&stream=true",
+            headers={"Accept-Encoding": "gzip"}
+        )
+        
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertNotIn("Content-Length", response.headers)
+        lines = gzip.decompress(response.data).decode("utf-8").splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.documents[:2])
+    
+    def test_disabled(self):
+        """测试关闭压缩"""
+        self.app.config["COMPRESSION_ENABLED"] = False
+        self.db_manager.search_page.return_value = {"data": self.documents}
+        
+        response = self.client.get("/api/search?db_name=db1&collection_name=c1", headers={"Accept-Encoding": "gzip"})
+        
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.get_json(), self.documents)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,12 +3,37 @@
 测试MongoDB管理器的各项功能
 """
 
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import Mock, patch, MagicMock
 import json
 
+from prometheus_client import REGISTRY
+from pymongo.errors import AutoReconnect, BulkWriteError, OperationFailure
+
 from config import TestingConfig
 from database import MongoDBManager
+from utils import make_read_preference
+
+
+EXPLAIN_RESULT = {
+    "queryPlanner": {
+        "winningPlan": {
+            "stage": "LIMIT",
+            "inputStage": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "type_1"}}
+        },
+        "rejectedPlans": [{"stage": "COLLSCAN"}]
+    },
+    "executionStats": {
+        "nReturned": 5,
+        "totalDocsExamined": 120,
+        "totalKeysExamined": 120,
+        "executionTimeMillis": 3,
+        "allPlansExecution": []
+    }
+}
 
 
 class TestMongoDBManager(unittest.TestCase):
@@ -20,6 +45,20 @@ class TestMongoDBManager(unittest.TestCase):
         with patch('database.MongoClient'):
             self.db_manager = MongoDBManager(self.config)
     
+    def test_client_options_from_config(self):
+        """测试连接池参数和事件监听器传给MongoClient"""
+        self.config.MONGO_MAX_POOL_SIZE = 50
+        self.config.MONGO_COMPRESSORS = "zstd,zlib"
+        
+        with patch('database.MongoClient') as mock_client:
+            db_manager = MongoDBManager(self.config)
+        
+        kwargs = mock_client.call_args[1]
+        self.assertEqual(kwargs["maxPoolSize"], 50)
+        self.assertEqual(kwargs["compressors"], "zstd,zlib")
+        self.assertNotIn("minPoolSize", kwargs)
+        self.assertIn(db_manager.pool_metrics, kwargs["event_listeners"])
+    
     def test_generate_uuid(self):
         """测试UUID生成"""
         uuid1 = self.db_manager.generate_uuid()
@@ -102,6 +141,122 @@ class TestMongoDBManager(unittest.TestCase):
         self.assertEqual(result["message"], "Data saved successfully")
         self.assertIn("id", result)
     
+    def test_save_data_ensures_indexes_once(self):
+        """测试保存数据时每个集合只创建一次索引"""
+        mock_collection = Mock()
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        for _ in range(3):
+            self.db_manager.save_data({"db_name": "test_db", "collection_name": "test_collection", "uuid_name": "doc_id"})
+        self.wait_for_background()
+        
+        mock_collection.create_indexes.assert_called_once()
+        indexes = [model.document for model in mock_collection.create_indexes.call_args[0][0]]
+        self.assertEqual([list(index["key"].items()) for index in indexes], [
+            [("doc_id", 1)],
+            [("created_at", -1), ("_id", -1)],
+            [("updated_at", -1), ("_id", -1)]
+        ])
+        self.assertFalse(indexes[0]["unique"])
+        self.assertEqual(mock_collection.update_one.call_count, 3)
+    
+    def wait_for_background(self, db_manager=None):
+        """等待后台线程中已提交的索引创建和explain完成"""
+        (db_manager or self.db_manager)._background.submit(lambda: None).result(timeout=5)
+    
+    def test_save_data_does_not_wait_for_indexes(self):
+        """测试并发的首次写入只提交一次索引创建，且不等待索引创建完成"""
+        started = threading.Event()
+        release = threading.Event()
+        mock_collection = Mock()
+        mock_collection.create_indexes.side_effect = lambda models: (started.set(), release.wait(5))
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        data = {"db_name": "test_db", "collection_name": "test_collection", "content": "{}"}
+        
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(lambda _: self.db_manager.save_data(data), range(8)))
+        self.assertTrue(started.wait(5))
+        
+        self.assertEqual(len(results), 8)
+        self.assertEqual(mock_collection.update_one.call_count, 8)
+        self.assertNotIn(("test_db", "test_collection", "uuid"), self.db_manager.indexed_collections)
+        release.set()
+        self.wait_for_background()
+        mock_collection.create_indexes.assert_called_once()
+        self.assertIn(("test_db", "test_collection", "uuid"), self.db_manager.indexed_collections)
+    
+    def test_ensure_indexes_unique_and_disabled(self):
+        """测试uuid唯一索引配置和关闭自动索引"""
+        mock_collection = Mock()
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        self.config.UUID_INDEX_UNIQUE = True
+        self.db_manager.ensure_indexes("test_db", "test_collection")
+        self.assertTrue(mock_collection.create_indexes.call_args[0][0][0].document["unique"])
+        
+        self.config.AUTO_CREATE_INDEXES = False
+        self.db_manager.ensure_indexes("test_db", "other_collection")
+        mock_collection.create_indexes.assert_called_once()
+    
+    def test_ensure_indexes_errors(self):
+        """测试索引创建失败不影响请求，网络错误时下次重试"""
+        mock_collection = Mock()
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        mock_collection.create_indexes.side_effect = AutoReconnect("timeout")
+        self.db_manager.ensure_indexes("test_db", "test_collection")
+        self.assertNotIn(("test_db", "test_collection", "uuid"), self.db_manager.indexed_collections)
+        
+        mock_collection.create_indexes.side_effect = OperationFailure("duplicate key")
+        self.db_manager.ensure_indexes("test_db", "test_collection")
+        self.db_manager.ensure_indexes("test_db", "test_collection")
+        self.assertEqual(mock_collection.create_indexes.call_count, 2)
+    
+    def test_warm_up(self):
+        """测试预热重试连接、填充连接池并为配置的集合创建索引"""
+        mock_collection = Mock()
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        self.config.MONGO_MIN_POOL_SIZE = 4
+        self.config.WARMUP_RETRY_INTERVAL = 0
+        self.config.WARMUP_COLLECTIONS = ["db1.events.2024", "invalid"]
+        self.db_manager.client.admin.command.side_effect = [AutoReconnect("refused"), {"ok": 1}] + [{"ok": 1}] * 4
+        
+        self.db_manager.warm_up()
+        
+        self.assertEqual(self.db_manager.warmup_status, "done")
+        self.assertIsNone(self.db_manager.warmup_error)
+        self.assertEqual(self.db_manager.client.admin.command.call_count, 6)
+        mock_db.__getitem__.assert_called_with("events.2024")
+        self.assertIn(("db1", "events.2024", "uuid"), self.db_manager.indexed_collections)
+    
+    def test_readiness(self):
+        """测试就绪状态取决于预热进度和拓扑中是否有可写的服务器，且不访问数据库"""
+        description = Mock(topology_type_name="ReplicaSetWithPrimary")
+        description.has_writable_server.return_value = True
+        description.has_readable_server.return_value = True
+        self.db_manager.topology_state.description_changed(Mock(new_description=description))
+        
+        with patch.object(self.db_manager, "start_warmup") as start_warmup:
+            self.assertFalse(self.db_manager.readiness()["ready"])
+            start_warmup.assert_called_once()
+            
+            self.db_manager.warmup_status = "done"
+            readiness = self.db_manager.readiness()
+        
+        self.assertTrue(readiness["ready"])
+        self.assertEqual(readiness["topology"]["topology_type"], "ReplicaSetWithPrimary")
+        self.db_manager.client.admin.command.assert_not_called()
+    
     def test_save_data_with_list_content(self):
         """测试保存列表内容"""
         data = {
@@ -122,19 +277,228 @@ class TestMongoDBManager(unittest.TestCase):
         result = self.db_manager.save_data(data)
         
         self.assertEqual(result["message"], "Data saved successfully")
-        # 验证update_one被调用了两次（第一次保存数据，第二次添加created_at）
-        self.assertEqual(mock_collection.update_one.call_count, 2)
+        # 验证只调用一次update_one，created_at通过$setOnInsert写入
+        self.assertEqual(mock_collection.update_one.call_count, 1)
         
-        # 检查第一次调用（保存数据）
-        first_call = mock_collection.update_one.call_args_list[0]
-        set_data = first_call[0][1]["$set"]
+        call = mock_collection.update_one.call_args
+        set_data = call[0][1]["$set"]
         self.assertIn("list", set_data)
         self.assertEqual(set_data["list"], [{"item": 1}, {"item": 2}])
         self.assertIn("updated_at", set_data)
+        self.assertNotIn("created_at", set_data)
+        self.assertEqual(call[0][1]["$setOnInsert"]["created_at"], set_data["updated_at"])
+        self.assertTrue(call[1]["upsert"])
+    
+    def test_save_data_write_concern_from_request(self):
+        """测试请求中指定写关注"""
+        data = {
+            "db_name": "test_db",
+            "collection_name": "test_collection",
+            "write_concern": {"w": "majority", "wtimeout": 1000}
+        }
+        
+        mock_collection = Mock()
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        self.db_manager.save_data(data)
+        
+        write_concern = mock_collection.with_options.call_args[1]["write_concern"]
+        self.assertEqual(write_concern.document, {"w": "majority", "wtimeout": 1000})
+        mock_collection.with_options.return_value.update_one.assert_called_once()
+    
+    def test_save_data_unacknowledged(self):
+        """测试非确认写入"""
+        self.config.WRITE_CONCERN_W = "0"
+        data = {"db_name": "test_db", "collection_name": "test_collection"}
+        
+        mock_collection = Mock()
+        mock_collection.with_options.return_value.update_one.return_value.acknowledged = False
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        result = self.db_manager.save_data(data)
+        
+        self.assertIsNone(result["is_new"])
+        self.assertFalse(result["acknowledged"])
+        write_concern = mock_collection.with_options.call_args[1]["write_concern"]
+        self.assertFalse(write_concern.acknowledged)
+    
+    def test_get_write_concern(self):
+        """测试写关注构建"""
+        self.assertIsNone(self.db_manager.get_write_concern())
+        
+        self.config.WRITE_CONCERN_W = "1"
+        self.config.WRITE_CONCERN_J = True
+        self.assertEqual(self.db_manager.get_write_concern().document, {"w": 1, "j": True})
+        self.assertEqual(
+            self.db_manager.get_write_concern({"j": False}).document,
+            {"w": 1, "j": False}
+        )
+    
+    def test_get_write_concern_invalid(self):
+        """测试无效写关注"""
+        with self.assertRaises(ValueError):
+            self.db_manager.get_write_concern({"unknown": 1})
+        with self.assertRaises(ValueError):
+            self.db_manager.get_write_concern({"w": 0, "j": True})
+        with self.assertRaises(ValueError):
+            self.db_manager.get_write_concern("majority")
+    
+    def test_save_batch_groups_by_collection(self):
+        """测试批量保存按集合分组写入"""
+        items = [
+            {"db_name": "db1", "collection_name": "c1", "uuid": "a", "content": '{"n": 1}'},
+            {"db_name": "db1", "collection_name": "c2", "uuid": "b", "content": '[1, 2]'},
+            {"db_name": "db1", "collection_name": "c1", "uuid": "c"}
+        ]
+        
+        collections = {"c1": Mock(), "c2": Mock()}
+        collections["c1"].bulk_write.return_value.upserted_ids = {1: "new_id"}
+        collections["c2"].bulk_write.return_value.upserted_ids = {}
+        mock_db = MagicMock()
+        mock_db.__getitem__.side_effect = lambda name: collections[name]
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        result = self.db_manager.save_batch(items)
+        
+        self.assertEqual(result["saved"], 3)
+        self.assertEqual(result["failed"], 0)
+        self.assertEqual(collections["c1"].bulk_write.call_count, 1)
+        self.assertEqual(collections["c2"].bulk_write.call_count, 1)
+        
+        operations = collections["c1"].bulk_write.call_args[0][0]
+        self.assertEqual(len(operations), 2)
+        self.assertFalse(collections["c1"].bulk_write.call_args[1]["ordered"])
+        update = operations[0]._doc
+        self.assertEqual(update["$set"]["n"], 1)
+        self.assertIn("updated_at", update["$set"])
+        self.assertIn("created_at", update["$setOnInsert"])
+        
+        list_update = collections["c2"].bulk_write.call_args[0][0][0]._doc
+        self.assertEqual(list_update["$set"]["list"], [1, 2])
         
-        # 检查第二次调用（添加created_at）
-        second_call = mock_collection.update_one.call_args_list[1]
-        self.assertIn("created_at", second_call[0][1]["$set"])
+        self.assertEqual(result["results"][0], {"index": 0, "id": {"uuid": "a"}, "is_new": False})
+        self.assertEqual(result["results"][1], {"index": 1, "id": {"uuid": "b"}, "is_new": False})
+        self.assertEqual(result["results"][2], {"index": 2, "id": {"uuid": "c"}, "is_new": True})
+    
+    def test_save_batch_invalid_items(self):
+        """测试批量保存中的无效数据项"""
+        items = [
+            "not a dict",
+            {"collection_name": "c1"},
+            {"db_name": "db1", "collection_name": "c1", "content": '"scalar"'}
+        ]
+        
+        result = self.db_manager.save_batch(items)
+        
+        self.assertEqual(result["saved"], 0)
+        self.assertEqual(result["failed"], 3)
+        for index, item in enumerate(result["results"]):
+            self.assertEqual(item["index"], index)
+            self.assertIn("error", item)
+        self.db_manager.client.__getitem__.assert_not_called()
+    
+    def test_save_batch_duplicate_uuids(self):
+        """测试同一批中重复的uuid分轮写入，每轮内uuid互不相同，按请求中的顺序生效"""
+        items = [
+            {"db_name": "db1", "collection_name": "c1", "uuid": "a", "content": '{"n": 1}'},
+            {"db_name": "db1", "collection_name": "c1", "uuid": "b"},
+            {"db_name": "db1", "collection_name": "c1", "uuid": "a", "content": '{"n": 2}'},
+            {"db_name": "db1", "collection_name": "c1", "uuid": "a", "content": '{"n": 3}'}
+        ]
+        
+        mock_collection = Mock()
+        mock_collection.bulk_write.side_effect = [
+            Mock(acknowledged=True, upserted_ids={0: "new_a", 1: "new_b"}),
+            Mock(acknowledged=True, upserted_ids={}),
+            Mock(acknowledged=True, upserted_ids={})
+        ]
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        result = self.db_manager.save_batch(items)
+        
+        self.assertEqual(result["saved"], 4)
+        rounds = [call[0][0] for call in mock_collection.bulk_write.call_args_list]
+        self.assertEqual([[operation._filter for operation in operations] for operations in rounds],
+                         [[{"uuid": "a"}, {"uuid": "b"}], [{"uuid": "a"}], [{"uuid": "a"}]])
+        self.assertEqual([operations[0]._doc["$set"].get("n") for operations in rounds], [1, 2, 3])
+        self.assertEqual([item["is_new"] for item in result["results"]], [True, True, False, False])
+    
+    def test_save_batch_write_errors(self):
+        """测试批量保存的部分写入失败"""
+        items = [
+            {"db_name": "db1", "collection_name": "c1", "uuid": "a"},
+            {"db_name": "db1", "collection_name": "c1", "uuid": "b"}
+        ]
+        
+        mock_collection = Mock()
+        mock_collection.bulk_write.side_effect = BulkWriteError({
+            "upserted": [{"index": 0, "_id": "new_id"}],
+            "writeErrors": [{"index": 1, "errmsg": "duplicate key"}]
+        })
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        result = self.db_manager.save_batch(items)
+        
+        self.assertEqual(result["saved"], 1)
+        self.assertEqual(result["failed"], 1)
+        self.assertTrue(result["results"][0]["is_new"])
+        self.assertEqual(result["results"][1]["error"], "duplicate key")
+    
+    def test_save_async_enqueues(self):
+        """测试异步保存校验数据、生成ID后放入队列"""
+        self.db_manager.write_behind = Mock()
+        
+        result = self.db_manager.save_async({
+            "db_name": "db1", "collection_name": "c1", "content": '{"n": 1}'
+        })
+        
+        db_name, collection_name, find_obj, update = self.db_manager.write_behind.put.call_args[0][0]
+        self.assertEqual((db_name, collection_name), ("db1", "c1"))
+        self.assertEqual(result["id"], find_obj)
+        self.assertTrue(find_obj["uuid"])
+        self.assertEqual(update["$set"]["n"], 1)
+        
+        result = self.db_manager.save_async({"db_name": "db1", "collection_name": "c1", "write_concern": {"w": 0}})
+        self.assertIn("error", result)
+        result = self.db_manager.save_async({"db_name": "db1", "collection_name": "c1", "content": '"scalar"'})
+        self.assertIn("error", result)
+        self.assertEqual(self.db_manager.write_behind.put.call_count, 1)
+    
+    def test_flush_write_behind(self):
+        """测试异步写入按集合分组，同一uuid的后续写入放到下一轮"""
+        collections = {"c1": Mock(), "c2": Mock()}
+        mock_db = MagicMock()
+        mock_db.__getitem__.side_effect = lambda name: collections[name]
+        self.db_manager.client.__getitem__.return_value = mock_db
+        self.db_manager.config.AUTO_CREATE_INDEXES = False
+        
+        items = [
+            ("db1", "c1", {"uuid": "a"}, {"$set": {"n": 1}}),
+            ("db1", "c2", {"uuid": "b"}, {"$set": {"n": 2}}),
+            ("db1", "c1", {"uuid": "a"}, {"$set": {"n": 3}}),
+            ("db1", "c1", {"uuid": "c"}, {"$set": {"n": 4}})
+        ]
+        
+        failed = self.db_manager._flush_write_behind(items)
+        
+        self.assertEqual(failed, 0)
+        rounds = [call[0][0] for call in collections["c1"].bulk_write.call_args_list]
+        self.assertEqual([[operation._doc["$set"]["n"] for operation in operations] for operations in rounds],
+                         [[1, 4], [3]])
+        self.assertEqual(collections["c2"].bulk_write.call_count, 1)
+        
+        collections["c2"].bulk_write.side_effect = BulkWriteError({
+            "writeErrors": [{"index": 0, "errmsg": "duplicate key"}]
+        })
+        self.assertEqual(self.db_manager._flush_write_behind(items[1:2]), 1)
     
     def test_search_data_missing_db_name(self):
         """测试搜索缺少数据库名称"""
@@ -176,6 +540,114 @@ class TestMongoDBManager(unittest.TestCase):
         
         self.assertEqual(results, [])
     
+    def test_get_collection_cached(self):
+        """测试集合对象按写关注和读偏好缓存"""
+        mock_db = MagicMock()
+        self.db_manager.client.__getitem__.return_value = mock_db
+        read_preference = make_read_preference({"mode": "nearest", "max_staleness_seconds": -1})
+        
+        first = self.db_manager.get_collection("test_db", "test_collection", read_preference=read_preference)
+        second = self.db_manager.get_collection("test_db", "test_collection", read_preference=read_preference)
+        primary = self.db_manager.get_collection("test_db", "test_collection")
+        
+        self.assertIs(first, second)
+        self.assertIsNot(first, primary)
+        mock_db.__getitem__.return_value.with_options.assert_called_once_with(
+            write_concern=None, read_preference=read_preference)
+        self.assertEqual(self.db_manager.client.__getitem__.call_count, 2)
+    
+    def test_text_search(self):
+        """测试配置了全文索引的集合使用$text并按相关度排序，全文索引随其他索引创建"""
+        self.config.TEXT_INDEXES = {"test_db.articles": {"title": 10, "content": 1}}
+        mock_collection = Mock()
+        mock_collection.find.return_value.skip.return_value.limit.return_value.sort.return_value = [
+            {"title": "MongoDB", "score": 1.5}
+        ]
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        results = self.db_manager.search_data({
+            "db_name": "test_db",
+            "collection_name": "articles",
+            "q": "mongodb 索引",
+            "conditions": '{"status": "published"}',
+            "fields": "title"
+        })
+        
+        self.assertEqual(results, [{"title": "MongoDB", "score": 1.5}])
+        mock_collection.find.assert_called_once_with(
+            {"status": "published", "$text": {"$search": "mongodb 索引"}},
+            {"title": 1, "_id": 0, "score": {"$meta": "textScore"}}
+        )
+        mock_collection.find.return_value.skip.return_value.limit.return_value.sort.assert_called_once_with(
+            {"score": {"$meta": "textScore"}}
+        )
+        # 搜索不创建集合和索引，全文索引在写入时随其他索引创建
+        mock_collection.create_indexes.assert_not_called()
+        self.db_manager.ensure_indexes("test_db", "articles")
+        text_index = mock_collection.create_indexes.call_args[0][0][-1].document
+        self.assertEqual(text_index["key"], {"title": "text", "content": "text"})
+        self.assertEqual(text_index["weights"], {"title": 10, "content": 1})
+        self.assertEqual(text_index["default_language"], "none")
+    
+    def test_text_search_fallback(self):
+        """测试没有全文索引的集合在配置的字段上按正则匹配，指定sorts时按sorts排序"""
+        self.config.TEXT_SEARCH_FALLBACK_FIELDS = ["title", "content"]
+        
+        query = self.db_manager.build_search_query({
+            "db_name": "test_db",
+            "collection_name": "notes",
+            "q": "a+b",
+            "conditions": '{"$or": [{"type": "x"}, {"type": "y"}]}',
+            "sorts": '{"updated_at": -1}'
+        })
+        
+        self.assertEqual(query["filter"], {"$and": [
+            {"$or": [{"type": "x"}, {"type": "y"}]},
+            {"$or": [{"title": {"$regex": r"a\+b", "$options": "i"}}, {"content": {"$regex": r"a\+b", "$options": "i"}}]}
+        ]})
+        self.assertEqual(query["projection"], {"_id": 0})
+        self.assertEqual(query["sort"], {"updated_at": -1})
+        self.assertEqual(self.db_manager.build_search_query({
+            "db_name": "test_db", "collection_name": "notes", "q": "x"
+        })["filter"], {"$or": [{"title": {"$regex": "x", "$options": "i"}}, {"content": {"$regex": "x", "$options": "i"}}]})
+    
+    def test_search_read_preference_and_hint(self):
+        """测试按数据库配置和请求参数选择读偏好，索引提示用于查询和计数"""
+        self.config.READ_PREFERENCE = "secondaryPreferred"
+        self.config.READ_MAX_STALENESS_SECONDS = 120
+        self.config.READ_PREFERENCES = {"primary_db": "primary", "nearby_db": {"mode": "nearest"}}
+        params = {"db_name": "test_db", "collection_name": "c1", "conditions": '{"type": "a"}'}
+        
+        query = self.db_manager.build_search_query(params)
+        self.assertEqual(query["read_preference"], {"mode": "secondaryPreferred", "max_staleness_seconds": 120})
+        self.assertNotIn("read_preference", self.db_manager.build_search_query(dict(params, db_name="primary_db")))
+        self.assertEqual(self.db_manager.build_search_query(dict(params, db_name="nearby_db"))["read_preference"],
+                         {"mode": "nearest", "max_staleness_seconds": 120})
+        self.assertEqual(self.db_manager.build_search_query(dict(params, read_preference="nearest"))["read_preference"],
+                         {"mode": "nearest", "max_staleness_seconds": -1})
+        with self.assertRaises(ValueError):
+            self.db_manager.build_search_query(dict(params, read_preference="primary", max_staleness_seconds="120"))
+        
+        mock_collection = Mock()
+        secondary_collection = mock_collection.with_options.return_value
+        cursor = secondary_collection.find.return_value.skip.return_value.limit.return_value.sort.return_value
+        cursor.hint.return_value = [{"type": "a"}]
+        secondary_collection.count_documents.return_value = 1
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        page = self.db_manager.search_page(dict(params, hint='{"type": 1}', with_total="true"))
+        
+        self.assertEqual(page["data"], [{"type": "a"}])
+        cursor.hint.assert_called_once_with([("type", 1)])
+        self.assertEqual(secondary_collection.count_documents.call_args[1]["hint"], [("type", 1)])
+        read_preference = mock_collection.with_options.call_args[1]["read_preference"]
+        self.assertEqual(read_preference.document, {"mode": "secondaryPreferred", "maxStalenessSeconds": 120})
+        mock_collection.find.assert_not_called()
+    
     def test_search_data_with_uuid(self):
         """测试UUID搜索"""
         query_params = {
@@ -196,6 +668,543 @@ class TestMongoDBManager(unittest.TestCase):
         
         self.assertEqual(results, [])
     
+    def test_search_page_with_cursor(self):
+        """测试游标分页"""
+        query_params = {
+            "db_name": "test_db",
+            "collection_name": "test_collection",
+            "conditions": '{"type": "log"}',
+            "limit": "2",
+            "cursor": ""
+        }
+        
+        documents = [
+            {"_id": 3, "uuid": "c", "created_at": 30},
+            {"_id": 2, "uuid": "b", "created_at": 20},
+            {"_id": 1, "uuid": "a", "created_at": 10}
+        ]
+        mock_collection = Mock()
+        mock_collection.find.return_value.limit.return_value.sort.return_value = documents
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        page = self.db_manager.search_page(query_params)
+        
+        self.assertEqual(page["data"], [{"uuid": "c", "created_at": 30}, {"uuid": "b", "created_at": 20}])
+        self.assertIsNotNone(page["next_cursor"])
+        mock_collection.find.return_value.limit.assert_called_with(3)
+        mock_collection.find.return_value.limit.return_value.sort.assert_called_with(
+            [("created_at", -1), ("_id", -1)]
+        )
+        
+        # 使用游标查询下一页，不再使用skip
+        query_params["cursor"] = page["next_cursor"]
+        mock_collection.find.return_value.limit.return_value.sort.return_value = [documents[2]]
+        
+        page = self.db_manager.search_page(query_params)
+        
+        self.assertEqual(page["data"], [{"uuid": "a", "created_at": 10}])
+        self.assertIsNone(page["next_cursor"])
+        find_obj = mock_collection.find.call_args[0][0]
+        self.assertEqual(find_obj["$and"][0], {"type": "log"})
+        self.assertIn("$or", find_obj["$and"][1])
+        mock_collection.find.return_value.skip.assert_not_called()
+    
+    def test_aggregate(self):
+        """测试聚合管道和选项传给Collection.aggregate"""
+        mock_collection = Mock()
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        self.db_manager.aggregate({
+            "db_name": "test_db",
+            "collection_name": "test_collection",
+            "pipeline": '[{"$group": {"_id": "$type", "count": {"$sum": 1}}}]',
+            "allow_disk_use": "true",
+            "max_time_ms": 5000,
+            "batch_size": "500"
+        })
+        
+        mock_collection.aggregate.assert_called_once_with(
+            [{"$group": {"_id": "$type", "count": {"$sum": 1}}}],
+            allowDiskUse=True, batchSize=500, maxTimeMS=5000
+        )
+    
+    def test_aggregate_partitioned(self):
+        """测试分区集合的聚合用$unionWith合并与开头$match时间范围重叠的分区"""
+        self.config.PARTITIONED_COLLECTIONS = ["test_db.logs"]
+        mock_db = MagicMock()
+        mock_db.list_collection_names.return_value = ["logs_2026_08", "logs_2026_09", "logs_2026_10"]
+        self.db_manager.client.__getitem__.return_value = mock_db
+        match = {"$match": {"created_at": {"$gte": 1788220800000}, "level": "error"}}
+        group = {"$group": {"_id": "$level", "count": {"$sum": 1}}}
+        
+        # 2026-09-01 00:00 UTC之后
+        self.db_manager.aggregate({"db_name": "test_db", "collection_name": "logs", "pipeline": [match, group]})
+        
+        mock_db.__getitem__.assert_called_with("logs_2026_10")
+        pipeline = mock_db.__getitem__.return_value.aggregate.call_args[0][0]
+        self.assertEqual(pipeline, [match, {"$unionWith": {"coll": "logs_2026_09", "pipeline": [match]}}, group])
+        
+        mock_db.list_collection_names.return_value = []
+        self.db_manager.aggregate({"db_name": "test_db", "collection_name": "logs", "pipeline": [group]})
+        mock_db.__getitem__.assert_called_with("logs")
+        self.assertEqual(mock_db.__getitem__.return_value.aggregate.call_args[0][0], [group])
+    
+    def test_aggregate_invalid_params(self):
+        """测试无效的聚合参数"""
+        base = {"db_name": "test_db", "collection_name": "test_collection", "pipeline": []}
+        invalid = [
+            {"pipeline": '{"$match": {}}'},
+            {"pipeline": [{"$match": {}, "$limit": 1}]},
+            {"pipeline": [{"match": {}}]},
+            {"pipeline": [{"$merge": "other"}]},
+            {"max_time_ms": 0},
+            {"batch_size": -1},
+            {"allow_disk_use": 1},
+            {"collection_name": ""}
+        ]
+        for params in invalid:
+            with self.assertRaises(ValueError, msg=params):
+                self.db_manager.aggregate(dict(base, **params))
+    
+    def test_search_page_with_total(self):
+        """测试with_total按查询条件选择计数方式"""
+        mock_collection = Mock()
+        mock_collection.find.return_value.skip.return_value.limit.return_value.sort.return_value = [{"uuid": "a"}]
+        mock_collection.count_documents.return_value = 42
+        mock_collection.estimated_document_count.return_value = 1000
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        base = {"db_name": "test_db", "collection_name": "test_collection", "with_total": "true"}
+        
+        page = self.db_manager.search_page(dict(base, conditions='{"type": "log"}'))
+        self.assertEqual(page, {"data": [{"uuid": "a"}], "total": 42, "total_exact": True})
+        mock_collection.count_documents.assert_called_once_with({"type": "log"})
+        
+        page = self.db_manager.search_page(dict(base, conditions='{}'))
+        self.assertEqual(page["total"], 1000)
+        self.assertFalse(page["total_exact"])
+        mock_collection.estimated_document_count.assert_called_once_with()
+        
+        # 超过上限时返回上限
+        page = self.db_manager.search_page(dict(base, conditions='{"type": "log"}', total_limit="10"))
+        self.assertEqual((page["total"], page["total_exact"]), (10, False))
+        mock_collection.count_documents.assert_called_with({"type": "log"}, limit=11)
+        
+        with self.assertRaises(ValueError):
+            self.db_manager.search_page(dict(base, conditions='{}', total_limit="0"))
+    
+    def test_explain_search(self):
+        """测试explain返回执行计划和执行统计"""
+        mock_collection = Mock()
+        cursor = mock_collection.find.return_value.skip.return_value.limit.return_value.sort.return_value
+        cursor.explain.return_value = EXPLAIN_RESULT
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        result = self.db_manager.explain_search({
+            "db_name": "test_db", "collection_name": "test_collection",
+            "conditions": '{"type": "log", "size": {"$gt": 10}}'
+        })
+        
+        self.assertEqual(result["query_shape"], {"type": "?", "size": {"$gt": "?"}})
+        self.assertEqual(result["plan_summary"], "LIMIT > FETCH > IXSCAN type_1")
+        self.assertEqual(result["rejected_plans"], 1)
+        self.assertEqual(result["execution_stats"]["totalDocsExamined"], 120)
+        self.assertNotIn("allPlansExecution", result["execution_stats"])
+        mock_collection.find.assert_called_once_with({"type": "log", "size": {"$gt": 10}}, {"_id": 0})
+        
+        with self.assertRaises(ValueError):
+            self.db_manager.explain_search({"db_name": "test_db", "collection_name": "test_collection"})
+    
+    def test_slow_query_log(self):
+        """测试慢查询日志在后台explain并记录执行计划和扫描数，同一结构在间隔内只记录一次"""
+        self.config.SLOW_QUERY_MS = 0
+        with patch('database.MongoClient'):
+            db_manager = MongoDBManager(self.config)
+        mock_collection = Mock()
+        mock_collection.name = "test_collection"
+        mock_collection.database.command.return_value = EXPLAIN_RESULT
+        cursor = MagicMock()
+        cursor.__iter__.return_value = iter([{"uuid": "a"}])
+        mock_collection.find.return_value.skip.return_value.limit.return_value.sort.return_value = cursor
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        db_manager.client.__getitem__.return_value = mock_db
+        params = {"db_name": "test_db", "collection_name": "test_collection", "conditions": '{"type": "secret"}'}
+        
+        with self.assertLogs('database', level='WARNING') as logs:
+            db_manager.search_page(params)
+            db_manager.search_page(dict(params, conditions='{"type": "other"}'))
+            self.wait_for_background(db_manager)
+        
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('查询结构: {"type":"?"}', logs.output[0])
+        self.assertIn("执行计划: LIMIT > FETCH > IXSCAN type_1", logs.output[0])
+        self.assertIn("扫描索引键数: 120, 扫描文档数: 120, 返回文档数: 1", logs.output[0])
+        self.assertNotIn("secret", logs.output[0])
+        cursor.explain.assert_not_called()
+        mock_collection.database.command.assert_called_once()
+        args, kwargs = mock_collection.database.command.call_args
+        self.assertEqual(args[0], "explain")
+        self.assertEqual(args[1]["find"], "test_collection")
+        self.assertEqual(args[1]["filter"], {"type": "secret"})
+        self.assertEqual(kwargs["verbosity"], "executionStats")
+    
+    def test_search_page_without_total(self):
+        """测试未请求总数时不计数"""
+        mock_collection = Mock()
+        mock_collection.find.return_value.skip.return_value.limit.return_value.sort.return_value = []
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        page = self.db_manager.search_page({
+            "db_name": "test_db", "collection_name": "test_collection", "conditions": '{"type": "log"}'
+        })
+        
+        self.assertEqual(page, {"data": []})
+        mock_collection.count_documents.assert_not_called()
+    
+    def test_search_data_with_projection(self):
+        """测试字段投影传给查询"""
+        mock_collection = Mock()
+        mock_collection.find.return_value.skip.return_value.limit.return_value.sort.return_value = []
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        self.db_manager.search_data({
+            "db_name": "test_db",
+            "collection_name": "test_collection",
+            "conditions": '{}',
+            "fields": 'title,data.name'
+        })
+        
+        mock_collection.find.assert_called_once_with({}, {"title": 1, "data.name": 1, "_id": 0})
+        
+        with self.assertRaises(ValueError):
+            self.db_manager.search_data({
+                "db_name": "test_db",
+                "collection_name": "test_collection",
+                "conditions": '{}',
+                "fields": '$where'
+            })
+    
+    def test_search_page_cursor_with_projection(self):
+        """测试游标分页时为生成游标查询排序字段，但不在结果中返回"""
+        mock_collection = Mock()
+        mock_collection.find.return_value.limit.return_value.sort.return_value = [
+            {"_id": 2, "title": "b", "created_at": 20},
+            {"_id": 1, "title": "a", "created_at": 10}
+        ]
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        page = self.db_manager.search_page({
+            "db_name": "test_db",
+            "collection_name": "test_collection",
+            "conditions": '{}',
+            "fields": "title",
+            "limit": "1",
+            "cursor": ""
+        })
+        
+        self.assertEqual(page["data"], [{"title": "b"}])
+        self.assertIsNotNone(page["next_cursor"])
+        self.assertEqual(mock_collection.find.call_args[0][1], {"title": 1, "created_at": 1})
+    
+    def test_search_page_cursor_sort_mismatch(self):
+        """测试游标与排序条件不匹配"""
+        query_params = {
+            "db_name": "test_db",
+            "collection_name": "test_collection",
+            "conditions": '{}',
+            "cursor": ""
+        }
+        mock_collection = Mock()
+        mock_collection.find.return_value.limit.return_value.sort.return_value = [
+            {"_id": index, "created_at": index} for index in range(10)
+        ]
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        query_params["cursor"] = self.db_manager.search_page(query_params)["next_cursor"]
+        query_params["sorts"] = '{"title": 1}'
+        
+        with self.assertRaises(ValueError):
+            self.db_manager.search_page(query_params)
+    
+    def test_search_stream(self):
+        """测试流式搜索使用batch_size分批获取"""
+        query_params = {
+            "db_name": "test_db",
+            "collection_name": "test_collection",
+            "conditions": '{"type": "log"}',
+            "limit": "0",
+            "batch_size": "50"
+        }
+        
+        mock_collection = Mock()
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        documents = self.db_manager.search_stream(query_params)
+        
+        chain = mock_collection.find.return_value.skip.return_value.limit.return_value.sort.return_value
+        chain.batch_size.assert_called_once_with(50)
+        self.assertIs(documents, chain.batch_size.return_value)
+        mock_collection.find.return_value.skip.return_value.limit.assert_called_once_with(0)
+    
+    def test_search_stream_invalid_params(self):
+        """测试流式搜索的参数校验"""
+        base_params = {"db_name": "test_db", "collection_name": "test_collection", "conditions": "{}"}
+        
+        with self.assertRaises(ValueError):
+            self.db_manager.search_stream(dict(base_params, cursor=""))
+        with self.assertRaises(ValueError):
+            self.db_manager.search_stream(dict(base_params, batch_size="-1"))
+    
+    def test_save_data_partitioned(self):
+        """测试分区集合按created_at写入当月分区，并在分区上创建索引"""
+        self.config.PARTITIONED_COLLECTIONS = ["test_db.logs"]
+        mock_db = MagicMock()
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        with patch.object(self.db_manager, 'get_current_timestamp', return_value=1790812800000):
+            self.db_manager.save_data({"db_name": "test_db", "collection_name": "logs", "content": '{"a": 1}'})
+        self.wait_for_background()
+        
+        mock_db.__getitem__.assert_called_with("logs_2026_10")
+        mock_db.__getitem__.return_value.create_indexes.assert_called_once()
+        self.assertNotIn(("test_db", "logs", "uuid"), self.db_manager.indexed_collections)
+    
+    def test_save_data_partitioned_existing_uuid(self):
+        """测试跨月份重复保存同一uuid时写回已保存它的分区，不在当月分区新建"""
+        self.config.PARTITIONED_COLLECTIONS = ["test_db.logs"]
+        collections = {name: Mock() for name in ("logs_2026_11", "logs_2026_10")}
+        collections["logs_2026_11"].find.return_value = []
+        collections["logs_2026_10"].find.return_value = [{"uuid": "u1"}]
+        mock_db = MagicMock()
+        mock_db.list_collection_names.return_value = ["logs_2026_10", "logs_2026_11"]
+        mock_db.__getitem__.side_effect = lambda name: collections.setdefault(name, Mock())
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        # 2026-11-01 00:00 UTC，u1保存于10月
+        with patch.object(self.db_manager, 'get_current_timestamp', return_value=1793491200000):
+            self.db_manager.save_data({"db_name": "test_db", "collection_name": "logs", "uuid": "u1",
+                                       "content": '{"a": 2}'})
+            self.db_manager.save_data({"db_name": "test_db", "collection_name": "logs", "uuid": "u2",
+                                       "content": '{"a": 1}'})
+        
+        collections["logs_2026_10"].update_one.assert_called_once()
+        self.assertEqual(collections["logs_2026_10"].update_one.call_args[0][0], {"uuid": "u1"})
+        collections["logs_2026_11"].update_one.assert_called_once()
+        self.assertEqual(collections["logs_2026_11"].update_one.call_args[0][0], {"uuid": "u2"})
+        query, projection = collections["logs_2026_11"].find.call_args_list[0][0]
+        self.assertEqual(query, {"$or": [{"uuid": {"$in": ["u1"]}}]})
+        self.assertEqual(projection, {"uuid": 1, "_id": 0})
+    
+    def test_save_batch_partitioned_existing_uuid(self):
+        """测试批量保存和异步写入队列把已存在的uuid写回原分区，新uuid写入当月分区"""
+        self.config.PARTITIONED_COLLECTIONS = ["test_db.logs"]
+        collections = {name: Mock() for name in ("logs_2026_11", "logs_2026_10")}
+        collections["logs_2026_11"].find.return_value = []
+        collections["logs_2026_10"].find.return_value = [{"uuid": "u1"}]
+        for collection in collections.values():
+            collection.bulk_write.return_value = Mock(acknowledged=True, upserted_ids={})
+        mock_db = MagicMock()
+        mock_db.list_collection_names.return_value = ["logs_2026_10", "logs_2026_11"]
+        mock_db.__getitem__.side_effect = lambda name: collections[name]
+        self.db_manager.client.__getitem__.return_value = mock_db
+        items = [{"db_name": "test_db", "collection_name": "logs", "uuid": uuid_value, "content": "{}"}
+                 for uuid_value in ("u1", "u2")]
+        
+        with patch.object(self.db_manager, 'get_current_timestamp', return_value=1793491200000):
+            self.db_manager.save_batch(items)
+            self.db_manager._flush_write_behind(
+                [("test_db", "logs") + self.db_manager.build_save_operation(item) for item in items])
+        
+        for name, uuid_value in (("logs_2026_10", "u1"), ("logs_2026_11", "u2")):
+            self.assertEqual(collections[name].bulk_write.call_count, 2)
+            for call in collections[name].bulk_write.call_args_list:
+                self.assertEqual([operation._filter for operation in call[0][0]], [{"uuid": uuid_value}])
+    
+    def test_patch_data(self):
+        """测试局部更新只发送指定的操作符并更新updated_at，不存在时返回Not found"""
+        mock_collection = Mock()
+        mock_collection.update_one.return_value = Mock(acknowledged=True, matched_count=1, modified_count=1)
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        data = {"db_name": "test_db", "collection_name": "chats", "uuid": "u1",
+                "update": {"$push": {"messages": {"$each": [{"text": "hi"}], "$slice": -50}}}}
+        
+        with patch.object(self.db_manager, 'get_current_timestamp', return_value=1234567890):
+            result = self.db_manager.patch_data(data)
+        
+        self.assertEqual(result, {"message": "Data patched successfully", "id": {"uuid": "u1"}, "modified": True})
+        find_obj, update = mock_collection.update_one.call_args[0]
+        self.assertEqual(find_obj, {"uuid": "u1"})
+        self.assertEqual(update, {
+            "$push": {"messages": {"$each": [{"text": "hi"}], "$slice": -50}},
+            "$set": {"updated_at": 1234567890}
+        })
+        self.assertNotIn("upsert", mock_collection.update_one.call_args[1])
+        
+        mock_collection.update_one.return_value = Mock(acknowledged=True, matched_count=0, modified_count=0)
+        self.assertEqual(self.db_manager.patch_data(data)["message"], "Not found")
+        self.assertEqual(self.db_manager.patch_data({**data, "uuid": ""})["message"], "Invalid parameters")
+    
+    def test_patch_data_partitioned(self):
+        """测试分区集合从最新的分区开始查找要更新的数据"""
+        self.config.PARTITIONED_COLLECTIONS = ["test_db.logs"]
+        collections = {name: Mock() for name in ("logs_2026_10", "logs_2026_09")}
+        collections["logs_2026_10"].update_one.return_value = Mock(acknowledged=True, matched_count=0)
+        collections["logs_2026_09"].update_one.return_value = Mock(acknowledged=True, matched_count=1, modified_count=1)
+        mock_db = MagicMock()
+        mock_db.list_collection_names.return_value = ["logs_2026_09", "logs_2026_10"]
+        mock_db.__getitem__.side_effect = lambda name: collections[name]
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        result = self.db_manager.patch_data({"db_name": "test_db", "collection_name": "logs", "uuid": "u1",
+                                             "update": '{"$set": {"level": "warn"}}'})
+        
+        self.assertTrue(result["modified"])
+        collections["logs_2026_10"].update_one.assert_called_once()
+        collections["logs_2026_09"].update_one.assert_called_once()
+    
+    def test_open_change_stream(self):
+        """测试变更流只推送插入、更新和替换，分区集合在数据库级别监听全部分区"""
+        mock_db = MagicMock()
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        self.db_manager.open_change_stream("test_db", "events", {"_data": "01"})
+        
+        pipeline = mock_db.__getitem__.return_value.watch.call_args[0][0]
+        kwargs = mock_db.__getitem__.return_value.watch.call_args[1]
+        self.assertEqual(pipeline, [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}])
+        self.assertEqual(kwargs["full_document"], "updateLookup")
+        self.assertEqual(kwargs["resume_after"], {"_data": "01"})
+        
+        self.config.PARTITIONED_COLLECTIONS = ["test_db.logs"]
+        self.db_manager.open_change_stream("test_db", "logs")
+        
+        pipeline = mock_db.watch.call_args[0][0]
+        self.assertEqual(pipeline[0]["$match"]["ns.coll"], {"$regex": r"^logs_(\d{4})_(\d{2})$"})
+    
+    def test_search_partitioned(self):
+        """测试分区集合只查询时间范围重叠的分区，合并后再分页"""
+        self.config.PARTITIONED_COLLECTIONS = ["test_db.logs"]
+        partitions = {
+            "logs_2026_10": [{"_id": 6, "uuid": "f", "created_at": 1790812800006},
+                             {"_id": 5, "uuid": "e", "created_at": 1790812800005}],
+            "logs_2026_09": [{"_id": 4, "uuid": "d", "created_at": 1790812800004},
+                             {"_id": 3, "uuid": "c", "created_at": 1790812800003}],
+        }
+        collections = {}
+        for name, documents in partitions.items():
+            collections[name] = Mock()
+            collections[name].find.return_value.limit.return_value.sort.return_value = documents
+            collections[name].count_documents.return_value = len(documents)
+        mock_db = MagicMock()
+        mock_db.__getitem__.side_effect = collections.__getitem__
+        mock_db.list_collection_names.return_value = ["logs_2026_08", "logs_2026_09", "logs_2026_10"]
+        self.db_manager.client.__getitem__.return_value = mock_db
+        
+        page = self.db_manager.search_page({
+            "db_name": "test_db",
+            "collection_name": "logs",
+            "conditions": '{"created_at": {"$gte": 1788220800000}}',
+            "limit": "2",
+            "skip": "1",
+            "with_total": "true"
+        })
+        
+        self.assertEqual(page, {"data": [{"uuid": "e", "created_at": 1790812800005},
+                                         {"uuid": "d", "created_at": 1790812800004}],
+                                "total": 4, "total_exact": True})
+        for collection in collections.values():
+            collection.find.return_value.limit.assert_called_once_with(3)
+            collection.find.return_value.limit.return_value.sort.assert_called_once_with(
+                [("created_at", -1), ("_id", -1)])
+        mock_db.create_indexes.assert_not_called()
+    
+    def test_search_data_cached_until_write(self):
+        """测试搜索缓存命中以及写入后失效"""
+        self.config.SEARCH_CACHE_ENABLED = True
+        with patch('database.MongoClient'):
+            db_manager = MongoDBManager(self.config)
+        
+        mock_collection = Mock()
+        mock_collection.find.return_value.skip.return_value.limit.return_value.sort.return_value = [{"uuid": "a"}]
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        db_manager.client.__getitem__.return_value = mock_db
+        
+        query_params = {
+            "db_name": "test_db",
+            "collection_name": "test_collection",
+            "conditions": '{"title": "test"}'
+        }
+        
+        self.assertEqual(db_manager.search_data(query_params), [{"uuid": "a"}])
+        self.assertEqual(db_manager.search_data(dict(query_params)), [{"uuid": "a"}])
+        self.assertEqual(mock_collection.find.call_count, 1)
+        
+        # cache=false跳过缓存
+        db_manager.search_data(dict(query_params, cache="false"))
+        self.assertEqual(mock_collection.find.call_count, 2)
+        
+        db_manager.save_data({"db_name": "test_db", "collection_name": "test_collection"})
+        db_manager.search_data(query_params)
+        self.assertEqual(mock_collection.find.call_count, 3)
+        self.assertEqual(db_manager.query_cache.stats()["hits"], 1)
+    
+    def test_search_data_coalesced(self):
+        """测试同时进行的相同搜索只查询一次"""
+        started = threading.Event()
+        release = threading.Event()
+        
+        def documents(*args):
+            started.set()
+            release.wait(2)
+            return [{"uuid": "a"}]
+        
+        mock_collection = Mock()
+        mock_collection.find.return_value.skip.return_value.limit.return_value.sort.side_effect = documents
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        self.db_manager.client.__getitem__.return_value = mock_db
+        query_params = {"db_name": "test_db", "collection_name": "test_collection", "conditions": '{"title": "test"}'}
+        labels = {"database": "test_db", "collection": "test_collection"}
+        coalesced = REGISTRY.get_sample_value("search_coalesced_requests_total", labels) or 0
+        results = []
+        
+        threads = [threading.Thread(target=lambda: results.append(self.db_manager.search_data(query_params)))
+                   for _ in range(3)]
+        threads[0].start()
+        started.wait(2)
+        for thread in threads[1:]:
+            thread.start()
+        while self.db_manager.single_flight.stats()["coalesced"] < 2:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(2)
+        
+        self.assertEqual(results, [[{"uuid": "a"}]] * 3)
+        self.assertEqual(mock_collection.find.call_count, 1)
+        self.assertEqual(REGISTRY.get_sample_value("search_coalesced_requests_total", labels), coalesced + 2)
+    
     def test_search_data_empty_conditions(self):
         """测试空条件搜索"""
         query_params = {
@@ -0,0 +1,177 @@
+"""
+监控模块测试
+测试连接池指标的统计
+"""
+
+import datetime
+import unittest
+from unittest.mock import Mock
+
+from prometheus_client import REGISTRY
+from pymongo import monitoring
+
+from monitoring import OTHER_LABEL, CommandMetrics, NamespaceLabels, PoolMetrics, SlowQueryLog, TopologyState
+
+ADDRESS = ("localhost", 27017)
+
+
+class TestPoolMetrics(unittest.TestCase):
+    """连接池指标测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.metrics = PoolMetrics()
+        self.metrics.pool_created(monitoring.PoolCreatedEvent(ADDRESS, {}))
+    
+    def test_checkout_and_checkin(self):
+        """测试连接检出和归还"""
+        for connection_id in (1, 2):
+            self.metrics.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(ADDRESS))
+            self.metrics.connection_checked_out(
+                monitoring.ConnectionCheckedOutEvent(ADDRESS, connection_id, 0.002 * connection_id))
+        self.metrics.connection_checked_in(monitoring.ConnectionCheckedInEvent(ADDRESS, 1))
+        
+        snapshot = self.metrics.snapshot()
+        
+        self.assertEqual(snapshot["checkouts"], 2)
+        self.assertEqual(snapshot["checked_in"], 1)
+        self.assertEqual(snapshot["in_use"], 1)
+        self.assertEqual(snapshot["in_use_by_server"], {"localhost:27017": 1})
+        self.assertEqual(snapshot["in_use_max"], 2)
+        self.assertEqual(snapshot["checkouts_waiting"], 0)
+        self.assertAlmostEqual(snapshot["wait_time_avg_ms"], 3.0)
+        self.assertAlmostEqual(snapshot["wait_time_max_ms"], 4.0)
+    
+    def test_pool_exhausted(self):
+        """测试连接池耗尽统计"""
+        self.metrics.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(ADDRESS))
+        self.metrics.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(ADDRESS))
+        self.metrics.connection_check_out_failed(monitoring.ConnectionCheckOutFailedEvent(
+            ADDRESS, monitoring.ConnectionCheckOutFailedReason.TIMEOUT, 0.5))
+        
+        snapshot = self.metrics.snapshot()
+        
+        self.assertEqual(snapshot["pool_exhausted"], 1)
+        self.assertEqual(snapshot["checkout_failures"], {"timeout": 1})
+        self.assertEqual(snapshot["checkouts_waiting"], 1)
+        self.assertEqual(snapshot["wait_time_max_ms"], 500.0)
+
+
+class TestCommandMetrics(unittest.TestCase):
+    """MongoDB命令指标测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.metrics = CommandMetrics()
+    
+    @staticmethod
+    def sample(name, command, collection):
+        """读取指标当前值"""
+        return REGISTRY.get_sample_value(name, {
+            "command": command, "database": "metrics_db", "collection": collection
+        }) or 0
+    
+    def run_command(self, command, request_id, failure=None):
+        """模拟一次命令的开始和结束事件"""
+        command_name = next(iter(command))
+        self.metrics.started(monitoring.CommandStartedEvent(command, "metrics_db", request_id, ADDRESS, 1))
+        duration = datetime.timedelta(milliseconds=3)
+        if failure is None:
+            self.metrics.succeeded(monitoring.CommandSucceededEvent(
+                duration, {"ok": 1}, command_name, request_id, ADDRESS, 1, database_name="metrics_db"))
+        else:
+            self.metrics.failed(monitoring.CommandFailedEvent(
+                duration, failure, command_name, request_id, ADDRESS, 1, database_name="metrics_db"))
+    
+    def test_latency_by_command_and_collection(self):
+        """测试按命令和集合统计耗时"""
+        count = self.sample("mongodb_command_duration_seconds_count", "find", "users")
+        total = self.sample("mongodb_command_duration_seconds_sum", "find", "users")
+        
+        self.run_command({"find": "users", "filter": {}}, 1)
+        self.run_command({"getMore": 12345, "collection": "users"}, 2)
+        self.run_command({"ping": 1}, 3)
+        
+        self.assertEqual(self.sample("mongodb_command_duration_seconds_count", "find", "users"), count + 1)
+        self.assertAlmostEqual(self.sample("mongodb_command_duration_seconds_sum", "find", "users"), total + 0.003)
+        self.assertGreaterEqual(self.sample("mongodb_command_duration_seconds_count", "getMore", "users"), 1)
+        self.assertGreaterEqual(self.sample("mongodb_command_duration_seconds_count", "ping", ""), 1)
+    
+    def test_failures(self):
+        """测试命令失败统计"""
+        failures = self.sample("mongodb_command_failures_total", "insert", "orders")
+        
+        self.run_command({"insert": "orders", "documents": []}, 4, failure={"ok": 0, "errmsg": "boom"})
+        
+        self.assertEqual(self.sample("mongodb_command_failures_total", "insert", "orders"), failures + 1)
+    
+    def test_bounded_labels(self):
+        """测试分区集合折叠为基础集合名，标签取值超过上限的计入other"""
+        labels = NamespaceLabels(2)
+        self.assertEqual(labels.labels("db1", "events_2024_05"), ("db1", "events"))
+        self.assertEqual(labels.labels("db1", "events_2024_06"), ("db1", "events"))
+        self.assertEqual(labels.labels("db2", "users"), ("db2", "users"))
+        self.assertEqual(labels.labels("db3", "orders"), (OTHER_LABEL, OTHER_LABEL))
+        self.assertEqual(labels.labels("db1", ""), ("db1", ""))
+        
+        self.metrics = CommandMetrics(labels)
+        other = {"command": "find", "database": OTHER_LABEL, "collection": OTHER_LABEL}
+        count = REGISTRY.get_sample_value("mongodb_command_duration_seconds_count", other) or 0
+        self.run_command({"find": "orders_2024_05", "filter": {}}, 5)
+        self.assertEqual(REGISTRY.get_sample_value("mongodb_command_duration_seconds_count", other), count + 1)
+
+
+
+class TestTopologyState(unittest.TestCase):
+    """拓扑状态监听器测试类"""
+    
+    def test_description_changed(self):
+        """测试拓扑变化和关闭时更新可写、可读状态"""
+        state = TopologyState()
+        self.assertFalse(state.snapshot()["writable"])
+        
+        description = Mock(topology_type_name="ReplicaSetNoPrimary")
+        description.has_writable_server.return_value = False
+        description.has_readable_server.return_value = True
+        state.description_changed(Mock(new_description=description))
+        
+        snapshot = state.snapshot()
+        self.assertEqual(snapshot["topology_type"], "ReplicaSetNoPrimary")
+        self.assertFalse(snapshot["writable"])
+        self.assertTrue(snapshot["readable"])
+        self.assertIsNotNone(snapshot["changed_at"])
+        
+        state.closed(Mock())
+        self.assertFalse(state.snapshot()["readable"])
+
+
+class TestSlowQueryLog(unittest.TestCase):
+    """慢查询日志限流测试类"""
+    
+    def test_threshold(self):
+        """测试慢查询阈值"""
+        slow_query_log = SlowQueryLog(100, 60)
+        
+        self.assertFalse(slow_query_log.is_slow(0.05))
+        self.assertTrue(slow_query_log.is_slow(0.1))
+    
+    def test_acquire_per_shape(self):
+        """测试同一查询结构在间隔内只记录一次，之后报告跳过的次数"""
+        slow_query_log = SlowQueryLog(100, 60, max_shapes=2)
+        
+        self.assertEqual(slow_query_log.acquire("a"), 0)
+        self.assertIsNone(slow_query_log.acquire("a"))
+        self.assertIsNone(slow_query_log.acquire("a"))
+        self.assertEqual(slow_query_log.acquire("b"), 0)
+        
+        slow_query_log.interval = 0
+        self.assertEqual(slow_query_log.acquire("a"), 2)
+        self.assertEqual(slow_query_log.acquire("a"), 0)
+        
+        # 超出max_shapes时淘汰最久未出现的结构
+        slow_query_log.acquire("c")
+        self.assertNotIn("b", slow_query_log._shapes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""
+时间分区测试
+测试分区命名、按时间范围筛选分区以及合并多个分区的结果
+"""
+
+import asyncio
+import unittest
+
+from partitioning import (merge_sorted, merge_sorted_async, partition_bounds, partition_name,
+                          select_partitions, time_range)
+
+OCTOBER_2026 = 1790812800000  # 2026-10-01T00:00:00Z
+
+
+class TestPartitioning(unittest.TestCase):
+    """时间分区测试类"""
+    
+    def test_partition_name(self):
+        """测试按UTC月份生成分区名"""
+        self.assertEqual(partition_name("logs", OCTOBER_2026), "logs_2026_10")
+        self.assertEqual(partition_name("logs", OCTOBER_2026 - 1), "logs_2026_09")
+    
+    def test_partition_bounds(self):
+        """测试分区覆盖的时间范围，十二月跨年"""
+        self.assertEqual(partition_bounds(2026, 10)[0], OCTOBER_2026)
+        start, end = partition_bounds(2026, 12)
+        self.assertEqual(partition_name("logs", end - 1), "logs_2026_12")
+        self.assertEqual(partition_name("logs", end), "logs_2027_01")
+    
+    def test_time_range(self):
+        """测试从顶层和$and条件中提取时间范围"""
+        self.assertEqual(time_range({}), (None, None))
+        self.assertEqual(time_range({"created_at": 5}), (5, 5))
+        self.assertEqual(time_range({"created_at": {"$gte": 5, "$lt": 9}}), (5, 9))
+        self.assertEqual(time_range({"created_at": {"$in": [7, 3]}}), (3, 7))
+        self.assertEqual(
+            time_range({"created_at": {"$gt": 2}, "$and": [{"created_at": {"$gte": 5}}, {"created_at": {"$lte": 8}}]}),
+            (5, 8)
+        )
+        # 无法识别的条件不缩小范围
+        self.assertEqual(time_range({"created_at": {"$ne": 5}, "$or": [{"created_at": 1}]}), (None, None))
+        self.assertEqual(time_range({"created_at": {"$gte": "2026-10-01"}}), (None, None))
+    
+    def test_select_partitions(self):
+        """测试只选出与时间范围重叠的分区，按时间从新到旧排列"""
+        names = ["logs_2026_08", "logs_2026_10", "logs_2026_09", "logs", "logs_archive", "logs_2026_13", "other_2026_10"]
+        
+        self.assertEqual(select_partitions("logs", names, {}), ["logs_2026_10", "logs_2026_09", "logs_2026_08"])
+        self.assertEqual(
+            select_partitions("logs", names, {"created_at": {"$gte": OCTOBER_2026 - 1}}),
+            ["logs_2026_10", "logs_2026_09"]
+        )
+        self.assertEqual(select_partitions("logs", names, {"created_at": {"$lt": OCTOBER_2026}}),
+                         ["logs_2026_10", "logs_2026_09", "logs_2026_08"])
+        self.assertEqual(select_partitions("logs", names, {"created_at": {"$gte": OCTOBER_2026}}), ["logs_2026_10"])
+    
+    def test_merge_sorted(self):
+        """测试按多字段排序合并，缺失的字段排在最前"""
+        sort_spec = [("type", 1), ("created_at", -1)]
+        first = [{"created_at": 4}, {"type": "a", "created_at": 9}, {"type": "b", "created_at": 2}]
+        second = [{"type": "a", "created_at": 7}, {"type": "b", "created_at": 8}]
+        
+        merged = list(merge_sorted([first, [], second], sort_spec))
+        
+        self.assertEqual([document["created_at"] for document in merged], [4, 9, 7, 8, 2])
+    
+    def test_merge_sorted_async(self):
+        """测试合并异步结果"""
+        async def documents(values):
+            for value in values:
+                yield {"created_at": value}
+        
+        async def merge():
+            merged = merge_sorted_async([documents([9, 5, 1]), documents([]), documents([8, 6])], [("created_at", -1)])
+            return [document["created_at"] async for document in merged]
+        
+        self.assertEqual(asyncio.run(merge()), [9, 8, 6, 5, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
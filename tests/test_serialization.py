@@ -0,0 +1,97 @@
+"""
+JSON序列化测试
+测试两种后端对BSON类型的编码结果一致
+"""
+
+import json
+import unittest
+from datetime import datetime
+
+from bson import Decimal128, Int64, ObjectId, json_util
+from flask import Flask, jsonify
+
+import serialization
+from serialization import FastJSONProvider
+
+
+DOCUMENT = {
+    "_id": ObjectId("64b7f0c2a1b2c3d4e5f60718"),
+    "title": "标题",
+    "created_at": datetime(2024, 1, 2, 3, 4, 5, 678000),
+    "price": Decimal128("1.50"),
+    "count": Int64(3),
+    "tags": ["a", "b"]
+}
+
+
+class TestSerialization(unittest.TestCase):
+    """JSON序列化测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.addCleanup(serialization.set_backend, serialization.get_backend())
+    
+    def backends(self):
+        """依次切换到可用的后端"""
+        for name in ("orjson", "json"):
+            if serialization.set_backend(name) == name:
+                yield name
+    
+    def test_resolve_backend(self):
+        """测试后端名称解析"""
+        self.assertEqual(serialization.resolve_backend("json"), "json")
+        self.assertIn(serialization.resolve_backend("auto"), ("orjson", "json"))
+        with self.assertRaises(ValueError):
+            serialization.resolve_backend("ujson")
+    
+    def test_dumps_bson_types(self):
+        """测试BSON类型转换为字符串，两种后端结果一致"""
+        expected = {
+            "_id": "64b7f0c2a1b2c3d4e5f60718",
+            "count": 3,
+            "created_at": "2024-01-02T03:04:05.678000",
+            "price": "1.50",
+            "tags": ["a", "b"],
+            "title": "标题"
+        }
+        outputs = set()
+        for name in self.backends():
+            with self.subTest(backend=name):
+                output = serialization.dumps(DOCUMENT, sort_keys=True)
+                self.assertEqual(json.loads(output), expected)
+                self.assertEqual(serialization.dumps_bytes(DOCUMENT, sort_keys=True), output.encode("utf-8"))
+                outputs.add(output)
+        self.assertEqual(len(outputs), 1)
+    
+    def test_dumps_extended_matches_json_util(self):
+        """测试扩展JSON与json_util的输出等价"""
+        expected = json.loads(json_util.dumps(DOCUMENT, json_options=json_util.RELAXED_JSON_OPTIONS))
+        for name in self.backends():
+            with self.subTest(backend=name):
+                output = serialization.dumps_extended(DOCUMENT)
+                self.assertEqual(json.loads(output), expected)
+                self.assertEqual(list(json.loads(output)), list(DOCUMENT))
+    
+    def test_loads(self):
+        """测试解析字符串和字节串，非法JSON抛出JSONDecodeError"""
+        for name in self.backends():
+            with self.subTest(backend=name):
+                self.assertEqual(serialization.loads('{"a": [1, 2]}'), {"a": [1, 2]})
+                self.assertEqual(serialization.loads('{"a": "标题"}'.encode("utf-8")), {"a": "标题"})
+                with self.assertRaises(serialization.JSONDecodeError):
+                    serialization.loads("{invalid")
+    
+    def test_flask_provider(self):
+        """测试Flask使用的JSON提供器"""
+        app = Flask(__name__)
+        app.json = FastJSONProvider(app)
+        for name in self.backends():
+            with self.subTest(backend=name), app.test_request_context():
+                response = jsonify({"b": DOCUMENT["_id"], "a": 1})
+                self.assertEqual(response.mimetype, "application/json")
+                self.assertEqual(response.get_data(), b'{"a":1,"b":"64b7f0c2a1b2c3d4e5f60718"}\n')
+                self.assertEqual(app.json.loads(b'{"a": 1}'), {"a": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,10 +7,16 @@ import unittest
 import json
 from datetime import datetime
 
+from bson import Int64, ObjectId
+
 from utils import (
     safe_json_loads, safe_int_convert, validate_uuid,
     sanitize_data, format_timestamp, build_query_filter,
-    build_sort_criteria, paginate_results
+    build_sort_criteria, paginate_results, normalize_sort,
+    get_field_value, encode_cursor, decode_cursor, build_keyset_filter,
+    build_projection, keyset_projection, remove_field, query_shape, summarize_plan,
+    parse_read_preference, make_read_preference, parse_hint,
+    parse_text_index, build_regex_search_filter, parse_update
 )
 
 
@@ -160,6 +166,212 @@ class TestUtils(unittest.TestCase):
         result = build_sort_criteria("title:desc,created_at:asc")
         self.assertEqual(result, [("title", -1), ("created_at", 1)])
     
+    def test_normalize_sort(self):
+        """测试游标分页排序条件规范化"""
+        self.assertEqual(normalize_sort({"created_at": -1}), [("created_at", -1), ("_id", -1)])
+        self.assertEqual(normalize_sort({"_id": 1}), [("_id", 1)])
+        with self.assertRaises(ValueError):
+            normalize_sort({"title": "asc"})
+    
+    def test_get_field_value(self):
+        """测试点分路径取值"""
+        document = {"data": {"name": "test"}, "list": [1, 2]}
+        self.assertEqual(get_field_value(document, "data.name"), "test")
+        self.assertIsNone(get_field_value(document, "data.missing"))
+        self.assertIsNone(get_field_value(document, "list.0"))
+    
+    def test_cursor_round_trip(self):
+        """测试游标编码和解析保留BSON类型"""
+        object_id = ObjectId()
+        sort_spec = [("data.score", 1), ("created_at", -1), ("_id", -1)]
+        document = {"_id": object_id, "data": {"score": 1.5}, "created_at": Int64(1640995200000)}
+        
+        cursor = encode_cursor(sort_spec, document)
+        decoded_sort, values = decode_cursor(cursor)
+        
+        self.assertNotIn("=", cursor)
+        self.assertEqual(decoded_sort, sort_spec)
+        self.assertEqual(values, [1.5, 1640995200000, object_id])
+        self.assertIsInstance(values[1], Int64)
+    
+    def test_decode_cursor_invalid(self):
+        """测试无效游标"""
+        with self.assertRaises(ValueError):
+            decode_cursor("not-a-cursor")
+    
+    def test_build_keyset_filter(self):
+        """测试游标范围条件构建"""
+        sort_spec = [("created_at", -1), ("_id", 1)]
+        result = build_keyset_filter(sort_spec, [100, "id-1"])
+        
+        self.assertEqual(result, {"$or": [
+            {"$or": [{"created_at": {"$lt": 100}}, {"created_at": None}]},
+            {"created_at": 100, "_id": {"$gt": "id-1"}}
+        ]})
+    
+    def test_build_keyset_filter_null_values(self):
+        """测试排序字段为null时的范围条件"""
+        result = build_keyset_filter([("score", 1), ("_id", 1)], [None, "id-1"])
+        self.assertEqual(result, {"$or": [
+            {"score": {"$ne": None}},
+            {"score": None, "_id": {"$gt": "id-1"}}
+        ]})
+        
+        result = build_keyset_filter([("score", -1), ("_id", -1)], [None, "id-1"])
+        self.assertEqual(result, {"score": None, "_id": {"$lt": "id-1"}})
+    
+    def test_build_projection(self):
+        """测试字段投影"""
+        self.assertEqual(build_projection(), {"_id": 0})
+        self.assertEqual(build_projection("title, data.name"), {"title": 1, "data.name": 1, "_id": 0})
+        self.assertEqual(
+            build_projection('{"title": 1, "comments": {"$slice": -5}, "logs": {"$slice": [10, 5]}}'),
+            {"title": 1, "comments": {"$slice": -5}, "logs": {"$slice": [10, 5]}, "_id": 0}
+        )
+        self.assertEqual(build_projection(exclude="content,data.raw"), {"content": 0, "data.raw": 0, "_id": 0})
+        self.assertEqual(build_projection(exclude='["content"]'), {"content": 0, "_id": 0})
+    
+    def test_build_projection_invalid(self):
+        """测试无效的字段投影"""
+        invalid = [
+            {"fields": "title", "exclude": "content"},
+            {"fields": "data..name"},
+            {"fields": "$where"},
+            {"fields": "_id"},
+            {"fields": "data,data.name"},
+            {"fields": '{"title": 0}'},
+            {"fields": '{"tags": {"$slice": [1, 0]}}'},
+            {"fields": '{"tags": {"$elemMatch": {"a": 1}}}'},
+            {"fields": '{"title": 1'},
+            {"exclude": '{"content": 0}'},
+            {"fields": ",".join(f"f{index}" for index in range(101))}
+        ]
+        for params in invalid:
+            with self.assertRaises(ValueError, msg=params):
+                build_projection(**params)
+    
+    def test_keyset_projection(self):
+        """测试游标分页的投影调整"""
+        sort_spec = [("created_at", -1), ("_id", -1)]
+        
+        self.assertEqual(keyset_projection({"_id": 0}, sort_spec), (None, []))
+        self.assertEqual(keyset_projection({"title": 1, "_id": 0}, sort_spec),
+                         ({"title": 1, "created_at": 1}, ["created_at"]))
+        self.assertEqual(keyset_projection({"created_at": 1, "_id": 0}, sort_spec), ({"created_at": 1}, []))
+        self.assertEqual(keyset_projection({"content": 0, "created_at": 0, "_id": 0}, sort_spec),
+                         ({"content": 0}, ["created_at"]))
+        self.assertEqual(keyset_projection({"data": 1, "_id": 0}, [("data.score", 1), ("_id", 1)]),
+                         ({"data": 1}, []))
+        with self.assertRaises(ValueError):
+            keyset_projection({"data.name": 1, "_id": 0}, [("data", 1), ("_id", 1)])
+    
+    def test_remove_field(self):
+        """测试按路径删除字段"""
+        document = {"a": 1, "data": {"score": 2, "name": "x"}}
+        remove_field(document, "data.score")
+        remove_field(document, "missing.path")
+        remove_field(document, "a")
+        
+        self.assertEqual(document, {"data": {"name": "x"}})
+    
+    def test_query_shape(self):
+        """测试去掉查询条件中的值"""
+        conditions = {
+            "type": "log",
+            "size": {"$gt": 10, "$in": [1, 2]},
+            "$or": [{"user": "alice"}, {"tags": {"$all": ["a"]}}],
+            "items": []
+        }
+        
+        self.assertEqual(query_shape(conditions), {
+            "type": "?",
+            "size": {"$gt": "?", "$in": "?"},
+            "$or": [{"user": "?"}, {"tags": {"$all": "?"}}],
+            "items": "?"
+        })
+    
+    def test_summarize_plan(self):
+        """测试执行计划概要"""
+        plan = {"stage": "SORT", "inputStage": {"stage": "OR", "inputStages": [
+            {"stage": "IXSCAN", "indexName": "a_1"}, {"stage": "COLLSCAN"}
+        ]}}
+        
+        self.assertEqual(summarize_plan(plan), "SORT > OR(IXSCAN a_1, COLLSCAN)")
+        self.assertEqual(summarize_plan({"queryPlan": {"stage": "COLLSCAN"}}), "COLLSCAN")
+    
+    def test_parse_read_preference(self):
+        """测试读偏好参数校验"""
+        self.assertIsNone(parse_read_preference(None))
+        self.assertEqual(parse_read_preference("SECONDARYPREFERRED", "120"),
+                         {"mode": "secondaryPreferred", "max_staleness_seconds": 120})
+        read_preference = make_read_preference(parse_read_preference("nearest"))
+        self.assertEqual(read_preference.document, {"mode": "nearest"})
+        
+        for mode, max_staleness in [("fastest", None), ("nearest", 30), ("primary", 120),
+                                    (None, 120), ("nearest", "abc")]:
+            with self.assertRaises(ValueError):
+                parse_read_preference(mode, max_staleness)
+    
+    def test_parse_hint(self):
+        """测试索引提示解析"""
+        self.assertEqual(parse_hint("type_1_created_at_-1"), "type_1_created_at_-1")
+        self.assertEqual(parse_hint('{"type": 1, "created_at": -1}'), [("type", 1), ("created_at", -1)])
+        self.assertEqual(parse_hint('[["_id", 1]]'), [("_id", 1)])
+        
+        for hint in ["", "{}", '{"a": true}', '{"$a": 1}', "[1]", "{bad"]:
+            with self.assertRaises(ValueError):
+                parse_hint(hint)
+    
+    def test_parse_text_index(self):
+        """测试全文索引配置解析"""
+        self.assertEqual(parse_text_index(["title", "content"]), {"title": 1, "content": 1})
+        self.assertEqual(parse_text_index({"title": 10, "data.body": 2}), {"title": 10, "data.body": 2})
+        
+        for spec in [[], {}, "title", {"title": 0}, {"title": True}, {"$title": 1}]:
+            with self.assertRaises(ValueError):
+                parse_text_index(spec)
+    
+    def test_build_regex_search_filter(self):
+        """测试没有全文索引时的正则搜索条件，搜索词按字面匹配"""
+        self.assertEqual(build_regex_search_filter("a.b", ["title"]), {"title": {"$regex": r"a\.b", "$options": "i"}})
+        self.assertEqual(build_regex_search_filter(" x  y ", ["title", "content"]), {"$or": [
+            {"title": {"$regex": "x", "$options": "i"}},
+            {"title": {"$regex": "y", "$options": "i"}},
+            {"content": {"$regex": "x", "$options": "i"}},
+            {"content": {"$regex": "y", "$options": "i"}}
+        ]})
+        
+        with self.assertRaises(ValueError):
+            build_regex_search_filter(" ", ["title"])
+        with self.assertRaises(ValueError):
+            build_regex_search_filter("x", [])
+    
+    def test_parse_update(self):
+        """测试局部更新操作符的校验，$unset的值统一为空字符串"""
+        update = parse_update(
+            '{"$set": {"meta.status": "done"}, "$inc": {"count": 1}, "$unset": {"draft": true}, '
+            '"$push": {"messages": {"$each": [{"role": "user"}], "$slice": -100}, "tags": "a"}}',
+            ("uuid", "updated_at")
+        )
+        self.assertEqual(update, {
+            "$set": {"meta.status": "done"},
+            "$inc": {"count": 1},
+            "$unset": {"draft": ""},
+            "$push": {"messages": {"$each": [{"role": "user"}], "$slice": -100}, "tags": "a"}
+        })
+        
+        invalid = [
+            "[]", {}, {"$rename": {"a": "b"}}, {"$set": {}}, {"$set": {"a..b": 1}}, {"$set": {"items.$.x": 1}},
+            {"$set": {"_id": 1}}, {"$set": {"uuid": "x"}}, {"$unset": {"updated_at": 1}},
+            {"$inc": {"count": "1"}}, {"$inc": {"count": True}},
+            {"$push": {"a": {"$slice": 1}}}, {"$push": {"a": {"$each": 1}}},
+            {"$push": {"a": {"$each": [], "$sort": 1}}}, {"$push": {"a": {"$each": [], "$slice": 1.5}}},
+            {"$set": {"meta": {}}, "$unset": {"meta.status": 1}}
+        ]
+        for update in invalid:
+            with self.assertRaises(ValueError):
+                parse_update(update, ("uuid", "updated_at"))
+    
     def test_paginate_results(self):
         """测试结果分页"""
         results = list(range(25))  # 0-24
@@ -0,0 +1,151 @@
+"""
+异步写入队列测试
+测试按条数和时间间隔分批、队列满时的拒绝以及关闭时写完剩余数据
+"""
+
+import threading
+import time
+import unittest
+
+from writebehind import WriteBehindQueue, WriteQueueFull
+
+
+class TestWriteBehindQueue(unittest.TestCase):
+    """异步写入队列测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+    
+    def flush(self, batch):
+        """记录写入的批次"""
+        self.release.wait()
+        self.batches.append(list(batch))
+        return 0
+    
+    def test_flush_by_batch_size(self):
+        """测试累计到batch_size条时立即写入"""
+        write_queue = WriteBehindQueue(self.flush, max_size=100, batch_size=3, flush_interval=10)
+        for item in range(6):
+            write_queue.put(item)
+        
+        deadline = time.monotonic() + 2
+        while len(self.batches) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        
+        self.assertEqual(self.batches, [[0, 1, 2], [3, 4, 5]])
+        write_queue.close(timeout=2)
+    
+    def test_flush_by_interval(self):
+        """测试不足batch_size条时按时间间隔写入"""
+        write_queue = WriteBehindQueue(self.flush, max_size=100, batch_size=100, flush_interval=0.05)
+        write_queue.put("a")
+        
+        time.sleep(0.5)
+        
+        self.assertEqual(self.batches, [["a"]])
+        self.assertEqual(write_queue.stats()["written"], 1)
+        write_queue.close(timeout=2)
+    
+    def test_backpressure(self):
+        """测试队列满时拒绝写入"""
+        self.release.clear()
+        write_queue = WriteBehindQueue(self.flush, max_size=2, batch_size=1, flush_interval=0.01)
+        write_queue.put(1)
+        time.sleep(0.1)  # 后台线程取出第一条后阻塞在flush中
+        write_queue.put(2)
+        write_queue.put(3)
+        
+        with self.assertRaises(WriteQueueFull):
+            write_queue.put(4)
+        self.assertEqual(write_queue.stats()["rejected"], 1)
+        
+        self.release.set()
+        write_queue.close(timeout=2)
+        self.assertEqual([item for batch in self.batches for item in batch], [1, 2, 3])
+    
+    def test_close_drains_queue(self):
+        """测试关闭时写完队列中的数据并拒绝新数据"""
+        write_queue = WriteBehindQueue(self.flush, max_size=100, batch_size=2, flush_interval=10)
+        for item in range(5):
+            write_queue.put(item)
+        
+        write_queue.close(timeout=2)
+        
+        self.assertEqual([item for batch in self.batches for item in batch], [0, 1, 2, 3, 4])
+        self.assertEqual(write_queue.stats()["pending"], 0)
+        with self.assertRaises(WriteQueueFull):
+            write_queue.put(5)
+    
+    def test_flush_error_counted(self):
+        """测试写入异常计入失败条数且不影响后续批次"""
+        calls = []
+        
+        def flush(batch):
+            calls.append(batch)
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+            return 1
+        
+        write_queue = WriteBehindQueue(flush, max_size=100, batch_size=2, flush_interval=10)
+        for item in range(4):
+            write_queue.put(item)
+        write_queue.close(timeout=2)
+        
+        stats = write_queue.stats()
+        self.assertEqual(stats["batches"], 2)
+        self.assertEqual(stats["failed"], 3)
+        self.assertEqual(stats["written"], 1)
+    
+    def test_close_while_putting(self):
+        """测试与close并发的put要么被拒绝，要么其数据一定被写入"""
+        write_queue = WriteBehindQueue(self.flush, max_size=50, batch_size=10, flush_interval=0.01,
+                                       enqueue_timeout=0.5)
+        accepted = []
+        start = threading.Event()
+        
+        def producer(base):
+            start.wait()
+            for item in range(base, base + 100):
+                try:
+                    write_queue.put(item)
+                except WriteQueueFull:
+                    return
+                accepted.append(item)
+        
+        producers = [threading.Thread(target=producer, args=(base,)) for base in range(0, 400, 100)]
+        for thread in producers:
+            thread.start()
+        start.set()
+        time.sleep(0.01)
+        write_queue.close(timeout=5)
+        for thread in producers:
+            thread.join()
+        
+        written = sorted(item for batch in self.batches for item in batch)
+        self.assertEqual(written, sorted(accepted))
+        self.assertEqual(write_queue.stats()["pending"], 0)
+    
+    def test_close_with_full_queue(self):
+        """测试队列已满放不下停止标记时，后台线程仍写完剩余数据并退出"""
+        self.release.clear()
+        write_queue = WriteBehindQueue(self.flush, max_size=2, batch_size=1, flush_interval=0.01)
+        write_queue.put(1)
+        time.sleep(0.1)  # 后台线程取出第一条后阻塞在flush中
+        write_queue.put(2)
+        write_queue.put(3)
+        thread = write_queue._thread
+        
+        write_queue.close(timeout=0.05)
+        self.assertTrue(thread.is_alive())
+        
+        self.release.set()
+        thread.join(2)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual([item for batch in self.batches for item in batch], [1, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,11 +3,17 @@
 提供通用的工具函数和辅助方法
 """
 
-import json
+import base64
 import logging
-from typing import Any, Dict, List, Optional, Union
+import re
+from typing import Any, Dict, List, Optional, Tuple, Union
 from datetime import datetime
 
+from bson import json_util
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred, _ServerMode
+
+from serialization import JSONDecodeError, loads
+
 logger = logging.getLogger(__name__)
 
 
@@ -23,8 +29,8 @@ def safe_json_loads(data: str, default: Any = None) -> Any:
         解析后的数据或默认值
     """
     try:
-        return json.loads(data) if data else default
-    except (json.JSONDecodeError, TypeError) as e:
+        return loads(data) if data else default
+    except (JSONDecodeError, TypeError) as e:
         logger.warning(f"JSON解析失败: {e}, 数据: {data}")
         return default
 
@@ -165,6 +171,626 @@ def build_sort_criteria(sort_param: str, default_field: str = "created_at") -> L
     return sort_criteria if sort_criteria else [(default_field, -1)]
 
 
+def normalize_sort(sort_obj: Any) -> List[Tuple[str, int]]:
+    """
+    规范化排序条件并追加_id作为唯一的排序依据
+    
+    Args:
+        sort_obj: 排序条件，字典或(字段, 方向)列表
+        
+    Returns:
+        List[Tuple[str, int]]: 排序条件列表，最后一项为_id
+        
+    Raises:
+        ValueError: 排序条件格式无效
+    """
+    items = sort_obj.items() if isinstance(sort_obj, dict) else sort_obj
+    try:
+        sort_spec = [(str(field), direction) for field, direction in items]
+    except (TypeError, ValueError):
+        raise ValueError("排序条件格式无效")
+    
+    for field, direction in sort_spec:
+        if direction not in (1, -1) or isinstance(direction, bool):
+            raise ValueError(f"游标分页的排序方向必须是1或-1: {field}")
+    
+    if not any(field == "_id" for field, _ in sort_spec):
+        last_direction = sort_spec[-1][1] if sort_spec else 1
+        sort_spec.append(("_id", last_direction))
+    return sort_spec
+
+
+def get_field_value(document: Dict[str, Any], path: str) -> Any:
+    """
+    按点分路径读取文档字段值
+    
+    Args:
+        document: 文档
+        path: 字段路径，如 "data.name"
+        
+    Returns:
+        字段值，不存在时返回None
+    """
+    value: Any = document
+    for key in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def encode_cursor(sort_spec: List[Tuple[str, int]], document: Dict[str, Any]) -> str:
+    """
+    根据一页中的最后一条文档生成游标
+    
+    Args:
+        sort_spec: 规范化后的排序条件
+        document: 最后一条文档（需包含排序字段和_id）
+        
+    Returns:
+        str: URL安全的游标字符串
+    """
+    payload = {
+        "s": [[field, direction] for field, direction in sort_spec],
+        "v": [get_field_value(document, field) for field, _ in sort_spec]
+    }
+    raw = json_util.dumps(payload, json_options=json_util.CANONICAL_JSON_OPTIONS)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[List[Tuple[str, int]], List[Any]]:
+    """
+    解析游标
+    
+    Args:
+        cursor: encode_cursor生成的游标字符串
+        
+    Returns:
+        Tuple: (排序条件, 排序字段值)
+        
+    Raises:
+        ValueError: 游标格式无效
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json_util.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        sort_spec = [(str(field), int(direction)) for field, direction in payload["s"]]
+        values = list(payload["v"])
+    except Exception:
+        raise ValueError("无效的 cursor 参数")
+    
+    if len(sort_spec) != len(values):
+        raise ValueError("无效的 cursor 参数")
+    return sort_spec, values
+
+
+def build_keyset_filter(sort_spec: List[Tuple[str, int]], values: List[Any]) -> Dict[str, Any]:
+    """
+    构建从游标位置之后继续查询的范围条件
+    
+    对排序字段 (f1, ..., fn) 生成 f1 之后，或 f1 相等且 f2 之后，依此类推的 $or 条件。
+    null/缺失值在升序中排在最前、在降序中排在最后。
+    
+    Args:
+        sort_spec: 规范化后的排序条件
+        values: 上一页最后一条文档的排序字段值
+        
+    Returns:
+        Dict[str, Any]: MongoDB查询条件
+    """
+    branches = []
+    for position, (field, direction) in enumerate(sort_spec):
+        value = values[position]
+        prefix = {sort_field: values[index] for index, (sort_field, _) in enumerate(sort_spec[:position])}
+        
+        if value is None:
+            # 降序时null已经是最后，之后没有更多数据
+            if direction == -1:
+                continue
+            branch = dict(prefix, **{field: {'$ne': None}})
+        elif direction == 1:
+            branch = dict(prefix, **{field: {'$gt': value}})
+        elif field == '_id':
+            # _id不会为null，无需包含null分支
+            branch = dict(prefix, **{field: {'$lt': value}})
+        else:
+            branch = dict(prefix, **{'$or': [{field: {'$lt': value}}, {field: None}]})
+        branches.append(branch)
+    
+    if not branches:
+        # 游标已位于末尾，构造一个不匹配任何文档的条件
+        return {'_id': {'$in': []}}
+    return {'$or': branches} if len(branches) > 1 else branches[0]
+
+
+# 投影最多包含的字段数
+MAX_PROJECTION_FIELDS = 100
+
+
+def _paths_overlap(first: str, second: str) -> bool:
+    """判断两个字段路径是否相同或一个是另一个的上级"""
+    return first == second or first.startswith(second + '.') or second.startswith(first + '.')
+
+
+def _validate_field_path(path: Any) -> str:
+    """
+    校验投影中的字段路径
+    
+    Raises:
+        ValueError: 路径为空、包含空段或以$开头的段，或为_id
+    """
+    if not isinstance(path, str) or not path.strip():
+        raise ValueError("字段路径不能为空")
+    path = path.strip()
+    if path == '_id':
+        raise ValueError("_id 不能出现在 fields 或 exclude 中")
+    for segment in path.split('.'):
+        if not segment or segment.startswith('$') or '\0' in segment:
+            raise ValueError(f"无效的字段路径: {path}")
+    return path
+
+
+def _validate_slice(path: str, value: Any) -> Dict[str, Any]:
+    """
+    校验 {"$slice": n} 或 {"$slice": [skip, n]}
+    
+    Raises:
+        ValueError: 不是合法的$slice
+    """
+    if not isinstance(value, dict) or list(value) != ['$slice']:
+        raise ValueError(f"字段 {path} 的投影只能是1或 {{\"$slice\": n}}")
+    slice_value = value['$slice']
+    if isinstance(slice_value, int) and not isinstance(slice_value, bool):
+        return {'$slice': slice_value}
+    if (isinstance(slice_value, list) and len(slice_value) == 2
+            and all(isinstance(item, int) and not isinstance(item, bool) for item in slice_value)
+            and slice_value[1] > 0):
+        return {'$slice': slice_value}
+    raise ValueError(f"字段 {path} 的 $slice 必须是整数或 [skip, limit]，且limit大于0")
+
+
+def _parse_field_spec(value: str, name: str) -> Any:
+    """解析逗号分隔的字段列表或JSON格式的字段参数"""
+    value = value.strip()
+    if value[:1] in ('{', '['):
+        try:
+            return loads(value)
+        except JSONDecodeError:
+            raise ValueError(f"{name} 不是合法的JSON")
+    return [item for item in value.split(',') if item.strip()]
+
+
+def build_projection(fields: Optional[str] = None, exclude: Optional[str] = None) -> Dict[str, Any]:
+    """
+    根据fields和exclude参数构建MongoDB投影
+    
+    fields为逗号分隔的字段路径（如 "title,data.name"），或JSON对象，
+    对象的值为1或 {"$slice": n}/{"$slice": [skip, n]}（如 {"title": 1, "comments": {"$slice": -5}}）；
+    exclude为逗号分隔的字段路径或JSON数组。两者不能同时使用，_id始终不返回。
+    
+    Args:
+        fields: 需要返回的字段
+        exclude: 需要排除的字段
+        
+    Returns:
+        Dict[str, Any]: MongoDB投影
+        
+    Raises:
+        ValueError: 参数无效
+    """
+    projection: Dict[str, Any] = {}
+    if fields and exclude:
+        raise ValueError("fields 和 exclude 不能同时使用")
+    
+    if fields:
+        spec = _parse_field_spec(fields, "fields")
+        if isinstance(spec, list):
+            spec = {path: 1 for path in spec}
+        if not isinstance(spec, dict):
+            raise ValueError("fields 必须是逗号分隔的字段或JSON对象")
+        for path, value in spec.items():
+            path = _validate_field_path(path)
+            if value in (1, True) and not isinstance(value, float):
+                projection[path] = 1
+            else:
+                projection[path] = _validate_slice(path, value)
+    elif exclude:
+        spec = _parse_field_spec(exclude, "exclude")
+        if not isinstance(spec, list):
+            raise ValueError("exclude 必须是逗号分隔的字段或JSON数组")
+        for path in spec:
+            projection[_validate_field_path(path)] = 0
+    
+    if len(projection) > MAX_PROJECTION_FIELDS:
+        raise ValueError(f"投影最多包含 {MAX_PROJECTION_FIELDS} 个字段")
+    paths = list(projection)
+    for index, path in enumerate(paths):
+        for other in paths[index + 1:]:
+            if _paths_overlap(path, other):
+                raise ValueError(f"字段路径冲突: {path} 与 {other}")
+    
+    projection['_id'] = 0
+    return projection
+
+
+def keyset_projection(projection: Dict[str, Any],
+                      sort_spec: List[Tuple[str, int]]) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """
+    为游标分页调整投影，确保返回排序字段和_id以生成下一页游标
+    
+    Args:
+        projection: build_projection构建的投影
+        sort_spec: 规范化后的排序条件
+        
+    Returns:
+        Tuple: (调整后的投影，为空时为None；需要从结果中删除的附加字段)
+        
+    Raises:
+        ValueError: 排序字段与投影字段冲突
+    """
+    projection = {path: value for path, value in projection.items() if path != '_id'}
+    inclusive = any(value == 1 for value in projection.values())
+    hidden = []
+    
+    for field, _ in sort_spec:
+        if field == '_id':
+            continue
+        if inclusive and any(value == 1 and (field == path or field.startswith(path + '.'))
+                             for path, value in projection.items()):
+            continue
+        if not inclusive and projection.get(field) == 0:
+            del projection[field]
+            hidden.append(field)
+            continue
+        if any(_paths_overlap(path, field) for path in projection):
+            raise ValueError(f"排序字段 {field} 与投影字段冲突")
+        if inclusive:
+            projection[field] = 1
+            hidden.append(field)
+    
+    return projection or None, hidden
+
+
+def remove_field(document: Dict[str, Any], path: str):
+    """
+    按点分路径删除文档字段
+    
+    Args:
+        document: 文档
+        path: 字段路径，如 "data.name"
+    """
+    *parents, key = path.split('.')
+    for parent in parents:
+        document = document.get(parent) if isinstance(document, dict) else None
+        if not isinstance(document, dict):
+            return
+    document.pop(key, None)
+
+
+# 全文搜索时返回相关度得分的字段
+TEXT_SCORE_FIELD = 'score'
+
+
+def parse_text_index(spec: Any) -> Dict[str, int]:
+    """
+    解析全文索引配置
+    
+    Args:
+        spec: 字段列表（如 ["title", "content"]），或字段到权重的对象（如 {"title": 10, "content": 1}）
+        
+    Returns:
+        Dict[str, int]: 字段到权重的映射
+        
+    Raises:
+        ValueError: 配置格式无效
+    """
+    if isinstance(spec, list):
+        spec = {field: 1 for field in spec}
+    if not isinstance(spec, dict) or not spec:
+        raise ValueError("全文索引配置必须是非空的字段数组或字段到权重的对象")
+    
+    weights = {}
+    for field, weight in spec.items():
+        if isinstance(weight, bool) or not isinstance(weight, int) or weight <= 0:
+            raise ValueError(f"全文索引字段的权重必须是正整数: {field}")
+        weights[_validate_field_path(field)] = weight
+    return weights
+
+
+def build_regex_search_filter(text: str, fields: List[str]) -> Dict[str, Any]:
+    """
+    构建没有全文索引时的搜索条件
+    
+    搜索词按空白拆分，任一字段包含任一搜索词即匹配（与$text一致）；
+    搜索词按字面匹配、不区分大小写。这种条件无法使用索引，会扫描整个集合
+    
+    Args:
+        text: 搜索内容
+        fields: 参与搜索的字段
+        
+    Returns:
+        Dict[str, Any]: 查询条件
+        
+    Raises:
+        ValueError: 没有搜索词或没有可搜索的字段
+    """
+    terms = text.split()
+    if not terms:
+        raise ValueError("q 不能为空")
+    if not fields:
+        raise ValueError("集合没有全文索引，也没有配置 TEXT_SEARCH_FALLBACK_FIELDS")
+    
+    clauses = [{field: {'$regex': re.escape(term), '$options': 'i'}} for field in fields for term in terms]
+    return {'$or': clauses} if len(clauses) > 1 else clauses[0]
+
+
+# 聚合管道中不允许的阶段（写入其他集合，绕过保存接口的时间戳和缓存失效）
+FORBIDDEN_PIPELINE_STAGES = ('$out', '$merge')
+
+
+def parse_pipeline(pipeline: Any) -> List[Dict[str, Any]]:
+    """
+    解析并校验聚合管道
+    
+    Args:
+        pipeline: 聚合管道，JSON数组或其字符串形式
+        
+    Returns:
+        List[Dict[str, Any]]: 聚合管道
+        
+    Raises:
+        ValueError: 管道无效或包含写入阶段
+    """
+    if isinstance(pipeline, str):
+        try:
+            pipeline = loads(pipeline)
+        except JSONDecodeError:
+            raise ValueError("pipeline 不是合法的JSON")
+    if not isinstance(pipeline, list):
+        raise ValueError("pipeline 必须是JSON数组")
+    
+    for index, stage in enumerate(pipeline):
+        if not isinstance(stage, dict) or len(stage) != 1:
+            raise ValueError(f"pipeline 第 {index + 1} 个阶段必须是只包含一个操作符的JSON对象")
+        operator = next(iter(stage))
+        if not operator.startswith('$'):
+            raise ValueError(f"pipeline 第 {index + 1} 个阶段的操作符无效: {operator}")
+        if operator in FORBIDDEN_PIPELINE_STAGES:
+            raise ValueError(f"pipeline 不支持 {operator} 阶段")
+    return pipeline
+
+
+# /api/patch支持的更新操作符
+UPDATE_OPERATORS = ('$set', '$inc', '$push', '$unset')
+
+# 一次局部更新最多修改的字段数
+MAX_UPDATE_FIELDS = 100
+
+
+def _validate_push(path: str, value: Any) -> Any:
+    """
+    校验$push的值：单个元素，或 {"$each": [...], "$slice": n}
+    
+    Raises:
+        ValueError: 修饰符无效
+    """
+    if not isinstance(value, dict) or not any(key.startswith('$') for key in value):
+        return value
+    if '$each' not in value:
+        raise ValueError(f"字段 {path} 的 $push 使用修饰符时必须指定 $each")
+    for key in value:
+        if key not in ('$each', '$slice'):
+            raise ValueError(f"字段 {path} 的 $push 只支持 $each 和 $slice 修饰符")
+    if not isinstance(value['$each'], list):
+        raise ValueError(f"字段 {path} 的 $each 必须是数组")
+    if '$slice' in value and (not isinstance(value['$slice'], int) or isinstance(value['$slice'], bool)):
+        raise ValueError(f"字段 {path} 的 $slice 必须是整数")
+    return value
+
+
+def parse_update(update: Any, protected_fields: Tuple[str, ...] = ()) -> Dict[str, Dict[str, Any]]:
+    """
+    解析并校验局部更新的操作符
+    
+    支持$set（点分路径）、$inc（数值）、$push（单个元素，或带$each和$slice）和$unset；
+    同一字段或存在上下级关系的字段只能出现一次
+    
+    Args:
+        update: JSON对象或其字符串形式，如 {"$push": {"messages": {"$each": [...], "$slice": -100}}}
+        protected_fields: 不允许修改的字段（如uuid字段和服务端维护的时间戳）
+        
+    Returns:
+        Dict[str, Dict[str, Any]]: 更新文档
+        
+    Raises:
+        ValueError: 更新无效
+    """
+    if isinstance(update, str):
+        try:
+            update = loads(update)
+        except JSONDecodeError:
+            raise ValueError("update 不是合法的JSON")
+    if not isinstance(update, dict) or not update:
+        raise ValueError("update 必须是非空的JSON对象")
+    
+    parsed: Dict[str, Dict[str, Any]] = {}
+    paths: List[str] = []
+    for operator, fields in update.items():
+        if operator not in UPDATE_OPERATORS:
+            raise ValueError(f"update 不支持的操作符: {operator}，只支持 {', '.join(UPDATE_OPERATORS)}")
+        if not isinstance(fields, dict) or not fields:
+            raise ValueError(f"{operator} 必须是非空的JSON对象")
+        
+        parsed[operator] = {}
+        for path, value in fields.items():
+            if not isinstance(path, str) or not path.strip():
+                raise ValueError("字段路径不能为空")
+            path = path.strip()
+            for segment in path.split('.'):
+                if not segment or segment.startswith('$') or '\0' in segment:
+                    raise ValueError(f"无效的字段路径: {path}")
+            if any(_paths_overlap(path, field) for field in ('_id',) + tuple(protected_fields)):
+                raise ValueError(f"字段 {path} 不允许修改")
+            if any(_paths_overlap(path, existing) for existing in paths):
+                raise ValueError(f"字段 {path} 与同一次更新中的其他字段冲突")
+            paths.append(path)
+            
+            if operator == '$inc' and (not isinstance(value, (int, float)) or isinstance(value, bool)):
+                raise ValueError(f"字段 {path} 的 $inc 必须是数值")
+            if operator == '$push':
+                value = _validate_push(path, value)
+            if operator == '$unset':
+                value = ''
+            parsed[operator][path] = value
+    
+    if len(paths) > MAX_UPDATE_FIELDS:
+        raise ValueError(f"一次更新最多修改 {MAX_UPDATE_FIELDS} 个字段")
+    return parsed
+
+
+READ_PREFERENCE_MODES = {
+    "primary": Primary,
+    "primarypreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondarypreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+# MongoDB要求maxStalenessSeconds不小于90秒
+MIN_MAX_STALENESS_SECONDS = 90
+
+
+def parse_read_preference(mode: Any, max_staleness_seconds: Any = None) -> Optional[Dict[str, Any]]:
+    """
+    校验读偏好参数
+    
+    Args:
+        mode: primary、primaryPreferred、secondary、secondaryPreferred或nearest（不区分大小写），None表示未设置
+        max_staleness_seconds: 从节点允许落后主节点的最大秒数，None或-1表示不限制
+        
+    Returns:
+        Optional[Dict[str, Any]]: {"mode": 规范的模式名, "max_staleness_seconds": 秒数}，未设置模式时返回None
+        
+    Raises:
+        ValueError: 参数无效
+    """
+    if max_staleness_seconds in (None, ""):
+        max_staleness_seconds = -1
+    try:
+        max_staleness_seconds = int(max_staleness_seconds)
+    except (TypeError, ValueError):
+        raise ValueError("max_staleness_seconds 必须是整数")
+    if max_staleness_seconds != -1 and max_staleness_seconds < MIN_MAX_STALENESS_SECONDS:
+        raise ValueError(f"max_staleness_seconds 不能小于 {MIN_MAX_STALENESS_SECONDS}")
+    
+    if not mode:
+        if max_staleness_seconds != -1:
+            raise ValueError("max_staleness_seconds 需要与 read_preference 一起使用")
+        return None
+    mode_class = READ_PREFERENCE_MODES.get(str(mode).lower())
+    if mode_class is None:
+        raise ValueError(f"无效的 read_preference: {mode}")
+    if mode_class is Primary and max_staleness_seconds != -1:
+        raise ValueError("read_preference 为 primary 时不能设置 max_staleness_seconds")
+    return {"mode": mode_class().mongos_mode, "max_staleness_seconds": max_staleness_seconds}
+
+
+def make_read_preference(spec: Dict[str, Any]) -> _ServerMode:
+    """
+    根据parse_read_preference的结果创建PyMongo读偏好
+    
+    Args:
+        spec: parse_read_preference的返回值
+        
+    Returns:
+        _ServerMode: 读偏好
+    """
+    mode_class = READ_PREFERENCE_MODES[spec["mode"].lower()]
+    if mode_class is Primary:
+        return Primary()
+    return mode_class(max_staleness=spec["max_staleness_seconds"])
+
+
+def parse_hint(hint: Any) -> Union[str, List[Tuple[str, Any]]]:
+    """
+    解析索引提示
+    
+    Args:
+        hint: 索引名，或JSON格式的索引键（如 {"type": 1, "created_at": -1}）
+        
+    Returns:
+        Union[str, List[Tuple[str, Any]]]: 索引名或(字段, 方向)列表
+        
+    Raises:
+        ValueError: 格式无效
+    """
+    if isinstance(hint, str):
+        hint = hint.strip()
+        if hint[:1] not in ('{', '['):
+            if not hint:
+                raise ValueError("hint 不能为空")
+            return hint
+        try:
+            hint = loads(hint)
+        except JSONDecodeError:
+            raise ValueError("hint 不是合法的JSON")
+    
+    items = hint.items() if isinstance(hint, dict) else hint
+    try:
+        spec = [(field, direction) for field, direction in items]
+    except (TypeError, ValueError):
+        raise ValueError("hint 必须是索引名或索引键，如 {\"created_at\": -1}")
+    if not spec:
+        raise ValueError("hint 不能为空")
+    for field, direction in spec:
+        if not isinstance(field, str) or not field or field.startswith('$'):
+            raise ValueError(f"hint 中的字段无效: {field}")
+        if isinstance(direction, bool) or not (direction in (1, -1) or isinstance(direction, str)):
+            raise ValueError(f"hint 中字段 {field} 的索引类型无效")
+    return spec
+
+
+def query_shape(value: Any) -> Any:
+    """
+    去掉查询条件中的值，只保留字段名和操作符
+    
+    字面值替换为 "?"；元素全部是对象的数组（如$and、$or）逐个处理，其他数组（如$in的值）替换为 "?"。
+    用于慢查询日志，避免记录用户数据，同时让结构相同的查询可以归为一类。
+    
+    Args:
+        value: 查询条件
+        
+    Returns:
+        去掉值之后的查询结构
+    """
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+        return [query_shape(item) for item in value]
+    return "?"
+
+
+def summarize_plan(plan: Dict[str, Any]) -> str:
+    """
+    将explain的执行计划概括为一行，如 "LIMIT > FETCH > IXSCAN created_at_-1__id_-1"
+    
+    Args:
+        plan: queryPlanner.winningPlan
+        
+    Returns:
+        str: 自顶向下的阶段列表，使用索引的阶段附带索引名，多个输入的阶段以括号列出
+    """
+    # MongoDB 7.0+ 使用SBE时执行计划在queryPlan字段中
+    plan = plan.get("queryPlan", plan)
+    stage = plan.get("stage", "UNKNOWN")
+    if plan.get("indexName"):
+        stage = f"{stage} {plan['indexName']}"
+    if isinstance(plan.get("inputStage"), dict):
+        return f"{stage} > {summarize_plan(plan['inputStage'])}"
+    if plan.get("inputStages"):
+        return f"{stage}({', '.join(summarize_plan(item) for item in plan['inputStages'])})"
+    return stage
+
+
 def paginate_results(results: List[Any], page: int = 1, per_page: int = 10) -> Dict[str, Any]:
     """
     分页处理结果
@@ -0,0 +1,191 @@
+"""
+异步写入队列模块
+为 /api/save?mode=async 提供进程内的有界队列，由后台线程按条数或时间间隔批量写入
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 关闭时放入队列末尾，唤醒等待数据的后台线程；队列已满时后台线程在取空队列后自行退出
+_STOP = object()
+
+
+class WriteQueueFull(Exception):
+    """写入队列已满或已关闭，调用方应稍后重试"""
+
+
+class WriteBehindQueue:
+    """
+    异步写入队列
+    
+    请求线程调用put放入数据后立即返回；后台线程取出数据，累计到batch_size条
+    或距第一条数据超过flush_interval秒时调用flush批量写入。
+    队列满时put最多等待enqueue_timeout秒，仍然没有空位则抛出WriteQueueFull。
+    """
+    
+    def __init__(self, flush: Callable[[List[Any]], int], max_size: int, batch_size: int,
+                 flush_interval: float, enqueue_timeout: float = 0):
+        """
+        初始化队列
+        
+        Args:
+            flush: 批量写入函数，参数为一批数据，返回写入失败的条数
+            max_size: 队列最大条数
+            batch_size: 每批最多写入的条数
+            flush_interval: 一批数据最长等待时间（秒）
+            enqueue_timeout: 队列满时put的最长等待时间（秒），0表示不等待
+        """
+        self.flush = flush
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        
+        self._queue: "queue.Queue[Any]" = queue.Queue(max_size)
+        self._lock = threading.Lock()
+        # 正在放入数据的put调用数，close等待它们结束后才发出停止信号
+        self._putting = 0
+        self._idle = threading.Condition(self._lock)
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        
+        self.enqueued = 0
+        self.rejected = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+    
+    def put(self, item: Any):
+        """
+        放入一条待写入的数据
+        
+        Args:
+            item: 待写入的数据
+            
+        Raises:
+            WriteQueueFull: 队列已满或已关闭
+        """
+        with self._lock:
+            if self._closed:
+                raise WriteQueueFull("写入队列已关闭")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+            self._putting += 1
+        
+        # 队列满时最多等待enqueue_timeout秒，不持有锁；close会等待本次放入结束
+        accepted = False
+        try:
+            if self.enqueue_timeout > 0:
+                self._queue.put(item, timeout=self.enqueue_timeout)
+            else:
+                self._queue.put_nowait(item)
+            accepted = True
+        except queue.Full:
+            raise WriteQueueFull("写入队列已满")
+        finally:
+            with self._lock:
+                if accepted:
+                    self.enqueued += 1
+                else:
+                    self.rejected += 1
+                self._putting -= 1
+                if self._putting == 0:
+                    self._idle.notify_all()
+    
+    def close(self, timeout: Optional[float] = None):
+        """
+        停止接收新数据，写完队列中剩余的数据后结束后台线程
+        
+        先等待正在进行的put结束，保证停止后不会再有数据进入队列；队列已满放不下停止标记时，
+        后台线程写完剩余数据后自行退出
+        
+        Args:
+            timeout: 最长等待时间（秒），None表示一直等待
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+            # put最多等待enqueue_timeout秒，不会无限期占用
+            self._idle.wait_for(lambda: self._putting == 0)
+        self._stopping.set()
+        if thread is None:
+            return
+        
+        try:
+            self._queue.put(_STOP, timeout=self._remaining(deadline))
+        except queue.Full:
+            pass
+        thread.join(self._remaining(deadline))
+        if thread.is_alive() or not self._queue.empty():
+            logger.warning(f"异步写入队列未能在 {timeout} 秒内写完，剩余 {self._queue.qsize()} 条数据")
+        else:
+            logger.info("异步写入队列已写完")
+    
+    @staticmethod
+    def _remaining(deadline: Optional[float]) -> Optional[float]:
+        """距截止时间的剩余秒数，没有截止时间时返回None"""
+        if deadline is None:
+            return None
+        return max(deadline - time.monotonic(), 0)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取队列统计
+        
+        Returns:
+            Dict[str, Any]: 队列长度、放入、拒绝、写入、失败条数和批次数
+        """
+        with self._lock:
+            return {
+                "pending": self._queue.qsize(),
+                "max_size": self._queue.maxsize,
+                "enqueued": self.enqueued,
+                "rejected": self.rejected,
+                "written": self.written,
+                "failed": self.failed,
+                "batches": self.batches
+            }
+    
+    def _run(self):
+        """后台线程：按条数或时间间隔取出一批数据并写入，停止后写完队列中的数据再退出"""
+        while True:
+            # close在所有put结束后才设置停止，此时队列为空就不会再有数据
+            if self._stopping.is_set() and self._queue.empty():
+                return
+            first = self._queue.get()
+            if first is _STOP:
+                continue
+            
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    break
+                batch.append(item)
+            
+            self._write(batch)
+    
+    def _write(self, batch: List[Any]):
+        """写入一批数据并更新统计，异常不会结束后台线程"""
+        try:
+            failed = self.flush(batch)
+        except Exception as e:
+            logger.error(f"异步写入失败，数量: {len(batch)}, 错误: {e}")
+            failed = len(batch)
+        
+        with self._lock:
+            self.batches += 1
+            self.written += len(batch) - failed
+            self.failed += failed
@@ -0,0 +1,12 @@
+"""
+WSGI入口模块
+
+供gunicorn等生产服务器加载，导入时只创建Flask应用，不创建数据库连接。
+
+启动方式:
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from app import init_app
+
+app = init_app()